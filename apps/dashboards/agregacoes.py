@@ -0,0 +1,247 @@
+"""
+Agregações do relatório fiscal feitas no banco
+
+Lêem os resumos por período (ResumoItem/ResumoDocumento, ver
+apps.sped.resumos) e os somam com values().annotate(Sum(...)) por produto,
+CFOP e participante; a view só recebe as linhas já agrupadas e aplica as
+alíquotas da reforma.
+"""
+from decimal import Decimal
+
+from django.db.models import Exists, Min, OuterRef, Subquery, Sum
+
+from apps.sped.models import Registro0150, Registro0200, RegistroC113, RegistroC170
+from apps.sped.validador_devolucao import TIPO_DEVOLUCAO_VENDA, classificar_cfop_devolucao
+
+# CFOPs (sem o primeiro dígito) que representam compras efetivas para REVENDA/industrialização
+# Exclui: devoluções (411), consumo (407,408,556,557), transferências, serviços, energia, remessas
+SUFIXOS_COMPRA_EFETIVA = {
+    '101', '102', '111', '113', '116', '117', '118', '120', '121', '122',
+    '124', '125', '126', '128',
+    '401', '403',
+}
+
+# CFOPs que representam compras para USO/CONSUMO
+SUFIXOS_CONSUMO = {
+    '407', '408', '556', '557',
+}
+
+# CFOPs que representam vendas efetivas de mercadorias
+# Exclui: devoluções de compra, transferências, bonificações, remessas, lançamentos
+SUFIXOS_VENDA_EFETIVA = {
+    '101', '102', '103', '104', '105', '106', '109', '110', '111', '112',
+    '113', '114', '115', '116', '117', '118', '119', '120', '122', '123',
+    '401', '402', '403', '404', '405',
+}
+
+# Entradas consideradas: operações internas (1xxx) e interestaduais (2xxx)
+PREFIXOS_ENTRADA = '12'
+
+# Casas decimais das somas: no SQLite o Sum de DecimalField volta com resíduo de float
+CENTAVOS = Decimal('0.01')
+CASAS_QTD = Decimal('0.00001')
+
+# Somas por produto: campo do relatório -> (campo do ResumoItem, casas decimais)
+SOMAS_PRODUTO = [
+    ('quantidade', 'qtd', CASAS_QTD),
+    ('valor_total', 'vl_item', CENTAVOS),
+    ('icms', 'vl_icms', CENTAVOS),
+    ('pis', 'vl_pis', CENTAVOS),
+    ('cofins', 'vl_cofins', CENTAVOS),
+]
+SOMAS_BASES = [
+    ('vl_bc_icms', 'vl_bc_icms', CENTAVOS),
+    ('vl_bc_pis', 'vl_bc_pis', CENTAVOS),
+    ('vl_bc_cofins', 'vl_bc_cofins', CENTAVOS),
+]
+
+
+def cfops_com_sufixos(sufixos, prefixos='0123456789'):
+    """CFOPs de 4 dígitos formados pelos prefixos e sufixos informados (para cfop__in)"""
+    return sorted(prefixo + sufixo for prefixo in prefixos for sufixo in sufixos)
+
+
+def _soma(valor, casas=CENTAVOS):
+    """Soma vinda do banco com as casas do campo (None quando não há linhas)"""
+    return (valor or Decimal('0')).quantize(casas)
+
+
+def somar_campos(linhas, campos):
+    """Totais dos campos informados numa única passada pelas linhas"""
+    totais = dict.fromkeys(campos, 0)
+    for linha in linhas:
+        for campo in campos:
+            totais[campo] += linha.get(campo, 0)
+    return totais
+
+
+def itens_0200_por_codigo(registros_0000):
+    """Descrição e NCM do 0200 por cod_item (o último registro prevalece)"""
+    itens_0200 = {}
+    for cod_item, descr_item, cod_ncm in Registro0200.objects.filter(
+        registro_0000__in=registros_0000
+    ).order_by('registro_0000_id', 'id').values_list('cod_item', 'descr_item', 'cod_ncm'):
+        itens_0200[cod_item] = {
+            'descricao': descr_item,
+            'ncm': cod_ncm,
+        }
+    return itens_0200
+
+
+def participantes_por_codigo(registros_0000):
+    """Dados do 0150 por cod_part com o regime tributário (o primeiro registro prevalece)"""
+    participantes = {}
+    for part in Registro0150.objects.filter(registro_0000__in=registros_0000).order_by('registro_0000_id', 'id'):
+        if part.cod_part in participantes:
+            continue
+        # Determinar regime tributário
+        if part.optante_mei:
+            regime = 'MEI'
+        elif part.optante_simples:
+            regime = 'SIMPLES NACIONAL'
+        elif part.cnpj:
+            if not part.consultado:
+                regime = 'NÃO CONSULTADO'
+            else:
+                regime = 'LUCRO REAL/PRESUMIDO'
+        else:
+            regime = 'PESSOA FÍSICA' if part.cpf else '-'
+
+        participantes[part.cod_part] = {
+            'codigo': part.cod_part,
+            'cnpj_cpf': part.cnpj or part.cpf or '-',
+            'nome': part.nome,
+            'regime': regime,
+            'uf': part.uf,
+            'is_contribuinte': part.is_contribuinte,
+        }
+    return participantes
+
+
+def _somas_itens(resumos, cfops, somas):
+    """
+    Resumos de itens nos CFOPs informados somados por (cod_item, cfop); os
+    grupos de cada produto vêm na ordem do primeiro item C170. NCM e
+    descrição são os do resumo com o primeiro item do grupo (o NCM do C170
+    vem do 0200 de cada período e muda se o item for reclassificado)
+    """
+    primeiro_resumo = resumos.filter(
+        cod_item=OuterRef('cod_item'), cfop=OuterRef('cfop'),
+    ).order_by('primeiro_item')
+    return resumos.filter(cfop__in=cfops).values('cod_item', 'cfop').annotate(
+        descr=Subquery(primeiro_resumo.values('descr_compl')[:1]),
+        ncm=Subquery(primeiro_resumo.values('cod_ncm')[:1]),
+        primeiro=Min('primeiro_item'),
+        **{nome: Sum(campo) for nome, campo, _ in somas},
+    ).order_by('cod_item', 'primeiro')
+
+
+def produtos_entrada(resumos, sufixos, itens_0200):
+    """Produtos adquiridos (1xxx/2xxx com os sufixos de CFOP informados) por cod_item"""
+    produtos = {}
+    for linha in _somas_itens(resumos, cfops_com_sufixos(sufixos, PREFIXOS_ENTRADA), SOMAS_PRODUTO + SOMAS_BASES):
+        cod = linha['cod_item']
+        prod = produtos.get(cod)
+        if prod is None:
+            info_item = itens_0200.get(cod, {})
+            prod = produtos[cod] = {
+                'codigo': cod,
+                'descricao': info_item.get('descricao', linha['descr'] or cod),
+                'ncm': linha['ncm'] or info_item.get('ncm', ''),
+                'cfops': set(),
+                'quantidade': Decimal('0'),
+                'valor_total': Decimal('0'),
+                'icms': Decimal('0'),
+                'icms_st': Decimal('0'),
+                'ipi': Decimal('0'),
+                'pis': Decimal('0'),
+                'cofins': Decimal('0'),
+                'vl_bc_icms': Decimal('0'),
+                'vl_bc_pis': Decimal('0'),
+                'vl_bc_cofins': Decimal('0'),
+            }
+        for nome, _, casas in SOMAS_PRODUTO + SOMAS_BASES:
+            prod[nome] += _soma(linha[nome], casas)
+        prod['cfops'].add(linha['cfop'])
+    return produtos
+
+
+def produtos_saida(resumos, itens_0200):
+    """Produtos vendidos (CFOPs de venda efetiva) por cod_item"""
+    produtos = {}
+    for linha in _somas_itens(resumos, cfops_com_sufixos(SUFIXOS_VENDA_EFETIVA), SOMAS_PRODUTO):
+        cod = linha['cod_item']
+        prod = produtos.get(cod)
+        if prod is None:
+            info_item = itens_0200.get(cod, {})
+            prod = produtos[cod] = {
+                'codigo': cod,
+                'descricao': info_item.get('descricao', linha['descr'] or cod),
+                'ncm': linha['ncm'] or info_item.get('ncm', ''),
+                'cfop': linha['cfop'],
+                'quantidade': Decimal('0'),
+                'valor_total': Decimal('0'),
+                'icms': Decimal('0'),
+                'icms_st': Decimal('0'),
+                'ipi': Decimal('0'),
+                'pis': Decimal('0'),
+                'cofins': Decimal('0'),
+            }
+        for nome, _, casas in SOMAS_PRODUTO:
+            prod[nome] += _soma(linha[nome], casas)
+    return produtos
+
+
+def pis_cofins_por_cfop(resumos):
+    """PIS e COFINS dos itens C170 por CFOP (o C190 não possui esses campos)"""
+    for linha in resumos.exclude(cfop='').values('cfop').annotate(
+        pis=Sum('vl_pis'),
+        cofins=Sum('vl_cofins'),
+    ).order_by('cfop'):
+        yield {'cfop': linha['cfop'], 'pis': _soma(linha['pis']), 'cofins': _soma(linha['cofins'])}
+
+
+def documentos_por_participante(resumos):
+    """Totais dos documentos C100 por cod_part, na ordem do primeiro documento de cada um"""
+    somas = ['valor_bruto', 'icms', 'pis', 'cofins']
+    linhas = resumos.values('cod_part').annotate(
+        valor_bruto=Sum('vl_doc'),
+        icms=Sum('vl_icms'),
+        pis=Sum('vl_pis'),
+        cofins=Sum('vl_cofins'),
+        primeiro=Min('primeiro_documento'),
+    ).order_by('primeiro')
+    return [
+        {'cod_part': linha['cod_part'], **{nome: _soma(linha[nome]) for nome in somas}}
+        for linha in linhas
+    ]
+
+
+def classificar_documentos(documentos):
+    """
+    Documentos C100 com tem_itens (possui C170), devolucao (C113 ou algum
+    item com CFOP de devolução) e devolucao_venda (C113 ou CFOP de devolução
+    de venda), em duas consultas
+    """
+    linhas = list(documentos.annotate(
+        tem_itens=Exists(RegistroC170.objects.filter(registro_c100=OuterRef('pk'))),
+        tem_c113=Exists(RegistroC113.objects.filter(registro_c100=OuterRef('pk'))),
+    ).values('id', 'cod_part', 'cod_mod', 'chv_nfe', 'vl_icms', 'tem_itens', 'tem_c113'))
+
+    # Tipo de devolução dos CFOPs distintos de cada documento
+    tipos_cfop = {}
+    tipos_documento = {}
+    for doc_id, cfop in RegistroC170.objects.filter(
+        registro_c100__in=documentos,
+    ).values_list('registro_c100_id', 'cfop').distinct():
+        if cfop not in tipos_cfop:
+            eh_dev, tipo_dev, _ = classificar_cfop_devolucao(cfop or '')
+            tipos_cfop[cfop] = tipo_dev if eh_dev else None
+        if tipos_cfop[cfop]:
+            tipos_documento.setdefault(doc_id, set()).add(tipos_cfop[cfop])
+
+    for linha in linhas:
+        tipos = tipos_documento.get(linha['id'], set())
+        linha['devolucao'] = linha['tem_c113'] or bool(tipos)
+        linha['devolucao_venda'] = linha['tem_c113'] or TIPO_DEVOLUCAO_VENDA in tipos
+    return linhas
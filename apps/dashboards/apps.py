@@ -5,3 +5,6 @@ class DashboardsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.dashboards'
     verbose_name = 'Dashboards'
+
+    def ready(self):
+        from apps.dashboards import signals  # noqa: F401
@@ -0,0 +1,77 @@
+"""
+Armazém dos XML de NF-e baixados da API (media/xml_nfe)
+
+Cada XML fica compactado (gzip) em xml_nfe/{aa}/{bb}/{chave}.xml.gz, com aa/bb
+tirados do SHA-1 da chave para espalhar os arquivos entre as pastas. A chave de
+acesso identifica o conteúdo (o XML autorizado de uma chave não muda), então um
+XML armazenado nunca é buscado de novo na API paga; os produtos em cache
+(media/xml_cache) são derivados daqui e podem ser refeitos com
+python manage.py reextrair_produtos_xml.
+
+A gravação é atômica: o arquivo é escrito com outro nome na mesma pasta e
+renomeado no fim, então uma leitura nunca vê um XML pela metade.
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+
+PASTA = 'xml_nfe'
+EXTENSAO = '.xml.gz'
+
+
+def pasta_raiz():
+    """Pasta do armazém (MEDIA_ROOT/xml_nfe)"""
+    return os.path.join(settings.MEDIA_ROOT, PASTA)
+
+
+def caminho_xml(chave_acesso, raiz=None):
+    """Arquivo do XML da chave (exista ou não); raiz: pasta do armazém, para quem roda sem Django"""
+    resumo = hashlib.sha1(chave_acesso.encode()).hexdigest()
+    return os.path.join(raiz or pasta_raiz(), resumo[:2], resumo[2:4], f"{chave_acesso}{EXTENSAO}")
+
+
+def existe_xml(chave_acesso, raiz=None):
+    return os.path.exists(caminho_xml(chave_acesso, raiz))
+
+
+def ler_xml(chave_acesso):
+    """Conteúdo do XML armazenado da chave, ou None"""
+    try:
+        with gzip.open(caminho_xml(chave_acesso), 'rt', encoding='utf-8') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def salvar_xml(chave_acesso, xml_content, raiz=None):
+    """Grava o XML da chave, texto ou bytes UTF-8 (substituindo o anterior); devolve o tamanho compactado"""
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode('utf-8')
+    destino = caminho_xml(chave_acesso, raiz)
+    pasta = os.path.dirname(destino)
+    os.makedirs(pasta, exist_ok=True)
+    descritor, temporario = tempfile.mkstemp(dir=pasta, prefix=f".{chave_acesso}.", suffix='.tmp')
+    try:
+        # Fecha o arquivo antes de renomear (no Windows não dá para renomear arquivo aberto)
+        with os.fdopen(descritor, 'wb') as f:
+            with gzip.GzipFile(filename='', mode='wb', fileobj=f, mtime=0) as gz:
+                gz.write(xml_content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporario, destino)
+    except BaseException:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+        raise
+    return os.path.getsize(destino)
+
+
+def chaves_armazenadas():
+    """Chaves de todos os XML do armazém (percorre as pastas)"""
+    for _, _, arquivos in os.walk(pasta_raiz()):
+        for nome in arquivos:
+            if nome.endswith(EXTENSAO) and not nome.startswith('.'):
+                yield nome[:-len(EXTENSAO)]
@@ -0,0 +1,313 @@
+"""
+Busca em lote dos produtos via API MeuDanfe (BuscaProdutosAPI)
+
+A página só enfileira a busca e acompanha o progresso; quem consulta a API é o
+worker (python manage.py worker_busca_api, fila em apps.utilitarios.fila), em
+lotes de NOTAS_POR_LOTE notas consultadas em paralelo (ver
+apps.dashboards.meudanfe). Os produtos de cada lote são gravados de uma vez
+(bulk_create), substituindo os das mesmas chaves, e o progresso fica no
+próprio registro da busca.
+"""
+import logging
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Subquery
+from django.utils import timezone
+
+from apps.dashboards import meudanfe
+from apps.dashboards.cache_relatorio import invalidar_empresa
+from apps.dashboards.models import BuscaProdutosAPI, ProdutoEntradaAPI, ProdutoSaidaAPI
+
+logger = logging.getLogger('dashboards.api')
+
+NOTAS_POR_LOTE = 20
+
+MODELOS = {'saida': ProdutoSaidaAPI, 'entrada': ProdutoEntradaAPI}
+IND_OPER = {'saida': '1', 'entrada': '0'}
+
+CAMPOS_TEXTO = ['codigo', 'descricao', 'ncm', 'cfop', 'unidade', 'icms_cst', 'ipi_cst', 'pis_cst', 'cofins_cst']
+CAMPOS_VALOR = [
+    'quantidade', 'valor_unitario', 'valor_total', 'icms_aliq', 'icms_valor', 'icms_st_valor',
+    'ipi_aliq', 'ipi_valor', 'pis_aliq', 'pis_valor', 'cofins_aliq', 'cofins_valor',
+]
+
+
+# ========================================
+# NOTAS DO PERÍODO
+# ========================================
+
+def _documentos(empresa_id, periodo_inicial, periodo_final, ind_oper):
+    from apps.sped.models import Registro0000, RegistroC100
+
+    registros_0000 = Registro0000.objects.filter(
+        empresa_id=empresa_id,
+        processado=True,
+        periodo__gte=periodo_inicial + '-01',
+        periodo__lte=periodo_final + '-28'
+    )
+    return RegistroC100.objects.filter(
+        registro_0000__in=registros_0000,
+        ind_oper=ind_oper
+    ).exclude(chv_nfe__isnull=True).exclude(chv_nfe='')
+
+
+def _separar_modelos(documentos, referenciada=False):
+    """Dados das notas com chave válida: (NF-e para buscar, NFC-e ignoradas)"""
+    chaves_nfe = []
+    chaves_nfce = []
+    for doc in documentos:
+        if not doc.chv_nfe or len(doc.chv_nfe) < 44:
+            continue
+
+        modelo = doc.cod_mod or '55'
+        dados_doc = {
+            'chave_nfe': doc.chv_nfe,
+            'numero': doc.num_doc,
+            'modelo': modelo,
+            'modelo_desc': 'NF-e' if modelo == '55' else 'NFC-e',
+            'valor': float(doc.vl_doc) if doc.vl_doc else 0,
+            'data': doc.dt_doc.strftime('%d/%m/%Y') if doc.dt_doc else '',
+        }
+        if referenciada:
+            dados_doc['chave_referenciada'] = doc.chave_c113 if doc.chave_c113 and len(doc.chave_c113) >= 44 else ''
+
+        if modelo == '55':
+            chaves_nfe.append(dados_doc)
+        else:
+            chaves_nfce.append(dados_doc)
+    return chaves_nfe, chaves_nfce
+
+
+def chaves_saida(empresa_id, periodo_inicial, periodo_final):
+    """Notas de saída do período com chave de acesso: (NF-e, NFC-e)"""
+    return _separar_modelos(_documentos(empresa_id, periodo_inicial, periodo_final, '1'))
+
+
+def chaves_entrada_sem_itens(empresa_id, periodo_inicial, periodo_final):
+    """
+    Notas de entrada do período sem itens C170: (NF-e, NFC-e), com a chave da
+    primeira nota referenciada (C113 - devolução) em chave_referenciada
+    """
+    from apps.sped.models import RegistroC113, RegistroC170
+
+    primeira_c113 = RegistroC113.objects.filter(registro_c100=OuterRef('pk')).order_by('pk').values('chv_nfe')[:1]
+    documentos = _documentos(empresa_id, periodo_inicial, periodo_final, '0').annotate(
+        tem_itens=Exists(RegistroC170.objects.filter(registro_c100=OuterRef('pk'))),
+        chave_c113=Subquery(primeira_c113),
+    ).filter(tem_itens=False)
+    return _separar_modelos(documentos, referenciada=True)
+
+
+def chaves_gravadas(tipo, empresa_id, periodo_inicial, periodo_final):
+    """Chaves com produtos já gravados no período"""
+    return set(MODELOS[tipo].objects.filter(
+        empresa_id=empresa_id,
+        periodo_inicial=periodo_inicial,
+        periodo_final=periodo_final
+    ).values_list('chave_nfe', flat=True).distinct())
+
+
+# ========================================
+# FILA
+# ========================================
+
+def enfileirar_busca(usuario, empresa_id, periodo_inicial, periodo_final, tipo):
+    """Cria a busca na fila; se já houver uma ativa para a mesma empresa/período/tipo, devolve essa"""
+    with transaction.atomic():
+        ativa = BuscaProdutosAPI.objects.select_for_update().filter(
+            empresa_id=empresa_id,
+            periodo_inicial=periodo_inicial,
+            periodo_final=periodo_final,
+            tipo=tipo,
+            status__in=['pendente', 'processando'],
+        ).first()
+        if ativa:
+            return ativa
+        return BuscaProdutosAPI.objects.create(
+            usuario=usuario,
+            empresa_id=empresa_id,
+            periodo_inicial=periodo_inicial,
+            periodo_final=periodo_final,
+            tipo=tipo,
+        )
+
+
+# ========================================
+# EXECUÇÃO
+# ========================================
+
+def _produto(modelo, periodo, chave_nfe, prod):
+    dados = {campo: prod.get(campo) or '' for campo in CAMPOS_TEXTO}
+    dados.update({campo: Decimal(str(prod.get(campo) or 0)) for campo in CAMPOS_VALOR})
+    return modelo(**periodo, chave_nfe=chave_nfe, **dados)
+
+
+def gravar_produtos(modelo, empresa_id, periodo_inicial, periodo_final, produtos_por_chave):
+    """
+    Substitui numa transação os produtos (ProdutoSaidaAPI/ProdutoEntradaAPI) das chaves
+    na empresa/período; devolve quantos gravou
+    """
+    if not produtos_por_chave:
+        return 0
+    periodo = {'empresa_id': empresa_id, 'periodo_inicial': periodo_inicial, 'periodo_final': periodo_final}
+    objetos = [
+        _produto(modelo, periodo, chave, prod)
+        for chave, produtos in produtos_por_chave.items()
+        for prod in produtos
+    ]
+    with transaction.atomic():
+        modelo.objects.filter(**periodo, chave_nfe__in=list(produtos_por_chave)).delete()
+        modelo.objects.bulk_create(objetos, batch_size=settings.SPED_BULK_BATCH_SIZE)
+    # bulk_create não dispara post_save: invalida o relatório em cache aqui, após o commit
+    transaction.on_commit(lambda: invalidar_empresa(empresa_id))
+    return len(objetos)
+
+
+def _gravar_lote(busca, produtos_por_chave):
+    return gravar_produtos(
+        MODELOS[busca.tipo], busca.empresa_id, busca.periodo_inicial, busca.periodo_final, produtos_por_chave,
+    )
+
+
+def _salvar_progresso(busca, *campos):
+    busca.save(update_fields=list(campos) + ['updated_at'])
+
+
+def _cancelamento_pedido(busca):
+    return BuscaProdutosAPI.objects.filter(id=busca.id, cancelar=True).exists()
+
+
+def _produtos_locais(nota, em_cache, ind_oper, pastas):
+    """Produtos da nota (ou da referenciada) no cache ou extraídos do XML já armazenado"""
+    chaves = [nota['chave_nfe']] + ([nota['chave_referenciada']] if nota.get('chave_referenciada') else [])
+    for chave in chaves:
+        if em_cache.get(chave):
+            return em_cache[chave]
+    for chave in chaves:
+        try:
+            produtos = meudanfe.produtos_armazenados(chave, ind_oper, nota.get('numero', ''), pastas)
+        except Exception:
+            # XML ilegível: a nota segue para a consulta, que registra o erro
+            continue
+        if produtos:
+            return produtos
+    return None
+
+
+def _falha_recente(nota, falhas):
+    """A nota e, se houver, a referenciada foram consultadas sem XML há pouco"""
+    referenciada = nota.get('chave_referenciada')
+    return nota['chave_nfe'] in falhas and (not referenciada or referenciada in falhas)
+
+
+def executar_busca(busca):
+    """Consulta e grava os produtos das notas da busca (chamado pelo worker)"""
+    listar = chaves_saida if busca.tipo == 'saida' else chaves_entrada_sem_itens
+    ind_oper = IND_OPER[busca.tipo]
+    notas, nfce = listar(busca.empresa_id, busca.periodo_inicial, busca.periodo_final)
+
+    gravadas = chaves_gravadas(busca.tipo, busca.empresa_id, busca.periodo_inicial, busca.periodo_final)
+    notas = [nota for nota in notas if nota['chave_nfe'] not in gravadas]
+
+    busca.chaves_total = len(notas)
+    busca.chaves_ja_gravadas = len(gravadas)
+    busca.relatorio = {'erros': [], 'nfce_ignoradas': nfce}
+    _salvar_progresso(busca, 'chaves_total', 'chaves_ja_gravadas', 'relatorio')
+    logger.info(
+        f"[BUSCA-API] Busca {busca.id}: {len(notas)} NF-e a buscar, "
+        f"{len(gravadas)} já gravadas, {len(nfce)} NFC-e ignoradas"
+    )
+
+    # Notas com produtos no cache local ou XML no armazém não consomem consultas
+    pastas = {}
+    consultar = []
+    produtos_cache = {}
+    em_cache = meudanfe.ler_caches_xml(
+        [nota['chave_nfe'] for nota in notas]
+        + [nota['chave_referenciada'] for nota in notas if nota.get('chave_referenciada')]
+    )
+    for nota in notas:
+        produtos = _produtos_locais(nota, em_cache, ind_oper, pastas)
+        if produtos:
+            produtos_cache[nota['chave_nfe']] = produtos
+        else:
+            consultar.append(nota)
+    do_cache = list(produtos_cache.items())
+    for inicio in range(0, len(do_cache), NOTAS_POR_LOTE):
+        lote = dict(do_cache[inicio:inicio + NOTAS_POR_LOTE])
+        busca.produtos += _gravar_lote(busca, lote)
+        busca.do_cache += len(lote)
+        busca.sucesso += len(lote)
+        busca.chaves_processadas += len(lote)
+        _salvar_progresso(busca, 'produtos', 'do_cache', 'sucesso', 'chaves_processadas')
+
+    # Notas consultadas sem XML há pouco (a nota e a referenciada) não entram no limite de consultas
+    falhas = meudanfe.falhas_recentes(
+        [nota['chave_nfe'] for nota in consultar]
+        + [nota['chave_referenciada'] for nota in consultar if nota.get('chave_referenciada')]
+    )
+    conhecidas = [nota for nota in consultar if _falha_recente(nota, falhas)]
+    if conhecidas:
+        consultar = [nota for nota in consultar if not _falha_recente(nota, falhas)]
+        for nota in conhecidas:
+            falha = falhas.get(nota.get('chave_referenciada')) or falhas[nota['chave_nfe']]
+            busca.relatorio['erros'].append({**nota, 'erro': falha['mensagem']})
+        busca.erros += len(conhecidas)
+        busca.chaves_processadas += len(conhecidas)
+        _salvar_progresso(busca, 'erros', 'chaves_processadas', 'relatorio')
+
+    limite = settings.MEUDANFE_CONSULTAS_POR_BUSCA
+    restantes = consultar[limite:] if limite > 0 else []
+    if limite > 0:
+        consultar = consultar[:limite]
+
+    interrupcao = None
+    for inicio in range(0, len(consultar), NOTAS_POR_LOTE):
+        if _cancelamento_pedido(busca):
+            busca.status = 'cancelado'
+            busca.mensagem = 'Busca cancelada pelo usuário'
+            break
+
+        produtos_lote = {}
+        for nota, resultado in meudanfe.consultar_chaves(consultar[inicio:inicio + NOTAS_POR_LOTE]):
+            if resultado['status'] in meudanfe.INTERROMPEM_BUSCA:
+                interrupcao = resultado
+                continue
+            produtos = []
+            mensagem = resultado['mensagem']
+            if resultado['status'] == meudanfe.ENCONTRADA:
+                try:
+                    produtos = meudanfe.registrar_xml(resultado, ind_oper, nota.get('numero', ''), pastas)
+                except Exception as e:
+                    mensagem = f'Erro ao extrair produtos do XML: {e}'
+            busca.chaves_processadas += 1
+            if produtos:
+                produtos_lote[nota['chave_nfe']] = produtos
+                busca.sucesso += 1
+            else:
+                busca.erros += 1
+                busca.relatorio['erros'].append({**nota, 'erro': mensagem or 'Sem produtos retornados'})
+
+        busca.produtos += _gravar_lote(busca, produtos_lote)
+        _salvar_progresso(busca, 'chaves_processadas', 'sucesso', 'erros', 'produtos', 'relatorio')
+        if interrupcao:
+            break
+
+    if interrupcao and interrupcao['status'] == meudanfe.SEM_SALDO:
+        busca.status = 'pausado'
+        busca.mensagem = f"Saldo insuficiente na API. Busca pausada em {busca.chaves_processadas}/{busca.chaves_total}."
+    elif interrupcao:
+        busca.status = 'erro'
+        busca.mensagem = interrupcao['mensagem']
+    elif busca.status != 'cancelado' and restantes:
+        busca.status = 'pausado'
+        busca.mensagem = f"Limite de {limite} consultas atingido. {len(restantes)} nota(s) restante(s)."
+    elif busca.status != 'cancelado':
+        busca.status = 'concluido'
+        busca.mensagem = f"{busca.sucesso} notas processadas, {busca.produtos} produtos gravados."
+    busca.finalizado_em = timezone.now()
+    _salvar_progresso(busca, 'status', 'mensagem', 'finalizado_em', 'relatorio')
+    logger.info(f"[BUSCA-API] Busca {busca.id} {busca.get_status_display()}: {busca.mensagem}")
+    return busca
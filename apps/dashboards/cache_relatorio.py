@@ -0,0 +1,121 @@
+"""
+Cache dos resultados do relatório fiscal
+
+Guarda as agregações que não dependem das alíquotas (as alíquotas são
+aplicadas a cada requisição por simulacao.aplicar_aliquotas), uma entrada por
+seção do relatório (ver secoes_relatorio). A chave combina
+empresa, período, agrupamento de filiais e a versão de dados de cada empresa
+envolvida. A versão muda quando um Registro0000 da empresa é
+importado/excluído ou quando produtos via API e ajustes manuais são gravados
+(ver apps.dashboards.signals), o que torna as entradas antigas inalcançáveis
+sem precisar listá-las.
+
+Requisições idênticas simultâneas calculam o relatório uma única vez: quem
+consegue a trava (cache.add) calcula, as demais aguardam o resultado. Entre
+threads do mesmo processo a trava local garante isso; entre processos só no
+Redis, onde o add é atômico. No cache em arquivos (padrão) o add é get + set
+e dois processos podem calcular a mesma seção ao mesmo tempo: é só trabalho
+repetido, o resultado é o mesmo. A versão não depende dessa atomicidade (ver
+invalidar_empresa).
+"""
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from apps.empresa.models import Empresa
+
+logger = logging.getLogger('dashboards.api')
+
+PREFIXO = 'relatorio_fiscal'
+# Tempo máximo de um cálculo; depois disso a trava expira e outro processo assume
+TEMPO_TRAVA = 300
+INTERVALO_ESPERA = 0.2
+
+# Travas locais (threads do mesmo processo), distribuídas por hash da chave
+_TRAVAS_LOCAIS = [threading.Lock() for _ in range(32)]
+
+
+def _chave_versao(empresa_id):
+    return f'{PREFIXO}:versao:{empresa_id}'
+
+
+def versoes_empresas(empresa_ids):
+    """Versão atual dos dados de cada empresa (criada na primeira consulta)"""
+    chaves = {_chave_versao(empresa_id): empresa_id for empresa_id in empresa_ids}
+    versoes = cache.get_many(list(chaves))
+    for chave in chaves.keys() - versoes.keys():
+        # Valor inicial único: se a versão for descartada pelo cache, não volta a um número já usado
+        cache.add(chave, time.time_ns(), timeout=None)
+        versoes[chave] = cache.get(chave)
+    return sorted((chaves[chave], versao) for chave, versao in versoes.items())
+
+
+def invalidar_empresa(empresa_id):
+    """Muda a versão dos dados da empresa, invalidando os relatórios em cache"""
+    # Um valor novo em vez de incr: fora do Redis o incr é get + set, e dois
+    # processos invalidando juntos gravariam a mesma versão
+    cache.set(_chave_versao(empresa_id), time.time_ns(), timeout=None)
+
+
+def _empresas_relatorio(empresa_id, agrupar_filiais):
+    """Empresas cujos dados entram no relatório (a matriz e as filiais, quando agrupadas)"""
+    if not agrupar_filiais:
+        return [int(empresa_id)]
+    empresa = Empresa.objects.get(id=empresa_id)
+    cnpj_base = empresa.cnpj_cpf[:8] if empresa.cnpj_cpf else ''
+    return list(Empresa.objects.filter(cnpj_cpf__startswith=cnpj_base).values_list('id', flat=True))
+
+
+def chave_relatorio(empresa_id, periodo_inicial, periodo_final, agrupar_filiais):
+    """Chave do relatório com os parâmetros e as versões das empresas envolvidas"""
+    versoes = versoes_empresas(_empresas_relatorio(empresa_id, agrupar_filiais))
+    parametros = repr((str(empresa_id), periodo_inicial, periodo_final, agrupar_filiais, versoes))
+    return f'{PREFIXO}:{hashlib.sha1(parametros.encode()).hexdigest()}'
+
+
+def obter_ou_calcular(chave, calcular, timeout=None):
+    """Valor em cache ou calculado por calcular(); um único cálculo por chave de cada vez"""
+    resultado = cache.get(chave)
+    if resultado is not None:
+        return resultado
+
+    with _TRAVAS_LOCAIS[hash(chave) % len(_TRAVAS_LOCAIS)]:
+        resultado = cache.get(chave)
+        if resultado is not None:
+            return resultado
+
+        trava = f'{chave}:calculando'
+        if not cache.add(trava, 1, timeout=TEMPO_TRAVA):
+            # Outro processo está calculando: aguarda o resultado enquanto a trava existir
+            limite = time.monotonic() + TEMPO_TRAVA
+            while time.monotonic() < limite:
+                time.sleep(INTERVALO_ESPERA)
+                resultado = cache.get(chave)
+                if resultado is not None:
+                    return resultado
+                if cache.get(trava) is None:
+                    break
+            logger.warning(f"Cálculo concorrente de {chave} não terminou; calculando novamente")
+
+        try:
+            resultado = calcular()
+            cache.set(chave, resultado, timeout=timeout)
+        finally:
+            cache.delete(trava)
+    return resultado
+
+
+def obter_secoes(empresa_id, periodo_inicial, periodo_final, agrupar_filiais, calcular_secoes):
+    """
+    Seções do relatório fiscal a partir do cache, juntas em um dict; cada seção
+    tem a própria entrada e calcular_secoes[nome]() a gera na falta
+    """
+    chave = chave_relatorio(empresa_id, periodo_inicial, periodo_final, agrupar_filiais)
+    dados = {}
+    for nome, calcular in calcular_secoes.items():
+        dados.update(obter_ou_calcular(f'{chave}:{nome}', calcular, timeout=settings.RELATORIO_CACHE_SEGUNDOS))
+    return dados
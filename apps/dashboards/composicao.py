@@ -0,0 +1,251 @@
+"""
+Composição por NF do relatório fiscal, paginada no banco
+
+As linhas vêm da ComposicaoNF (gerada com os resumos do período, ver
+apps.sped.resumos) e, nas entradas, também dos produtos buscados via API
+(ProdutoEntradaAPI). As duas consultas têm as mesmas colunas e são unidas no
+banco (UNION ALL); filtros, ordenação e totais também rodam no banco. Cada
+página continua depois da última linha da anterior (paginação por chave:
+colunas da ordenação + origem + id), então nem o servidor nem a página
+carregam a lista inteira.
+"""
+import json
+from decimal import Decimal
+
+from django.db.models import Case, CharField, Count, F, Func, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, Length, NullIf, Replace, Substr, Trim
+
+from apps.dashboards.agregacoes import CENTAVOS, SUFIXOS_COMPRA_EFETIVA, SUFIXOS_VENDA_EFETIVA, cfops_com_sufixos
+from apps.dashboards.models import ProdutoEntradaAPI
+
+TIPOS = {'entradas': '0', 'saidas': '1'}
+
+# Colunas comuns às consultas unidas (mesma ordem nas duas) -> chave devolvida à página;
+# origem (0 = ComposicaoNF, 1 = API) e linha (id) só desempatam a ordenação
+COLUNAS = {
+    'nf': 'num_doc',
+    'cfop_nf': 'cfop',
+    'cod': 'codigo',
+    'descr': 'descricao',
+    'vl': 'valor',
+    'origem': None,
+    'linha': None,
+}
+
+# Ordenações aceitas: nome -> colunas; empates sempre por origem e id (linha)
+ORDENS = {
+    'num_doc': ['nf', 'cfop_nf', 'cod'],
+    'cfop': ['cfop_nf', 'nf', 'cod'],
+    'codigo': ['cod', 'nf', 'cfop_nf'],
+    'valor': ['vl', 'nf', 'cfop_nf', 'cod'],
+}
+ORDEM_PADRAO = 'num_doc'
+
+# Filtros multi-seleção por coluna (parâmetro -> coluna da consulta)
+FILTROS_COLUNA = {'cfop': 'cfop_nf', 'nf': 'nf', 'codigo': 'cod'}
+
+# CFOPs de compra/venda efetiva ("Apenas Compras" / "Apenas Vendas")
+CFOPS_EFETIVOS = {
+    'entradas': cfops_com_sufixos(SUFIXOS_COMPRA_EFETIVA, '12'),
+    'saidas': cfops_com_sufixos(SUFIXOS_VENDA_EFETIVA, '56'),
+}
+
+LIMITE_PAGINA = 200
+LIMITE_PAGINA_MAXIMO = 2000
+LIMITE_VALORES = 500
+
+
+class FiltroComposicao:
+    """Filtros, ordenação e cursor da composição lidos da query string (ValueError se inválidos)"""
+
+    def __init__(self, tipo, params):
+        if tipo not in TIPOS:
+            raise ValueError(f'Composição inválida: {tipo}')
+        self.tipo = tipo
+        self.busca = (params.get('busca') or '').strip()
+        self.efetivas = params.get('efetivas') == '1'
+        self.colunas = {nome: params.getlist(nome) for nome in FILTROS_COLUNA if nome in params}
+        self.ordem = params.get('ordem') or ORDEM_PADRAO
+        if self.ordem not in ORDENS:
+            raise ValueError(f'Ordenação inválida: {self.ordem}')
+        self.decrescente = params.get('direcao') == 'desc'
+        try:
+            self.limite = min(int(params.get('limite') or LIMITE_PAGINA), LIMITE_PAGINA_MAXIMO)
+            self.apos = json.loads(params['apos']) if params.get('apos') else None
+        except ValueError:
+            raise ValueError('Parâmetros de paginação inválidos')
+        tamanho_cursor = len(ORDENS[self.ordem]) + 2
+        if self.limite < 1 or (self.apos is not None and (
+            not isinstance(self.apos, list) or len(self.apos) != tamanho_cursor
+        )):
+            raise ValueError('Parâmetros de paginação inválidos')
+
+    @property
+    def colunas_ordem(self):
+        return ORDENS[self.ordem]
+
+    def ordenacao(self):
+        prefixo = '-' if self.decrescente else ''
+        return [prefixo + coluna for coluna in self.colunas_ordem] + ['origem', 'linha']
+
+
+def _linhas_nf(consulta, ind_oper):
+    from apps.sped.models import ComposicaoNF
+
+    return ComposicaoNF.objects.filter(
+        registro_0000__in=consulta.registros_0000, ind_oper=ind_oper,
+    ).annotate(
+        nf=F('num_doc'), cfop_nf=F('cfop'), cod=F('codigo'), descr=F('descricao'), vl=F('valor'),
+        origem=Value(0, output_field=IntegerField()), linha=F('id'),
+    )
+
+
+def _linhas_api(consulta):
+    """Produtos da API, com o número da NF tirado da chave (posições 26 a 34, sem zeros à esquerda)"""
+    numero = Func(Substr('chave_nfe', 26, 9), Value('0'), function='LTRIM', output_field=CharField())
+    return ProdutoEntradaAPI.objects.filter(
+        empresa_id=consulta.empresa_id,
+        periodo_inicial=consulta.periodo_inicial,
+        periodo_final=consulta.periodo_final,
+    ).alias(tamanho_chave=Length('chave_nfe')).annotate(
+        nf=Case(
+            When(tamanho_chave__gte=34, then=Coalesce(NullIf(numero, Value('')), Value('0'))),
+            default=Value(''),
+            output_field=CharField(),
+        ),
+        cfop_nf=Trim(Replace('cfop', Value('.'), Value(''))),
+        cod=F('codigo'), descr=F('descricao'), vl=F('valor_total'),
+        origem=Value(1, output_field=IntegerField()), linha=F('id'),
+    )
+
+
+def _aplicar_filtros(consultas, filtro, exceto=None):
+    """Filtros da página em cada consulta; exceto = filtro de coluna ignorado (lista do próprio dropdown)"""
+    condicao = Q()
+    if filtro.efetivas:
+        condicao &= Q(cfop_nf__in=CFOPS_EFETIVOS[filtro.tipo])
+    for nome, valores in filtro.colunas.items():
+        if nome != exceto:
+            condicao &= Q(**{f'{FILTROS_COLUNA[nome]}__in': valores})
+    if filtro.busca:
+        condicao &= (
+            Q(nf__icontains=filtro.busca) | Q(cfop_nf__icontains=filtro.busca)
+            | Q(cod__icontains=filtro.busca) | Q(descr__icontains=filtro.busca)
+        )
+    return [qs.filter(condicao) for qs in consultas]
+
+
+def consultas_composicao(consulta, filtro, exceto=None):
+    """Consultas (ComposicaoNF e, nas entradas, produtos da API) com os filtros aplicados"""
+    consultas = [_linhas_nf(consulta, TIPOS[filtro.tipo])]
+    if filtro.tipo == 'entradas':
+        consultas.append(_linhas_api(consulta))
+    return _aplicar_filtros(consultas, filtro, exceto)
+
+
+def _depois_do_cursor(filtro, origem):
+    """Linhas de uma consulta (origem) posteriores ao cursor na ordenação escolhida"""
+    *chave, origem_cursor, linha_cursor = filtro.apos
+    colunas = filtro.colunas_ordem
+    if 'vl' in colunas:
+        chave[colunas.index('vl')] = Decimal(str(chave[colunas.index('vl')]))
+    comparacao = 'lt' if filtro.decrescente else 'gt'
+    condicao = Q()
+    iguais = {}
+    for coluna, valor in zip(colunas, chave):
+        condicao |= Q(**iguais, **{f'{coluna}__{comparacao}': valor})
+        iguais[coluna] = valor
+    if origem > origem_cursor:
+        condicao |= Q(**iguais)
+    elif origem == origem_cursor:
+        condicao |= Q(**iguais, linha__gt=linha_cursor)
+    return condicao
+
+
+def _unidas(consultas):
+    consultas = [qs.values(*COLUNAS) for qs in consultas]
+    return consultas[0].union(*consultas[1:], all=True) if len(consultas) > 1 else consultas[0]
+
+
+def _item(linha):
+    item = {chave: linha[coluna] for coluna, chave in COLUNAS.items() if chave}
+    item['valor'] = float(item['valor'] or 0)
+    return item
+
+
+def pagina_composicao(consulta, filtro):
+    """Próxima página da composição e o cursor da seguinte (None na última)"""
+    consultas = consultas_composicao(consulta, filtro)
+    if filtro.apos is not None:
+        consultas = [
+            qs.filter(_depois_do_cursor(filtro, origem)) for origem, qs in enumerate(consultas)
+        ]
+    linhas = list(_unidas(consultas).order_by(*filtro.ordenacao())[:filtro.limite + 1])
+
+    proximo = None
+    if len(linhas) > filtro.limite:
+        linhas = linhas[:filtro.limite]
+        ultima = linhas[-1]
+        proximo = [
+            str(ultima[coluna]) if coluna == 'vl' else ultima[coluna] for coluna in filtro.colunas_ordem
+        ] + [ultima['origem'], ultima['linha']]
+    return {'itens': [_item(linha) for linha in linhas], 'proximo': proximo}
+
+
+def linhas_composicao(consulta, filtro, chunk_size=2000):
+    """Todas as linhas filtradas, na ordenação escolhida, lidas do banco em blocos (exportação)"""
+    unidas = _unidas(consultas_composicao(consulta, filtro)).order_by(*filtro.ordenacao())
+    for linha in unidas.iterator(chunk_size=chunk_size):
+        yield _item(linha)
+
+
+def totais_composicao(consulta, filtro):
+    """Quantidade e totais das linhas filtradas (produtos, '---' e geral) e subtotais por CFOP"""
+    totais = {'registros': 0, 'total': Decimal('0'), 'total_outras': Decimal('0')}
+    por_cfop = {}
+    for qs in consultas_composicao(consulta, filtro):
+        somas = qs.aggregate(
+            registros=Count('linha'), total=Sum('vl'), total_outras=Sum('vl', filter=Q(cod='---')),
+        )
+        totais['registros'] += somas['registros']
+        totais['total'] += (somas['total'] or Decimal('0')).quantize(CENTAVOS)
+        totais['total_outras'] += (somas['total_outras'] or Decimal('0')).quantize(CENTAVOS)
+        for linha in qs.values('cfop_nf').annotate(qtd=Count('linha'), valor=Sum('vl')).order_by():
+            atual = por_cfop.setdefault(linha['cfop_nf'] or 'N/I', {'qtd': 0, 'valor': Decimal('0')})
+            atual['qtd'] += linha['qtd']
+            atual['valor'] += (linha['valor'] or Decimal('0')).quantize(CENTAVOS)
+    return {
+        'registros': totais['registros'],
+        'total': float(totais['total']),
+        'total_produtos': float(totais['total'] - totais['total_outras']),
+        'total_outras': float(totais['total_outras']),
+        'cfops': [
+            {'cfop': cfop, 'qtd': info['qtd'], 'valor': float(info['valor'])}
+            for cfop, info in sorted(por_cfop.items())
+        ],
+    }
+
+
+def valores_coluna(consulta, filtro, nome, busca=''):
+    """
+    Valores distintos de uma coluna (dropdown de filtro) com quantidade e total,
+    considerando os demais filtros; limitado a LIMITE_VALORES
+    """
+    coluna = FILTROS_COLUNA[nome]
+    valores = {}
+    for qs in consultas_composicao(consulta, filtro, exceto=nome):
+        if busca:
+            qs = qs.filter(**{f'{coluna}__icontains': busca})
+        linhas = qs.values(coluna).annotate(qtd=Count('linha'), total=Sum('vl')).order_by(coluna)
+        for linha in linhas[:LIMITE_VALORES + 1]:
+            atual = valores.setdefault(linha[coluna] or '', {'qtd': 0, 'total': Decimal('0')})
+            atual['qtd'] += linha['qtd']
+            atual['total'] += (linha['total'] or Decimal('0')).quantize(CENTAVOS)
+    ordenados = sorted(valores.items())
+    return {
+        'valores': [
+            {'valor': valor, 'qtd': info['qtd'], 'total': float(info['total'])}
+            for valor, info in ordenados[:LIMITE_VALORES]
+        ],
+        'completo': len(ordenados) <= LIMITE_VALORES,
+    }
@@ -0,0 +1,264 @@
+"""
+Exportação do relatório fiscal para XLSX
+
+As planilhas são gravadas com o xlsxwriter em constant_memory: cada linha vai
+para o arquivo temporário assim que a próxima começa, então a memória não
+cresce com o tamanho da planilha. As seções agregadas vêm do cache
+(secoes_relatorio.dados_secoes, com as alíquotas aplicadas) e a composição por
+NF é lida do banco em blocos (composicao.linhas_composicao). O arquivo pronto
+é enviado em blocos (resposta_xlsx) e apagado quando a resposta é encerrada.
+"""
+import logging
+import os
+import tempfile
+from itertools import chain
+
+from django.http import StreamingHttpResponse
+
+logger = logging.getLogger('dashboards.api')
+
+CONTENT_TYPE_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+TAMANHO_BLOCO = 64 * 1024
+# Linhas por aba no Excel (a composição continua em "<aba> (2)", "<aba> (3)"...)
+LIMITE_LINHAS_ABA = 1_048_576
+
+# Formatos das colunas
+FORMATOS = {
+    'texto': None,
+    'valor': {'num_format': '#,##0.00'},
+    'quantidade': {'num_format': '#,##0.00000'},
+    'percentual': {'num_format': '0.00'},
+}
+
+# Colunas: (título, campo, formato, largura)
+COLUNAS_PRODUTOS = [
+    ('Código', 'codigo', 'texto', 15),
+    ('CFOP', 'cfop', 'texto', 10),
+    ('Descrição', 'descricao', 'texto', 45),
+    ('NCM', 'ncm', 'texto', 10),
+    ('Quant.', 'quantidade', 'quantidade', 14),
+    ('% Red.', 'perc_reducao', 'percentual', 8),
+    ('Aliq. IBS/CBS', 'aliq_ibs_cbs', 'percentual', 10),
+    ('Valor Bruto Unit.', 'valor_bruto_unit', 'valor', 15),
+    ('Valor Bruto Tot.', 'valor_total', 'valor', 15),
+    ('ICMS', 'icms', 'valor', 14),
+    ('ICMS ST', 'icms_st', 'valor', 14),
+    ('IPI', 'ipi', 'valor', 14),
+    ('PIS', 'pis', 'valor', 14),
+    ('COFINS', 'cofins', 'valor', 14),
+    ('Total Tributos', 'total_tributos', 'valor', 15),
+    ('Valor Líq. Unit.', 'valor_liq_unit', 'valor', 15),
+    ('Valor Líq. Tot.', 'valor_liquido', 'valor', 15),
+    ('IBS/CBS Unit.', 'ibs_cbs_unit', 'valor', 14),
+    ('IBS/CBS Tot.', 'ibs_cbs', 'valor', 14),
+    ('Total Reforma Unit.', 'total_reforma_unit', 'valor', 15),
+    ('Total Reforma', 'total_reforma', 'valor', 15),
+    ('Dif. Unit.', 'dif_unit', 'valor', 14),
+    ('Dif. Total', 'dif_total', 'valor', 14),
+]
+COLUNAS_PRODUTOS_SAIDAS = [('Chave NF-e', 'chave_nfe', 'texto', 46)] + COLUNAS_PRODUTOS
+COLUNAS_FORNECEDORES = [
+    ('Código', 'codigo', 'texto', 15),
+    ('CNPJ/CPF', 'cnpj_cpf', 'texto', 18),
+    ('Nome', 'nome', 'texto', 40),
+    ('Regime', 'regime', 'texto', 18),
+    ('Valor Bruto', 'valor_bruto', 'valor', 15),
+    ('ICMS', 'icms', 'valor', 14),
+    ('ICMS ST', 'icms_st', 'valor', 14),
+    ('IPI', 'ipi', 'valor', 14),
+    ('ISS', 'iss', 'valor', 14),
+    ('PIS', 'pis', 'valor', 14),
+    ('COFINS', 'cofins', 'valor', 14),
+    ('Tributos', 'tributos', 'valor', 14),
+    ('Líquido', 'liquido', 'valor', 15),
+    ('IBS/CBS Efetivo', 'ibs_cbs_efetivo', 'valor', 15),
+    ('Total Reforma', 'total_reforma', 'valor', 15),
+]
+COLUNAS_TOTAIS_OPERACAO = [
+    ('Valor Bruto', 'valor_bruto', 'valor', 15),
+    ('ICMS', 'icms', 'valor', 14),
+    ('ICMS ST', 'icms_st', 'valor', 14),
+    ('IPI', 'ipi', 'valor', 14),
+    ('PIS', 'pis', 'valor', 14),
+    ('COFINS', 'cofins', 'valor', 14),
+    ('Tributos', 'tributos', 'valor', 14),
+    ('Líquido', 'liquido', 'valor', 15),
+]
+COLUNAS_CFOPS = [('CFOP', 'cfop', 'texto', 10)] + COLUNAS_TOTAIS_OPERACAO
+COLUNAS_UFS = [('UF', 'uf', 'texto', 6)] + COLUNAS_TOTAIS_OPERACAO[:4] + [('ISS', 'iss', 'valor', 14)] + COLUNAS_TOTAIS_OPERACAO[4:]
+COLUNAS_AJUSTES = [
+    ('Código de Ajuste', 'codigo', 'texto', 18),
+    ('Tipo de Ajuste', 'descricao', 'texto', 45),
+    ('Valor do Ajuste', 'valor', 'valor', 15),
+]
+COLUNAS_COMPOSICAO = [
+    ('Nº NF', 'num_doc', 'texto', 12),
+    ('CFOP', 'cfop', 'texto', 8),
+    ('Código', 'codigo', 'texto', 15),
+    ('Descrição', 'descricao', 'texto', 45),
+    ('Valor Total', 'valor', 'valor', 18),
+]
+
+# Abas das seções agregadas: (aba, lista em dados_secoes, colunas)
+ABAS_SECOES = [
+    ('Produtos Entradas', 'produtos_entradas', COLUNAS_PRODUTOS),
+    ('Produtos Consumo', 'produtos_consumo', COLUNAS_PRODUTOS),
+    ('Produtos Saídas', 'produtos_saidas', COLUNAS_PRODUTOS_SAIDAS),
+    ('Fornecedores', 'fornecedores_entradas', COLUNAS_FORNECEDORES),
+    ('CFOPs Entradas', 'cfops_entradas', COLUNAS_CFOPS),
+    ('UFs Entradas', 'ufs_entradas', COLUNAS_UFS),
+    ('Ajustes ICMS', 'ajustes_icms', COLUNAS_AJUSTES),
+]
+SECOES_EXPORTACAO = ['produtos', 'fornecedores', 'cfops_entradas', 'ufs_entradas', 'ajustes_icms']
+
+# Totais de simulacao.totais_relatorio na aba Resumo
+TOTAIS_RESUMO = [
+    ('Compra bruta', 'compra_bruta'),
+    ('Créditos atuais (ICMS/PIS/COFINS)', 'creditos_entradas'),
+    ('Compra líquida', 'compra_liquida'),
+    ('Créditos IBS/CBS', 'creditos_ibs_cbs'),
+    ('Compra total na reforma', 'compra_total_reforma'),
+    ('Venda bruta', 'venda_bruta'),
+    ('Débitos atuais (ICMS/PIS/COFINS)', 'debitos_saidas'),
+    ('Venda líquida', 'venda_liquida'),
+    ('Débitos IBS/CBS', 'debitos_ibs_cbs'),
+    ('Venda total na reforma', 'venda_total_reforma'),
+    ('Débitos atuais', 'debitos_atual'),
+    ('Créditos atuais', 'creditos_atual'),
+    ('Resultado atual', 'resultado_atual'),
+    ('Débitos na reforma', 'debitos_reforma'),
+    ('Créditos na reforma', 'creditos_reforma'),
+    ('Resultado na reforma', 'resultado_reforma'),
+    ('Total ajustes ICMS (E111)', 'total_ajustes_icms'),
+    ('Total ajustes manuais ICMS', 'total_ajustes_manuais_icms'),
+]
+
+
+class PlanilhaXlsx:
+    """Workbook do xlsxwriter em constant_memory com os formatos das colunas"""
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self.cabecalho = workbook.add_format({'bold': True, 'font_color': '#FFFFFF', 'bg_color': '#2C3E50', 'border': 1})
+        self.formatos = {nome: workbook.add_format(props) if props else None for nome, props in FORMATOS.items()}
+
+    def nova_aba(self, nome, colunas):
+        aba = self.workbook.add_worksheet(nome[:31])
+        for indice, (titulo, _, formato, largura) in enumerate(colunas):
+            aba.set_column(indice, indice, largura, self.formatos[formato])
+            aba.write_string(0, indice, titulo, self.cabecalho)
+        aba.freeze_panes(1, 0)
+        return aba
+
+    def escrever_linhas(self, nome, colunas, linhas):
+        """Grava as linhas (dicts) em ordem, abrindo outra aba ao atingir o limite do Excel; retorna a quantidade"""
+        aba, parte, linha_aba, total = self.nova_aba(nome, colunas), 1, 1, 0
+        for linha in linhas:
+            if linha_aba == LIMITE_LINHAS_ABA:
+                parte += 1
+                aba, linha_aba = self.nova_aba(f'{nome[:26]} ({parte})', colunas), 1
+            for indice, (_, campo, formato, _) in enumerate(colunas):
+                self._escrever(aba, linha_aba, indice, linha.get(campo), formato)
+            linha_aba += 1
+            total += 1
+        return total
+
+    def _escrever(self, aba, linha, coluna, valor, formato):
+        if valor is None or valor == '':
+            return
+        if formato == 'texto':
+            aba.write_string(linha, coluna, str(valor))
+        else:
+            aba.write_number(linha, coluna, float(valor), self.formatos[formato])
+
+
+def resposta_xlsx(nome_arquivo, escrever):
+    """
+    Gera a planilha num arquivo temporário (escrever(workbook) preenche o
+    Workbook em constant_memory) e a envia em blocos; o arquivo é apagado
+    quando o Django fecha a resposta
+    """
+    import xlsxwriter
+
+    descritor, caminho = tempfile.mkstemp(suffix='.xlsx')
+    os.close(descritor)
+    try:
+        workbook = xlsxwriter.Workbook(caminho, {'constant_memory': True})
+        try:
+            escrever(workbook)
+        finally:
+            workbook.close()
+    except Exception:
+        os.remove(caminho)
+        raise
+
+    conteudo = _ArquivoTemporario(caminho)
+    try:
+        response = StreamingHttpResponse(conteudo, content_type=CONTENT_TYPE_XLSX)
+        response['Content-Length'] = os.path.getsize(caminho)
+        response['Content-Disposition'] = f'attachment; filename={nome_arquivo}'
+    except Exception:
+        conteudo.close()
+        raise
+    return response
+
+
+class _ArquivoTemporario:
+    """
+    Blocos de um arquivo temporário para a StreamingHttpResponse. O Django
+    chama close() ao encerrar a resposta, mesmo se o cliente desconectar antes
+    do primeiro bloco; é ali que o arquivo é fechado e apagado
+    """
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        try:
+            self.arquivo = open(caminho, 'rb')
+        except OSError:
+            os.remove(caminho)
+            raise
+
+    def __iter__(self):
+        while bloco := self.arquivo.read(TAMANHO_BLOCO):
+            yield bloco
+
+    def close(self):
+        if self.arquivo.closed:
+            return
+        self.arquivo.close()
+        try:
+            os.remove(self.caminho)
+        except FileNotFoundError:
+            pass
+
+
+def escrever_composicao(planilha, consulta, filtro, nome_aba):
+    """Composição por NF filtrada e, depois de uma linha em branco, os subtotais por CFOP e o total geral"""
+    from apps.dashboards.composicao import linhas_composicao, totais_composicao
+
+    totais = totais_composicao(consulta, filtro)
+    rodape = [{'descricao': f"Subtotal CFOP {info['cfop']}", 'valor': info['valor']} for info in totais['cfops']]
+    rodape.append({'descricao': 'TOTAL GERAL', 'valor': totais['total']})
+    planilha.escrever_linhas(nome_aba, COLUNAS_COMPOSICAO, chain(linhas_composicao(consulta, filtro), [{}], rodape))
+    return totais['registros']
+
+
+def escrever_relatorio(workbook, dados, consulta):
+    """Todas as seções do relatório: Resumo, seções agregadas e as composições por NF de entradas e saídas"""
+    from django.http import QueryDict
+    from apps.dashboards.composicao import FiltroComposicao
+
+    planilha = PlanilhaXlsx(workbook)
+    planilha.escrever_linhas(
+        'Resumo', [('Total', 'titulo', 'texto', 40), ('Valor', 'valor', 'valor', 18)],
+        ({'titulo': titulo, 'valor': dados.get(campo)} for titulo, campo in TOTAIS_RESUMO),
+    )
+    for nome_aba, lista, colunas in ABAS_SECOES:
+        planilha.escrever_linhas(nome_aba, colunas, dados.get(lista, []))
+    planilha.escrever_linhas('Ajustes Manuais ICMS', COLUNAS_AJUSTES, (
+        {'codigo': ajuste.codigo, 'descricao': ajuste.descricao, 'valor': ajuste.valor}
+        for ajuste in dados.get('ajustes_manuais_icms', [])
+    ))
+    for tipo, nome_aba in (('entradas', 'Composição Entradas'), ('saidas', 'Composição Saídas')):
+        linhas = escrever_composicao(planilha, consulta, FiltroComposicao(tipo, QueryDict()), nome_aba)
+        logger.info(f'Exportação do relatório fiscal: {linhas} linhas em {nome_aba}')
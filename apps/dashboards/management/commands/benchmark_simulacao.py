@@ -0,0 +1,94 @@
+"""
+Benchmark da simulação de alíquotas (Decimal x NumPy) sobre N produtos sintéticos
+
+Uso: python manage.py benchmark_simulacao --produtos 100000
+"""
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.dashboards import simulacao, simulacao_vetorial
+
+
+class Command(BaseCommand):
+    help = 'Compara o tempo e os resultados da simulação de IBS/CBS em Decimal e vetorial (NumPy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--produtos', type=int, default=100_000, help='Quantidade de produtos')
+        parser.add_argument('--aliquota', type=Decimal, default=Decimal('26.5'), help='Alíquota total IBS+CBS+IS')
+        parser.add_argument('--cenarios', type=int, default=30, help='Cenários somados juntos (simular_cenarios)')
+        parser.add_argument('--semente', type=int, default=1)
+
+    def handle(self, *args, **options):
+        if simulacao_vetorial.np is None:
+            raise CommandError('NumPy não instalado')
+
+        total = options['produtos']
+        aliq_total = options['aliquota']
+        self.stdout.write(f'Gerando {total} produtos sintéticos...')
+        produtos = self._gerar_produtos(total, random.Random(options['semente']))
+
+        decimais = [dict(prod) for prod in produtos]
+        inicio = time.perf_counter()
+        for prod in decimais:
+            for regra in prod['regras_reforma']:
+                simulacao.REGRAS[regra](prod, aliq_total)
+        duracao_decimal = time.perf_counter() - inicio
+
+        # A carga das colunas é feita uma vez, junto com as agregações em cache
+        inicio = time.perf_counter()
+        tabela = simulacao_vetorial.carregar_colunas(produtos)
+        duracao_carga = time.perf_counter() - inicio
+        if tabela is None:
+            raise CommandError('Valores fora da escala do cálculo vetorial')
+
+        vetoriais = [dict(prod) for prod in produtos]
+        inicio = time.perf_counter()
+        if not simulacao_vetorial.aplicar_regras(vetoriais, aliq_total, tabela):
+            raise CommandError('Valores fora da escala do cálculo vetorial')
+        duracao_vetorial = time.perf_counter() - inicio
+
+        divergentes = sum(
+            1 for a, b in zip(decimais, vetoriais)
+            if {campo: str(valor) for campo, valor in a.items()} != {campo: str(valor) for campo, valor in b.items()}
+        )
+
+        self.stdout.write(f'Decimal: {duracao_decimal:.2f}s | {total / duracao_decimal:,.0f} produtos/s')
+        self.stdout.write(f'NumPy:   {duracao_vetorial:.2f}s | {total / duracao_vetorial:,.0f} produtos/s '
+                          f'(carga das colunas: {duracao_carga:.2f}s)')
+        estilo = self.style.SUCCESS if not divergentes else self.style.ERROR
+        self.stdout.write(estilo(
+            f'Ganho: {duracao_decimal / duracao_vetorial:.1f}x | produtos divergentes: {divergentes}'
+        ))
+
+        cenarios = [(aliq_total + indice, {}) for indice in range(options['cenarios'])]
+        inicio = time.perf_counter()
+        simulacao_vetorial.somas_cenarios(tabela, cenarios, simulacao.CAMPOS_SOMA_REFORMA)
+        duracao_cenarios = time.perf_counter() - inicio
+        self.stdout.write(f'Somas de {len(cenarios)} cenários: {duracao_cenarios:.2f}s')
+
+    def _gerar_produtos(self, total, rnd):
+        regras = [['sped']] * 6 + [['sped', 'api'], ['api_formatada'], ['saida'], ['saida_api']]
+        produtos = []
+        for indice in range(total):
+            valor_total = Decimal(rnd.randint(1, 5_000_000)).scaleb(-2)
+            prod = {
+                'codigo': f'ITEM{indice}',
+                'valor_total': valor_total,
+                'icms': (valor_total * Decimal('0.18')).quantize(simulacao.CENTAVOS),
+                'icms_st': Decimal('0'),
+                'ipi': Decimal(rnd.choice([0, 0, rnd.randint(0, 50_000)])).scaleb(-2),
+                'pis': (valor_total * Decimal('0.0165')).quantize(simulacao.CENTAVOS),
+                'cofins': (valor_total * Decimal('0.076')).quantize(simulacao.CENTAVOS),
+                'quantidade': Decimal(rnd.choice([0, 100_000, rnd.randint(1, 100_000_000)])).scaleb(-5),
+                'perc_reducao': Decimal('60') if indice % 7 == 0 else Decimal('0'),
+                'regras_reforma': rnd.choice(regras),
+            }
+            prod['total_tributos'] = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
+            prod['valor_liquido'] = valor_total - prod['total_tributos']
+            qtd = prod['quantidade'] if prod['quantidade'] > 0 else Decimal('1')
+            prod['valor_bruto_unit'] = (valor_total / qtd).quantize(simulacao.CENTAVOS)
+            produtos.append(prod)
+        return produtos
@@ -0,0 +1,44 @@
+"""
+Indexa os arquivos já existentes em media/xml_cache (XmlCacheNFe)
+
+Uso: python manage.py indexar_xml_cache [--limpar]
+
+A migração que cria o índice já indexa os arquivos existentes; o comando serve
+para arquivos copiados depois para media/xml_cache.
+
+Percorre xml_cache/{empresa}/{AAAA-MM}/{entrada|saida|outros}/{chave}.json e grava
+(ou atualiza) a linha de cada chave; a data da busca é a de modificação do arquivo.
+Com --limpar remove do índice as chaves cujo arquivo não existe mais.
+"""
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.dashboards.meudanfe import CHAVES_POR_CONSULTA, indexar_arquivos_cache
+from apps.dashboards.models import XmlCacheNFe
+
+
+class Command(BaseCommand):
+    help = 'Indexa os arquivos existentes do cache de produtos por NF-e (media/xml_cache)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limpar', action='store_true', help='Remove do índice as chaves sem arquivo')
+
+    def handle(self, *args, **options):
+        indexados = indexar_arquivos_cache()
+        self.stdout.write(f'{indexados} arquivo(s) indexado(s)')
+
+        if options['limpar']:
+            removidos = self._limpar()
+            self.stdout.write(f'{removidos} chave(s) sem arquivo removida(s) do índice')
+
+    @staticmethod
+    def _limpar():
+        sem_arquivo = [
+            chave for chave, caminho in XmlCacheNFe.objects.values_list('chave_acesso', 'caminho').iterator()
+            if not os.path.exists(os.path.join(settings.MEDIA_ROOT, caminho))
+        ]
+        for inicio in range(0, len(sem_arquivo), CHAVES_POR_CONSULTA):
+            XmlCacheNFe.objects.filter(chave_acesso__in=sem_arquivo[inicio:inicio + CHAVES_POR_CONSULTA]).delete()
+        return len(sem_arquivo)
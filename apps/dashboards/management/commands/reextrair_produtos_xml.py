@@ -0,0 +1,87 @@
+"""
+Refaz os produtos em cache (media/xml_cache) a partir dos XML armazenados (media/xml_nfe)
+
+Uso: python manage.py reextrair_produtos_xml [--gravar]
+
+Não consulta a API: serve para aplicar uma correção da extração a todos os XML
+já baixados. O tipo (entrada/saída) de cada chave vem do índice do cache
+(XmlCacheNFe) ou, sem ele, da tabela de produtos em que a chave aparece. Com
+--gravar substitui também os produtos já gravados (ProdutoSaidaAPI /
+ProdutoEntradaAPI) de cada empresa/período que tenha a chave. XML que não
+puder ser lido conta como erro e não altera nem o cache nem os produtos gravados.
+"""
+from collections import defaultdict
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from apps.dashboards import armazem_xml, meudanfe
+from apps.dashboards.busca_api import IND_OPER, MODELOS, gravar_produtos
+from apps.dashboards.models import XmlCacheNFe
+
+CHAVES_POR_BLOCO = 500
+
+
+class Command(BaseCommand):
+    help = 'Refaz o cache de produtos (e opcionalmente os produtos gravados) a partir dos XML armazenados'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gravar', action='store_true', help='Substitui os produtos gravados das chaves')
+
+    def handle(self, *args, **options):
+        chaves = armazem_xml.chaves_armazenadas()
+        pastas = {}
+        extraidos = gravados = erros = 0
+        while True:
+            bloco = list(islice(chaves, CHAVES_POR_BLOCO))
+            if not bloco:
+                break
+            ind_oper = dict(XmlCacheNFe.objects.filter(chave_acesso__in=bloco).values_list('chave_acesso', 'ind_oper'))
+            gravacoes = self._gravacoes(bloco)
+            for tipo, por_periodo in gravacoes.items():
+                for chave in {c for chaves_periodo in por_periodo.values() for c in chaves_periodo}:
+                    if not ind_oper.get(chave):
+                        ind_oper[chave] = IND_OPER[tipo]
+
+            produtos_por_chave = {}
+            for chave in bloco:
+                try:
+                    produtos = meudanfe.produtos_armazenados(chave, ind_oper.get(chave, ''), pastas=pastas)
+                except Exception as e:
+                    # Cache e produtos gravados da chave ficam como estão
+                    erros += 1
+                    self.stderr.write(f'{chave}: {e}')
+                    continue
+                if produtos is not None:
+                    produtos_por_chave[chave] = produtos
+                    extraidos += 1
+
+            if options['gravar']:
+                gravados += self._gravar(gravacoes, produtos_por_chave)
+
+        self.stdout.write(f'{extraidos} XML reextraído(s), {erros} com erro')
+        if options['gravar']:
+            self.stdout.write(f'{gravados} produto(s) gravado(s)')
+
+    @staticmethod
+    def _gravacoes(bloco):
+        """{tipo: {(empresa, período inicial, período final): [chaves]}} das chaves já gravadas"""
+        gravacoes = {}
+        for tipo, modelo in MODELOS.items():
+            por_periodo = defaultdict(set)
+            linhas = modelo.objects.filter(chave_nfe__in=bloco).values_list(
+                'empresa_id', 'periodo_inicial', 'periodo_final', 'chave_nfe',
+            ).distinct()
+            for empresa_id, periodo_inicial, periodo_final, chave in linhas:
+                por_periodo[(empresa_id, periodo_inicial, periodo_final)].add(chave)
+            gravacoes[tipo] = por_periodo
+        return gravacoes
+
+    @staticmethod
+    def _gravar(gravacoes, produtos_por_chave):
+        gravados = 0
+        for tipo, por_periodo in gravacoes.items():
+            for (empresa_id, periodo_inicial, periodo_final), chaves in por_periodo.items():
+                produtos = {chave: produtos_por_chave[chave] for chave in chaves if chave in produtos_por_chave}
+                gravados += gravar_produtos(MODELOS[tipo], empresa_id, periodo_inicial, periodo_final, produtos)
+        return gravados
@@ -0,0 +1,29 @@
+"""
+Worker das buscas de produtos via API MeuDanfe (BuscaProdutosAPI)
+
+Uso: python manage.py worker_busca_api [--uma-vez] [--intervalo 2]
+
+Reserva, batimento e recuperação das buscas ficam em apps.utilitarios.fila.
+O limite de requisições por segundo vale por processo (com N workers, o
+provedor recebe até N vezes MEUDANFE_REQUISICOES_POR_SEGUNDO). Buscas sem
+sinal de vida por BUSCA_API_TIMEOUT_MINUTOS voltam para a fila; as notas já
+gravadas não são consultadas de novo.
+"""
+import logging
+
+from apps.dashboards.busca_api import executar_busca
+from apps.dashboards.models import BuscaProdutosAPI
+from apps.utilitarios.fila import WorkerFila
+
+
+class Command(WorkerFila):
+    help = 'Processa a fila de buscas de produtos via API MeuDanfe (BuscaProdutosAPI)'
+    model = BuscaProdutosAPI
+    titulo = 'busca via API'
+    rotulo = 'Busca'
+    timeout = 'BUSCA_API_TIMEOUT_MINUTOS'
+    mensagem_interrompido = 'Busca interrompida repetidas vezes'
+    logger = logging.getLogger('dashboards.api')
+
+    def executar(self, busca):
+        executar_busca(busca)
@@ -0,0 +1,547 @@
+"""
+Cliente da API MeuDanfe (XML das NF-e pela chave de acesso)
+
+As consultas rodam em asyncio com httpx. Na busca em lote (consultar_chaves)
+ficam no máximo MEUDANFE_CONCORRENCIA notas em andamento, e as requisições ao
+mesmo provedor respeitam MEUDANFE_REQUISICOES_POR_SEGUNDO, limite
+compartilhado por todas as buscas do processo (LimiteRequisicoes). A URL base
+vem de MEUDANFE_URL, que nos testes aponta para um servidor local.
+
+Consultas sem XML também ficam registradas: a chave não encontrada (ou com
+erro) não é consultada de novo antes do prazo do resultado (ConsultaChaveAPI),
+e saldo insuficiente / API Key inválida pausam todas as consultas ao provedor
+(EstadoCotaAPI), sem gastar requisições que falhariam do mesmo jeito.
+
+Os XML baixados vão para o armazém (apps.dashboards.armazem_xml), consultado
+antes da API; também ficam aqui a extração dos produtos do XML e o cache local
+dos produtos extraídos (media/xml_cache).
+"""
+import asyncio
+import base64
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from apps.dashboards import armazem_xml
+from apps.dashboards.models import ConsultaChaveAPI, EstadoCotaAPI, XmlCacheNFe
+from apps.empresa.models import Empresa
+from apps.xml_manager.parser import produtos_nfe
+
+logger = logging.getLogger('dashboards.api')
+
+# Resultado de uma consulta
+ENCONTRADA = 'encontrada'
+NAO_ENCONTRADA = 'nao_encontrada'
+SEM_SALDO = 'sem_saldo'
+API_KEY_INVALIDA = 'api_key_invalida'
+ERRO = 'erro'
+# Resultados que interrompem a busca em lote (as próximas notas falhariam do mesmo jeito)
+INTERROMPEM_BUSCA = (SEM_SALDO, API_KEY_INVALIDA)
+
+STATUS_ENCONTRADA = ('FOUND', 'Found', 'found', 'OK', 'ok', 'SUCCESS', 'success')
+
+MENSAGEM_SEM_API_KEY = 'API Key da MeuDanfe não configurada (MEUDANFE_API_KEY no .env)'
+
+# Tentativas de cada requisição em falha de rede, 429 ou 5xx (esperando 1s, 2s, ...)
+TENTATIVAS = 3
+
+
+class LimiteRequisicoes:
+    """Intervalo mínimo entre requisições a um provedor (vale entre threads e event loops)"""
+
+    def __init__(self, por_segundo):
+        self.intervalo = 1 / por_segundo if por_segundo > 0 else 0
+        self._lock = threading.Lock()
+        self._proxima = 0.0
+
+    async def aguardar(self):
+        with self._lock:
+            agora = time.monotonic()
+            inicio = max(agora, self._proxima)
+            self._proxima = inicio + self.intervalo
+        if inicio > agora:
+            await asyncio.sleep(inicio - agora)
+
+
+_limites = {}
+_limites_lock = threading.Lock()
+
+
+def limite_provedor(url):
+    """LimiteRequisicoes do host da URL, criado na primeira busca"""
+    host = urlsplit(url).netloc
+    with _limites_lock:
+        if host not in _limites:
+            _limites[host] = LimiteRequisicoes(settings.MEUDANFE_REQUISICOES_POR_SEGUNDO)
+        return _limites[host]
+
+
+def novo_cliente():
+    if not settings.MEUDANFE_API_KEY:
+        raise ImproperlyConfigured(MENSAGEM_SEM_API_KEY)
+    return httpx.AsyncClient(
+        base_url=settings.MEUDANFE_URL,
+        headers={'Api-Key': settings.MEUDANFE_API_KEY, 'Content-Type': 'application/json'},
+        timeout=settings.MEUDANFE_TIMEOUT,
+        limits=httpx.Limits(max_connections=max(settings.MEUDANFE_CONCORRENCIA, 1)),
+    )
+
+
+def _resultado(chave_acesso, status, mensagem='', xml=None, armazenado=False):
+    return {'chave': chave_acesso, 'status': status, 'mensagem': mensagem, 'xml': xml, 'armazenado': armazenado}
+
+
+async def _requisitar(cliente, limite, metodo, url):
+    for tentativa in range(1, TENTATIVAS + 1):
+        await limite.aguardar()
+        try:
+            resposta = await cliente.request(metodo, url)
+        except httpx.TransportError:
+            if tentativa == TENTATIVAS:
+                raise
+        else:
+            if tentativa == TENTATIVAS or (resposta.status_code != 429 and resposta.status_code < 500):
+                return resposta
+        await asyncio.sleep(tentativa)
+
+
+def _xml_da_resposta(dados):
+    if (dados.get('data') or '').startswith('<?xml'):
+        return dados['data']
+    xml_base64 = dados.get('Base64') or dados.get('base64')
+    if xml_base64:
+        return base64.b64decode(xml_base64).decode('utf-8')
+    return None
+
+
+async def consultar_chave(cliente, limite, chave_acesso):
+    """
+    Adiciona a chave na MeuDanfe e baixa o XML; devolve {'chave', 'status', 'mensagem', 'xml', 'armazenado'}.
+    Chave com XML no armazém (já baixado antes) não vai à API: armazenado=True.
+    """
+    xml_armazenado = armazem_xml.ler_xml(chave_acesso)
+    if xml_armazenado is not None:
+        return _resultado(chave_acesso, ENCONTRADA, xml=xml_armazenado, armazenado=True)
+    if not settings.MEUDANFE_API_KEY:
+        return _resultado(chave_acesso, API_KEY_INVALIDA, MENSAGEM_SEM_API_KEY)
+
+    # NFC-e (modelo 65, posições 21-22 da chave) usa outro endpoint
+    rota = 'nfce' if chave_acesso[20:22] == '65' else 'fd'
+    num_nota = chave_acesso[25:34].lstrip('0')
+    try:
+        resposta = await _requisitar(cliente, limite, 'PUT', f'{rota}/add/{chave_acesso}')
+        if resposta.status_code == 402:
+            logger.error(f"[API-XML] NF {num_nota} - Saldo insuficiente")
+            return _resultado(chave_acesso, SEM_SALDO, 'Saldo insuficiente na API')
+        if resposta.status_code == 401:
+            logger.error(f"[API-XML] NF {num_nota} - API Key inválida")
+            return _resultado(chave_acesso, API_KEY_INVALIDA, 'API Key inválida')
+        if resposta.status_code != 200:
+            logger.error(f"[API-XML] NF {num_nota} - Erro HTTP: {resposta.status_code}")
+            return _resultado(chave_acesso, ERRO, f'Erro na API: {resposta.status_code}')
+
+        dados = resposta.json()
+        status_busca = dados.get('SearchStatus') or dados.get('searchStatus') or dados.get('status')
+        if status_busca not in STATUS_ENCONTRADA:
+            logger.warning(f"[API-XML] NF {num_nota} - Não encontrada: {status_busca}")
+            return _resultado(chave_acesso, NAO_ENCONTRADA, f'NFe não encontrada: {status_busca}')
+
+        resposta_xml = await _requisitar(cliente, limite, 'GET', f'{rota}/get/xml/{chave_acesso}')
+        if resposta_xml.status_code != 200:
+            return _resultado(chave_acesso, ERRO, f'Erro ao buscar XML: {resposta_xml.status_code}')
+        xml_content = _xml_da_resposta(resposta_xml.json())
+        if not xml_content:
+            return _resultado(chave_acesso, ERRO, 'XML não retornado pela API')
+        return _resultado(chave_acesso, ENCONTRADA, xml=xml_content)
+    except Exception as e:
+        logger.error(f"[API-XML] NF {num_nota} - Exceção: {e}")
+        return _resultado(chave_acesso, ERRO, f'Erro: {e}')
+
+
+async def _consultar_lote(notas, conhecidas, bloqueio):
+    parar = False
+    limite = limite_provedor(settings.MEUDANFE_URL)
+    pendentes = iter(notas)
+    resultados = []
+    consultadas = []
+
+    async def consultar(cliente, chave_acesso):
+        # XML no armazém vale mesmo com a chave ou o provedor bloqueados (ex.: importado de um ZIP)
+        if not armazem_xml.existe_xml(chave_acesso):
+            if chave_acesso in conhecidas:
+                return conhecidas[chave_acesso]
+            if bloqueio:
+                return {**bloqueio, 'chave': chave_acesso}
+        resultado = await consultar_chave(cliente, limite, chave_acesso)
+        if not resultado['armazenado']:
+            consultadas.append(resultado)
+        return resultado
+
+    async def consultar_pendentes(cliente):
+        nonlocal parar
+        for nota in pendentes:
+            if parar:
+                return
+            resultado = await consultar(cliente, nota['chave_nfe'])
+            # Devolução sem XML próprio: tenta a nota referenciada (C113)
+            if resultado['status'] == NAO_ENCONTRADA and nota.get('chave_referenciada'):
+                resultado = await consultar(cliente, nota['chave_referenciada'])
+            if resultado['status'] in INTERROMPEM_BUSCA:
+                parar = True
+            resultados.append((nota, resultado))
+
+    # Sem API Key o bloqueio responde por toda nota que não esteja no armazém
+    contexto = novo_cliente() if settings.MEUDANFE_API_KEY else contextlib.nullcontext()
+    async with contexto as cliente:
+        await asyncio.gather(*(consultar_pendentes(cliente) for _ in range(max(settings.MEUDANFE_CONCORRENCIA, 1))))
+    return resultados, consultadas
+
+
+def consultar_chaves(notas):
+    """
+    Consulta as notas ({'chave_nfe', 'chave_referenciada'}) com no máximo
+    MEUDANFE_CONCORRENCIA em andamento; devolve [(nota, resultado)] na ordem em
+    que terminaram. Após saldo insuficiente / API Key inválida nenhuma nota nova
+    é iniciada, e as que não foram consultadas ficam fora da lista.
+
+    Chaves consultadas sem XML há pouco (falhas_recentes) não vão à API, e com o
+    provedor bloqueado (bloqueio_cota) ou sem MEUDANFE_API_KEY nenhuma vai: a
+    primeira nota já volta com o resultado do bloqueio.
+    """
+    chaves = [nota['chave_nfe'] for nota in notas] + [
+        nota['chave_referenciada'] for nota in notas if nota.get('chave_referenciada')
+    ]
+    if settings.MEUDANFE_API_KEY:
+        bloqueio = bloqueio_cota()
+    else:
+        logger.error(f"[API-XML] {MENSAGEM_SEM_API_KEY}")
+        bloqueio = _resultado('', API_KEY_INVALIDA, MENSAGEM_SEM_API_KEY)
+    resultados, consultadas = asyncio.run(_consultar_lote(notas, falhas_recentes(chaves), bloqueio))
+    registrar_consultas(consultadas)
+    return resultados
+
+
+def consultar_chave_sincrona(chave_acesso):
+    """Consulta de uma chave fora de um event loop (uma nota por request), com as mesmas regras de consultar_chaves"""
+    return consultar_chaves([{'chave_nfe': chave_acesso}])[0][1]
+
+
+# ========================================
+# RESULTADOS ANTERIORES (ConsultaChaveAPI / EstadoCotaAPI)
+# ========================================
+
+def _provedor():
+    return urlsplit(settings.MEUDANFE_URL).netloc
+
+
+def _resumo_api_key():
+    return hashlib.sha1(settings.MEUDANFE_API_KEY.encode()).hexdigest()
+
+
+def _prazos():
+    """Tempo até a nova consulta de uma chave, por resultado"""
+    return {
+        NAO_ENCONTRADA: timedelta(hours=settings.MEUDANFE_REPETIR_NAO_ENCONTRADA_HORAS),
+        ERRO: timedelta(minutes=settings.MEUDANFE_REPETIR_ERRO_MINUTOS),
+        # Saldo e API Key não dizem nada da chave: o bloqueio é do provedor (EstadoCotaAPI)
+        SEM_SALDO: timedelta(0),
+        API_KEY_INVALIDA: timedelta(0),
+    }
+
+
+def bloqueio_cota():
+    """Resultado de saldo insuficiente / API Key inválida enquanto o provedor estiver bloqueado, senão None"""
+    estado = EstadoCotaAPI.objects.filter(provedor=_provedor(), bloqueado_ate__gt=timezone.now()).first()
+    # Trocar a API Key nas configurações libera as consultas na hora
+    if estado is None or (estado.status == API_KEY_INVALIDA and estado.api_key != _resumo_api_key()):
+        return None
+    ate = timezone.localtime(estado.bloqueado_ate)
+    return _resultado('', estado.status, f"{estado.mensagem} (nova tentativa após {ate:%d/%m %H:%M})")
+
+
+def falhas_recentes(chaves):
+    """{chave: resultado da última consulta} das chaves consultadas sem XML ainda dentro do prazo"""
+    chaves = list(chaves)
+    agora = timezone.now()
+    falhas = {}
+    for inicio in range(0, len(chaves), CHAVES_POR_CONSULTA):
+        consultas = ConsultaChaveAPI.objects.filter(
+            chave_acesso__in=chaves[inicio:inicio + CHAVES_POR_CONSULTA], repetir_em__gt=agora,
+        )
+        for consulta in consultas:
+            consultada = timezone.localtime(consulta.consultado_em)
+            repetir = timezone.localtime(consulta.repetir_em)
+            falhas[consulta.chave_acesso] = _resultado(
+                consulta.chave_acesso,
+                consulta.status,
+                f"{consulta.mensagem} (consultada em {consultada:%d/%m %H:%M}; nova consulta após {repetir:%d/%m %H:%M})",
+            )
+    return falhas
+
+
+def registrar_consultas(resultados):
+    """
+    Guarda o resultado das consultas feitas à API: a chave sem XML fica em
+    ConsultaChaveAPI até o prazo do resultado; saldo insuficiente / API Key
+    inválida bloqueiam o provedor por MEUDANFE_PAUSA_COTA_MINUTOS.
+    """
+    if not resultados:
+        return
+    agora = timezone.now()
+    prazos = _prazos()
+    encontradas = [resultado['chave'] for resultado in resultados if resultado['status'] == ENCONTRADA]
+    sem_xml = {resultado['chave']: resultado for resultado in resultados if resultado['status'] != ENCONTRADA}
+    if encontradas:
+        ConsultaChaveAPI.objects.filter(chave_acesso__in=encontradas).delete()
+    if sem_xml:
+        tentativas = dict(
+            ConsultaChaveAPI.objects.filter(chave_acesso__in=list(sem_xml)).values_list('chave_acesso', 'tentativas')
+        )
+        ConsultaChaveAPI.objects.bulk_create(
+            [
+                ConsultaChaveAPI(
+                    chave_acesso=chave,
+                    status=resultado['status'],
+                    mensagem=resultado['mensagem'][:255],
+                    tentativas=tentativas.get(chave, 0) + 1,
+                    consultado_em=agora,
+                    repetir_em=agora + prazos[resultado['status']],
+                )
+                for chave, resultado in sem_xml.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['chave_acesso'],
+            update_fields=['status', 'mensagem', 'tentativas', 'consultado_em', 'repetir_em'],
+        )
+
+    bloqueio = next((resultado for resultado in resultados if resultado['status'] in INTERROMPEM_BUSCA), None)
+    if bloqueio:
+        EstadoCotaAPI.objects.update_or_create(provedor=_provedor(), defaults={
+            'status': bloqueio['status'],
+            'mensagem': bloqueio['mensagem'],
+            'api_key': _resumo_api_key(),
+            'bloqueado_ate': agora + timedelta(minutes=settings.MEUDANFE_PAUSA_COTA_MINUTOS),
+        })
+        logger.warning(f"[API-XML] {bloqueio['mensagem']}: consultas pausadas por {settings.MEUDANFE_PAUSA_COTA_MINUTOS:g} min")
+    elif any(resultado['status'] in (ENCONTRADA, NAO_ENCONTRADA) for resultado in resultados):
+        # O provedor voltou a responder normalmente
+        EstadoCotaAPI.objects.filter(provedor=_provedor()).delete()
+
+
+# ========================================
+# CACHE LOCAL DOS PRODUTOS (media/xml_cache)
+# ========================================
+# Arquivos em xml_cache/{empresa}/{AAAA-MM}/{entrada|saida|outros}/{chave}.json; o índice
+# XmlCacheNFe guarda onde está cada chave, então a leitura não depende do nome da pasta
+# (que muda se a empresa for renomeada). Arquivos anteriores ao índice são indexados
+# pela migração que cria o XmlCacheNFe e por python manage.py indexar_xml_cache
+
+TIPOS_CACHE = {'0': 'entrada', '1': 'saida'}
+IND_OPER_PASTA = {pasta: ind_oper for ind_oper, pasta in TIPOS_CACHE.items()}
+# Chaves por consulta ao índice (limite de parâmetros do SQLite)
+CHAVES_POR_CONSULTA = 5000
+
+
+def _pasta_empresa(cnpj_chave, pastas=None):
+    """Pasta do emitente no cache (razão social da empresa cadastrada ou o CNPJ da chave)"""
+    raiz = cnpj_chave[:8]
+    if pastas is not None and raiz in pastas:
+        return pastas[raiz]
+    try:
+        empresa = Empresa.objects.filter(cnpj_cpf__startswith=raiz).first()
+        nome_pasta = re.sub(r'[<>:"/\\|?*\n\r]', '_', (empresa.razao_social[:80] if empresa else cnpj_chave)).strip('. ')
+    except Exception:
+        nome_pasta = cnpj_chave
+    if pastas is not None:
+        pastas[raiz] = nome_pasta
+    return nome_pasta
+
+
+def _caminho_cache(chave_acesso, ind_oper, pastas=None):
+    """Arquivo da chave relativo a MEDIA_ROOT (separado por '/', como fica no índice)"""
+    aamm = chave_acesso[2:6]
+    return '/'.join([
+        'xml_cache',
+        _pasta_empresa(chave_acesso[6:20], pastas),
+        f"20{aamm[:2]}-{aamm[2:]}",
+        TIPOS_CACHE.get(ind_oper, 'outros'),
+        f"{chave_acesso}.json",
+    ])
+
+
+def _indexar(modelo, lote):
+    # A mesma chave pode aparecer em mais de uma pasta: fica a última encontrada
+    por_chave = {item.chave_acesso: item for item in lote}
+    modelo.objects.bulk_create(
+        por_chave.values(),
+        update_conflicts=True,
+        unique_fields=['chave_acesso'],
+        update_fields=['caminho', 'ind_oper', 'tamanho', 'buscado_em'],
+    )
+    return len(por_chave)
+
+
+def indexar_arquivos_cache(modelo=XmlCacheNFe):
+    """
+    Grava (ou atualiza) no índice a linha de cada arquivo existente em
+    media/xml_cache; a data da busca é a de modificação do arquivo. modelo é o
+    XmlCacheNFe (ou o da migração). Retorna quantas chaves foram indexadas.
+    """
+    raiz = os.path.join(settings.MEDIA_ROOT, 'xml_cache')
+    lote = []
+    indexados = 0
+    for pasta, _, arquivos in os.walk(raiz):
+        for nome in arquivos:
+            chave, extensao = os.path.splitext(nome)
+            if extensao != '.json' or len(chave) != 44 or not chave.isdigit():
+                continue
+            caminho = os.path.join(pasta, nome)
+            info = os.stat(caminho)
+            lote.append(modelo(
+                chave_acesso=chave,
+                caminho=os.path.relpath(caminho, settings.MEDIA_ROOT).replace(os.sep, '/'),
+                ind_oper=IND_OPER_PASTA.get(os.path.basename(pasta), ''),
+                tamanho=info.st_size,
+                buscado_em=datetime.fromtimestamp(info.st_mtime, tz=dt_timezone.utc),
+            ))
+            if len(lote) >= settings.SPED_BULK_BATCH_SIZE:
+                indexados += _indexar(modelo, lote)
+                lote = []
+    if lote:
+        indexados += _indexar(modelo, lote)
+    return indexados
+
+
+def caminhos_cache_xml(chaves):
+    """{chave: caminho do arquivo} das chaves com cache, num SELECT por bloco de chaves"""
+    chaves = list(dict.fromkeys(chaves))
+    caminhos = {}
+    for inicio in range(0, len(chaves), CHAVES_POR_CONSULTA):
+        indexadas = XmlCacheNFe.objects.filter(
+            chave_acesso__in=chaves[inicio:inicio + CHAVES_POR_CONSULTA]
+        ).values_list('chave_acesso', 'caminho')
+        for chave, caminho in indexadas:
+            caminhos[chave] = os.path.join(settings.MEDIA_ROOT, caminho)
+    return caminhos
+
+
+def buscar_cache_xml(chave_acesso):
+    """Caminho do cache de produtos da chave, ou None"""
+    return caminhos_cache_xml([chave_acesso]).get(chave_acesso)
+
+
+def ler_caches_xml(chaves):
+    """{chave: produtos} das chaves com cache; arquivos apagados saem do índice"""
+    produtos = {}
+    apagados = []
+    for chave, caminho in caminhos_cache_xml(chaves).items():
+        try:
+            with open(caminho, 'r', encoding='utf-8') as f:
+                produtos[chave] = json.load(f).get('produtos', [])
+        except FileNotFoundError:
+            apagados.append(chave)
+        except Exception as e:
+            logger.warning(f"[API-XML] {chave} - Cache corrompido, rebuscando: {e}")
+    if apagados:
+        XmlCacheNFe.objects.filter(chave_acesso__in=apagados).delete()
+    return produtos
+
+
+def ler_cache_xml(chave_acesso):
+    """Produtos em cache da chave, ou None (sem cache ou arquivo corrompido)"""
+    return ler_caches_xml([chave_acesso]).get(chave_acesso)
+
+
+def salvar_caches_xml(notas, pastas=None):
+    """
+    Salva os produtos de várias notas em cache (media/xml_cache/{empresa}/{YYYY-MM}/{entrada|saida}/)
+    e indexa as chaves de uma vez; notas: [(chave, ind_oper, produtos, num_nota)]
+    """
+    agora = timezone.now()
+    indice = []
+    for chave_acesso, ind_oper, produtos, num_nota in notas:
+        if len(chave_acesso) < 20:
+            continue
+        caminho = _caminho_cache(chave_acesso, ind_oper, pastas)
+        cache_path = os.path.join(settings.MEDIA_ROOT, caminho)
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        try:
+            # Valores em Decimal vão como texto (sem perder casas decimais). Sem indent o
+            # json usa o encoder em C (json.dump com indent é bem mais lento)
+            conteudo = json.dumps({
+                'chave': chave_acesso,
+                'num_nota': num_nota,
+                'produtos': produtos,
+            }, ensure_ascii=False, default=str)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                f.write(conteudo)
+            indice.append(XmlCacheNFe(
+                chave_acesso=chave_acesso,
+                caminho=caminho,
+                ind_oper=ind_oper if ind_oper in TIPOS_CACHE else '',
+                tamanho=os.path.getsize(cache_path),
+                buscado_em=agora,
+            ))
+            logger.debug(f"[API-XML] NF {num_nota} - 💾 Cache salvo em {caminho.split('/')[-2]}/")
+        except Exception as e:
+            logger.warning(f"[API-XML] NF {num_nota} - Erro ao salvar cache: {e}")
+    if indice:
+        XmlCacheNFe.objects.bulk_create(
+            indice,
+            update_conflicts=True,
+            unique_fields=['chave_acesso'],
+            update_fields=['caminho', 'ind_oper', 'tamanho', 'buscado_em'],
+            batch_size=settings.SPED_BULK_BATCH_SIZE,
+        )
+    return len(indice)
+
+
+def salvar_cache_xml(chave_acesso, ind_oper, produtos, num_nota='', pastas=None):
+    """Salva os produtos de uma nota em cache e indexa a chave"""
+    salvar_caches_xml([(chave_acesso, ind_oper, produtos, num_nota)], pastas)
+
+
+def registrar_xml(resultado, ind_oper, num_nota='', pastas=None):
+    """
+    Produtos do XML de uma consulta encontrada; guarda o XML no armazém (se veio
+    da API) e os produtos no cache. Erro na leitura do XML é propagado, sem
+    alterar o cache (uma lista vazia ali substituiria os produtos bons)
+    """
+    chave_acesso = resultado['chave']
+    if not resultado['armazenado']:
+        try:
+            armazem_xml.salvar_xml(chave_acesso, resultado['xml'])
+        except Exception as e:
+            logger.warning(f"[API-XML] NF {num_nota} - Erro ao armazenar XML: {e}")
+    produtos = extrair_produtos_xml(resultado['xml'], chave_acesso)
+    salvar_cache_xml(chave_acesso, ind_oper, produtos, num_nota, pastas)
+    return produtos
+
+
+def produtos_armazenados(chave_acesso, ind_oper, num_nota='', pastas=None):
+    """Produtos extraídos do XML já armazenado da chave (refazendo o cache), ou None sem XML; erro de leitura é propagado"""
+    xml_content = armazem_xml.ler_xml(chave_acesso)
+    if xml_content is None:
+        return None
+    return registrar_xml(_resultado(chave_acesso, ENCONTRADA, xml=xml_content, armazenado=True), ind_oper, num_nota, pastas)
+
+
+def extrair_produtos_xml(xml_content, chave_acesso):
+    """Extrai dados dos produtos de um XML de NFe (valores em Decimal); XML inválido ou que não é de NF-e levanta exceção"""
+    try:
+        return produtos_nfe(xml_content, chave_acesso)
+    except Exception as e:
+        logger.warning(f"[API-XML] {chave_acesso} - Erro ao extrair produtos do XML: {e}")
+        raise
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboards', '0003_produtoentradaapi'),
+        ('empresa', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BuscaProdutosAPI',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo_inicial', models.CharField(max_length=7, verbose_name='Período Inicial')),
+                ('periodo_final', models.CharField(max_length=7, verbose_name='Período Final')),
+                ('tipo', models.CharField(choices=[('entrada', 'Entradas sem itens (C170)'), ('saida', 'Saídas')], max_length=10)),
+                ('status', models.CharField(choices=[('pendente', 'Na fila'), ('processando', 'Processando'), ('concluido', 'Concluída'), ('pausado', 'Pausada (saldo insuficiente)'), ('cancelado', 'Cancelada'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('cancelar', models.BooleanField(default=False, verbose_name='Cancelamento solicitado')),
+                ('chaves_total', models.PositiveIntegerField(default=0, verbose_name='Notas a buscar')),
+                ('chaves_ja_gravadas', models.PositiveIntegerField(default=0, verbose_name='Notas já gravadas no período')),
+                ('chaves_processadas', models.PositiveIntegerField(default=0)),
+                ('sucesso', models.PositiveIntegerField(default=0)),
+                ('do_cache', models.PositiveIntegerField(default=0, verbose_name='Notas lidas do cache local')),
+                ('erros', models.PositiveIntegerField(default=0)),
+                ('produtos', models.PositiveIntegerField(default=0, verbose_name='Produtos gravados')),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('relatorio', models.JSONField(blank=True, default=dict, verbose_name='NF-e com erro e NFC-e ignoradas')),
+                ('mensagem', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='buscas_produtos_api', to='empresa.empresa')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Busca de Produtos via API',
+                'verbose_name_plural': 'Buscas de Produtos via API',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='dashboards__status_ac5b2b_idx'), models.Index(fields=['empresa', 'periodo_inicial', 'periodo_final', 'tipo'], name='dashboards__empresa_2891b3_idx')],
+            },
+        ),
+    ]
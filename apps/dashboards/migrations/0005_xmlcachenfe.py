@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:11
+
+from django.db import migrations, models
+
+
+def indexar_cache_existente(apps, schema_editor):
+    # Arquivos gravados antes do índice seriam ignorados pela leitura (e consultados de novo na API)
+    from apps.dashboards.meudanfe import indexar_arquivos_cache
+
+    indexar_arquivos_cache(apps.get_model('dashboards', 'XmlCacheNFe'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboards', '0004_buscaprodutosapi'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='XmlCacheNFe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave_acesso', models.CharField(max_length=44, unique=True, verbose_name='Chave de Acesso')),
+                ('caminho', models.CharField(max_length=500, verbose_name='Arquivo (relativo a MEDIA_ROOT)')),
+                ('ind_oper', models.CharField(blank=True, max_length=1, verbose_name='Indicador de Operação')),
+                ('tamanho', models.PositiveIntegerField(default=0, verbose_name='Tamanho (bytes)')),
+                ('buscado_em', models.DateTimeField(verbose_name='Buscado em')),
+            ],
+            options={
+                'verbose_name': 'Cache de XML NF-e',
+                'verbose_name_plural': 'Cache de XML NF-e',
+            },
+        ),
+        migrations.RunPython(indexar_cache_existente, migrations.RunPython.noop),
+    ]
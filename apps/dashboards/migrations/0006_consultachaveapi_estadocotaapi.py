@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboards', '0005_xmlcachenfe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultaChaveAPI',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave_acesso', models.CharField(max_length=44, unique=True, verbose_name='Chave de Acesso')),
+                ('status', models.CharField(choices=[('nao_encontrada', 'Não encontrada'), ('erro', 'Erro'), ('sem_saldo', 'Saldo insuficiente'), ('api_key_invalida', 'API Key inválida')], max_length=20)),
+                ('mensagem', models.CharField(blank=True, max_length=255)),
+                ('tentativas', models.PositiveIntegerField(default=1, verbose_name='Consultas sem XML')),
+                ('consultado_em', models.DateTimeField(verbose_name='Consultada em')),
+                ('repetir_em', models.DateTimeField(verbose_name='Nova consulta a partir de')),
+            ],
+            options={
+                'verbose_name': 'Consulta de Chave na API',
+                'verbose_name_plural': 'Consultas de Chaves na API',
+            },
+        ),
+        migrations.CreateModel(
+            name='EstadoCotaAPI',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provedor', models.CharField(max_length=255, unique=True)),
+                ('status', models.CharField(choices=[('sem_saldo', 'Saldo insuficiente'), ('api_key_invalida', 'API Key inválida')], max_length=20)),
+                ('mensagem', models.CharField(blank=True, max_length=255)),
+                ('api_key', models.CharField(blank=True, max_length=40, verbose_name='API Key (SHA-1)')),
+                ('bloqueado_ate', models.DateTimeField(verbose_name='Bloqueado até')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Estado da Cota da API',
+                'verbose_name_plural': 'Estado da Cota da API',
+            },
+        ),
+    ]
@@ -1,3 +1,4 @@
+from django.conf import settings
 from django.db import models
 from apps.empresa.models import Empresa
 
@@ -110,4 +111,130 @@ class AjusteManualICMS(models.Model):
         ordering = ['codigo']
 
     def __str__(self):
-        return f"{self.codigo} - R$ {self.valor}"
\ No newline at end of file
+        return f"{self.codigo} - R$ {self.valor}"
+
+class BuscaProdutosAPI(models.Model):
+    """Busca em lote dos produtos via API MeuDanfe, executada pelo worker (manage.py worker_busca_api)"""
+    TIPO_CHOICES = [
+        ('entrada', 'Entradas sem itens (C170)'),
+        ('saida', 'Saídas'),
+    ]
+    STATUS_CHOICES = [
+        ('pendente', 'Na fila'),
+        ('processando', 'Processando'),
+        ('concluido', 'Concluída'),
+        ('pausado', 'Pausada (saldo insuficiente)'),
+        ('cancelado', 'Cancelada'),
+        ('erro', 'Erro'),
+    ]
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='buscas_produtos_api')
+    periodo_inicial = models.CharField('Período Inicial', max_length=7)
+    periodo_final = models.CharField('Período Final', max_length=7)
+    tipo = models.CharField(max_length=10, choices=TIPO_CHOICES)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    cancelar = models.BooleanField('Cancelamento solicitado', default=False)
+    chaves_total = models.PositiveIntegerField('Notas a buscar', default=0)
+    chaves_ja_gravadas = models.PositiveIntegerField('Notas já gravadas no período', default=0)
+    chaves_processadas = models.PositiveIntegerField(default=0)
+    sucesso = models.PositiveIntegerField(default=0)
+    do_cache = models.PositiveIntegerField('Notas lidas do cache local', default=0)
+    erros = models.PositiveIntegerField(default=0)
+    produtos = models.PositiveIntegerField('Produtos gravados', default=0)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    relatorio = models.JSONField('NF-e com erro e NFC-e ignoradas', default=dict, blank=True)
+    mensagem = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    finalizado_em = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Busca de Produtos via API'
+        verbose_name_plural = 'Buscas de Produtos via API'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['empresa', 'periodo_inicial', 'periodo_final', 'tipo']),
+        ]
+
+    def __str__(self):
+        return f"Busca {self.id} - {self.get_tipo_display()} {self.periodo_inicial} a {self.periodo_final} - {self.get_status_display()}"
+
+    @property
+    def ativa(self):
+        return self.status in ('pendente', 'processando')
+
+
+class XmlCacheNFe(models.Model):
+    """Índice do cache local de produtos por NF-e (media/xml_cache), uma linha por chave de acesso"""
+    chave_acesso = models.CharField('Chave de Acesso', max_length=44, unique=True)
+    caminho = models.CharField('Arquivo (relativo a MEDIA_ROOT)', max_length=500)
+    ind_oper = models.CharField('Indicador de Operação', max_length=1, blank=True)
+    tamanho = models.PositiveIntegerField('Tamanho (bytes)', default=0)
+    buscado_em = models.DateTimeField('Buscado em')
+
+    class Meta:
+        verbose_name = 'Cache de XML NF-e'
+        verbose_name_plural = 'Cache de XML NF-e'
+
+    def __str__(self):
+        return f"{self.chave_acesso} - {self.caminho}"
+
+
+class ConsultaChaveAPI(models.Model):
+    """
+    Última consulta sem XML de cada chave na API MeuDanfe. Até repetir_em a
+    chave não é consultada de novo (o prazo depende do resultado); a chave
+    encontrada sai da tabela, já que o XML fica no armazém.
+    """
+    STATUS_CHOICES = [
+        ('nao_encontrada', 'Não encontrada'),
+        ('erro', 'Erro'),
+        ('sem_saldo', 'Saldo insuficiente'),
+        ('api_key_invalida', 'API Key inválida'),
+    ]
+
+    chave_acesso = models.CharField('Chave de Acesso', max_length=44, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    mensagem = models.CharField(max_length=255, blank=True)
+    tentativas = models.PositiveIntegerField('Consultas sem XML', default=1)
+    consultado_em = models.DateTimeField('Consultada em')
+    repetir_em = models.DateTimeField('Nova consulta a partir de')
+
+    class Meta:
+        verbose_name = 'Consulta de Chave na API'
+        verbose_name_plural = 'Consultas de Chaves na API'
+
+    def __str__(self):
+        return f"{self.chave_acesso} - {self.get_status_display()}"
+
+
+class EstadoCotaAPI(models.Model):
+    """
+    Bloqueio das consultas a um provedor (host da MEUDANFE_URL) depois de
+    saldo insuficiente ou API Key inválida; vale para todos os processos
+    até bloqueado_ate.
+    """
+    STATUS_CHOICES = [
+        ('sem_saldo', 'Saldo insuficiente'),
+        ('api_key_invalida', 'API Key inválida'),
+    ]
+
+    provedor = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    mensagem = models.CharField(max_length=255, blank=True)
+    # Resumo da API Key bloqueada: trocar a chave nas configurações libera as consultas
+    api_key = models.CharField('API Key (SHA-1)', max_length=40, blank=True)
+    bloqueado_ate = models.DateTimeField('Bloqueado até')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Estado da Cota da API'
+        verbose_name_plural = 'Estado da Cota da API'
+
+    def __str__(self):
+        return f"{self.provedor} - {self.get_status_display()} até {self.bloqueado_ate:%d/%m/%Y %H:%M}"
@@ -0,0 +1,592 @@
+"""
+Seções do relatório fiscal
+
+Cada seção (produtos, fornecedores, CFOPs, UFs e ajustes de ICMS) é calculada
+por um serviço independente, que faz só as consultas de que precisa, e fica em
+cache com a própria chave (cache_relatorio.obter_secoes). A página abre só com
+o filtro e as abas; cada aba busca as suas seções em api_secao_relatorio_fiscal
+quando é aberta. A composição por NF é paginada no banco (ver composicao.py).
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from functools import cached_property
+
+from django.db.models import Max, Sum
+
+from apps.dashboards.agregacoes import (
+    SUFIXOS_COMPRA_EFETIVA, SUFIXOS_CONSUMO, SUFIXOS_VENDA_EFETIVA, classificar_documentos,
+    documentos_por_participante, itens_0200_por_codigo, participantes_por_codigo, pis_cofins_por_cfop,
+    produtos_entrada, produtos_saida, somar_campos,
+)
+from apps.dashboards.models import AjusteManualICMS, ProdutoEntradaAPI, ProdutoSaidaAPI
+from apps.dashboards.simulacao import formatar_valor, perc_reducao_ncm
+from apps.empresa.models import Empresa
+
+TIPOS_AJUSTE = {
+    '0': '0 – Outros débitos',
+    '1': '1 – Estorno de créditos',
+    '2': '2 – Outros créditos',
+    '3': '3 – Estorno de débitos',
+    '4': '4 – Deduções do imposto apurado',
+    '5': '5 – Débito especial',
+}
+
+
+class ConsultaRelatorio:
+    """Filtro do relatório e as consultas compartilhadas pelas seções (feitas só quando usadas)"""
+
+    def __init__(self, empresa_id, periodo_inicial, periodo_final, agrupar_filiais):
+        self.empresa_id = empresa_id
+        self.periodo_inicial = periodo_inicial
+        self.periodo_final = periodo_final
+        self.agrupar_filiais = agrupar_filiais
+
+    @cached_property
+    def registros_0000(self):
+        from apps.sped.models import Registro0000
+
+        empresas = {'empresa_id': self.empresa_id}
+        if self.agrupar_filiais:
+            empresa = Empresa.objects.get(id=self.empresa_id)
+            cnpj_base = empresa.cnpj_cpf[:8] if empresa.cnpj_cpf else ''
+            empresas = {'empresa__in': Empresa.objects.filter(cnpj_cpf__startswith=cnpj_base)}
+        return Registro0000.objects.filter(
+            processado=True,
+            periodo__gte=self.periodo_inicial + '-01',
+            periodo__lte=self.periodo_final + '-28',
+            **empresas,
+        )
+
+    def resumos_itens(self, ind_oper):
+        from apps.sped.models import ResumoItem
+        return ResumoItem.objects.filter(registro_0000__in=self.registros_0000, ind_oper=ind_oper)
+
+    def documentos(self, ind_oper):
+        """Documentos C100 (0=Entrada, 1=Saída)"""
+        from apps.sped.models import RegistroC100
+        return RegistroC100.objects.filter(registro_0000__in=self.registros_0000, ind_oper=ind_oper)
+
+    @cached_property
+    def totais_participantes(self):
+        """Documentos de entrada somados por cod_part"""
+        from apps.sped.models import ResumoDocumento
+
+        resumos = ResumoDocumento.objects.filter(registro_0000__in=self.registros_0000, ind_oper='0')
+        return documentos_por_participante(resumos)
+
+    @cached_property
+    def participantes(self):
+        return participantes_por_codigo(self.registros_0000)
+
+    @cached_property
+    def itens_0200(self):
+        return itens_0200_por_codigo(self.registros_0000)
+
+    @cached_property
+    def c190_entrada(self):
+        from apps.sped.models import RegistroC190
+        return RegistroC190.objects.filter(registro_c100__in=self.documentos('0')).exclude(cfop='')
+
+    @cached_property
+    def produtos_entrada_api(self):
+        """Produtos de entrada salvos via API (docs sem C170)"""
+        return list(ProdutoEntradaAPI.objects.filter(
+            empresa_id=self.empresa_id,
+            periodo_inicial=self.periodo_inicial,
+            periodo_final=self.periodo_final
+        ))
+
+
+def _somar_produtos_entrada_api(produtos_dict, produtos_api, sufixos):
+    """Soma os produtos da API com CFOP de entrada (1xxx/2xxx) nos sufixos informados"""
+    for prod in produtos_api:
+        cfop_api = (prod.cfop or '').replace('.', '').strip()
+        if len(cfop_api) < 4 or cfop_api[0] not in ('1', '2'):
+            continue
+        sufixo_api = cfop_api[1:]
+        if sufixo_api not in sufixos:
+            continue
+        cod = prod.codigo
+        if cod not in produtos_dict:
+            produtos_dict[cod] = {
+                'codigo': cod,
+                'descricao': prod.descricao,
+                'ncm': prod.ncm,
+                'cfops': set(),
+                'quantidade': Decimal('0'),
+                'valor_total': Decimal('0'),
+                'icms': Decimal('0'),
+                'icms_st': Decimal('0'),
+                'ipi': Decimal('0'),
+                'pis': Decimal('0'),
+                'cofins': Decimal('0'),
+                'vl_bc_icms': Decimal('0'),
+                'vl_bc_pis': Decimal('0'),
+                'vl_bc_cofins': Decimal('0'),
+                'regras_reforma': [],
+            }
+        produtos_dict[cod]['quantidade'] += prod.quantidade or Decimal('0')
+        produtos_dict[cod]['valor_total'] += prod.valor_total or Decimal('0')
+        produtos_dict[cod]['icms'] += prod.icms_valor or Decimal('0')
+        produtos_dict[cod]['icms_st'] += prod.icms_st_valor or Decimal('0')
+        produtos_dict[cod]['ipi'] += prod.ipi_valor or Decimal('0')
+        produtos_dict[cod]['pis'] += prod.pis_valor or Decimal('0')
+        produtos_dict[cod]['cofins'] += prod.cofins_valor or Decimal('0')
+        produtos_dict[cod]['cfops'].add(cfop_api)
+
+
+def _produtos_saidas_api(consulta):
+    """Produtos de saída salvos via API, agrupados por código + NCM (usados quando o SPED não tem itens)"""
+    produtos_api_db = ProdutoSaidaAPI.objects.filter(
+        empresa_id=consulta.empresa_id,
+        periodo_inicial=consulta.periodo_inicial,
+        periodo_final=consulta.periodo_final
+    )
+    produtos_api_dict = {}
+    for prod in produtos_api_db:
+        # Filtrar apenas CFOPs de venda efetiva nos produtos da API
+        cfop_api_s = (prod.cfop or '').replace('.', '').strip()
+        sufixo_api_s = cfop_api_s[1:] if len(cfop_api_s) >= 4 else ''
+        if sufixo_api_s not in SUFIXOS_VENDA_EFETIVA:
+            continue
+        chave = f"{prod.codigo}_{prod.ncm}"
+        if chave not in produtos_api_dict:
+            produtos_api_dict[chave] = {
+                'chave_nfe': prod.chave_nfe,
+                'codigo': prod.codigo,
+                'descricao': prod.descricao,
+                'ncm': prod.ncm,
+                'cfop': prod.cfop,
+                'quantidade': Decimal('0'),
+                'valor_total': Decimal('0'),
+                'icms': Decimal('0'),
+                'icms_st': Decimal('0'),
+                'ipi': Decimal('0'),
+                'pis': Decimal('0'),
+                'cofins': Decimal('0'),
+            }
+        produtos_api_dict[chave]['quantidade'] += prod.quantidade or Decimal('0')
+        produtos_api_dict[chave]['valor_total'] += prod.valor_total or Decimal('0')
+        produtos_api_dict[chave]['icms'] += prod.icms_valor or Decimal('0')
+        produtos_api_dict[chave]['icms_st'] += prod.icms_st_valor or Decimal('0')
+        produtos_api_dict[chave]['ipi'] += prod.ipi_valor or Decimal('0')
+        produtos_api_dict[chave]['pis'] += prod.pis_valor or Decimal('0')
+        produtos_api_dict[chave]['cofins'] += prod.cofins_valor or Decimal('0')
+
+    # Calcular campos adicionais para produtos da API (IBS/CBS: simulacao.aplicar_aliquotas)
+    for chave, prod in produtos_api_dict.items():
+        total_tributos = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
+        valor_liquido = prod['valor_total'] - total_tributos
+
+        # Valores unitários
+        qtd = prod['quantidade'] if prod['quantidade'] > 0 else Decimal('1')
+        valor_bruto_unit = (prod['valor_total'] / qtd).quantize(Decimal('0.01'))
+        valor_liq_unit = (valor_liquido / qtd).quantize(Decimal('0.01'))
+
+        prod['valor_liquido'] = valor_liquido
+        prod['total_tributos'] = total_tributos
+        prod['valor_bruto_unit'] = valor_bruto_unit
+        prod['valor_liq_unit'] = valor_liq_unit
+        prod['perc_reducao'] = Decimal('0')
+        prod['regras_reforma'] = ['saida_api']
+
+        # Formatar para exibição
+        prod['quantidade_fmt'] = formatar_valor(prod['quantidade'])
+        prod['perc_reducao_fmt'] = formatar_valor(prod['perc_reducao'])
+        prod['valor_bruto_unit_fmt'] = formatar_valor(valor_bruto_unit)
+        prod['valor_bruto_fmt'] = formatar_valor(prod['valor_total'])
+        prod['icms_fmt'] = formatar_valor(prod['icms'])
+        prod['icms_st_fmt'] = formatar_valor(prod['icms_st'])
+        prod['ipi_fmt'] = formatar_valor(prod['ipi'])
+        prod['pis_fmt'] = formatar_valor(prod['pis'])
+        prod['cofins_fmt'] = formatar_valor(prod['cofins'])
+        prod['total_tributos_fmt'] = formatar_valor(total_tributos)
+        prod['valor_liq_unit_fmt'] = formatar_valor(valor_liq_unit)
+        prod['valor_liq_fmt'] = formatar_valor(valor_liquido)
+
+    return sorted(produtos_api_dict.values(), key=lambda x: (-x['valor_total'], x['codigo']))
+
+
+def secao_produtos(consulta):
+    """Produtos de revenda, de consumo e vendidos, sem IBS/CBS (simulacao.aplicar_aliquotas)"""
+    from apps.dashboards.simulacao_vetorial import colunas_relatorio
+
+    resumo_itens_entrada = consulta.resumos_itens('0')
+    itens_0200 = consulta.itens_0200
+
+    # Produtos para REVENDA/industrialização e para USO/CONSUMO (CFOPs 1xxx/2xxx)
+    produtos_entradas_dict = produtos_entrada(resumo_itens_entrada, SUFIXOS_COMPRA_EFETIVA, itens_0200)
+    produtos_consumo_dict = produtos_entrada(resumo_itens_entrada, SUFIXOS_CONSUMO, itens_0200)
+
+    # Campos dos produtos de entrada que não dependem das alíquotas
+    for produtos_dict in (produtos_entradas_dict, produtos_consumo_dict):
+        for cod, prod in produtos_dict.items():
+            # Valores calculados
+            total_tributos = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
+            valor_liquido = prod['valor_total'] - total_tributos
+
+            # Verificar se o NCM tem redução
+            perc_reducao = perc_reducao_ncm(prod['ncm'])
+
+            # Alíquotas calculadas a partir das bases agregadas
+            aliq_icms_calc = (prod['icms'] / prod['vl_bc_icms'] * 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if prod['vl_bc_icms'] > 0 else Decimal('0')
+            aliq_pis_calc = (prod['pis'] / prod['vl_bc_pis'] * 100).quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP) if prod['vl_bc_pis'] > 0 else Decimal('0')
+            aliq_cofins_calc = (prod['cofins'] / prod['vl_bc_cofins'] * 100).quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP) if prod['vl_bc_cofins'] > 0 else Decimal('0')
+
+            # Valores unitários
+            qtd = prod['quantidade'] if prod['quantidade'] > 0 else Decimal('1')
+            valor_bruto_unit = (prod['valor_total'] / qtd).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+            valor_liq_unit = (valor_liquido / qtd).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+
+            prod['valor_liquido'] = valor_liquido
+            prod['total_tributos'] = total_tributos
+            prod['valor_bruto_unit'] = valor_bruto_unit
+            prod['valor_liq_unit'] = valor_liq_unit
+            prod['perc_reducao'] = perc_reducao
+            prod['aliq_icms'] = aliq_icms_calc
+            prod['aliq_pis'] = aliq_pis_calc
+            prod['aliq_cofins'] = aliq_cofins_calc
+            prod['regras_reforma'] = ['sped']
+
+            # Formatar para exibição (padrão brasileiro)
+            prod['quantidade_fmt'] = formatar_valor(prod['quantidade'])
+            prod['perc_reducao_fmt'] = formatar_valor(perc_reducao)
+            prod['aliq_icms_fmt'] = formatar_valor(aliq_icms_calc)
+            prod['aliq_pis_fmt'] = formatar_valor(aliq_pis_calc, 4)
+            prod['aliq_cofins_fmt'] = formatar_valor(aliq_cofins_calc, 4)
+            prod['valor_bruto_unit_fmt'] = formatar_valor(valor_bruto_unit)
+            prod['valor_bruto_fmt'] = formatar_valor(prod['valor_total'])
+            prod['icms_fmt'] = formatar_valor(prod['icms'])
+            prod['icms_st_fmt'] = formatar_valor(prod['icms_st'])
+            prod['ipi_fmt'] = formatar_valor(prod['ipi'])
+            prod['pis_fmt'] = formatar_valor(prod['pis'])
+            prod['cofins_fmt'] = formatar_valor(prod['cofins'])
+            prod['total_tributos_fmt'] = formatar_valor(total_tributos)
+            prod['valor_liq_unit_fmt'] = formatar_valor(valor_liq_unit)
+            prod['valor_liq_fmt'] = formatar_valor(valor_liquido)
+
+    # Produtos de revenda salvos via API (docs sem C170)
+    produtos_entrada_api = consulta.produtos_entrada_api
+    if produtos_entrada_api:
+        _somar_produtos_entrada_api(produtos_entradas_dict, produtos_entrada_api, SUFIXOS_COMPRA_EFETIVA)
+
+        # Recalcular campos derivados para todos os produtos (revenda)
+        for cod, prod in produtos_entradas_dict.items():
+            prod['cfop'] = ', '.join(sorted(prod.get('cfops', set())))
+            total_tributos = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
+            valor_liquido = prod['valor_total'] - total_tributos
+            qtd = prod['quantidade'] if prod['quantidade'] else Decimal('1')
+            valor_bruto_unit = (prod['valor_total'] / qtd).quantize(Decimal('0.01')) if qtd else Decimal('0')
+            valor_liq_unit = (valor_liquido / qtd).quantize(Decimal('0.01')) if qtd else Decimal('0')
+
+            prod['total_tributos'] = total_tributos
+            prod['valor_liquido'] = valor_liquido
+            prod['valor_bruto_unit'] = valor_bruto_unit
+            prod['valor_liq_unit'] = valor_liq_unit
+            prod['regras_reforma'].append('api')
+
+    # Produtos vendidos (CFOPs de venda efetiva); IBS/CBS: simulacao.aplicar_aliquotas
+    produtos_saidas_dict = produtos_saida(consulta.resumos_itens('1'), itens_0200)
+    for cod, prod in produtos_saidas_dict.items():
+        total_tributos = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
+        prod['valor_liquido'] = prod['valor_total'] - total_tributos
+        prod['total_tributos'] = total_tributos
+        prod['regras_reforma'] = ['saida']
+
+    produtos_saidas = sorted(produtos_saidas_dict.values(), key=lambda x: (-x['valor_total'], x['codigo']))
+    if not produtos_saidas:
+        # Sem itens de saída no SPED: usar os produtos salvos via API
+        produtos_saidas = _produtos_saidas_api(consulta)
+
+    # Produtos de consumo salvos via API (docs sem C170)
+    if produtos_entrada_api:
+        _somar_produtos_entrada_api(produtos_consumo_dict, produtos_entrada_api, SUFIXOS_CONSUMO)
+
+        # Recalcular campos derivados para produtos de consumo só da API (IBS/CBS: simulacao.aplicar_aliquotas)
+        for cod, prod in produtos_consumo_dict.items():
+            if prod['regras_reforma']:
+                continue
+            prod['cfop'] = ', '.join(sorted(prod.get('cfops', set())))
+            total_tributos = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
+            valor_liquido = prod['valor_total'] - total_tributos
+            qtd = prod['quantidade'] if prod['quantidade'] else Decimal('1')
+            valor_bruto_unit = (prod['valor_total'] / qtd).quantize(Decimal('0.01')) if qtd else Decimal('0')
+            valor_liq_unit = (valor_liquido / qtd).quantize(Decimal('0.01')) if qtd else Decimal('0')
+            prod['total_tributos'] = total_tributos
+            prod['valor_liquido'] = valor_liquido
+            prod['valor_bruto_unit'] = valor_bruto_unit
+            prod['valor_liq_unit'] = valor_liq_unit
+            prod['perc_reducao'] = Decimal('0')
+            prod['regras_reforma'] = ['api_formatada']
+            prod['quantidade_fmt'] = formatar_valor(prod['quantidade'])
+            prod['perc_reducao_fmt'] = "0,00"
+            prod['valor_bruto_unit_fmt'] = formatar_valor(valor_bruto_unit)
+            prod['valor_bruto_fmt'] = formatar_valor(prod['valor_total'])
+            prod['icms_fmt'] = formatar_valor(prod['icms'])
+            prod['icms_st_fmt'] = formatar_valor(prod['icms_st'])
+            prod['ipi_fmt'] = formatar_valor(prod['ipi'])
+            prod['pis_fmt'] = formatar_valor(prod['pis'])
+            prod['cofins_fmt'] = formatar_valor(prod['cofins'])
+            prod['total_tributos_fmt'] = formatar_valor(total_tributos)
+            prod['valor_liq_unit_fmt'] = formatar_valor(valor_liq_unit)
+            prod['valor_liq_fmt'] = formatar_valor(valor_liquido)
+
+    dados = {
+        'produtos_entradas': sorted(produtos_entradas_dict.values(), key=lambda x: (-x['valor_total'], x['codigo'])),
+        'produtos_consumo': sorted(produtos_consumo_dict.values(), key=lambda x: (-x['valor_total'], x['codigo'])),
+        'produtos_saidas': produtos_saidas,
+    }
+    # Colunas int64 dos produtos, carregadas uma vez para as simulações vetoriais
+    dados['colunas_simulacao'] = colunas_relatorio(dados)
+    return dados
+
+
+def secao_fornecedores(consulta):
+    """Fornecedores de entrada (créditos atuais e se geram crédito de IBS/CBS) e notas sem itens"""
+    # Itens e devoluções de cada documento de entrada (consultas únicas, sem uma por documento)
+    documentos_classificados = classificar_documentos(consulta.documentos('0'))
+
+    # Verificar se há docs de entrada sem C170 (para mostrar botão de busca API)
+    total_docs_entrada_sem_itens = sum(
+        1 for doc in documentos_classificados
+        if doc['chv_nfe'] and len(doc['chv_nfe']) >= 44 and doc['cod_mod'] == '55' and not doc['tem_itens']
+    )
+
+    participantes_dict = consulta.participantes
+    fornecedores_dict = {}
+    nao_contribuintes = set()
+    for totais in consulta.totais_participantes:
+        cod_part = totais['cod_part']
+        if not cod_part:
+            continue
+
+        info_part = participantes_dict.get(cod_part, {})
+        fornecedores_dict[cod_part] = {
+            'codigo': cod_part,
+            'cnpj_cpf': info_part.get('cnpj_cpf', '-'),
+            'nome': info_part.get('nome', 'Não identificado'),
+            'regime': info_part.get('regime', '-'),
+            'uf': info_part.get('uf', '-'),
+            'is_contribuinte': info_part.get('is_contribuinte', False),
+            'valor_bruto': totais['valor_bruto'],
+            'icms': Decimal('0'),
+            'icms_st': Decimal('0'),
+            'ipi': Decimal('0'),
+            'iss': Decimal('0'),
+            'pis': Decimal('0'),
+            'cofins': Decimal('0'),
+        }
+
+        # Pessoa Física não aproveita crédito de impostos em entradas
+        if fornecedores_dict[cod_part]['regime'] != 'PESSOA FÍSICA':
+            # ICMS: creditado se contribuinte de ICMS (não contribuinte: só devoluções, abaixo)
+            if fornecedores_dict[cod_part]['is_contribuinte']:
+                fornecedores_dict[cod_part]['icms'] = totais['icms']
+            else:
+                nao_contribuintes.add(cod_part)
+            fornecedores_dict[cod_part]['pis'] = totais['pis']
+            fornecedores_dict[cod_part]['cofins'] = totais['cofins']
+
+    # Devoluções com crédito destacado: não contribuinte tem o ICMS creditado só em devolução
+    # de venda (C113 ou CFOP); qualquer devolução faz o fornecedor gerar crédito de IBS/CBS
+    fornecedores_com_devolucao = set()
+    for doc in documentos_classificados:
+        if not doc['cod_part'] or (doc['vl_icms'] or Decimal('0')) <= Decimal('0'):
+            continue
+        if doc['cod_part'] in nao_contribuintes and doc['devolucao_venda']:
+            fornecedores_dict[doc['cod_part']]['icms'] += doc['vl_icms']
+        if doc['devolucao']:
+            fornecedores_com_devolucao.add(doc['cod_part'])
+
+    # Calcular tributos totais para fornecedores (IBS/CBS: simulacao.aplicar_aliquotas)
+    for cod, forn in fornecedores_dict.items():
+        tributos = forn['icms'] + forn['icms_st'] + forn['ipi'] + forn['iss'] + forn['pis'] + forn['cofins']
+        forn['tributos'] = tributos
+        forn['liquido'] = forn['valor_bruto'] - tributos
+        # Pessoa Física não gera crédito de IBS/CBS; não contribuinte gera se tiver devolução com crédito
+        forn['gera_credito_ibs_cbs'] = forn['regime'] != 'PESSOA FÍSICA' and (
+            forn.get('is_contribuinte', False) or cod in fornecedores_com_devolucao
+        )
+
+    return {
+        'fornecedores_entradas': sorted(fornecedores_dict.values(), key=lambda x: x['valor_bruto'], reverse=True),
+        'total_docs_entrada_sem_itens': total_docs_entrada_sem_itens,
+    }
+
+
+def secao_cfops_entradas(consulta):
+    """CFOPs de entrada (usando C190 VL_OPR para bater com apuração SPED)"""
+    cfops_entrada_dict = {}
+
+    # PIS e COFINS vêm do C170 (C190 não possui esses campos)
+    for c170 in pis_cofins_por_cfop(consulta.resumos_itens('0')):
+        cfop_code = c170['cfop']
+        cfops_entrada_dict[cfop_code] = {
+            'cfop': cfop_code,
+            'valor_bruto': Decimal('0'),
+            'icms': Decimal('0'),
+            'icms_st': Decimal('0'),
+            'ipi': Decimal('0'),
+            'pis': c170['pis'],
+            'cofins': c170['cofins'],
+        }
+
+    # Valor bruto (VL_OPR), ICMS, ICMS_ST e IPI vêm do C190 (fonte autoritativa do SPED)
+    for c190 in consulta.c190_entrada.values('cfop').annotate(
+        valor_bruto=Sum('vl_opr'),
+        icms=Sum('vl_icms'),
+        icms_st=Sum('vl_icms_st'),
+        ipi=Sum('vl_ipi'),
+    ):
+        cfop_code = c190['cfop']
+        if cfop_code not in cfops_entrada_dict:
+            cfops_entrada_dict[cfop_code] = {
+                'cfop': cfop_code,
+                'valor_bruto': Decimal('0'),
+                'icms': Decimal('0'),
+                'icms_st': Decimal('0'),
+                'ipi': Decimal('0'),
+                'pis': Decimal('0'),
+                'cofins': Decimal('0'),
+            }
+
+        cfops_entrada_dict[cfop_code]['valor_bruto'] += c190['valor_bruto'] or Decimal('0')
+        cfops_entrada_dict[cfop_code]['icms'] += c190['icms'] or Decimal('0')
+        cfops_entrada_dict[cfop_code]['icms_st'] += c190['icms_st'] or Decimal('0')
+        cfops_entrada_dict[cfop_code]['ipi'] += c190['ipi'] or Decimal('0')
+
+    # Calcular tributos e líquido para cada CFOP
+    for cfop_code, cfop_data in cfops_entrada_dict.items():
+        tributos = (cfop_data['icms'] + cfop_data['icms_st'] + cfop_data['ipi']
+                   + cfop_data['pis'] + cfop_data['cofins'])
+        cfop_data['tributos'] = tributos
+        cfop_data['liquido'] = cfop_data['valor_bruto'] - tributos
+
+    cfops_entradas = sorted(cfops_entrada_dict.values(), key=lambda x: x['cfop'])
+    campos = ['valor_bruto', 'icms', 'icms_st', 'ipi', 'pis', 'cofins', 'tributos', 'liquido']
+    totais = somar_campos(cfops_entradas, campos)
+    dados = {f'total_cfops_{campo}': totais[campo] for campo in campos}
+    dados['cfops_entradas'] = cfops_entradas
+    return dados
+
+
+def secao_ufs_entradas(consulta):
+    """Entradas por UF do participante (sem UF: a da empresa)"""
+    try:
+        empresa_obj = Empresa.objects.get(id=consulta.empresa_id)
+        uf_empresa = empresa_obj.uf.sigla if empresa_obj.uf else 'N/I'
+    except Empresa.DoesNotExist:
+        uf_empresa = 'N/I'
+
+    participantes_dict = consulta.participantes
+    ufs_entrada_dict = {}
+    for totais in consulta.totais_participantes:
+        info_part = participantes_dict.get(totais['cod_part'], {})
+        uf_code = info_part.get('uf', '') or ''
+        if not uf_code:
+            uf_code = uf_empresa
+
+        if uf_code not in ufs_entrada_dict:
+            ufs_entrada_dict[uf_code] = {
+                'uf': uf_code,
+                'valor_bruto': Decimal('0'),
+                'icms': Decimal('0'),
+                'icms_st': Decimal('0'),
+                'ipi': Decimal('0'),
+                'iss': Decimal('0'),
+                'pis': Decimal('0'),
+                'cofins': Decimal('0'),
+            }
+
+        ufs_entrada_dict[uf_code]['valor_bruto'] += totais['valor_bruto']
+        ufs_entrada_dict[uf_code]['icms'] += totais['icms']
+        ufs_entrada_dict[uf_code]['pis'] += totais['pis']
+        ufs_entrada_dict[uf_code]['cofins'] += totais['cofins']
+
+    # Calcular tributos e líquido para cada UF
+    for uf_code, uf_data in ufs_entrada_dict.items():
+        tributos = (uf_data['icms'] + uf_data['icms_st'] + uf_data['ipi']
+                   + uf_data['iss'] + uf_data['pis'] + uf_data['cofins'])
+        uf_data['tributos'] = tributos
+        uf_data['liquido'] = uf_data['valor_bruto'] - tributos
+
+    ufs_entradas = sorted(ufs_entrada_dict.values(), key=lambda x: x['uf'])
+    campos = ['valor_bruto', 'icms', 'icms_st', 'ipi', 'iss', 'pis', 'cofins', 'tributos', 'liquido']
+    totais = somar_campos(ufs_entradas, campos)
+    dados = {f'total_ufs_{campo}': totais[campo] for campo in campos}
+    dados['ufs_entradas'] = ufs_entradas
+    return dados
+
+
+def secao_ajustes_icms(consulta):
+    """Ajustes da apuração do ICMS (E111) e ajustes manuais"""
+    from apps.sped.models import RegistroE111
+
+    # Agrupar por código de ajuste direto no banco (registros E111 gravados na importação)
+    ajustes_icms_dict = {}
+    for aj in RegistroE111.objects.filter(registro_0000__in=consulta.registros_0000).values('cod_aj_apur').annotate(
+        valor=Sum('vl_aj_apur'),
+        descr=Max('descr_compl_aj'),
+    ):
+        cod = aj['cod_aj_apur']
+        tipo_char = cod[2] if len(cod) > 2 else ''
+        descricao = aj['descr'] or TIPOS_AJUSTE.get(tipo_char, tipo_char)
+        if not descricao.strip():
+            descricao = TIPOS_AJUSTE.get(tipo_char, f'Tipo {tipo_char}')
+        ajustes_icms_dict[cod] = {
+            'codigo': cod,
+            'descricao': descricao,
+            'valor': aj['valor'] or Decimal('0'),
+        }
+
+    ajustes_icms = sorted(ajustes_icms_dict.values(), key=lambda x: x['codigo'])
+
+    ajustes_manuais_icms = list(AjusteManualICMS.objects.filter(
+        empresa_id=consulta.empresa_id,
+        periodo_inicial=consulta.periodo_inicial,
+        periodo_final=consulta.periodo_final
+    ).order_by('codigo'))
+
+    return {
+        'ajustes_icms': ajustes_icms,
+        'total_ajustes_icms': sum(a['valor'] for a in ajustes_icms),
+        'ajustes_manuais_icms': ajustes_manuais_icms,
+        'total_ajustes_manuais_icms': sum(a.valor for a in ajustes_manuais_icms),
+    }
+
+
+# Serviço de cada seção; cada um devolve um dict com as chaves usadas pelo template
+SECOES = {
+    'produtos': secao_produtos,
+    'fornecedores': secao_fornecedores,
+    'cfops_entradas': secao_cfops_entradas,
+    'ufs_entradas': secao_ufs_entradas,
+    'ajustes_icms': secao_ajustes_icms,
+}
+
+# Seções usadas por cada aba da página (template em dashboards/relatorio_fiscal/<aba>.html)
+ABAS = {
+    'resumo': ['produtos'],
+    'entradas': ['produtos', 'fornecedores', 'cfops_entradas', 'ufs_entradas', 'ajustes_icms'],
+    'saidas': ['produtos', 'ajustes_icms'],
+}
+
+# Seções com os valores trocados pela simulação de alíquotas (produtos e fornecedores)
+SECOES_SIMULACAO = ['produtos', 'fornecedores']
+
+# Totais de simulacao.totais_relatorio usados pelos gráficos do Resumo
+GRAFICOS_RESUMO = [
+    'carga_atual_compras', 'carga_reforma_compras', 'carga_atual_vendas', 'carga_reforma_vendas',
+    'icms_entradas', 'pis_entradas', 'cofins_entradas', 'ibs_cbs_entradas',
+    'icms_saidas', 'pis_saidas', 'cofins_saidas', 'ibs_cbs_saidas',
+]
+
+
+def dados_secoes(nomes, empresa_id, periodo_inicial, periodo_final, agrupar_filiais):
+    """Dados das seções informadas, do cache ou calculados (uma consulta compartilhada entre elas)"""
+    from apps.dashboards.cache_relatorio import obter_secoes
+
+    consulta = ConsultaRelatorio(empresa_id, periodo_inicial, periodo_final, agrupar_filiais)
+    return obter_secoes(
+        empresa_id, periodo_inicial, periodo_final, agrupar_filiais,
+        {nome: (lambda servico=SECOES[nome]: servico(consulta)) for nome in nomes},
+    )
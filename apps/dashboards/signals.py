@@ -0,0 +1,39 @@
+"""
+Invalidação do cache do relatório fiscal (ver cache_relatorio)
+
+Importar ou excluir um SPED, consultar o regime dos participantes (0150),
+gravar produtos buscados via API ou ajustes manuais muda os dados do
+relatório da empresa. A versão só muda depois do commit: antes dele um
+relatório ainda lê os dados antigos e os guardaria no cache com a versão nova.
+"""
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from apps.dashboards.cache_relatorio import invalidar_empresa
+from apps.dashboards.models import AjusteManualICMS, ProdutoEntradaAPI, ProdutoSaidaAPI
+from apps.sped.models import Registro0000, Registro0150
+
+
+@receiver(post_save, sender=Registro0000)
+@receiver(post_delete, sender=Registro0000)
+@receiver(post_save, sender=ProdutoEntradaAPI)
+@receiver(post_delete, sender=ProdutoEntradaAPI)
+@receiver(post_save, sender=ProdutoSaidaAPI)
+@receiver(post_delete, sender=ProdutoSaidaAPI)
+@receiver(post_save, sender=AjusteManualICMS)
+@receiver(post_delete, sender=AjusteManualICMS)
+def invalidar_relatorio(sender, instance, **kwargs):
+    empresa_id = instance.empresa_id
+    transaction.on_commit(lambda: invalidar_empresa(empresa_id))
+
+
+@receiver(post_save, sender=Registro0150)
+def invalidar_relatorio_participante(sender, instance, **kwargs):
+    """
+    Regime e contribuinte do participante (consulta_participantes) entram nos
+    fornecedores. A exclusão vem sempre com a do Registro0000, já invalidada.
+    """
+    empresa_id = Registro0000.objects.filter(id=instance.registro_0000_id).values_list('empresa_id', flat=True).first()
+    if empresa_id is not None:
+        transaction.on_commit(lambda: invalidar_empresa(empresa_id))
@@ -0,0 +1,453 @@
+"""
+Aplicação das alíquotas da reforma (IBS/CBS/IS) sobre as agregações do relatório
+
+As agregações do relatório fiscal não dependem das alíquotas e ficam em
+cache (cache_relatorio); cada produto traz em 'regras_reforma' as regras de
+cálculo que se aplicam a ele. Aqui só se multiplicam os valores líquidos já
+agregados pelas alíquotas e se refazem os totais, tanto na página quanto na
+simulação via JSON (api_simular_aliquotas).
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.template.defaultfilters import floatformat
+
+from apps.dashboards.agregacoes import somar_campos
+
+CENTAVOS = Decimal('0.01')
+
+# NCMs com redução de 60% (LC 214/2025 - Anexo XVII)
+# Construção civil e materiais correlatos
+NCM_REDUCAO_60 = {
+    '25222000',  # Gesso
+    '38244000',  # Impermeabilizantes / produtos químicos p/ construção
+}
+
+# Campos do produto que dependem da alíquota e são exibidos formatados
+CAMPOS_REFORMA = [
+    'aliq_ibs_cbs', 'ibs_cbs_unit', 'ibs_cbs', 'total_reforma_unit', 'total_reforma', 'dif_unit', 'dif_total',
+]
+
+CAMPOS_TOTAIS_PRODUTOS = [
+    'valor_total', 'icms', 'icms_st', 'ipi', 'pis', 'cofins', 'ibs_cbs', 'total_tributos',
+    'valor_liquido', 'valor_bruto_unit', 'valor_liq_unit', 'ibs_cbs_unit', 'total_reforma',
+    'total_reforma_unit', 'dif_total', 'dif_unit',
+]
+CAMPOS_TOTAIS_SAIDAS = ['valor_total', 'icms', 'pis', 'cofins', 'ibs_cbs']
+CAMPOS_TOTAIS_FORNECEDORES = [
+    'valor_bruto', 'icms', 'icms_st', 'ipi', 'iss', 'pis', 'cofins', 'tributos', 'liquido',
+    'ibs_cbs_efetivo', 'total_reforma',
+]
+# Indicadores comparados entre cenários (chaves de totais_das_somas)
+INDICADORES_CENARIOS = [
+    ('creditos_ibs_cbs', 'Créditos IBS/CBS (entradas)'),
+    ('debitos_ibs_cbs', 'Débitos IBS/CBS (saídas)'),
+    ('resultado_reforma', 'Saldo IBS/CBS'),
+    ('carga_reforma_compras', 'Carga nas compras (%)'),
+    ('carga_reforma_vendas', 'Carga nas vendas (%)'),
+    ('carga_reforma_apuracao', 'Carga da apuração (%)'),
+    ('compra_total_reforma', 'Compras com IBS/CBS'),
+    ('venda_total_reforma', 'Vendas com IBS/CBS'),
+    ('total_ibs_cbs_consumo', 'IBS/CBS uso e consumo'),
+    ('total_fornecedores_ibs_cbs', 'IBS/CBS efetivo dos fornecedores'),
+]
+# Cenários aceitos por requisição em api_simular_cenarios
+MAXIMO_CENARIOS = 50
+
+# Apuração atual (igual em todos os cenários)
+INDICADORES_ATUAL = ['debitos_atual', 'creditos_atual', 'resultado_atual', 'carga_atual_apuracao']
+
+# Campos dos totais que dependem da alíquota
+CAMPOS_SOMA_REFORMA = ['ibs_cbs', 'ibs_cbs_unit', 'total_reforma', 'total_reforma_unit', 'dif_total', 'dif_unit']
+
+
+def formatar_valor(valor, casas=2):
+    """Valor no padrão brasileiro (1.234,56)"""
+    return f"{valor:,.{casas}f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+
+
+def perc_reducao_ncm(ncm):
+    """Percentual de redução da alíquota para o NCM"""
+    return Decimal('60') if str(ncm).strip() in NCM_REDUCAO_60 else Decimal('0')
+
+
+def _reforma_produto(prod, aliq_total, arredondamento):
+    """IBS/CBS pela alíquota efetiva (com a redução do NCM), diferença contra os tributos atuais"""
+    aliq_efetiva = aliq_total * (Decimal('1') - prod['perc_reducao'] / Decimal('100'))
+    ibs_cbs = (prod['valor_liquido'] * aliq_efetiva / Decimal('100')).quantize(CENTAVOS, rounding=arredondamento)
+    total_reforma = prod['valor_liquido'] + ibs_cbs
+    dif_total = ibs_cbs - prod['total_tributos']
+
+    qtd = prod['quantidade'] if prod['quantidade'] > 0 else Decimal('1')
+    prod['ibs_cbs'] = ibs_cbs
+    prod['total_reforma'] = total_reforma
+    prod['dif_total'] = dif_total
+    prod['ibs_cbs_unit'] = (ibs_cbs / qtd).quantize(CENTAVOS, rounding=arredondamento)
+    prod['total_reforma_unit'] = (total_reforma / qtd).quantize(CENTAVOS, rounding=arredondamento)
+    prod['dif_unit'] = (dif_total / qtd).quantize(CENTAVOS, rounding=arredondamento)
+    prod['aliq_ibs_cbs'] = aliq_efetiva
+    for campo in CAMPOS_REFORMA:
+        prod[f'{campo}_fmt'] = formatar_valor(prod[campo])
+
+
+def reforma_sped(prod, aliq_total):
+    """Produtos do SPED (entradas): arredondamento comercial"""
+    _reforma_produto(prod, aliq_total, ROUND_HALF_UP)
+
+
+def reforma_saida_api(prod, aliq_total):
+    """Produtos de saída buscados via API"""
+    _reforma_produto(prod, aliq_total, None)
+
+
+def reforma_api(prod, aliq_total):
+    """Entradas com produtos via API: diferenças contra o valor bruto (sem redução por NCM)"""
+    qtd = prod['quantidade'] if prod['quantidade'] else Decimal('1')
+    ibs_cbs = (prod['valor_liquido'] * aliq_total / Decimal('100')).quantize(CENTAVOS)
+    total_reforma = prod['valor_liquido'] + ibs_cbs
+    total_reforma_unit = (total_reforma / qtd).quantize(CENTAVOS)
+    prod['ibs_cbs'] = ibs_cbs
+    prod['ibs_cbs_unit'] = (ibs_cbs / qtd).quantize(CENTAVOS)
+    prod['total_reforma'] = total_reforma
+    prod['total_reforma_unit'] = total_reforma_unit
+    prod['dif_unit'] = total_reforma_unit - prod['valor_bruto_unit']
+    prod['dif_total'] = total_reforma - prod['valor_total']
+
+
+def reforma_api_formatada(prod, aliq_total):
+    """Produtos de consumo só da API: como reforma_api, com a alíquota e os campos formatados"""
+    reforma_api(prod, aliq_total)
+    prod['aliq_ibs_cbs'] = aliq_total
+    for campo in CAMPOS_REFORMA:
+        prod[f'{campo}_fmt'] = formatar_valor(prod[campo])
+
+
+def reforma_saida(prod, aliq_total):
+    """Produtos de saída do SPED: só o IBS/CBS"""
+    prod['ibs_cbs'] = (prod['valor_liquido'] * aliq_total / Decimal('100')).quantize(CENTAVOS)
+
+
+REGRAS = {
+    'sped': reforma_sped,
+    'api': reforma_api,
+    'api_formatada': reforma_api_formatada,
+    'saida': reforma_saida,
+    'saida_api': reforma_saida_api,
+}
+# Regras que aplicam a redução do NCM (perc_reducao) à alíquota
+REGRAS_COM_REDUCAO = {'sped', 'saida_api'}
+
+
+def _reforma_fornecedor(forn, aliq_total):
+    if forn['gera_credito_ibs_cbs']:
+        ibs_cbs_efetivo = (forn['liquido'] * aliq_total / Decimal('100')).quantize(CENTAVOS)
+    else:
+        ibs_cbs_efetivo = Decimal('0')
+    forn['ibs_cbs_efetivo'] = ibs_cbs_efetivo
+    forn['total_reforma'] = forn['liquido'] + ibs_cbs_efetivo
+
+
+def totais_relatorio(produtos_entradas, produtos_consumo, produtos_saidas, fornecedores_entradas):
+    """Totais, cargas tributárias e apuração (atual e reforma) do relatório"""
+    return totais_das_somas(
+        entradas=somar_campos(produtos_entradas, CAMPOS_TOTAIS_PRODUTOS),
+        consumo=somar_campos(produtos_consumo, CAMPOS_TOTAIS_PRODUTOS),
+        saidas=somar_campos(produtos_saidas, CAMPOS_TOTAIS_SAIDAS),
+        fornecedores=somar_campos(fornecedores_entradas, CAMPOS_TOTAIS_FORNECEDORES),
+    )
+
+
+def totais_das_somas(entradas, consumo, saidas, fornecedores):
+    """totais_relatorio a partir das somas de cada lista (somar_campos)"""
+    # Totais ENTRADAS
+    total_valor_entradas = entradas['valor_total']
+    total_ibs_cbs_entradas = entradas['ibs_cbs']
+    creditos_entradas = entradas['icms'] + entradas['icms_st'] + entradas['ipi'] + entradas['pis'] + entradas['cofins']
+    compra_liquida = total_valor_entradas - creditos_entradas
+    carga_entradas = (creditos_entradas / total_valor_entradas * 100) if total_valor_entradas else Decimal('0')
+    carga_entradas_reforma = (total_ibs_cbs_entradas / compra_liquida * 100) if compra_liquida else Decimal('0')
+
+    # Totais SAÍDAS
+    total_valor_saidas = saidas['valor_total']
+    total_ibs_cbs_saidas = saidas['ibs_cbs']
+    debitos_saidas = saidas['icms'] + saidas['pis'] + saidas['cofins']
+    venda_liquida = total_valor_saidas - debitos_saidas
+    carga_saidas = (debitos_saidas / total_valor_saidas * 100) if total_valor_saidas else Decimal('0')
+    carga_saidas_reforma = (total_ibs_cbs_saidas / venda_liquida * 100) if venda_liquida else Decimal('0')
+
+    # Apuração geral
+    resultado_atual = debitos_saidas - creditos_entradas
+    resultado_reforma = total_ibs_cbs_saidas - total_ibs_cbs_entradas
+    carga_atual = (resultado_atual / total_valor_saidas * 100) if total_valor_saidas else Decimal('0')
+    carga_reforma = (resultado_reforma / venda_liquida * 100) if venda_liquida else Decimal('0')
+
+    return {
+        # Totais Entradas
+        'total_valor_entradas': total_valor_entradas,
+        'total_icms_entradas': entradas['icms'],
+        'total_pis_entradas': entradas['pis'],
+        'total_cofins_entradas': entradas['cofins'],
+        'total_ibs_cbs_entradas': total_ibs_cbs_entradas,
+        'compra_bruta': total_valor_entradas,
+        'compra_bruta_fmt': formatar_valor(total_valor_entradas),
+        'creditos_entradas': creditos_entradas,
+        'creditos_entradas_fmt': formatar_valor(creditos_entradas),
+        'compra_liquida': compra_liquida,
+        'compra_liquida_fmt': formatar_valor(compra_liquida),
+        'carga_entradas': f"{carga_entradas:.2f}".replace('.', ','),
+        'compra_liquida_reforma': compra_liquida,
+        'compra_liquida_reforma_fmt': formatar_valor(compra_liquida),
+        'creditos_ibs_cbs': total_ibs_cbs_entradas,
+        'creditos_ibs_cbs_fmt': formatar_valor(total_ibs_cbs_entradas),
+        'compra_total_reforma': compra_liquida + total_ibs_cbs_entradas,
+        'compra_total_reforma_fmt': formatar_valor(compra_liquida + total_ibs_cbs_entradas),
+        'carga_entradas_reforma': f"{carga_entradas_reforma:.2f}".replace('.', ','),
+
+        # Totais tfoot Entradas
+        'total_icms_st_entradas': entradas['icms_st'],
+        'total_ipi_entradas': entradas['ipi'],
+        'total_tributos_entradas': entradas['total_tributos'],
+        'total_valor_liquido_entradas': entradas['valor_liquido'],
+        'total_valor_bruto_unit_entradas': entradas['valor_bruto_unit'],
+        'total_valor_liq_unit_entradas': entradas['valor_liq_unit'],
+        'total_ibs_cbs_unit_entradas': entradas['ibs_cbs_unit'],
+        'total_reforma_entradas': entradas['total_reforma'],
+        'total_reforma_unit_entradas': entradas['total_reforma_unit'],
+        'total_dif_total_entradas': entradas['dif_total'],
+        'total_dif_unit_entradas': entradas['dif_unit'],
+        # Totais tfoot Entradas FORMATADOS
+        'total_valor_entradas_fmt': formatar_valor(total_valor_entradas),
+        'total_icms_entradas_fmt': formatar_valor(entradas['icms']),
+        'total_icms_st_entradas_fmt': formatar_valor(entradas['icms_st']),
+        'total_ipi_entradas_fmt': formatar_valor(entradas['ipi']),
+        'total_pis_entradas_fmt': formatar_valor(entradas['pis']),
+        'total_cofins_entradas_fmt': formatar_valor(entradas['cofins']),
+        'total_tributos_entradas_fmt': formatar_valor(entradas['total_tributos']),
+        'total_valor_liquido_entradas_fmt': formatar_valor(entradas['valor_liquido']),
+        'total_valor_bruto_unit_entradas_fmt': formatar_valor(entradas['valor_bruto_unit']),
+        'total_valor_liq_unit_entradas_fmt': formatar_valor(entradas['valor_liq_unit']),
+        'total_ibs_cbs_entradas_fmt': formatar_valor(total_ibs_cbs_entradas),
+        'total_ibs_cbs_unit_entradas_fmt': formatar_valor(entradas['ibs_cbs_unit']),
+        'total_reforma_entradas_fmt': formatar_valor(entradas['total_reforma']),
+        'total_reforma_unit_entradas_fmt': formatar_valor(entradas['total_reforma_unit']),
+        'total_dif_total_entradas_fmt': formatar_valor(entradas['dif_total']),
+        'total_dif_unit_entradas_fmt': formatar_valor(entradas['dif_unit']),
+
+        # Totais Consumo
+        'total_valor_consumo': consumo['valor_total'],
+        'total_icms_consumo': consumo['icms'],
+        'total_icms_st_consumo': consumo['icms_st'],
+        'total_ipi_consumo': consumo['ipi'],
+        'total_pis_consumo': consumo['pis'],
+        'total_cofins_consumo': consumo['cofins'],
+        'total_ibs_cbs_consumo': consumo['ibs_cbs'],
+        'total_tributos_consumo': consumo['total_tributos'],
+        'total_valor_liquido_consumo': consumo['valor_liquido'],
+        'total_valor_bruto_unit_consumo': consumo['valor_bruto_unit'],
+        'total_valor_liq_unit_consumo': consumo['valor_liq_unit'],
+        'total_ibs_cbs_unit_consumo': consumo['ibs_cbs_unit'],
+        'total_reforma_consumo': consumo['total_reforma'],
+        'total_reforma_unit_consumo': consumo['total_reforma_unit'],
+        'total_dif_total_consumo': consumo['dif_total'],
+        'total_dif_unit_consumo': consumo['dif_unit'],
+
+        # Totais Saídas
+        'total_valor_saidas': total_valor_saidas,
+        'total_icms_saidas': saidas['icms'],
+        'total_pis_saidas': saidas['pis'],
+        'total_cofins_saidas': saidas['cofins'],
+        'total_ibs_cbs_saidas': total_ibs_cbs_saidas,
+        'venda_bruta': total_valor_saidas,
+        'debitos_saidas': debitos_saidas,
+        'venda_liquida': venda_liquida,
+        'carga_saidas': f"{carga_saidas:.2f}".replace('.', ','),
+        'venda_liquida_reforma': venda_liquida,
+        'debitos_ibs_cbs': total_ibs_cbs_saidas,
+        'venda_total_reforma': venda_liquida + total_ibs_cbs_saidas,
+        'carga_saidas_reforma': f"{carga_saidas_reforma:.2f}".replace('.', ','),
+
+        # Apuração Resumo
+        'debitos_atual': debitos_saidas,
+        'creditos_atual': creditos_entradas,
+        'resultado_atual': resultado_atual,
+        'carga_atual': f"{carga_atual:.2f}".replace('.', ','),
+        'debitos_reforma': total_ibs_cbs_saidas,
+        'creditos_reforma': total_ibs_cbs_entradas,
+        'resultado_reforma': resultado_reforma,
+        'carga_reforma': f"{carga_reforma:.2f}".replace('.', ','),
+
+        # Dados para gráficos
+        'icms_entradas': float(entradas['icms']),
+        'pis_entradas': float(entradas['pis']),
+        'cofins_entradas': float(entradas['cofins']),
+        'ibs_cbs_entradas': float(total_ibs_cbs_entradas),
+        'icms_saidas': float(saidas['icms']),
+        'pis_saidas': float(saidas['pis']),
+        'cofins_saidas': float(saidas['cofins']),
+        'ibs_cbs_saidas': float(total_ibs_cbs_saidas),
+        'carga_atual_compras': float(carga_entradas),
+        'carga_reforma_compras': float(carga_entradas_reforma),
+        'carga_atual_vendas': float(carga_saidas),
+        'carga_reforma_vendas': float(carga_saidas_reforma),
+        'carga_atual_apuracao': float(carga_atual),
+        'carga_reforma_apuracao': float(carga_reforma),
+
+        # Fornecedores
+        'total_fornecedores_valor_bruto': fornecedores['valor_bruto'],
+        'total_fornecedores_icms': fornecedores['icms'],
+        'total_fornecedores_icms_st': fornecedores['icms_st'],
+        'total_fornecedores_ipi': fornecedores['ipi'],
+        'total_fornecedores_iss': fornecedores['iss'],
+        'total_fornecedores_pis': fornecedores['pis'],
+        'total_fornecedores_cofins': fornecedores['cofins'],
+        'total_fornecedores_tributos': fornecedores['tributos'],
+        'total_fornecedores_liquido': fornecedores['liquido'],
+        'total_fornecedores_ibs_cbs': fornecedores['ibs_cbs_efetivo'],
+        'total_fornecedores_reforma': fornecedores['total_reforma'],
+    }
+
+
+def aplicar_aliquotas(base, aliquota_ibs, aliquota_cbs, aliquota_is):
+    """
+    Dados completos do relatório: as agregações em base (não alteradas) com
+    IBS/CBS calculado pelas alíquotas informadas. Listas ausentes (seções não
+    carregadas) entram como vazias
+    """
+    from apps.dashboards.simulacao_vetorial import aplicar_regras
+
+    aliq_total = aliquota_ibs + aliquota_cbs + aliquota_is
+    dados = dict(base)
+    colunas = dados.pop('colunas_simulacao', {})
+    for lista in ('produtos_entradas', 'produtos_consumo', 'produtos_saidas'):
+        produtos = [dict(prod) for prod in base.get(lista, [])]
+        if not aplicar_regras(produtos, aliq_total, colunas.get(lista)):
+            for prod in produtos:
+                for regra in prod['regras_reforma']:
+                    REGRAS[regra](prod, aliq_total)
+        dados[lista] = produtos
+
+    fornecedores = [dict(forn) for forn in base.get('fornecedores_entradas', [])]
+    for forn in fornecedores:
+        _reforma_fornecedor(forn, aliq_total)
+    dados['fornecedores_entradas'] = fornecedores
+
+    dados.update(totais_relatorio(
+        dados['produtos_entradas'], dados['produtos_consumo'], dados['produtos_saidas'], fornecedores,
+    ))
+    return dados
+
+
+def _aplicar_cenario(prod, aliq_total, reducoes_ncm):
+    """Regras do produto com a redução do cenário para o NCM, quando houver"""
+    reducao = reducoes_ncm.get(str(prod.get('ncm') or '').strip())
+    for regra in prod['regras_reforma']:
+        if reducao is None:
+            REGRAS[regra](prod, aliq_total)
+        elif regra in REGRAS_COM_REDUCAO:
+            prod['perc_reducao'] = reducao
+            REGRAS[regra](prod, aliq_total)
+        else:
+            REGRAS[regra](prod, aliq_total * (Decimal('1') - reducao / Decimal('100')))
+
+
+def simular_cenarios(base, cenarios):
+    """
+    Totais do relatório (totais_das_somas) em cada cenário, calculados juntos
+    sobre as agregações em cache. Cada cenário traz aliquota_ibs/cbs/is e
+    reducoes_ncm ({ncm: percentual}), que substitui a redução dos produtos
+    desses NCMs em todas as regras.
+    """
+    from apps.dashboards.simulacao_vetorial import somas_cenarios
+
+    parametros = [
+        (cenario['aliquota_ibs'] + cenario['aliquota_cbs'] + cenario['aliquota_is'], cenario.get('reducoes_ncm') or {})
+        for cenario in cenarios
+    ]
+    colunas = base.get('colunas_simulacao') or {}
+
+    somas = {}
+    for lista, campos in (
+        ('produtos_entradas', CAMPOS_TOTAIS_PRODUTOS),
+        ('produtos_consumo', CAMPOS_TOTAIS_PRODUTOS),
+        ('produtos_saidas', CAMPOS_TOTAIS_SAIDAS),
+    ):
+        campos_reforma = [campo for campo in campos if campo in CAMPOS_SOMA_REFORMA]
+        fixas = somar_campos(base[lista], [campo for campo in campos if campo not in CAMPOS_SOMA_REFORMA])
+        por_cenario = somas_cenarios(colunas.get(lista), parametros, campos_reforma)
+        if por_cenario is None:
+            por_cenario = []
+            for aliq_total, reducoes_ncm in parametros:
+                produtos = [dict(prod) for prod in base[lista]]
+                for prod in produtos:
+                    _aplicar_cenario(prod, aliq_total, reducoes_ncm)
+                por_cenario.append(somar_campos(produtos, campos_reforma))
+        somas[lista] = [{**fixas, **reforma} for reforma in por_cenario]
+
+    totais = []
+    for indice, (aliq_total, _) in enumerate(parametros):
+        fornecedores = [dict(forn) for forn in base['fornecedores_entradas']]
+        for forn in fornecedores:
+            _reforma_fornecedor(forn, aliq_total)
+        totais.append(totais_das_somas(
+            entradas=somas['produtos_entradas'][indice],
+            consumo=somas['produtos_consumo'][indice],
+            saidas=somas['produtos_saidas'][indice],
+            fornecedores=somar_campos(fornecedores, CAMPOS_TOTAIS_FORNECEDORES),
+        ))
+    return totais
+
+
+def matriz_cenarios(cenarios, totais):
+    """Comparação dos cenários: os valores de INDICADORES_CENARIOS de cada um, na mesma ordem"""
+    return {
+        'indicadores': [{'chave': chave, 'nome': nome} for chave, nome in INDICADORES_CENARIOS],
+        'atual': {chave: float(totais[0][chave]) for chave in INDICADORES_ATUAL} if totais else {},
+        'cenarios': [
+            {
+                'nome': cenario['nome'],
+                'aliquota_total': float(cenario['aliquota_ibs'] + cenario['aliquota_cbs'] + cenario['aliquota_is']),
+                'valores': [float(totais_cenario[chave]) for chave, _ in INDICADORES_CENARIOS],
+            }
+            for cenario, totais_cenario in zip(cenarios, totais)
+        ],
+    }
+
+
+def _moeda(valor):
+    """Como o filtro floatformat:2 do template"""
+    return floatformat(valor or Decimal('0'), 2)
+
+
+def valores_simulacao(dados):
+    """Textos que a página troca ao simular alíquotas, na ordem das linhas das tabelas"""
+    def campos_produto(prod):
+        return {f'{campo}_fmt': prod.get(f'{campo}_fmt', '0,00') for campo in CAMPOS_REFORMA}
+
+    return {
+        'produtos_entradas': [campos_produto(prod) for prod in dados['produtos_entradas']],
+        'produtos_saidas': [campos_produto(prod) for prod in dados['produtos_saidas']],
+        'fornecedores_entradas': [
+            {'ibs_cbs_efetivo': _moeda(forn['ibs_cbs_efetivo']), 'total_reforma': _moeda(forn['total_reforma'])}
+            for forn in dados['fornecedores_entradas']
+        ],
+        'totais': {
+            'creditos_ibs_cbs_fmt': dados['creditos_ibs_cbs_fmt'],
+            'compra_total_reforma_fmt': dados['compra_total_reforma_fmt'],
+            'carga_entradas_reforma': dados['carga_entradas_reforma'],
+            'total_ibs_cbs_unit_entradas_fmt': dados['total_ibs_cbs_unit_entradas_fmt'],
+            'total_ibs_cbs_entradas_fmt': dados['total_ibs_cbs_entradas_fmt'],
+            'total_reforma_unit_entradas_fmt': dados['total_reforma_unit_entradas_fmt'],
+            'total_reforma_entradas_fmt': dados['total_reforma_entradas_fmt'],
+            'total_dif_unit_entradas_fmt': dados['total_dif_unit_entradas_fmt'],
+            'total_dif_total_entradas_fmt': dados['total_dif_total_entradas_fmt'],
+            'total_fornecedores_ibs_cbs': _moeda(dados['total_fornecedores_ibs_cbs']),
+            'total_fornecedores_reforma': _moeda(dados['total_fornecedores_reforma']),
+            'debitos_ibs_cbs': _moeda(dados['debitos_ibs_cbs']),
+            'venda_total_reforma': _moeda(dados['venda_total_reforma']),
+            'carga_saidas_reforma': dados['carga_saidas_reforma'],
+            'total_ibs_cbs_saidas': _moeda(dados['total_ibs_cbs_saidas']),
+            'debitos_reforma': _moeda(dados['debitos_reforma']),
+            'creditos_reforma': _moeda(dados['creditos_reforma']),
+            'resultado_reforma': _moeda(dados['resultado_reforma']),
+            'carga_reforma': dados['carga_reforma'],
+        },
+    }
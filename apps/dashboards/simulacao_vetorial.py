@@ -0,0 +1,400 @@
+"""
+Simulação vetorial (NumPy) das alíquotas da reforma
+
+Mesmo cálculo das regras de simulacao.REGRAS, feito de uma vez para todos os
+produtos de cada regra: as colunas agregadas (valor_total, icms, icms_st,
+ipi, pis, cofins, quantidade) viram arrays int64 em centavos (a quantidade
+em 10^-5) e os arredondamentos são feitos em inteiros — meio para cima nas
+entradas do SPED, meio para o par nas demais — reproduzindo exatamente o
+quantize em Decimal, inclusive o sinal do zero (-0,00).
+
+As colunas são carregadas uma vez, junto com as agregações em cache
+(colunas_relatorio); cada simulação só refaz as contas e converte o
+resultado em Decimal. Sem NumPy, ou quando algum valor não cabe em int64
+com as casas necessárias, aplicar_regras() devolve False e a simulação
+segue em Decimal.
+"""
+from decimal import Decimal
+from functools import partial
+
+from apps.dashboards.simulacao import CAMPOS_REFORMA, REGRAS_COM_REDUCAO, formatar_valor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Colunas lidas dos produtos: campo -> casas decimais
+COLUNAS = {
+    'valor_total': 2,
+    'icms': 2,
+    'icms_st': 2,
+    'ipi': 2,
+    'pis': 2,
+    'cofins': 2,
+    'quantidade': 5,
+    'valor_bruto_unit': 2,
+}
+TRIBUTOS = ['icms', 'icms_st', 'ipi', 'pis', 'cofins']
+LISTAS = ['produtos_entradas', 'produtos_consumo', 'produtos_saidas']
+
+# Maior valor intermediário aceito (o arredondamento ainda dobra o resto da divisão)
+LIMITE = 2 ** 62
+
+ZERO = Decimal('0')
+ZERO_NEGATIVO = Decimal('-0.00')
+TEXTO_CENTAVOS = [f',{centavo:02d}' for centavo in range(100)]
+
+
+class ForaDeEscala(Exception):
+    """Valor que não cabe em int64 com as casas decimais usadas"""
+
+
+def _maximo(coluna):
+    valores = coluna[0]
+    return int(np.abs(valores).max()) if valores.size else 0
+
+
+def _inteiros(valores, casas):
+    """Decimais como (int64 em 10^-casas, sinal de cada valor); -0 mantém o sinal"""
+    inteiros = []
+    for valor in valores:
+        escalado = valor.scaleb(casas)
+        inteiro = int(escalado)
+        if inteiro != escalado or abs(inteiro) > LIMITE:
+            raise ForaDeEscala(valor)
+        inteiros.append(inteiro)
+    return (
+        np.array(inteiros, dtype=np.int64),
+        np.fromiter((valor.is_signed() for valor in valores), dtype=bool, count=len(valores)),
+    )
+
+
+def _somar(a, b):
+    """a + b como no Decimal: zero só é negativo quando as duas parcelas são -0"""
+    valores = a[0] + b[0]
+    return valores, np.where(valores != 0, valores < 0, a[1] & b[1])
+
+
+def _subtrair(a, b):
+    return _somar(a, (-b[0], ~b[1]))
+
+
+def _dividir(numerador, divisor, negativo, meio_para_cima):
+    """
+    numerador / divisor arredondado para inteiro (divisor positivo); negativo
+    é o sinal do quociente, que o Decimal mantém mesmo quando o resultado é zero
+    """
+    quociente, resto = np.divmod(numerador, divisor)
+    dobro = 2 * resto
+    if meio_para_cima:
+        empate = numerador >= 0
+    else:
+        empate = (quociente % 2) == 1
+    quociente += (dobro > divisor) | ((dobro == divisor) & empate)
+    return quociente, negativo
+
+
+def _divisor_aliquota(casas_aliquota):
+    """100 * 10^casas, o divisor de liquido * alíquota, desde que caiba em int64"""
+    divisor = 100 * 10 ** casas_aliquota
+    if divisor > LIMITE:
+        raise ForaDeEscala(f'aliquota com {casas_aliquota} casas')
+    return divisor
+
+
+def _multiplicar_aliquota(liquido, aliquotas, casas_aliquota, meio_para_cima):
+    """liquido * alíquota / 100 em centavos (alíquotas em 10^-casas_aliquota)"""
+    divisor = _divisor_aliquota(casas_aliquota)
+    if _maximo(liquido) * _maximo(aliquotas) > LIMITE:
+        raise ForaDeEscala('liquido * aliquota')
+    return _dividir(liquido[0] * aliquotas[0], divisor, liquido[1] ^ aliquotas[1], meio_para_cima)
+
+
+def _por_quantidade(valor, qtd, meio_para_cima):
+    """valor / quantidade em centavos (quantidade em 10^-5, diferente de zero)"""
+    fator = 10 ** COLUNAS['quantidade']
+    if _maximo(valor) * fator > LIMITE:
+        raise ForaDeEscala('valor / quantidade')
+    numerador = valor[0] * fator
+    return _dividir(
+        np.where(qtd[0] > 0, numerador, -numerador), np.abs(qtd[0]), valor[1] ^ qtd[1], meio_para_cima,
+    )
+
+
+def _aliquotas(aliquotas):
+    """Alíquotas Decimal como inteiros na menor escala exata comum"""
+    for aliquota in aliquotas:
+        if not aliquota.is_finite():
+            raise ForaDeEscala(aliquota)
+    casas = max([0] + [-aliquota.as_tuple().exponent for aliquota in aliquotas])
+    _divisor_aliquota(casas)
+    return _inteiros(aliquotas, casas), casas
+
+
+def _decimais(coluna):
+    valores, negativos = coluna
+    return [
+        ZERO_NEGATIVO if negativo and not valor else Decimal(valor).scaleb(-2)
+        for valor, negativo in zip(valores.tolist(), negativos.tolist())
+    ]
+
+
+def _qtd(colunas, so_positiva):
+    """Quantidade do divisor das unitárias (1 quando zero, ou não positiva em so_positiva)"""
+    valores, negativos = colunas['quantidade']
+    usar = valores > 0 if so_positiva else valores != 0
+    return np.where(usar, valores, 10 ** COLUNAS['quantidade']), np.where(usar, negativos, False)
+
+
+def _formatados(coluna):
+    """Como simulacao.formatar_valor, direto dos centavos"""
+    valores, negativos = coluna
+    reais, centavos = np.divmod(np.abs(valores), 100)
+    return [
+        ('-' if negativo else '') + f'{real:,}'.replace(',', '.') + TEXTO_CENTAVOS[centavo]
+        for real, centavo, negativo in zip(reais.tolist(), centavos.tolist(), negativos.tolist())
+    ]
+
+
+def _resultados(colunas, formatar=()):
+    """Colunas de resultados como listas de Decimais, com os campos *_fmt pedidos"""
+    valores = {campo: _decimais(coluna) if isinstance(coluna, tuple) else coluna for campo, coluna in colunas.items()}
+    for campo in formatar:
+        if isinstance(colunas[campo], tuple):
+            valores[f'{campo}_fmt'] = _formatados(colunas[campo])
+        else:
+            # Alíquotas: poucos valores distintos
+            textos = {}
+            valores[f'{campo}_fmt'] = [
+                textos.get(valor) or textos.setdefault(valor, formatar_valor(valor)) for valor in colunas[campo]
+            ]
+    return valores
+
+
+def _ordenar_regras(sequencias):
+    """Ordem das regras compatível com a de cada produto (None se não houver uma)"""
+    anteriores = {regra: set() for sequencia in sequencias for regra in sequencia}
+    for sequencia in sequencias:
+        for anterior, regra in zip(sequencia, sequencia[1:]):
+            anteriores[regra].add(anterior)
+    ordem = []
+    while anteriores:
+        livres = [regra for regra, pendentes in anteriores.items() if not pendentes - set(ordem)]
+        if not livres:
+            return None
+        for regra in livres:
+            ordem.append(regra)
+            del anteriores[regra]
+    return ordem
+
+
+class ColunasProdutos:
+    """Colunas inteiras de uma lista de produtos e as posições de cada regra de 'regras_reforma'"""
+
+    def __init__(self, produtos):
+        self.colunas = {
+            campo: _inteiros([prod.get(campo, ZERO) for prod in produtos], casas)
+            for campo, casas in COLUNAS.items()
+        }
+        # Líquido e tributos somados na mesma ordem do relatório
+        tributos = self.colunas['icms']
+        for campo in TRIBUTOS[1:]:
+            tributos = _somar(tributos, self.colunas[campo])
+        self.colunas['total_tributos'] = tributos
+        self.colunas['valor_liquido'] = _subtrair(self.colunas['valor_total'], tributos)
+
+        # Percentuais de redução distintos (pelo texto, que guarda as casas) e o índice de cada produto neles
+        reducoes = {}
+        indices = []
+        for prod in produtos:
+            perc = prod.get('perc_reducao', ZERO)
+            indices.append(reducoes.setdefault(str(perc), (len(reducoes), perc))[0])
+        self.reducoes = [perc for _, perc in reducoes.values()]
+        self.reducao = np.array(indices, dtype=np.intp)
+
+        regras = {}
+        for indice, prod in enumerate(produtos):
+            for regra in prod['regras_reforma']:
+                regras.setdefault(regra, []).append(indice)
+        self.regras = {regra: np.array(indices, dtype=np.intp) for regra, indices in regras.items()}
+        self.ordem_regras = _ordenar_regras({tuple(prod['regras_reforma']) for prod in produtos})
+
+        # Posições dos produtos de cada NCM (reduções por NCM dos cenários)
+        ncms = {}
+        for indice, prod in enumerate(produtos):
+            ncms.setdefault(str(prod.get('ncm') or '').strip(), []).append(indice)
+        self.indices_ncm = {ncm: np.array(indices, dtype=np.intp) for ncm, indices in ncms.items()}
+
+    def de_regra(self, regra):
+        """Colunas só dos produtos da regra"""
+        indices = self.regras[regra]
+        colunas = {campo: (valores[indices], sinais[indices]) for campo, (valores, sinais) in self.colunas.items()}
+        return colunas, self.reducao[indices]
+
+
+def carregar_colunas(produtos):
+    """ColunasProdutos dos produtos, ou None quando o cálculo vetorial não se aplica"""
+    if np is None:
+        return None
+    try:
+        tabela = ColunasProdutos(produtos)
+    except ForaDeEscala:
+        return None
+    return tabela if tabela.ordem_regras is not None else None
+
+
+def colunas_relatorio(dados):
+    """Colunas de cada lista de produtos do relatório (guardadas com as agregações)"""
+    return {lista: carregar_colunas(dados[lista]) for lista in LISTAS}
+
+
+# Regras que gravam a alíquota e os campos formatados
+REGRAS_FORMATADAS = {'sped', 'saida_api', 'api_formatada'}
+
+
+def _reforma_produto(colunas, aliquotas, casas, meio_para_cima):
+    """Vetorial de simulacao._reforma_produto"""
+    ibs_cbs = _multiplicar_aliquota(colunas['valor_liquido'], aliquotas, casas, meio_para_cima)
+    total_reforma = _somar(colunas['valor_liquido'], ibs_cbs)
+    dif_total = _subtrair(ibs_cbs, colunas['total_tributos'])
+    qtd = _qtd(colunas, so_positiva=True)
+    return {
+        'ibs_cbs': ibs_cbs,
+        'total_reforma': total_reforma,
+        'dif_total': dif_total,
+        'ibs_cbs_unit': _por_quantidade(ibs_cbs, qtd, meio_para_cima),
+        'total_reforma_unit': _por_quantidade(total_reforma, qtd, meio_para_cima),
+        'dif_unit': _por_quantidade(dif_total, qtd, meio_para_cima),
+    }
+
+
+def _reforma_api(colunas, aliquotas, casas):
+    """Vetorial de simulacao.reforma_api"""
+    ibs_cbs = _multiplicar_aliquota(colunas['valor_liquido'], aliquotas, casas, meio_para_cima=False)
+    total_reforma = _somar(colunas['valor_liquido'], ibs_cbs)
+    qtd = _qtd(colunas, so_positiva=False)
+    total_reforma_unit = _por_quantidade(total_reforma, qtd, meio_para_cima=False)
+    return {
+        'ibs_cbs': ibs_cbs,
+        'ibs_cbs_unit': _por_quantidade(ibs_cbs, qtd, meio_para_cima=False),
+        'total_reforma': total_reforma,
+        'total_reforma_unit': total_reforma_unit,
+        'dif_unit': _subtrair(total_reforma_unit, colunas['valor_bruto_unit']),
+        'dif_total': _subtrair(total_reforma, colunas['valor_total']),
+    }
+
+
+def _reforma_saida(colunas, aliquotas, casas):
+    """Vetorial de simulacao.reforma_saida"""
+    return {'ibs_cbs': _multiplicar_aliquota(colunas['valor_liquido'], aliquotas, casas, meio_para_cima=False)}
+
+
+# Cálculo inteiro de cada regra de simulacao.REGRAS; as alíquotas podem ter uma
+# linha por cenário (cenários x produtos), os resultados seguem o mesmo formato
+CALCULOS = {
+    'sped': partial(_reforma_produto, meio_para_cima=True),
+    'api': _reforma_api,
+    'api_formatada': _reforma_api,
+    'saida': _reforma_saida,
+    'saida_api': partial(_reforma_produto, meio_para_cima=False),
+}
+
+
+def _simular_regra(tabela, regra, aliq_total):
+    """Resultados da regra para os seus produtos, como os grava simulacao.REGRAS"""
+    colunas, reducao = tabela.de_regra(regra)
+    if regra in REGRAS_COM_REDUCAO:
+        aliq_efetivas = [aliq_total * (Decimal('1') - perc / Decimal('100')) for perc in tabela.reducoes]
+    else:
+        aliq_efetivas, reducao = [aliq_total], np.zeros_like(reducao)
+    (valores, sinais), casas = _aliquotas(aliq_efetivas)
+    resultado = CALCULOS[regra](colunas, (valores[reducao], sinais[reducao]), casas)
+    if regra not in REGRAS_FORMATADAS:
+        return _resultados(resultado)
+    resultado['aliq_ibs_cbs'] = [aliq_efetivas[indice] for indice in reducao.tolist()]
+    return _resultados(resultado, formatar=CAMPOS_REFORMA)
+
+
+def aplicar_regras(produtos, aliq_total, tabela=None):
+    """
+    Aplica aos produtos (alterados no lugar) as regras de cada um em
+    'regras_reforma', a partir das colunas já carregadas em tabela quando
+    houver; False quando o cálculo precisa seguir em Decimal
+    """
+    if tabela is None:
+        tabela = carregar_colunas(produtos)
+        if tabela is None:
+            return False
+
+    try:
+        resultados = {regra: _simular_regra(tabela, regra, aliq_total) for regra in tabela.ordem_regras}
+    except ForaDeEscala:
+        return False
+
+    # Cada produto recebe as regras na sua ordem, como em simulacao.aplicar_aliquotas
+    for regra in tabela.ordem_regras:
+        produtos_regra = [produtos[indice] for indice in tabela.regras[regra].tolist()]
+        for campo, valores in resultados[regra].items():
+            for prod, valor in zip(produtos_regra, valores):
+                prod[campo] = valor
+    return True
+
+
+def _aliquotas_cenarios(tabela, regra, indices, cenarios):
+    """
+    Alíquotas efetivas (cenários x produtos da regra): a redução do NCM nas
+    regras que a usam, trocada pela redução do cenário nos NCMs informados
+    """
+    percentuais = {}
+
+    def indice_perc(perc):
+        return percentuais.setdefault(str(perc), (len(percentuais), perc))[0]
+
+    if regra in REGRAS_COM_REDUCAO:
+        base = np.array([indice_perc(perc) for perc in tabela.reducoes], dtype=np.intp)[tabela.reducao[indices]]
+    else:
+        base = np.full(len(indices), indice_perc(ZERO), dtype=np.intp)
+    linhas = np.tile(base, (len(cenarios), 1))
+    for linha, (_, reducoes_ncm) in zip(linhas, cenarios):
+        for ncm, perc in reducoes_ncm.items():
+            produtos_ncm = tabela.indices_ncm.get(ncm)
+            if produtos_ncm is not None:
+                linha[np.isin(indices, produtos_ncm)] = indice_perc(perc)
+
+    percs = [perc for _, perc in percentuais.values()]
+    aliq_efetivas = [aliq_total * (Decimal('1') - perc / Decimal('100')) for aliq_total, _ in cenarios for perc in percs]
+    (valores, sinais), casas = _aliquotas(aliq_efetivas)
+    posicoes = np.arange(len(cenarios))[:, None] * len(percs) + linhas
+    return (valores[posicoes], sinais[posicoes]), casas
+
+
+def somas_cenarios(tabela, cenarios, campos):
+    """
+    Somas dos campos de reforma dos produtos em cada cenário (aliq_total,
+    {ncm: perc_reducao}), todos calculados juntos; None quando o cálculo
+    precisa seguir em Decimal
+    """
+    if tabela is None:
+        return None
+    total = len(tabela.reducao)
+    finais = {campo: np.zeros((len(cenarios), total), dtype=np.int64) for campo in campos}
+    try:
+        # Na ordem das regras: a última regra de cada produto prevalece
+        for regra in tabela.ordem_regras:
+            indices = tabela.regras[regra]
+            colunas, _ = tabela.de_regra(regra)
+            aliquotas, casas = _aliquotas_cenarios(tabela, regra, indices, cenarios)
+            for campo, (valores, _) in CALCULOS[regra](colunas, aliquotas, casas).items():
+                if campo in finais:
+                    finais[campo][:, indices] = valores
+        if any(_maximo((valores,)) * max(total, 1) > LIMITE for valores in finais.values()):
+            raise ForaDeEscala('soma dos produtos')
+    except ForaDeEscala:
+        return None
+
+    somas = {campo: valores.sum(axis=1).tolist() for campo, valores in finais.items()}
+    return [
+        {campo: Decimal(somas[campo][indice]).scaleb(-2) for campo in campos}
+        for indice in range(len(cenarios))
+    ]
@@ -0,0 +1,859 @@
+import io
+import json
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import skipIf
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.dashboards import armazem_xml, busca_api, meudanfe, simulacao, simulacao_vetorial
+from apps.dashboards.agregacoes import (
+    SUFIXOS_COMPRA_EFETIVA, SUFIXOS_CONSUMO, SUFIXOS_VENDA_EFETIVA, documentos_por_participante,
+    pis_cofins_por_cfop, produtos_entrada, produtos_saida,
+)
+from apps.dashboards.cache_relatorio import versoes_empresas
+from apps.dashboards.composicao import (
+    CFOPS_EFETIVOS, ORDENS, FiltroComposicao, linhas_composicao, pagina_composicao, totais_composicao,
+)
+from apps.dashboards.models import AjusteManualICMS, ConsultaChaveAPI, EstadoCotaAPI, ProdutoEntradaAPI
+from apps.dashboards.secoes_relatorio import ConsultaRelatorio
+from apps.dashboards.views import _aliquotas_da_requisicao
+from apps.empresa.models import UF, Empresa
+from apps.sped.models import (
+    ComposicaoNF, Registro0000, Registro0150, Registro0200, RegistroC100, RegistroC170, RegistroC190, ResumoDocumento,
+    ResumoItem,
+)
+from apps.sped.resumos import atualizar_resumos
+
+# Documentos dos períodos de teste: (período, num_doc, ind_oper, cod_part, itens, C190)
+# itens: (cod_item, cfop, qtd, vl_item, cod_ncm, descr_compl); C190: (cfop, vl_opr)
+DOCUMENTOS = [
+    ('2025-01-01', '1001', '0', 'F1', [
+        ('P1', '1102', '10', '333.33', '73181500', 'PARAFUSO 1/4'),
+        ('P2', '1102', '1.33333', '0.10', '25232910', ''),
+        ('P3', '1407', '5', '89.90', '', 'LUVA'),
+    ], [('1102', '383.43'), ('1407', '89.90')]),
+    ('2025-01-01', '1002', '0', 'F2', [
+        ('P1', '2102', '3', '1234.57', '73181500', ''),
+        ('P2', '1411', '1', '40.00', '25232910', ''),
+    ], [('2102', '1234.57'), ('1411', '40.00')]),
+    ('2025-01-01', '1003', '0', 'F1', [], [('1102', '500.00')]),
+    ('2025-01-01', '1004', '0', 'F1', [
+        ('P1', '1102', '1', '5.55', '73181599', ''),
+        ('P3', '1407', '1', '10.00', '', 'LUVA P'),
+    ], [('1102', '5.55'), ('1407', '10.00')]),
+    ('2025-01-01', '5001', '1', 'C1', [
+        ('P1', '5102', '2', '999.99', '73181500', ''),
+        ('P2', '5910', '1', '10.00', '25232910', ''),
+    ], []),
+    ('2025-01-01', '5002', '1', 'C2', [('P1', '6102', '0.5', '100.01', '73181500', '')], []),
+    ('2025-02-01', '2001', '0', 'F2', [
+        ('P1', '1102', '0.00001', '0.01', '73181600', ''),
+        ('P3', '1556', '2', '12.34', '', 'LUVA G'),
+    ], [('1102', '0.01'), ('1556', '12.34')]),
+    ('2025-02-01', '6001', '1', 'C1', [('P2', '5102', '7', '77.77', '25232910', '')], []),
+]
+# 0200 por período: (cod_item, descr_item, cod_ncm); P1 reclassificado em fevereiro, P3 sem 0200
+ITENS_0200 = {
+    '2025-01-01': [('P1', 'PARAFUSO', '73181500'), ('P2', 'CIMENTO', '25232910')],
+    '2025-02-01': [('P1', 'PARAFUSO INOX', '73181600')],
+}
+
+
+def _produtos():
+    """Produtos pequenos cobrindo as regras de simulacao.REGRAS"""
+    regras = [['sped'], ['sped', 'api'], ['api_formatada'], ['saida'], ['saida_api']]
+    produtos = []
+    for indice, regras_reforma in enumerate(regras * 2):
+        valor_total = Decimal(123_457 * (indice + 1)).scaleb(-2)
+        prod = {
+            'valor_total': valor_total,
+            'icms': (valor_total * Decimal('0.18')).quantize(simulacao.CENTAVOS),
+            'icms_st': Decimal('0'),
+            'ipi': Decimal('1.05'),
+            'pis': (valor_total * Decimal('0.0165')).quantize(simulacao.CENTAVOS),
+            'cofins': (valor_total * Decimal('0.076')).quantize(simulacao.CENTAVOS),
+            'quantidade': Decimal(indice * 37).scaleb(-1),
+            'perc_reducao': Decimal('60') if indice % 3 == 0 else Decimal('0'),
+            'regras_reforma': regras_reforma,
+        }
+        prod['total_tributos'] = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
+        prod['valor_liquido'] = valor_total - prod['total_tributos']
+        qtd = prod['quantidade'] if prod['quantidade'] > 0 else Decimal('1')
+        prod['valor_bruto_unit'] = (valor_total / qtd).quantize(simulacao.CENTAVOS)
+        produtos.append(prod)
+    return produtos
+
+
+def _produtos_empate():
+    """
+    Produtos com empates de meio centavo a 1%: IBS/CBS de 0,005 (líquido 0,50, ou
+    1,25 com redução de 60%) e valores unitários de ±0,025 e 2,525 (2 unidades)
+    """
+    produtos = []
+    for regras_reforma in [['sped'], ['sped', 'api'], ['api_formatada'], ['saida'], ['saida_api']]:
+        for valor_liquido, tributos, quantidade, perc_reducao in [
+            ('0.50', '0', '1', '0'), ('1.25', '0', '1', '60'), ('5.00', '0.10', '2', '0'),
+        ]:
+            valor_liquido, tributos, quantidade = Decimal(valor_liquido), Decimal(tributos), Decimal(quantidade)
+            valor_total = valor_liquido + tributos
+            produtos.append({
+                'valor_total': valor_total,
+                'icms': tributos,
+                'icms_st': Decimal('0'),
+                'ipi': Decimal('0'),
+                'pis': Decimal('0'),
+                'cofins': Decimal('0'),
+                'quantidade': quantidade,
+                'perc_reducao': Decimal(perc_reducao),
+                'regras_reforma': regras_reforma,
+                'total_tributos': tributos,
+                'valor_liquido': valor_liquido,
+                'valor_bruto_unit': (valor_total / quantidade).quantize(simulacao.CENTAVOS),
+            })
+    return produtos
+
+
+def _centavos(valor, taxa):
+    return (valor * Decimal(taxa)).quantize(simulacao.CENTAVOS)
+
+
+def _criar_periodos(empresa):
+    """Registros 0000 processados com DOCUMENTOS e ITENS_0200, com os resumos gerados"""
+    registros = {}
+    for periodo, itens_0200 in ITENS_0200.items():
+        registro = registros[periodo] = Registro0000.objects.create(
+            empresa=empresa, tipo='fiscal', periodo=periodo, processado=True,
+        )
+        for cod_item, descr_item, cod_ncm in itens_0200:
+            Registro0200.objects.create(registro_0000=registro, cod_item=cod_item, descr_item=descr_item, cod_ncm=cod_ncm)
+    for periodo, num_doc, ind_oper, cod_part, itens, analiticos in DOCUMENTOS:
+        valores = [Decimal(vl_item) for _, _, _, vl_item, _, _ in itens]
+        doc = RegistroC100.objects.create(
+            registro_0000=registros[periodo], ind_oper=ind_oper, ind_emit='1', cod_part=cod_part, cod_mod='55',
+            cod_sit='00', num_doc=num_doc,
+            vl_doc=sum((Decimal(vl_opr) for _, vl_opr in analiticos), sum(valores, Decimal('0'))) if analiticos
+            else sum(valores, Decimal('0')),
+            vl_icms=sum((_centavos(vl, '0.18') for vl in valores), Decimal('0')),
+            vl_pis=sum((_centavos(vl, '0.0165') for vl in valores), Decimal('0')),
+            vl_cofins=sum((_centavos(vl, '0.076') for vl in valores), Decimal('0')),
+        )
+        for num_item, (cod_item, cfop, qtd, vl_item, cod_ncm, descr_compl) in enumerate(itens, 1):
+            vl_item = Decimal(vl_item)
+            RegistroC170.objects.create(
+                registro_c100=doc, num_item=str(num_item), cod_item=cod_item, descr_compl=descr_compl,
+                qtd=Decimal(qtd), vl_item=vl_item, cfop=cfop, cod_ncm=cod_ncm,
+                vl_bc_icms=vl_item, vl_icms=_centavos(vl_item, '0.18'),
+                vl_bc_pis=vl_item, vl_pis=_centavos(vl_item, '0.0165'),
+                vl_bc_cofins=vl_item, vl_cofins=_centavos(vl_item, '0.076'),
+            )
+        for cfop, vl_opr in analiticos:
+            RegistroC190.objects.create(registro_c100=doc, cst_icms='000', cfop=cfop, vl_opr=Decimal(vl_opr))
+    for registro in registros.values():
+        atualizar_resumos(registro)
+    return list(registros.values())
+
+
+def _itens_0200_c170(registros):
+    """0200 de todos os períodos, o último prevalecendo (como o relatório fazia antes dos resumos)"""
+    return {
+        item.cod_item: {'descricao': item.descr_item, 'ncm': item.cod_ncm}
+        for item in Registro0200.objects.filter(registro_0000__in=registros).order_by('registro_0000_id', 'id')
+    }
+
+
+def _produtos_c170(itens, itens_0200, sufixos, prefixos=None):
+    """Produtos somados item a item, como o relatório fazia antes dos resumos (prefixos=None: saídas)"""
+    campos = {'quantidade': 'qtd', 'valor_total': 'vl_item', 'icms': 'vl_icms', 'pis': 'vl_pis', 'cofins': 'vl_cofins'}
+    if prefixos:
+        campos.update(vl_bc_icms='vl_bc_icms', vl_bc_pis='vl_bc_pis', vl_bc_cofins='vl_bc_cofins')
+    produtos = {}
+    for item in itens.order_by('id'):
+        cfop = (item.cfop or '').replace('.', '').strip()
+        if len(cfop) < 4 or cfop[1:] not in sufixos or (prefixos and cfop[0] not in prefixos):
+            continue
+        prod = produtos.get(item.cod_item)
+        if prod is None:
+            info_item = itens_0200.get(item.cod_item, {})
+            prod = produtos[item.cod_item] = {
+                'codigo': item.cod_item,
+                'descricao': info_item.get('descricao', item.descr_compl or item.cod_item),
+                'ncm': item.cod_ncm or info_item.get('ncm', ''),
+                **dict.fromkeys(['icms_st', 'ipi', *campos], Decimal('0')),
+                **({'cfops': set()} if prefixos else {'cfop': item.cfop}),
+            }
+        for nome, campo in campos.items():
+            prod[nome] += getattr(item, campo)
+        if prefixos:
+            prod['cfops'].add(cfop)
+    return produtos
+
+
+def _composicao_c170(registros, ind_oper):
+    """
+    Composição por NF montada item a item como antes dos resumos, ordenada por
+    (num_doc, cfop, codigo). A descrição vem do 0200 do próprio período: a
+    ComposicaoNF é gerada por período na importação
+    """
+    linhas = []
+    soma_por_nf_cfop = {}
+    itens = RegistroC170.objects.filter(
+        registro_c100__registro_0000__in=registros, registro_c100__ind_oper=ind_oper,
+    ).select_related('registro_c100').order_by('id')
+    for item in itens:
+        doc = item.registro_c100
+        item_0200 = Registro0200.objects.filter(registro_0000=doc.registro_0000_id, cod_item=item.cod_item).first()
+        cfop = item.cfop.replace('.', '').strip()
+        linhas.append({
+            'num_doc': doc.num_doc,
+            'cfop': cfop,
+            'codigo': item.cod_item,
+            'descricao': item_0200.descr_item if item_0200 else item.descr_compl or item.cod_item,
+            'valor': float(item.vl_item),
+        })
+        soma_por_nf_cfop[doc.num_doc, cfop] = soma_por_nf_cfop.get((doc.num_doc, cfop), Decimal('0')) + item.vl_item
+    if ind_oper == '0':
+        c190_por_nf_cfop = {}
+        for c190 in RegistroC190.objects.filter(
+            registro_c100__registro_0000__in=registros, registro_c100__ind_oper='0',
+        ).select_related('registro_c100'):
+            chave = (c190.registro_c100.num_doc, c190.cfop)
+            c190_por_nf_cfop[chave] = c190_por_nf_cfop.get(chave, Decimal('0')) + c190.vl_opr
+        for (num_doc, cfop), vl_opr in c190_por_nf_cfop.items():
+            soma_c170 = soma_por_nf_cfop.get((num_doc, cfop), Decimal('0'))
+            diferenca = vl_opr - soma_c170
+            if diferenca > Decimal('0.01'):
+                descricao, valor = 'Outras Despesas (Frete/Seguro/Outros)', diferenca
+            elif diferenca < Decimal('-0.01') and soma_c170 == Decimal('0'):
+                descricao, valor = 'Valor da Operação (sem itens C170)', vl_opr
+            else:
+                continue
+            linhas.append({
+                'num_doc': num_doc, 'cfop': cfop, 'codigo': '---', 'descricao': descricao, 'valor': float(valor),
+            })
+        for prod in ProdutoEntradaAPI.objects.order_by('id'):
+            linhas.append({
+                'num_doc': prod.chave_nfe[25:34].lstrip('0') or '0',
+                'cfop': prod.cfop.replace('.', '').strip(),
+                'codigo': prod.codigo,
+                'descricao': prod.descricao,
+                'valor': float(prod.valor_total),
+            })
+    return sorted(linhas, key=lambda linha: (linha['num_doc'], linha['cfop'], linha['codigo']))
+
+
+def _chave(numero):
+    """Chave de acesso de NF-e (modelo 55) com o número informado"""
+    return f'3525011234567800019955001{numero:09d}1{numero:08d}0'
+
+
+def _xml_nfe(chave, *itens):
+    """XML de NF-e com os itens (codigo, descricao, cfop, quantidade, valor)"""
+    dets = ''.join(
+        f'<det nItem="{numero}"><prod><cProd>{codigo}</cProd><xProd>{descricao}</xProd><NCM>38244000</NCM>'
+        f'<CFOP>{cfop}</CFOP><uCom>UN</uCom><qCom>{quantidade}</qCom><vProd>{valor}</vProd></prod>'
+        f'<imposto><ICMS><ICMS00><CST>00</CST><pICMS>18.00</pICMS><vICMS>1.80</vICMS></ICMS00></ICMS></imposto></det>'
+        for numero, (codigo, descricao, cfop, quantidade, valor) in enumerate(itens, 1)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?><nfeProc xmlns="http://www.portalfiscal.inf.br/nfe"><NFe>'
+        f'<infNFe Id="NFe{chave}"><ide><mod>55</mod><tpNF>0</tpNF><nNF>{int(chave[25:34])}</nNF></ide>{dets}'
+        '</infNFe></NFe></nfeProc>'
+    )
+
+
+class _RespostasMeuDanfe(BaseHTTPRequestHandler):
+    """
+    MeuDanfe local: server.respostas[chave] é o XML da nota, 'NOT_FOUND' ou um
+    status HTTP (chave ausente = NOT_FOUND); server.requisicoes guarda
+    (método, rota, Api-Key) de cada requisição
+    """
+
+    def _responder(self, status, dados=None):
+        corpo = json.dumps(dados or {}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _resposta(self, metodo):
+        self.server.requisicoes.append((metodo, self.path, self.headers.get('Api-Key')))
+        return self.server.respostas.get(self.path.rsplit('/', 1)[-1], 'NOT_FOUND')
+
+    def do_PUT(self):
+        resposta = self._resposta('PUT')
+        if isinstance(resposta, int):
+            self._responder(resposta)
+        else:
+            self._responder(200, {'status': 'NOT_FOUND' if resposta == 'NOT_FOUND' else 'OK'})
+
+    def do_GET(self):
+        self._responder(200, {'data': self._resposta('GET')})
+
+    def log_message(self, *args):
+        pass
+
+
+class MeuDanfeLocalMixin:
+    """MEUDANFE_URL apontando para um servidor local (_RespostasMeuDanfe) e MEDIA_ROOT temporário"""
+
+    def setUp(self):
+        super().setUp()
+        self.servidor = ThreadingHTTPServer(('127.0.0.1', 0), _RespostasMeuDanfe)
+        self.servidor.respostas = {}
+        self.servidor.requisicoes = []
+        threading.Thread(target=self.servidor.serve_forever, args=(0.05,), daemon=True).start()
+        self.addCleanup(self.servidor.server_close)
+        self.addCleanup(self.servidor.shutdown)
+
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        configuracao = override_settings(
+            MEUDANFE_URL=f'http://127.0.0.1:{self.servidor.server_port}',
+            MEUDANFE_API_KEY='chave-teste',
+            MEUDANFE_CONCORRENCIA=2,
+            MEUDANFE_REQUISICOES_POR_SEGUNDO=0,
+            MEDIA_ROOT=media,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        )
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def rotas(self, metodo=None):
+        return [rota for requisicao, rota, _ in self.servidor.requisicoes if metodo in (None, requisicao)]
+
+
+def _textos(produtos):
+    return [{campo: str(valor) for campo, valor in prod.items()} for prod in produtos]
+
+
+@skipIf(simulacao_vetorial.np is None, 'NumPy não instalado')
+class SimulacaoVetorialTests(SimpleTestCase):
+    ALIQUOTAS = ['26.5', '1', '0', '0.000000000000000001', '1E-20', '123456789.123456789', '-3.25']
+
+    def _decimal(self, produtos, aliq_total):
+        for prod in produtos:
+            for regra in prod['regras_reforma']:
+                simulacao.REGRAS[regra](prod, aliq_total)
+        return produtos
+
+    def test_mesmo_resultado_que_decimal(self):
+        base = _produtos() + _produtos_empate()
+        tabela = simulacao_vetorial.carregar_colunas(base)
+        for texto in self.ALIQUOTAS:
+            with self.subTest(aliquota=texto):
+                aliq_total = Decimal(texto)
+                esperado = self._decimal([dict(prod) for prod in base], aliq_total)
+                vetoriais = [dict(prod) for prod in base]
+                if not simulacao_vetorial.aplicar_regras(vetoriais, aliq_total, tabela):
+                    # Fora da escala do cálculo inteiro: segue em Decimal
+                    vetoriais = self._decimal(vetoriais, aliq_total)
+                self.assertEqual(_textos(vetoriais), _textos(esperado))
+
+    def test_empates_meio_para_cima_so_na_regra_sped(self):
+        """A regra 'sped' arredonda o meio centavo para cima, como o relatório original; as demais para o par"""
+        produtos = _produtos_empate()
+        self.assertTrue(simulacao_vetorial.aplicar_regras(
+            produtos, Decimal('1'), simulacao_vetorial.carregar_colunas(produtos),
+        ))
+        valores = {
+            (prod['regras_reforma'][0], prod['valor_liquido']): prod for prod in produtos
+            if len(prod['regras_reforma']) == 1
+        }
+        self.assertEqual(valores['sped', Decimal('0.50')]['ibs_cbs'], Decimal('0.01'))
+        self.assertEqual(valores['sped', Decimal('1.25')]['ibs_cbs'], Decimal('0.01'))
+        self.assertEqual(valores['sped', Decimal('5.00')]['ibs_cbs_unit'], Decimal('0.03'))
+        self.assertEqual(valores['sped', Decimal('5.00')]['dif_unit'], Decimal('-0.03'))
+        self.assertEqual(valores['sped', Decimal('5.00')]['total_reforma_unit'], Decimal('2.53'))
+        self.assertEqual(valores['saida', Decimal('0.50')]['ibs_cbs'], Decimal('0.00'))
+        self.assertEqual(valores['saida_api', Decimal('1.25')]['ibs_cbs'], Decimal('0.00'))
+        self.assertEqual(valores['saida_api', Decimal('5.00')]['ibs_cbs_unit'], Decimal('0.02'))
+        self.assertEqual(valores['saida_api', Decimal('5.00')]['dif_unit'], Decimal('-0.02'))
+        self.assertEqual(valores['api_formatada', Decimal('5.00')]['total_reforma_unit'], Decimal('2.52'))
+
+    def test_aliquota_extrema_fica_fora_de_escala(self):
+        tabela = simulacao_vetorial.carregar_colunas(_produtos())
+        for texto in ['0.000000000000000001', '1E-20', 'NaN', 'Infinity', '-Infinity']:
+            with self.subTest(aliquota=texto):
+                produtos = _produtos()
+                self.assertFalse(simulacao_vetorial.aplicar_regras(produtos, Decimal(texto), tabela))
+                cenarios = [(Decimal('26.5'), {}), (Decimal(texto), {})]
+                self.assertIsNone(simulacao_vetorial.somas_cenarios(tabela, cenarios, simulacao.CAMPOS_SOMA_REFORMA))
+
+    def test_somas_cenarios(self):
+        base = _produtos()
+        tabela = simulacao_vetorial.carregar_colunas(base)
+        cenarios = [(Decimal('26.5'), {}), (Decimal('12.25'), {})]
+        somas = simulacao_vetorial.somas_cenarios(tabela, cenarios, simulacao.CAMPOS_SOMA_REFORMA)
+        for (aliq_total, _), soma in zip(cenarios, somas):
+            esperado = simulacao.somar_campos(
+                self._decimal([dict(prod) for prod in base], aliq_total), simulacao.CAMPOS_SOMA_REFORMA,
+            )
+            self.assertEqual(soma, esperado)
+
+
+class AliquotasDaRequisicaoTests(SimpleTestCase):
+    def test_padroes_e_virgula(self):
+        request = RequestFactory().get('/', {'aliquota_ibs': '17,7', 'aliquota_cbs': ''})
+        self.assertEqual(_aliquotas_da_requisicao(request), (Decimal('17.7'), Decimal('8.5'), Decimal('0')))
+
+    def test_rejeita_valores_nao_finitos(self):
+        for texto in ['NaN', 'Infinity', '-inf', 'sNaN', 'abc']:
+            with self.subTest(aliquota=texto):
+                request = RequestFactory().get('/', {'aliquota_ibs': texto})
+                self.assertIsNone(_aliquotas_da_requisicao(request))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class InvalidacaoRelatorioTests(TestCase):
+    def setUp(self):
+        uf = UF.objects.create(codigo=35, sigla='SP', nome='São Paulo')
+        self.empresa = Empresa.objects.create(cnpj_cpf='12345678000199', razao_social='Empresa', uf=uf)
+        self.versao = versoes_empresas([self.empresa.id])
+
+    def test_gravar_produtos_invalida_apos_commit(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            busca_api.gravar_produtos(
+                ProdutoEntradaAPI, self.empresa.id, '2025-01', '2025-01',
+                {'1' * 44: [{'codigo': 'A', 'descricao': 'Produto', 'valor_total': '10.00'}]},
+            )
+            self.assertEqual(versoes_empresas([self.empresa.id]), self.versao)
+        self.assertEqual(len(callbacks), 1)
+        self.assertNotEqual(versoes_empresas([self.empresa.id]), self.versao)
+
+    def test_signal_invalida_apos_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            AjusteManualICMS.objects.create(
+                empresa=self.empresa, periodo_inicial='2025-01', periodo_final='2025-01', codigo='SP000001',
+                descricao='Outros débitos',
+            )
+            self.assertEqual(versoes_empresas([self.empresa.id]), self.versao)
+        self.assertNotEqual(versoes_empresas([self.empresa.id]), self.versao)
+
+    def test_consulta_de_participante_invalida(self):
+        registro = Registro0000.objects.create(
+            empresa=self.empresa, tipo='fiscal', periodo='2025-01-01', processado=True,
+        )
+        participante = Registro0150.objects.create(registro_0000=registro, cod_part='F1', nome='Fornecedor')
+        self.versao = versoes_empresas([self.empresa.id])
+        participante.optante_simples = True
+        participante.consultado = True
+        with self.captureOnCommitCallbacks(execute=True):
+            participante.save()
+            self.assertEqual(versoes_empresas([self.empresa.id]), self.versao)
+        self.assertNotEqual(versoes_empresas([self.empresa.id]), self.versao)
+
+
+class ResumosRelatorioTests(TestCase):
+    """Agregações lidas dos resumos por período iguais às somas item a item dos C170/C100"""
+
+    def setUp(self):
+        uf = UF.objects.create(codigo=35, sigla='SP', nome='São Paulo')
+        empresa = Empresa.objects.create(cnpj_cpf='12345678000199', razao_social='Empresa', uf=uf)
+        self.registros = _criar_periodos(empresa)
+        self.consulta = ConsultaRelatorio(empresa.id, '2025-01', '2025-02', False)
+
+    def _itens(self, ind_oper):
+        return RegistroC170.objects.filter(
+            registro_c100__registro_0000__in=self.registros, registro_c100__ind_oper=ind_oper,
+        )
+
+    def test_produtos_entrada(self):
+        itens_0200 = _itens_0200_c170(self.registros)
+        for sufixos in (SUFIXOS_COMPRA_EFETIVA, SUFIXOS_CONSUMO):
+            with self.subTest(sufixos=sorted(sufixos)[0]):
+                esperado = _produtos_c170(self._itens('0'), itens_0200, sufixos, '12')
+                self.assertTrue(esperado)
+                self.assertEqual(
+                    produtos_entrada(self.consulta.resumos_itens('0'), sufixos, self.consulta.itens_0200), esperado,
+                )
+
+    def test_produtos_saida(self):
+        esperado = _produtos_c170(self._itens('1'), _itens_0200_c170(self.registros), SUFIXOS_VENDA_EFETIVA)
+        self.assertEqual(set(esperado), {'P1', 'P2'})
+        self.assertEqual(produtos_saida(self.consulta.resumos_itens('1'), self.consulta.itens_0200), esperado)
+
+    def test_pis_cofins_por_cfop(self):
+        esperado = {}
+        for item in self._itens('0'):
+            somas = esperado.setdefault(item.cfop, {'cfop': item.cfop, 'pis': Decimal('0'), 'cofins': Decimal('0')})
+            somas['pis'] += item.vl_pis
+            somas['cofins'] += item.vl_cofins
+        self.assertEqual(
+            list(pis_cofins_por_cfop(self.consulta.resumos_itens('0'))), [esperado[cfop] for cfop in sorted(esperado)],
+        )
+
+    def test_documentos_por_participante(self):
+        esperado = {}
+        documentos = RegistroC100.objects.filter(registro_0000__in=self.registros, ind_oper='0').order_by('id')
+        for doc in documentos:
+            somas = esperado.setdefault(doc.cod_part, {
+                'cod_part': doc.cod_part, **dict.fromkeys(['valor_bruto', 'icms', 'pis', 'cofins'], Decimal('0')),
+            })
+            somas['valor_bruto'] += doc.vl_doc
+            somas['icms'] += doc.vl_icms
+            somas['pis'] += doc.vl_pis
+            somas['cofins'] += doc.vl_cofins
+        resumos = ResumoDocumento.objects.filter(registro_0000__in=self.registros, ind_oper='0')
+        self.assertEqual(documentos_por_participante(resumos), list(esperado.values()))
+
+    def test_regerar_resumos_acompanha_os_itens(self):
+        quantidade = ResumoItem.objects.count()
+        item = RegistroC170.objects.get(registro_c100__num_doc='1001', cod_item='P1')
+        item.vl_item = Decimal('300.00')
+        item.save()
+        atualizar_resumos(self.registros[0])
+
+        self.assertEqual(ResumoItem.objects.count(), quantidade)
+        esperado = _produtos_c170(self._itens('0'), _itens_0200_c170(self.registros), SUFIXOS_COMPRA_EFETIVA, '12')
+        self.assertEqual(esperado['P1']['valor_total'], Decimal('1540.13'))
+        self.assertEqual(
+            produtos_entrada(self.consulta.resumos_itens('0'), SUFIXOS_COMPRA_EFETIVA, self.consulta.itens_0200),
+            esperado,
+        )
+
+
+class ComposicaoPaginadaTests(TestCase):
+    """Páginas e totais da composição por NF iguais à lista montada item a item"""
+
+    def setUp(self):
+        uf = UF.objects.create(codigo=35, sigla='SP', nome='São Paulo')
+        empresa = Empresa.objects.create(cnpj_cpf='12345678000199', razao_social='Empresa', uf=uf)
+        self.registros = _criar_periodos(empresa)
+        # Produto de entrada buscado via API com a mesma NF (tirada da chave), CFOP e código de um
+        # item C170: o empate na ordenação é desfeito pela origem
+        ProdutoEntradaAPI.objects.create(
+            empresa=empresa, periodo_inicial='2025-01', periodo_final='2025-02',
+            chave_nfe='35250112345678000199550010000010011000010010', codigo='P1', descricao='PRODUTO API',
+            cfop='1.102', valor_total=Decimal('45.67'),
+        )
+        self.consulta = ConsultaRelatorio(empresa.id, '2025-01', '2025-02', False)
+
+    def _filtro(self, tipo, apos=None, **params):
+        query = QueryDict(mutable=True)
+        for nome, valor in params.items():
+            query.setlist(nome, valor if isinstance(valor, list) else [valor])
+        if apos is not None:
+            query['apos'] = json.dumps(apos)
+        return FiltroComposicao(tipo, query)
+
+    def _paginas(self, tipo, limite=2, **params):
+        """Todas as linhas, seguindo o cursor de página em página"""
+        linhas, apos = [], None
+        for _ in range(50):
+            pagina = pagina_composicao(self.consulta, self._filtro(tipo, apos, limite=str(limite), **params))
+            self.assertLessEqual(len(pagina['itens']), limite)
+            linhas += pagina['itens']
+            apos = pagina['proximo']
+            if apos is None:
+                return linhas
+        self.fail('O cursor não chegou à última página')
+
+    def test_paginas_na_ordem_da_lista_antiga(self):
+        for tipo, ind_oper in (('entradas', '0'), ('saidas', '1')):
+            with self.subTest(tipo=tipo):
+                esperado = _composicao_c170(self.registros, ind_oper)
+                self.assertEqual(self._paginas(tipo), esperado)
+
+    def test_todas_as_ordenacoes(self):
+        esperado = sorted(_composicao_c170(self.registros, '0'), key=lambda linha: sorted(linha.items()))
+        for ordem in ORDENS:
+            for direcao in ('asc', 'desc'):
+                filtro = self._filtro('entradas', ordem=ordem, direcao=direcao)
+                todas = list(linhas_composicao(self.consulta, filtro))
+                self.assertEqual(sorted(todas, key=lambda linha: sorted(linha.items())), esperado)
+                for limite in (1, 2):
+                    with self.subTest(ordem=ordem, direcao=direcao, limite=limite):
+                        self.assertEqual(self._paginas('entradas', limite, ordem=ordem, direcao=direcao), todas)
+
+    def test_filtros_e_totais(self):
+        casos = [
+            ({}, lambda linha: True),
+            ({'efetivas': '1'}, lambda linha: linha['cfop'] in CFOPS_EFETIVOS['entradas']),
+            ({'cfop': ['1102', '1407']}, lambda linha: linha['cfop'] in ('1102', '1407')),
+            ({'busca': 'luva'}, lambda linha: 'luva' in linha['descricao'].lower()),
+        ]
+        for params, condicao in casos:
+            with self.subTest(params=params):
+                esperado = [linha for linha in _composicao_c170(self.registros, '0') if condicao(linha)]
+                self.assertTrue(esperado)
+                self.assertEqual(self._paginas('entradas', **params), esperado)
+
+                valores = [Decimal(str(linha['valor'])) for linha in esperado]
+                outras = [Decimal(str(linha['valor'])) for linha in esperado if linha['codigo'] == '---']
+                por_cfop = {}
+                for linha, valor in zip(esperado, valores):
+                    atual = por_cfop.setdefault(linha['cfop'], {'cfop': linha['cfop'], 'qtd': 0, 'valor': Decimal('0')})
+                    atual['qtd'] += 1
+                    atual['valor'] += valor
+                self.assertEqual(totais_composicao(self.consulta, self._filtro('entradas', **params)), {
+                    'registros': len(esperado),
+                    'total': float(sum(valores)),
+                    'total_produtos': float(sum(valores) - sum(outras)),
+                    'total_outras': float(sum(outras, Decimal('0'))),
+                    'cfops': [
+                        {**info, 'valor': float(info['valor'])} for _, info in sorted(por_cfop.items())
+                    ],
+                })
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class RelatorioSemResumosTests(TestCase):
+    """O relatório só lê os resumos: períodos sem eles ficam para o worker de importação"""
+
+    def setUp(self):
+        uf = UF.objects.create(codigo=35, sigla='SP', nome='São Paulo')
+        self.empresa = Empresa.objects.create(cnpj_cpf='12345678000199', razao_social='Empresa', uf=uf)
+        _criar_periodos(self.empresa)
+        # Períodos importados antes dos resumos
+        for model in (ResumoItem, ResumoDocumento, ComposicaoNF):
+            model.objects.all().delete()
+        Registro0000.objects.update(resumos_em=None)
+        usuario = get_user_model().objects.create_user('analista', password='senha')
+        self.client.force_login(usuario)
+
+    def test_get_nao_grava_resumos(self):
+        params = {'empresa': self.empresa.id, 'periodo_inicial': '2025-01', 'periodo_final': '2025-02'}
+        urls = [
+            reverse('dashboards:api_secao_relatorio_fiscal', args=[secao]) for secao in ('resumo', 'entradas', 'saidas')
+        ] + [reverse('dashboards:api_composicao_relatorio_fiscal', args=[tipo]) for tipo in ('entradas', 'saidas')]
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, params).status_code, 200)
+        self.assertFalse(ResumoItem.objects.exists())
+        self.assertFalse(ResumoDocumento.objects.exists())
+        self.assertFalse(ComposicaoNF.objects.exists())
+        self.assertFalse(Registro0000.objects.filter(resumos_em__isnull=False).exists())
+
+
+class ConsultarChavesTests(MeuDanfeLocalMixin, TestCase):
+    def test_encontrada_e_nao_encontrada(self):
+        encontrada, nao_encontrada = _chave(1), _chave(2)
+        xml = _xml_nfe(encontrada, ('A1', 'PRODUTO A', '5102', '2', '10.00'))
+        self.servidor.respostas[encontrada] = xml
+
+        resultados = meudanfe.consultar_chaves([{'chave_nfe': encontrada}, {'chave_nfe': nao_encontrada}])
+
+        por_chave = {nota['chave_nfe']: resultado for nota, resultado in resultados}
+        self.assertEqual(por_chave[encontrada]['status'], meudanfe.ENCONTRADA)
+        self.assertEqual(por_chave[encontrada]['xml'], xml)
+        self.assertEqual(por_chave[nao_encontrada]['status'], meudanfe.NAO_ENCONTRADA)
+        self.assertEqual(sorted(self.rotas()), sorted([
+            f'/fd/add/{encontrada}', f'/fd/get/xml/{encontrada}', f'/fd/add/{nao_encontrada}',
+        ]))
+        self.assertEqual({api_key for _, _, api_key in self.servidor.requisicoes}, {'chave-teste'})
+        # Só a chave sem XML fica registrada
+        self.assertEqual(list(ConsultaChaveAPI.objects.values_list('chave_acesso', 'status')), [
+            (nao_encontrada, meudanfe.NAO_ENCONTRADA),
+        ])
+
+    def test_devolucao_busca_a_referenciada(self):
+        devolucao, referenciada = _chave(3), _chave(4)
+        self.servidor.respostas[referenciada] = _xml_nfe(referenciada, ('A1', 'PRODUTO A', '1202', '1', '5.00'))
+
+        [(nota, resultado)] = meudanfe.consultar_chaves([{'chave_nfe': devolucao, 'chave_referenciada': referenciada}])
+
+        self.assertEqual(nota['chave_nfe'], devolucao)
+        self.assertEqual((resultado['chave'], resultado['status']), (referenciada, meudanfe.ENCONTRADA))
+
+    def test_saldo_e_api_key_interrompem_o_lote(self):
+        for status, resultado_esperado in ((402, meudanfe.SEM_SALDO), (401, meudanfe.API_KEY_INVALIDA)):
+            with self.subTest(status=status), override_settings(MEUDANFE_CONCORRENCIA=1):
+                EstadoCotaAPI.objects.all().delete()
+                self.servidor.requisicoes.clear()
+                bloqueada, seguinte = _chave(10), _chave(11)
+                self.servidor.respostas = {
+                    bloqueada: status, seguinte: _xml_nfe(seguinte, ('A1', 'PRODUTO A', '5102', '1', '1.00')),
+                }
+
+                resultados = meudanfe.consultar_chaves([{'chave_nfe': bloqueada}, {'chave_nfe': seguinte}])
+
+                self.assertEqual([(nota['chave_nfe'], r['status']) for nota, r in resultados], [
+                    (bloqueada, resultado_esperado),
+                ])
+                self.assertEqual(self.rotas(), [f'/fd/add/{bloqueada}'])
+                self.assertEqual(EstadoCotaAPI.objects.get().status, resultado_esperado)
+
+
+class WorkerBuscaAPITests(MeuDanfeLocalMixin, TransactionTestCase):
+    # O worker chama close_old_connections(), que não convive com a transação do TestCase
+
+    def setUp(self):
+        super().setUp()
+        uf = UF.objects.create(codigo=35, sigla='SP', nome='São Paulo')
+        self.empresa = Empresa.objects.create(cnpj_cpf='12345678000199', razao_social='Empresa', uf=uf)
+        registro = Registro0000.objects.create(empresa=self.empresa, tipo='fiscal', periodo='2025-01-01', processado=True)
+        self.chaves = [_chave(numero) for numero in range(1, 5)]
+        for chave in self.chaves:
+            RegistroC100.objects.create(
+                registro_0000=registro, ind_oper='0', ind_emit='1', cod_part='F1', cod_mod='55', cod_sit='00',
+                num_doc=str(int(chave[25:34])), chv_nfe=chave, vl_doc=Decimal('100.00'),
+            )
+
+    def _buscar(self):
+        busca = busca_api.enfileirar_busca(None, self.empresa.id, '2025-01', '2025-01', 'entrada')
+        call_command('worker_busca_api', '--uma-vez', stdout=io.StringIO(), stderr=io.StringIO())
+        busca.refresh_from_db()
+        return busca
+
+    def test_grava_os_produtos_encontrados(self):
+        primeira, segunda, nao_encontrada, com_erro = self.chaves
+        self.servidor.respostas = {
+            primeira: _xml_nfe(primeira, ('A1', 'PRODUTO A', '1102', '2', '10.00'), ('B1', 'PRODUTO B', '1102', '1', '5.50')),
+            segunda: _xml_nfe(segunda, ('A1', 'PRODUTO A', '1102', '3', '15.00')),
+            com_erro: 404,
+        }
+
+        busca = self._buscar()
+
+        self.assertEqual(busca.status, 'concluido')
+        self.assertEqual((busca.chaves_total, busca.chaves_processadas), (4, 4))
+        self.assertEqual((busca.sucesso, busca.erros, busca.produtos), (2, 2, 3))
+        self.assertEqual(
+            sorted((erro['chave_nfe'], erro['erro']) for erro in busca.relatorio['erros']),
+            sorted([(nao_encontrada, 'NFe não encontrada: NOT_FOUND'), (com_erro, 'Erro na API: 404')]),
+        )
+        self.assertEqual(
+            sorted(ProdutoEntradaAPI.objects.values_list('chave_nfe', 'codigo', 'cfop', 'quantidade', 'valor_total')),
+            sorted([
+                (primeira, 'A1', '1102', Decimal('2'), Decimal('10.00')),
+                (primeira, 'B1', '1102', Decimal('1'), Decimal('5.50')),
+                (segunda, 'A1', '1102', Decimal('3'), Decimal('15.00')),
+            ]),
+        )
+        self.assertTrue(armazem_xml.existe_xml(primeira))
+        self.assertEqual(len(self.rotas('PUT')), 4)
+
+    @override_settings(MEUDANFE_CONSULTAS_POR_BUSCA=1)
+    def test_falhas_recentes_nao_gastam_consultas(self):
+        agora = timezone.now()
+        for chave in self.chaves[:2]:
+            ConsultaChaveAPI.objects.create(
+                chave_acesso=chave, status=meudanfe.NAO_ENCONTRADA, mensagem='NFe não encontrada: NOT_FOUND',
+                consultado_em=agora, repetir_em=agora + timedelta(hours=1),
+            )
+        terceira = self.chaves[2]
+        self.servidor.respostas[terceira] = _xml_nfe(terceira, ('A1', 'PRODUTO A', '1102', '1', '1.00'))
+
+        busca = self._buscar()
+
+        # As duas conhecidas não vão à API nem contam no limite de uma consulta por busca
+        self.assertEqual(self.rotas('PUT'), [f'/fd/add/{terceira}'])
+        self.assertEqual(busca.status, 'pausado')
+        self.assertIn('1 nota(s) restante(s)', busca.mensagem)
+        self.assertEqual((busca.sucesso, busca.erros, busca.chaves_processadas), (1, 2, 3))
+        self.assertEqual(sorted(erro['chave_nfe'] for erro in busca.relatorio['erros']), self.chaves[:2])
+
+    def test_sem_saldo_pausa_e_api_key_invalida_encerra(self):
+        for status, status_busca in ((402, 'pausado'), (401, 'erro')):
+            with self.subTest(status=status), override_settings(MEUDANFE_CONCORRENCIA=1):
+                EstadoCotaAPI.objects.all().delete()
+                self.servidor.requisicoes.clear()
+                self.servidor.respostas = dict.fromkeys(self.chaves, status)
+
+                busca = self._buscar()
+
+                self.assertEqual(busca.status, status_busca)
+                self.assertEqual(len(self.rotas()), 1)
+                self.assertEqual(busca.chaves_processadas, 0)
+                self.assertFalse(ProdutoEntradaAPI.objects.exists())
+
+
+@override_settings(
+    MEUDANFE_CONCORRENCIA=1,
+    MEUDANFE_REPETIR_NAO_ENCONTRADA_HORAS=6,
+    MEUDANFE_REPETIR_ERRO_MINUTOS=15,
+    MEUDANFE_PAUSA_COTA_MINUTOS=45,
+)
+class ResultadosConsultaTests(MeuDanfeLocalMixin, TestCase):
+    """Prazo de cada resultado sem XML (ConsultaChaveAPI) e pausa do provedor sem saldo (EstadoCotaAPI)"""
+
+    def _status(self, chaves):
+        return {nota['chave_nfe']: resultado['status'] for nota, resultado in meudanfe.consultar_chaves(
+            [{'chave_nfe': chave} for chave in chaves]
+        )}
+
+    def test_prazo_por_resultado(self):
+        nao_encontrada, com_erro, sem_saldo = _chave(1), _chave(2), _chave(3)
+        self.servidor.respostas = {com_erro: 404, sem_saldo: 402}
+
+        self._status([nao_encontrada, com_erro, sem_saldo])
+
+        prazos = {
+            consulta.chave_acesso: (consulta.status, consulta.repetir_em - consulta.consultado_em)
+            for consulta in ConsultaChaveAPI.objects.all()
+        }
+        self.assertEqual(prazos, {
+            nao_encontrada: (meudanfe.NAO_ENCONTRADA, timedelta(hours=6)),
+            com_erro: (meudanfe.ERRO, timedelta(minutes=15)),
+            # O saldo não diz nada da chave: quem fica bloqueado é o provedor
+            sem_saldo: (meudanfe.SEM_SALDO, timedelta(0)),
+        })
+        estado = EstadoCotaAPI.objects.get()
+        consultado_em = ConsultaChaveAPI.objects.get(chave_acesso=sem_saldo).consultado_em
+        self.assertEqual((estado.status, estado.bloqueado_ate), (meudanfe.SEM_SALDO, consultado_em + timedelta(minutes=45)))
+
+    def test_falha_recente_nao_vai_a_api(self):
+        nao_encontrada, com_erro = _chave(1), _chave(2)
+        self.servidor.respostas = {com_erro: 404}
+        self._status([nao_encontrada, com_erro])
+        self.servidor.requisicoes.clear()
+
+        [(_, resultado), _] = meudanfe.consultar_chaves([{'chave_nfe': nao_encontrada}, {'chave_nfe': com_erro}])
+
+        self.assertEqual(self.rotas(), [])
+        self.assertEqual(resultado['status'], meudanfe.NAO_ENCONTRADA)
+        self.assertIn('nova consulta após', resultado['mensagem'])
+
+        # Vencido o prazo a chave volta a ser consultada; encontrada, sai da tabela
+        ConsultaChaveAPI.objects.filter(chave_acesso=com_erro).update(repetir_em=timezone.now() - timedelta(seconds=1))
+        self.servidor.respostas[com_erro] = _xml_nfe(com_erro, ('A1', 'PRODUTO A', '1102', '1', '1.00'))
+        self.assertEqual(self._status([nao_encontrada, com_erro]), {
+            nao_encontrada: meudanfe.NAO_ENCONTRADA, com_erro: meudanfe.ENCONTRADA,
+        })
+        self.assertEqual(self.rotas('PUT'), [f'/fd/add/{com_erro}'])
+        self.assertEqual(list(ConsultaChaveAPI.objects.values_list('chave_acesso', 'tentativas')), [(nao_encontrada, 1)])
+
+    def test_sem_saldo_pausa_as_consultas_seguintes(self):
+        sem_saldo, outra, armazenada = _chave(1), _chave(2), _chave(3)
+        self.servidor.respostas = {sem_saldo: 402}
+        self._status([sem_saldo])
+        self.servidor.requisicoes.clear()
+        armazem_xml.salvar_xml(armazenada, _xml_nfe(armazenada, ('A1', 'PRODUTO A', '1102', '1', '1.00')))
+
+        # Provedor pausado: nenhuma requisição; o XML já armazenado continua valendo
+        resultados = meudanfe.consultar_chaves([{'chave_nfe': armazenada}, {'chave_nfe': outra}])
+        self.assertEqual(self.rotas(), [])
+        self.assertEqual([(nota['chave_nfe'], r['status']) for nota, r in resultados], [
+            (armazenada, meudanfe.ENCONTRADA), (outra, meudanfe.SEM_SALDO),
+        ])
+        self.assertIn('nova tentativa após', resultados[1][1]['mensagem'])
+
+        # Fim da pausa: volta a consultar e a resposta normal libera o provedor
+        EstadoCotaAPI.objects.update(bloqueado_ate=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self._status([outra]), {outra: meudanfe.NAO_ENCONTRADA})
+        self.assertEqual(self.rotas(), [f'/fd/add/{outra}'])
+        self.assertFalse(EstadoCotaAPI.objects.exists())
+
+    def test_trocar_api_key_libera_o_bloqueio(self):
+        chave = _chave(1)
+        self.servidor.respostas = {chave: 401}
+        self.assertEqual(self._status([chave]), {chave: meudanfe.API_KEY_INVALIDA})
+        self.servidor.requisicoes.clear()
+
+        self.assertEqual(self._status([chave]), {chave: meudanfe.API_KEY_INVALIDA})
+        self.assertEqual(self.rotas(), [])
+
+        with override_settings(MEUDANFE_API_KEY='outra-chave'):
+            self._status([chave])
+        self.assertEqual(self.servidor.requisicoes, [('PUT', f'/fd/add/{chave}', 'outra-chave')])
@@ -7,6 +7,13 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('relatorio-fiscal/', views.relatorio_fiscal, name='relatorio_fiscal'),
     path('api/periodos/', views.api_periodos, name='api_periodos'),
+    path('api/relatorio-fiscal/exportar/', views.api_exportar_relatorio_fiscal, name='api_exportar_relatorio_fiscal'),
+    path('api/relatorio-fiscal/<str:secao>/', views.api_secao_relatorio_fiscal, name='api_secao_relatorio_fiscal'),
+    path('api/relatorio-fiscal/composicao/<str:tipo>/', views.api_composicao_relatorio_fiscal, name='api_composicao_relatorio_fiscal'),
+    path('api/relatorio-fiscal/composicao/<str:tipo>/valores/<str:coluna>/', views.api_valores_composicao, name='api_valores_composicao'),
+    path('api/relatorio-fiscal/composicao/<str:tipo>/exportar/', views.api_exportar_composicao, name='api_exportar_composicao'),
+    path('api/simular-aliquotas/', views.api_simular_aliquotas, name='api_simular_aliquotas'),
+    path('api/simular-cenarios/', views.api_simular_cenarios, name='api_simular_cenarios'),
     path('api/buscar-xml-produto/', views.api_buscar_xml_produto, name='api_buscar_xml_produto'),
     path('api/listar-chaves-saida/', views.api_listar_chaves_saida, name='api_listar_chaves_saida'),
     path('api/chaves-processadas/', views.api_chaves_processadas, name='api_chaves_processadas'),
@@ -15,6 +22,10 @@ urlpatterns = [
     path('api/listar-chaves-entrada-sem-itens/', views.api_listar_chaves_entrada_sem_itens, name='api_listar_chaves_entrada_sem_itens'),
     path('api/salvar-produtos-entrada-api/', views.api_salvar_produtos_entrada_api, name='api_salvar_produtos_entrada_api'),
     path('api/chaves-entrada-processadas/', views.api_chaves_entrada_processadas, name='api_chaves_entrada_processadas'),
+    path('api/busca-api/iniciar/', views.api_iniciar_busca_api, name='api_iniciar_busca_api'),
+    path('api/busca-api/ultima/', views.api_ultima_busca_api, name='api_ultima_busca_api'),
+    path('api/busca-api/<int:busca_id>/', views.api_status_busca_api, name='api_status_busca_api'),
+    path('api/busca-api/<int:busca_id>/cancelar/', views.api_cancelar_busca_api, name='api_cancelar_busca_api'),
     path('api/importar-ajustes-manuais-icms/', views.api_importar_ajustes_manuais_icms, name='api_importar_ajustes_manuais_icms'),
     path('api/excluir-ajustes-manuais-icms/', views.api_excluir_ajustes_manuais_icms, name='api_excluir_ajustes_manuais_icms'),
     path('api/excluir-ajuste-manual-icms/<int:ajuste_id>/', views.api_excluir_ajuste_manual_icms, name='api_excluir_ajuste_manual_icms'),
@@ -1,6 +1,5 @@
-import os
 import json
-from decimal import Decimal
+from decimal import Decimal, InvalidOperation
 from pydoc import doc
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
@@ -11,6 +10,26 @@ from apps.empresa.models import Empresa
 from apps.dashboards.models import ProdutoSaidaAPI, ProdutoEntradaAPI, AjusteManualICMS
 
 
+def _decimal_finito(valor, padrao):
+    """Decimal do valor informado (padrão quando vazio); InvalidOperation se não for um número finito"""
+    numero = Decimal(str(valor if valor not in (None, '') else padrao).replace(',', '.'))
+    if not numero.is_finite():
+        raise InvalidOperation(valor)
+    return numero
+
+
+def _aliquotas_da_requisicao(request):
+    """Alíquotas IBS, CBS e IS da query string, ou None quando alguma é inválida"""
+    try:
+        return (
+            _decimal_finito(request.GET.get('aliquota_ibs'), '18.5'),
+            _decimal_finito(request.GET.get('aliquota_cbs'), '8.5'),
+            _decimal_finito(request.GET.get('aliquota_is'), '0'),
+        )
+    except InvalidOperation:
+        return None
+
+
 @login_required
 def index(request):
     return render(request, 'dashboards/index.html')
@@ -18,9 +37,8 @@ def index(request):
 
 @login_required
 def relatorio_fiscal(request):
-    from django.db.models import Sum
-    from decimal import Decimal
-    from apps.sped.models import Registro0000, Registro0200, RegistroC100, RegistroC170
+    """Página do relatório: filtro e abas; as seções vêm de api_secao_relatorio_fiscal ao abrir cada aba"""
+    from apps.sped.models import Registro0000
     
     empresas = Empresa.objects.filter(ativo=True)
     
@@ -28,15 +46,12 @@ def relatorio_fiscal(request):
     empresa_id = request.GET.get('empresa')
     periodo_inicial = request.GET.get('periodo_inicial')
     periodo_final = request.GET.get('periodo_final')
-    aliquota_ibs = Decimal(request.GET.get('aliquota_ibs', '18.5') or '18.5')
-    aliquota_cbs = Decimal(request.GET.get('aliquota_cbs', '8.5') or '8.5')
-    aliquota_is = Decimal(request.GET.get('aliquota_is', '0') or '0')
-    agrupar_filiais = request.GET.get('filiais') == '1'
     
     # Contexto base
     context = {
         'empresas': empresas,
         'periodos': [],
+        'relatorio_filtrado': bool(empresa_id and periodo_inicial and periodo_final),
     }
     
     # Se empresa selecionada, buscar períodos disponíveis
@@ -47,1300 +62,232 @@ def relatorio_fiscal(request):
         ).values_list('periodo', flat=True).distinct().order_by('periodo')
         context['periodos'] = [p.strftime('%Y-%m') for p in periodos]
     
-    # Se filtro completo, buscar dados
-    if empresa_id and periodo_inicial and periodo_final:
-        # Buscar registros 0000 do período
-        registros_0000 = Registro0000.objects.filter(
-            empresa_id=empresa_id,
-            processado=True,
-            periodo__gte=periodo_inicial + '-01',
-            periodo__lte=periodo_final + '-28'
-        )
-        
-        if agrupar_filiais:
-            empresa = Empresa.objects.get(id=empresa_id)
-            cnpj_base = empresa.cnpj_cpf[:8] if empresa.cnpj_cpf else ''
-            empresas_grupo = Empresa.objects.filter(cnpj_cpf__startswith=cnpj_base)
-            registros_0000 = Registro0000.objects.filter(
-                empresa__in=empresas_grupo,
-                processado=True,
-                periodo__gte=periodo_inicial + '-01',
-                periodo__lte=periodo_final + '-28'
-            )
-        
-        # Buscar documentos C100 (0=Entrada, 1=Saída)
-        documentos_entrada = RegistroC100.objects.filter(registro_0000__in=registros_0000, ind_oper='0')
-        documentos_saida = RegistroC100.objects.filter(registro_0000__in=registros_0000, ind_oper='1')
-        
-        # Buscar itens C170
-        itens_entrada = RegistroC170.objects.filter(registro_c100__in=documentos_entrada).select_related('registro_c100')
-        itens_saida = RegistroC170.objects.filter(registro_c100__in=documentos_saida).select_related('registro_c100')
-        
-        # Buscar dados dos itens (0200) para NCM e descrição
-        itens_0200 = {}
-        for reg in registros_0000:
-            for item in Registro0200.objects.filter(registro_0000=reg):
-                itens_0200[item.cod_item] = {
-                    'descricao': item.descr_item,
-                    'ncm': item.cod_ncm,
-                }
-        
-# CFOPs que representam compras efetivas para REVENDA/industrialização
-        # Exclui: devoluções (411), consumo (407,408,556,557), transferências, serviços, energia, remessas
-        SUFIXOS_COMPRA_EFETIVA = {
-            '101', '102', '111', '113', '116', '117', '118', '120', '121', '122',
-            '124', '125', '126', '128',
-            '401', '403',
-        }
-        
-        # CFOPs que representam compras para USO/CONSUMO
-        SUFIXOS_CONSUMO = {
-            '407', '408', '556', '557',
-        }
-
-        produtos_entradas_dict = {}
-        for item in itens_entrada:
-            # Filtrar apenas CFOPs de compra efetiva (1xxx/2xxx)
-            cfop_item = (item.cfop or '').replace('.', '').strip()
-            if len(cfop_item) < 4 or cfop_item[0] not in ('1', '2'):
-                continue
-            sufixo_cfop = cfop_item[1:]
-            if sufixo_cfop not in SUFIXOS_COMPRA_EFETIVA:
-                continue
-            cod = item.cod_item
-            if cod not in produtos_entradas_dict:
-                info_item = itens_0200.get(cod, {})
-                produtos_entradas_dict[cod] = {
-                    'codigo': cod,
-                    'descricao': info_item.get('descricao', item.descr_compl or cod),
-                    'ncm': item.cod_ncm or info_item.get('ncm', ''),
-                    'cfops': set(),
-                    'quantidade': Decimal('0'),
-                    'valor_total': Decimal('0'),
-                    'icms': Decimal('0'),
-                    'icms_st': Decimal('0'),
-                    'ipi': Decimal('0'),
-                    'pis': Decimal('0'),
-                    'cofins': Decimal('0'),
-                    'vl_bc_icms': Decimal('0'),
-                    'vl_bc_pis': Decimal('0'),
-                    'vl_bc_cofins': Decimal('0'),
-                }
-            produtos_entradas_dict[cod]['quantidade'] += item.qtd or Decimal('0')
-            produtos_entradas_dict[cod]['valor_total'] += item.vl_item or Decimal('0')
-            produtos_entradas_dict[cod]['icms'] += item.vl_icms or Decimal('0')
-            produtos_entradas_dict[cod]['icms_st'] += getattr(item, 'vl_icms_st', Decimal('0')) or Decimal('0')
-            produtos_entradas_dict[cod]['ipi'] += getattr(item, 'vl_ipi', Decimal('0')) or Decimal('0')
-            produtos_entradas_dict[cod]['pis'] += item.vl_pis or Decimal('0')
-            produtos_entradas_dict[cod]['cofins'] += item.vl_cofins or Decimal('0')
-            produtos_entradas_dict[cod]['vl_bc_icms'] += item.vl_bc_icms or Decimal('0')
-            produtos_entradas_dict[cod]['vl_bc_pis'] += item.vl_bc_pis or Decimal('0')
-            produtos_entradas_dict[cod]['vl_bc_cofins'] += item.vl_bc_cofins or Decimal('0')
-            produtos_entradas_dict[cod]['cfops'].add(cfop_item)
-        
-        # ========================================
-        # AGREGAR PRODUTOS DE CONSUMO (ENTRADAS)
-        # ========================================
-        produtos_consumo_dict = {}
-        for item in itens_entrada:
-            cfop_item = (item.cfop or '').replace('.', '').strip()
-            if len(cfop_item) < 4 or cfop_item[0] not in ('1', '2'):
-                continue
-            sufixo_cfop = cfop_item[1:]
-            if sufixo_cfop not in SUFIXOS_CONSUMO:
-                continue
-            cod = item.cod_item
-            if cod not in produtos_consumo_dict:
-                info_item = itens_0200.get(cod, {})
-                produtos_consumo_dict[cod] = {
-                    'codigo': cod,
-                    'descricao': info_item.get('descricao', item.descr_compl or cod),
-                    'ncm': item.cod_ncm or info_item.get('ncm', ''),
-                    'cfops': set(),
-                    'quantidade': Decimal('0'),
-                    'valor_total': Decimal('0'),
-                    'icms': Decimal('0'),
-                    'icms_st': Decimal('0'),
-                    'ipi': Decimal('0'),
-                    'pis': Decimal('0'),
-                    'cofins': Decimal('0'),
-                    'vl_bc_icms': Decimal('0'),
-                    'vl_bc_pis': Decimal('0'),
-                    'vl_bc_cofins': Decimal('0'),
-                }
-            produtos_consumo_dict[cod]['quantidade'] += item.qtd or Decimal('0')
-            produtos_consumo_dict[cod]['valor_total'] += item.vl_item or Decimal('0')
-            produtos_consumo_dict[cod]['icms'] += item.vl_icms or Decimal('0')
-            produtos_consumo_dict[cod]['icms_st'] += getattr(item, 'vl_icms_st', Decimal('0')) or Decimal('0')
-            produtos_consumo_dict[cod]['ipi'] += getattr(item, 'vl_ipi', Decimal('0')) or Decimal('0')
-            produtos_consumo_dict[cod]['pis'] += item.vl_pis or Decimal('0')
-            produtos_consumo_dict[cod]['cofins'] += item.vl_cofins or Decimal('0')
-            produtos_consumo_dict[cod]['vl_bc_icms'] += item.vl_bc_icms or Decimal('0')
-            produtos_consumo_dict[cod]['vl_bc_pis'] += item.vl_bc_pis or Decimal('0')
-            produtos_consumo_dict[cod]['vl_bc_cofins'] += item.vl_bc_cofins or Decimal('0')
-            produtos_consumo_dict[cod]['cfops'].add(cfop_item)
-        
-# ========================================
-        # NCMs com redução de 60% (LC 214/2025 - Anexo XVII)
-        # Construção civil e materiais correlatos
-        # ========================================
-        NCM_REDUCAO_60 = {
-            '25222000',  # Gesso
-            '38244000',  # Impermeabilizantes / produtos químicos p/ construção
-        }
-        
-        from decimal import ROUND_HALF_UP
-        
-# Calcular IBS/CBS e formatar campos para entradas
-        for cod, prod in produtos_entradas_dict.items():
-            # Valores calculados
-            total_tributos = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
-            valor_liquido = prod['valor_total'] - total_tributos
-            
-            # Verificar se o NCM tem redução
-            ncm_prod = str(prod['ncm']).strip()
-            if ncm_prod in NCM_REDUCAO_60:
-                perc_reducao = Decimal('60')
-            else:
-                perc_reducao = Decimal('0')
-            
-            aliq_total = aliquota_ibs + aliquota_cbs + aliquota_is
-            aliq_efetiva = aliq_total * (Decimal('1') - perc_reducao / Decimal('100'))
-            ibs_cbs = (valor_liquido * aliq_efetiva / Decimal('100')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            total_reforma = valor_liquido + ibs_cbs
-            dif_total = ibs_cbs - total_tributos
-            
-            # Alíquotas calculadas a partir das bases agregadas
-            aliq_icms_calc = (prod['icms'] / prod['vl_bc_icms'] * 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if prod['vl_bc_icms'] > 0 else Decimal('0')
-            aliq_pis_calc = (prod['pis'] / prod['vl_bc_pis'] * 100).quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP) if prod['vl_bc_pis'] > 0 else Decimal('0')
-            aliq_cofins_calc = (prod['cofins'] / prod['vl_bc_cofins'] * 100).quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP) if prod['vl_bc_cofins'] > 0 else Decimal('0')
-            
-            # Valores unitários
-            qtd = prod['quantidade'] if prod['quantidade'] > 0 else Decimal('1')
-            valor_bruto_unit = (prod['valor_total'] / qtd).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            valor_liq_unit = (valor_liquido / qtd).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            ibs_cbs_unit = (ibs_cbs / qtd).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            total_reforma_unit = (total_reforma / qtd).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            dif_unit = (dif_total / qtd).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            
-            # Atualiza produto com valores calculados
-            prod['ibs_cbs'] = ibs_cbs
-            prod['valor_liquido'] = valor_liquido
-            prod['total_tributos'] = total_tributos
-            prod['total_reforma'] = total_reforma
-            prod['dif_total'] = dif_total
-            prod['valor_bruto_unit'] = valor_bruto_unit
-            prod['valor_liq_unit'] = valor_liq_unit
-            prod['ibs_cbs_unit'] = ibs_cbs_unit
-            prod['total_reforma_unit'] = total_reforma_unit
-            prod['dif_unit'] = dif_unit
-            prod['aliq_ibs_cbs'] = aliq_efetiva
-            prod['perc_reducao'] = perc_reducao
-            prod['aliq_icms'] = aliq_icms_calc
-            prod['aliq_pis'] = aliq_pis_calc
-            prod['aliq_cofins'] = aliq_cofins_calc
-            prod['aliq_icms'] = aliq_icms_calc
-            prod['aliq_pis'] = aliq_pis_calc
-            prod['aliq_cofins'] = aliq_cofins_calc
-            
-# Formatar para exibição (padrão brasileiro)
-            prod['quantidade_fmt'] = f"{prod['quantidade']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['perc_reducao_fmt'] = f"{perc_reducao:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['aliq_ibs_cbs_fmt'] = f"{aliq_efetiva:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['aliq_icms_fmt'] = f"{aliq_icms_calc:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['aliq_pis_fmt'] = f"{aliq_pis_calc:,.4f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['aliq_cofins_fmt'] = f"{aliq_cofins_calc:,.4f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['valor_bruto_unit_fmt'] = f"{valor_bruto_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['valor_bruto_fmt'] = f"{prod['valor_total']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['icms_fmt'] = f"{prod['icms']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['icms_st_fmt'] = f"{prod['icms_st']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['ipi_fmt'] = f"{prod['ipi']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['pis_fmt'] = f"{prod['pis']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['cofins_fmt'] = f"{prod['cofins']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['total_tributos_fmt'] = f"{total_tributos:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['valor_liq_unit_fmt'] = f"{valor_liq_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['valor_liq_fmt'] = f"{valor_liquido:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['ibs_cbs_unit_fmt'] = f"{ibs_cbs_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['ibs_cbs_fmt'] = f"{ibs_cbs:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['total_reforma_unit_fmt'] = f"{total_reforma_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['total_reforma_fmt'] = f"{total_reforma:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['dif_unit_fmt'] = f"{dif_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['dif_total_fmt'] = f"{dif_total:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-        
-        produtos_entradas = sorted(produtos_entradas_dict.values(), key=lambda x: (-x['valor_total'], x['codigo']))
-        
-        # ========================================
-        # CALCULAR IBS/CBS E FORMATAR PRODUTOS DE CONSUMO
-        # ========================================
-        for cod, prod in produtos_consumo_dict.items():
-            total_tributos = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
-            valor_liquido = prod['valor_total'] - total_tributos
-            ncm_prod = str(prod['ncm']).strip()
-            perc_reducao = Decimal('60') if ncm_prod in NCM_REDUCAO_60 else Decimal('0')
-            aliq_total = aliquota_ibs + aliquota_cbs + aliquota_is
-            aliq_efetiva = aliq_total * (Decimal('1') - perc_reducao / Decimal('100'))
-            ibs_cbs = (valor_liquido * aliq_efetiva / Decimal('100')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            total_reforma = valor_liquido + ibs_cbs
-            dif_total = ibs_cbs - total_tributos
-            aliq_icms_calc = (prod['icms'] / prod['vl_bc_icms'] * 100).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if prod['vl_bc_icms'] > 0 else Decimal('0')
-            aliq_pis_calc = (prod['pis'] / prod['vl_bc_pis'] * 100).quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP) if prod['vl_bc_pis'] > 0 else Decimal('0')
-            aliq_cofins_calc = (prod['cofins'] / prod['vl_bc_cofins'] * 100).quantize(Decimal('0.0001'), rounding=ROUND_HALF_UP) if prod['vl_bc_cofins'] > 0 else Decimal('0')
-            qtd = prod['quantidade'] if prod['quantidade'] > 0 else Decimal('1')
-            valor_bruto_unit = (prod['valor_total'] / qtd).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            valor_liq_unit = (valor_liquido / qtd).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            ibs_cbs_unit = (ibs_cbs / qtd).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            total_reforma_unit = (total_reforma / qtd).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            dif_unit = (dif_total / qtd).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            prod['ibs_cbs'] = ibs_cbs
-            prod['valor_liquido'] = valor_liquido
-            prod['total_tributos'] = total_tributos
-            prod['total_reforma'] = total_reforma
-            prod['dif_total'] = dif_total
-            prod['valor_bruto_unit'] = valor_bruto_unit
-            prod['valor_liq_unit'] = valor_liq_unit
-            prod['ibs_cbs_unit'] = ibs_cbs_unit
-            prod['total_reforma_unit'] = total_reforma_unit
-            prod['dif_unit'] = dif_unit
-            prod['aliq_ibs_cbs'] = aliq_efetiva
-            prod['perc_reducao'] = perc_reducao
-            prod['aliq_icms'] = aliq_icms_calc
-            prod['aliq_pis'] = aliq_pis_calc
-            prod['aliq_cofins'] = aliq_cofins_calc
-            prod['quantidade_fmt'] = f"{prod['quantidade']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['perc_reducao_fmt'] = f"{perc_reducao:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['aliq_ibs_cbs_fmt'] = f"{aliq_efetiva:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['aliq_icms_fmt'] = f"{aliq_icms_calc:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['aliq_pis_fmt'] = f"{aliq_pis_calc:,.4f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['aliq_cofins_fmt'] = f"{aliq_cofins_calc:,.4f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['valor_bruto_unit_fmt'] = f"{valor_bruto_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['valor_bruto_fmt'] = f"{prod['valor_total']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['icms_fmt'] = f"{prod['icms']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['icms_st_fmt'] = f"{prod['icms_st']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['ipi_fmt'] = f"{prod['ipi']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['pis_fmt'] = f"{prod['pis']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['cofins_fmt'] = f"{prod['cofins']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['total_tributos_fmt'] = f"{total_tributos:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['valor_liq_unit_fmt'] = f"{valor_liq_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['valor_liq_fmt'] = f"{valor_liquido:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['ibs_cbs_unit_fmt'] = f"{ibs_cbs_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['ibs_cbs_fmt'] = f"{ibs_cbs:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['total_reforma_unit_fmt'] = f"{total_reforma_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['total_reforma_fmt'] = f"{total_reforma:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['dif_unit_fmt'] = f"{dif_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            prod['dif_total_fmt'] = f"{dif_total:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-        
-        produtos_consumo = sorted(produtos_consumo_dict.values(), key=lambda x: (-x['valor_total'], x['codigo']))
-        
-        # ========================================
-        # BUSCAR PRODUTOS ENTRADA SALVOS VIA API (docs sem C170)
-        # ========================================
-        produtos_entrada_api = ProdutoEntradaAPI.objects.filter(
-            empresa_id=empresa_id,
-            periodo_inicial=periodo_inicial,
-            periodo_final=periodo_final
-        )
-        if produtos_entrada_api.exists():
-            for prod in produtos_entrada_api:
-                # Filtrar apenas CFOPs de compra efetiva nos produtos da API
-                cfop_api = (prod.cfop or '').replace('.', '').strip()
-                if len(cfop_api) < 4 or cfop_api[0] not in ('1', '2'):
-                    continue
-                sufixo_api = cfop_api[1:]
-                if sufixo_api not in SUFIXOS_COMPRA_EFETIVA:
-                    continue
-                cod = prod.codigo
-                if cod not in produtos_entradas_dict:
-                    produtos_entradas_dict[cod] = {
-                        'codigo': cod,
-                        'descricao': prod.descricao,
-                        'ncm': prod.ncm,
-                        'cfops': set(),
-                        'quantidade': Decimal('0'),
-                        'valor_total': Decimal('0'),
-                        'icms': Decimal('0'),
-                        'icms_st': Decimal('0'),
-                        'ipi': Decimal('0'),
-                        'pis': Decimal('0'),
-                        'cofins': Decimal('0'),
-                        'vl_bc_icms': Decimal('0'),
-                        'vl_bc_pis': Decimal('0'),
-                        'vl_bc_cofins': Decimal('0'),
-                    }
-                produtos_entradas_dict[cod]['quantidade'] += prod.quantidade or Decimal('0')
-                produtos_entradas_dict[cod]['valor_total'] += prod.valor_total or Decimal('0')
-                produtos_entradas_dict[cod]['icms'] += prod.icms_valor or Decimal('0')
-                produtos_entradas_dict[cod]['icms_st'] += prod.icms_st_valor or Decimal('0')
-                produtos_entradas_dict[cod]['ipi'] += prod.ipi_valor or Decimal('0')
-                produtos_entradas_dict[cod]['pis'] += prod.pis_valor or Decimal('0')
-                produtos_entradas_dict[cod]['cofins'] += prod.cofins_valor or Decimal('0')
-                produtos_entradas_dict[cod]['cfops'].add(cfop_api)
-
-# Recalcular campos derivados para todos os produtos (revenda)
-            aliq_total = aliquota_ibs + aliquota_cbs + aliquota_is
-            for cod, prod in produtos_entradas_dict.items():
-                prod['cfop'] = ', '.join(sorted(prod.get('cfops', set())))
-                total_tributos = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
-                valor_liquido = prod['valor_total'] - total_tributos
-                qtd = prod['quantidade'] if prod['quantidade'] else Decimal('1')
-                valor_bruto_unit = (prod['valor_total'] / qtd).quantize(Decimal('0.01')) if qtd else Decimal('0')
-                valor_liq_unit = (valor_liquido / qtd).quantize(Decimal('0.01')) if qtd else Decimal('0')
-                ibs_cbs = (valor_liquido * aliq_total / Decimal('100')).quantize(Decimal('0.01'))
-                ibs_cbs_unit = (ibs_cbs / qtd).quantize(Decimal('0.01')) if qtd else Decimal('0')
-                total_reforma = valor_liquido + ibs_cbs
-                total_reforma_unit = (total_reforma / qtd).quantize(Decimal('0.01')) if qtd else Decimal('0')
-                dif_unit = total_reforma_unit - valor_bruto_unit
-                dif_total = total_reforma - prod['valor_total']
-
-                prod['total_tributos'] = total_tributos
-                prod['valor_liquido'] = valor_liquido
-                prod['valor_bruto_unit'] = valor_bruto_unit
-                prod['valor_liq_unit'] = valor_liq_unit
-                prod['ibs_cbs'] = ibs_cbs
-                prod['ibs_cbs_unit'] = ibs_cbs_unit
-                prod['total_reforma'] = total_reforma
-                prod['total_reforma_unit'] = total_reforma_unit
-                prod['dif_unit'] = dif_unit
-                prod['dif_total'] = dif_total
-
-            produtos_entradas = sorted(produtos_entradas_dict.values(), key=lambda x: (-x['valor_total'], x['codigo']))
-
-        # Verificar se há docs de entrada sem C170 (para mostrar botão de busca API)
-        from apps.sped.models import RegistroC170 as C170Model
-        total_docs_entrada_sem_itens = 0
-        for doc in documentos_entrada:
-            if doc.chv_nfe and len(doc.chv_nfe) >= 44 and doc.cod_mod == '55':
-                if not C170Model.objects.filter(registro_c100=doc).exists():
-                    total_docs_entrada_sem_itens += 1
-
-        # ========================================
-        # AGREGAR FORNECEDORES DE ENTRADA
-        # ========================================
-        from apps.sped.models import Registro0150
-        
-        # Buscar participantes (fornecedores) dos registros
-        participantes_dict = {}
-        for reg in registros_0000:
-            for part in Registro0150.objects.filter(registro_0000=reg):
-                if part.cod_part not in participantes_dict:
-                    # Determinar regime tributário
-                    if part.optante_mei:
-                        regime = 'MEI'
-                    elif part.optante_simples:
-                        regime = 'SIMPLES NACIONAL'
-                    elif part.cnpj:
-                        if not part.consultado:
-                            regime = 'NÃO CONSULTADO'
-                        else:
-                            regime = 'LUCRO REAL/PRESUMIDO'
-                    else:
-                        regime = 'PESSOA FÍSICA' if part.cpf else '-'
-                    
-                    participantes_dict[part.cod_part] = {
-                        'codigo': part.cod_part,
-                        'cnpj_cpf': part.cnpj or part.cpf or '-',
-                        'nome': part.nome,
-                        'regime': regime,
-                        'uf': part.uf,
-                        'is_contribuinte': part.is_contribuinte,
-                    }
-        
-        # Agregar valores por fornecedor (documentos de entrada)
-        fornecedores_dict = {}
-        for doc in documentos_entrada:
-            cod_part = doc.cod_part
-            if not cod_part:
-                continue
-            
-            if cod_part not in fornecedores_dict:
-                info_part = participantes_dict.get(cod_part, {})
-                fornecedores_dict[cod_part] = {
-                    'codigo': cod_part,
-                    'cnpj_cpf': info_part.get('cnpj_cpf', '-'),
-                    'nome': info_part.get('nome', 'Não identificado'),
-                    'regime': info_part.get('regime', '-'),
-                    'uf': info_part.get('uf', '-'),
-                    'is_contribuinte': info_part.get('is_contribuinte', False),
-                    'valor_bruto': Decimal('0'),
-                    'icms': Decimal('0'),
-                    'icms_st': Decimal('0'),
-                    'ipi': Decimal('0'),
-                    'iss': Decimal('0'),
-                    'pis': Decimal('0'),
-                    'cofins': Decimal('0'),
-                }
-            
-            fornecedores_dict[cod_part]['valor_bruto'] += doc.vl_doc or Decimal('0')
-            # Pessoa Física não aproveita crédito de impostos em entradas
-            if fornecedores_dict[cod_part]['regime'] != 'PESSOA FÍSICA':
-                # Verificar se é devolução de venda via CFOP e/ou C113
-                from apps.sped.models import RegistroC113, RegistroC170 as C170DevCheck
-                from apps.sped.validador_devolucao import classificar_cfop_devolucao, TIPO_DEVOLUCAO_VENDA, TIPO_DEVOLUCAO_COMPRA
-                is_devolucao = False
-                # Verifica por C113 (nota referenciada)
-                if RegistroC113.objects.filter(registro_c100=doc).exists():
-                    is_devolucao = True
-                # Verifica por CFOP dos itens C170
-                if not is_devolucao:
-                    cfops_doc = C170DevCheck.objects.filter(registro_c100=doc).values_list('cfop', flat=True)
-                    for cfop_item in cfops_doc:
-                        eh_dev, tipo_dev, _ = classificar_cfop_devolucao(cfop_item or '')
-                        if eh_dev and tipo_dev == TIPO_DEVOLUCAO_VENDA:
-                            is_devolucao = True
-                            break
-                # ICMS: creditado se contribuinte de ICMS OU se for devolução com crédito destacado
-                if fornecedores_dict[cod_part].get('is_contribuinte', False) or (is_devolucao and (doc.vl_icms or Decimal('0')) > Decimal('0')):
-                    fornecedores_dict[cod_part]['icms'] += doc.vl_icms or Decimal('0')
-                fornecedores_dict[cod_part]['pis'] += doc.vl_pis or Decimal('0')
-                fornecedores_dict[cod_part]['cofins'] += doc.vl_cofins or Decimal('0')
-        
-# Identificar fornecedores que possuem devoluções com créditos
-        from apps.sped.models import RegistroC113, RegistroC170 as C170DevIdent
-        from apps.sped.validador_devolucao import classificar_cfop_devolucao as classif_dev
-        fornecedores_com_devolucao = set()
-        for doc in documentos_entrada:
-            if doc.cod_part and (doc.vl_icms or Decimal('0')) > Decimal('0'):
-                is_dev = False
-                if RegistroC113.objects.filter(registro_c100=doc).exists():
-                    is_dev = True
-                if not is_dev:
-                    cfops_doc = C170DevIdent.objects.filter(registro_c100=doc).values_list('cfop', flat=True)
-                    for cfop_item in cfops_doc:
-                        eh_dev, _, _ = classif_dev(cfop_item or '')
-                        if eh_dev:
-                            is_dev = True
-                            break
-                if is_dev:
-                    fornecedores_com_devolucao.add(doc.cod_part)
-        
-# Calcular tributos totais e valores reforma para fornecedores
-        for cod, forn in fornecedores_dict.items():
-            tributos = forn['icms'] + forn['icms_st'] + forn['ipi'] + forn['iss'] + forn['pis'] + forn['cofins']
-            liquido = forn['valor_bruto'] - tributos
-            
-# Pessoa Física não gera crédito de IBS/CBS; não contribuinte gera se tiver devolução com crédito
-            if forn['regime'] == 'PESSOA FÍSICA':
-                ibs_cbs_efetivo = Decimal('0')
-            elif not forn.get('is_contribuinte', False) and cod not in fornecedores_com_devolucao:
-                ibs_cbs_efetivo = Decimal('0')
-            else:
-                aliq_total = aliquota_ibs + aliquota_cbs + aliquota_is
-                ibs_cbs_efetivo = (liquido * aliq_total / Decimal('100')).quantize(Decimal('0.01'))
-            
-            total_reforma = liquido + ibs_cbs_efetivo
-            
-            forn['tributos'] = tributos
-            forn['liquido'] = liquido
-            forn['ibs_cbs_efetivo'] = ibs_cbs_efetivo
-            forn['total_reforma'] = total_reforma
-        
-        fornecedores_entradas = sorted(fornecedores_dict.values(), key=lambda x: x['valor_bruto'], reverse=True)
-        
-        # Totais fornecedores
-        total_fornecedores_valor_bruto = sum(f['valor_bruto'] for f in fornecedores_entradas)
-        total_fornecedores_icms = sum(f['icms'] for f in fornecedores_entradas)
-        total_fornecedores_icms_st = sum(f['icms_st'] for f in fornecedores_entradas)
-        total_fornecedores_ipi = sum(f['ipi'] for f in fornecedores_entradas)
-        total_fornecedores_iss = sum(f['iss'] for f in fornecedores_entradas)
-        total_fornecedores_pis = sum(f['pis'] for f in fornecedores_entradas)
-        total_fornecedores_cofins = sum(f['cofins'] for f in fornecedores_entradas)
-        total_fornecedores_tributos = sum(f['tributos'] for f in fornecedores_entradas)
-        total_fornecedores_liquido = sum(f['liquido'] for f in fornecedores_entradas)
-        total_fornecedores_ibs_cbs = sum(f['ibs_cbs_efetivo'] for f in fornecedores_entradas)
-        total_fornecedores_reforma = sum(f['total_reforma'] for f in fornecedores_entradas)
-        
-# ========================================
-        # AGREGAR CFOPs DE ENTRADA (usando C190 VL_OPR para bater com apuração SPED)
-        # ========================================
-        cfops_entrada_dict = {}
-        
-        # PIS e COFINS vêm do C170 (C190 não possui esses campos)
-        for item in itens_entrada:
-            cfop_code = item.cfop or ''
-            if not cfop_code:
-                continue
-            
-            if cfop_code not in cfops_entrada_dict:
-                cfops_entrada_dict[cfop_code] = {
-                    'cfop': cfop_code,
-                    'valor_bruto': Decimal('0'),
-                    'icms': Decimal('0'),
-                    'icms_st': Decimal('0'),
-                    'ipi': Decimal('0'),
-                    'pis': Decimal('0'),
-                    'cofins': Decimal('0'),
-                }
-            
-            cfops_entrada_dict[cfop_code]['pis'] += item.vl_pis or Decimal('0')
-            cfops_entrada_dict[cfop_code]['cofins'] += item.vl_cofins or Decimal('0')
-        
-        # Valor bruto (VL_OPR), ICMS, ICMS_ST e IPI vêm do C190 (fonte autoritativa do SPED)
-        from apps.sped.parser import parse_sped_file as parse_sped_c190
-        
-        nums_doc_entrada = set(doc.num_doc for doc in documentos_entrada if doc.num_doc)
-        
-        # Guardar dados C190 para reusar na composição detalhada
-        _c190_entrada_por_nf_cfop = {}
-        
-        for reg in registros_0000:
-            try:
-                arquivo = reg.arquivo_original
-                arquivo.open('rb')
-                conteudo_sped = arquivo.read()
-                arquivo.close()
-                dados_c190 = parse_sped_c190(conteudo_sped)
-                
-                for doc_sped in dados_c190.get('C100', []):
-                    if doc_sped['ind_oper'] != '0':
-                        continue
-                    num_doc = doc_sped.get('num_doc', '')
-                    if num_doc not in nums_doc_entrada:
-                        continue
-                    
-                    for c190 in doc_sped.get('analiticos', []):
-                        cfop_code = c190.get('cfop', '')
-                        if not cfop_code:
-                            continue
-                        
-                        if cfop_code not in cfops_entrada_dict:
-                            cfops_entrada_dict[cfop_code] = {
-                                'cfop': cfop_code,
-                                'valor_bruto': Decimal('0'),
-                                'icms': Decimal('0'),
-                                'icms_st': Decimal('0'),
-                                'ipi': Decimal('0'),
-                                'pis': Decimal('0'),
-                                'cofins': Decimal('0'),
-                            }
-                        
-                        cfops_entrada_dict[cfop_code]['valor_bruto'] += c190.get('vl_opr', Decimal('0'))
-                        cfops_entrada_dict[cfop_code]['icms'] += c190.get('vl_icms', Decimal('0'))
-                        cfops_entrada_dict[cfop_code]['icms_st'] += c190.get('vl_icms_st', Decimal('0'))
-                        cfops_entrada_dict[cfop_code]['ipi'] += c190.get('vl_ipi', Decimal('0'))
-                        
-                        # Armazenar VL_OPR por NF/CFOP para composição detalhada
-                        cfop_code_limpo = cfop_code.replace('.', '').strip()
-                        chave_nf_cfop = (num_doc, cfop_code_limpo)
-                        _c190_entrada_por_nf_cfop[chave_nf_cfop] = _c190_entrada_por_nf_cfop.get(chave_nf_cfop, Decimal('0')) + c190.get('vl_opr', Decimal('0'))
-            except Exception as e:
-                logger.error(f"Erro ao ler C190 do registro {reg.id}: {e}") if 'logger' in dir() else None
-        
-        # Calcular tributos e líquido para cada CFOP
-        for cfop_code, cfop_data in cfops_entrada_dict.items():
-            tributos = (cfop_data['icms'] + cfop_data['icms_st'] + cfop_data['ipi']
-                       + cfop_data['pis'] + cfop_data['cofins'])
-            cfop_data['tributos'] = tributos
-            cfop_data['liquido'] = cfop_data['valor_bruto'] - tributos
-        
-        cfops_entradas = sorted(cfops_entrada_dict.values(), key=lambda x: x['cfop'])
-        
-        # Totais CFOPs
-        total_cfops_valor_bruto = sum(c['valor_bruto'] for c in cfops_entradas)
-        total_cfops_icms = sum(c['icms'] for c in cfops_entradas)
-        total_cfops_icms_st = sum(c['icms_st'] for c in cfops_entradas)
-        total_cfops_ipi = sum(c['ipi'] for c in cfops_entradas)
-        total_cfops_pis = sum(c['pis'] for c in cfops_entradas)
-        total_cfops_cofins = sum(c['cofins'] for c in cfops_entradas)
-        total_cfops_tributos = sum(c['tributos'] for c in cfops_entradas)
-        total_cfops_liquido = sum(c['liquido'] for c in cfops_entradas)
-        
-        # ========================================
-        # AGREGAR UFs DE ENTRADA
-        # ========================================
-        from apps.empresa.models import Empresa as EmpresaModel
-        try:
-            empresa_obj = EmpresaModel.objects.get(id=empresa_id)
-            uf_empresa = empresa_obj.uf.sigla if empresa_obj.uf else 'N/I'
-        except EmpresaModel.DoesNotExist:
-            uf_empresa = 'N/I'
-        ufs_entrada_dict = {}
-        for doc in documentos_entrada:
-            cod_part = doc.cod_part
-            info_part = participantes_dict.get(cod_part, {})
-            uf_code = info_part.get('uf', '') or ''
-            if not uf_code:
-                uf_code = uf_empresa
-            
-            if uf_code not in ufs_entrada_dict:
-                ufs_entrada_dict[uf_code] = {
-                    'uf': uf_code,
-                    'valor_bruto': Decimal('0'),
-                    'icms': Decimal('0'),
-                    'icms_st': Decimal('0'),
-                    'ipi': Decimal('0'),
-                    'iss': Decimal('0'),
-                    'pis': Decimal('0'),
-                    'cofins': Decimal('0'),
-                }
-            
-            ufs_entrada_dict[uf_code]['valor_bruto'] += doc.vl_doc or Decimal('0')
-            ufs_entrada_dict[uf_code]['icms'] += doc.vl_icms or Decimal('0')
-            ufs_entrada_dict[uf_code]['pis'] += doc.vl_pis or Decimal('0')
-            ufs_entrada_dict[uf_code]['cofins'] += doc.vl_cofins or Decimal('0')
-        
-        # Calcular tributos e líquido para cada UF
-        for uf_code, uf_data in ufs_entrada_dict.items():
-            tributos = (uf_data['icms'] + uf_data['icms_st'] + uf_data['ipi']
-                       + uf_data['iss'] + uf_data['pis'] + uf_data['cofins'])
-            uf_data['tributos'] = tributos
-            uf_data['liquido'] = uf_data['valor_bruto'] - tributos
-        
-        ufs_entradas = sorted(ufs_entrada_dict.values(), key=lambda x: x['uf'])
-        
-        # Totais UFs
-        total_ufs_valor_bruto = sum(u['valor_bruto'] for u in ufs_entradas)
-        total_ufs_icms = sum(u['icms'] for u in ufs_entradas)
-        total_ufs_icms_st = sum(u['icms_st'] for u in ufs_entradas)
-        total_ufs_ipi = sum(u['ipi'] for u in ufs_entradas)
-        total_ufs_iss = sum(u['iss'] for u in ufs_entradas)
-        total_ufs_pis = sum(u['pis'] for u in ufs_entradas)
-        total_ufs_cofins = sum(u['cofins'] for u in ufs_entradas)
-        total_ufs_tributos = sum(u['tributos'] for u in ufs_entradas)
-        total_ufs_liquido = sum(u['liquido'] for u in ufs_entradas)
-        
-        # ========================================
-        # AGREGAR AJUSTES APURAÇÃO ICMS (E111)
-        # ========================================
-        from apps.sped.parser import parse_sped_file as parse_sped
-        
-        TIPOS_AJUSTE = {
-            '0': '0 – Outros débitos',
-            '1': '1 – Estorno de créditos',
-            '2': '2 – Outros créditos',
-            '3': '3 – Estorno de débitos',
-            '4': '4 – Deduções do imposto apurado',
-            '5': '5 – Débito especial',
-        }
-        
-        ajustes_icms_list = []
-        for reg in registros_0000:
-            try:
-                arquivo = reg.arquivo_original
-                arquivo.open('rb')
-                conteudo_sped = arquivo.read()
-                arquivo.close()
-                dados_sped = parse_sped(conteudo_sped)
-                for aj in dados_sped.get('E111', []):
-                    cod = aj.get('cod_aj_apur', '')
-                    tipo_char = cod[2] if len(cod) > 2 else ''
-                    descricao = aj.get('descr_compl_aj', '') or TIPOS_AJUSTE.get(tipo_char, tipo_char)
-                    if not descricao.strip():
-                        descricao = TIPOS_AJUSTE.get(tipo_char, f'Tipo {tipo_char}')
-                    ajustes_icms_list.append({
-                        'codigo': cod,
-                        'descricao': descricao,
-                        'valor': aj.get('vl_aj_apur', Decimal('0')),
-                    })
-            except Exception as e:
-                logger.error(f"Erro ao ler ajustes E111 do registro {reg.id}: {e}") if 'logger' in dir() else None
-        
-        # Agrupar por código de ajuste
-        ajustes_icms_dict = {}
-        for aj in ajustes_icms_list:
-            cod = aj['codigo']
-            if cod not in ajustes_icms_dict:
-                ajustes_icms_dict[cod] = {
-                    'codigo': cod,
-                    'descricao': aj['descricao'],
-                    'valor': Decimal('0'),
-                }
-            ajustes_icms_dict[cod]['valor'] += aj['valor']
-        
-        ajustes_icms = sorted(ajustes_icms_dict.values(), key=lambda x: x['codigo'])
-        total_ajustes_icms = sum(a['valor'] for a in ajustes_icms)
-        
-        # ========================================
-        # AJUSTES MANUAIS ICMS
-        # ========================================
-        ajustes_manuais_icms = AjusteManualICMS.objects.filter(
-            empresa_id=empresa_id,
-            periodo_inicial=periodo_inicial,
-            periodo_final=periodo_final
-        ).order_by('codigo')
-        total_ajustes_manuais_icms = sum(a.valor for a in ajustes_manuais_icms)
-        
-# Agregar produtos de SAÍDA
-        # CFOPs que representam vendas efetivas de mercadorias
-        # Exclui: devoluções de compra, transferências, bonificações, remessas, lançamentos
-        SUFIXOS_VENDA_EFETIVA = {
-            '101', '102', '103', '104', '105', '106', '109', '110', '111', '112',
-            '113', '114', '115', '116', '117', '118', '119', '120', '122', '123',
-            '401', '402', '403', '404', '405',
-        }
-
-        produtos_saidas_dict = {}
-        for item in itens_saida:
-            # Filtrar apenas CFOPs de venda efetiva
-            cfop_item = (item.cfop or '').replace('.', '').strip()
-            sufixo_cfop = cfop_item[1:] if len(cfop_item) >= 4 else ''
-            if sufixo_cfop not in SUFIXOS_VENDA_EFETIVA:
-                continue
-            cod = item.cod_item
-            if cod not in produtos_saidas_dict:
-                info_item = itens_0200.get(cod, {})
-                produtos_saidas_dict[cod] = {
-                    'codigo': cod,
-                    'descricao': info_item.get('descricao', item.descr_compl or cod),
-                    'ncm': item.cod_ncm or info_item.get('ncm', ''),
-                    'cfop': item.cfop,
-                    'quantidade': Decimal('0'),
-                    'valor_total': Decimal('0'),
-                    'icms': Decimal('0'),
-                    'icms_st': Decimal('0'),
-                    'ipi': Decimal('0'),
-                    'pis': Decimal('0'),
-                    'cofins': Decimal('0'),
-                }
-            produtos_saidas_dict[cod]['quantidade'] += item.qtd or Decimal('0')
-            produtos_saidas_dict[cod]['valor_total'] += item.vl_item or Decimal('0')
-            produtos_saidas_dict[cod]['icms'] += item.vl_icms or Decimal('0')
-            produtos_saidas_dict[cod]['icms_st'] += getattr(item, 'vl_icms_st', Decimal('0')) or Decimal('0')
-            produtos_saidas_dict[cod]['ipi'] += getattr(item, 'vl_ipi', Decimal('0')) or Decimal('0')
-            produtos_saidas_dict[cod]['pis'] += item.vl_pis or Decimal('0')
-            produtos_saidas_dict[cod]['cofins'] += item.vl_cofins or Decimal('0')
-        
-# Calcular IBS/CBS e formatar campos para saídas
-        for cod, prod in produtos_saidas_dict.items():
-            total_tributos = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
-            valor_liquido = prod['valor_total'] - total_tributos
-            aliq_total = aliquota_ibs + aliquota_cbs + aliquota_is
-            ibs_cbs = (valor_liquido * aliq_total / Decimal('100')).quantize(Decimal('0.01'))
-            
-            prod['ibs_cbs'] = ibs_cbs
-            prod['valor_liquido'] = valor_liquido
-            prod['total_tributos'] = total_tributos
-        
-        produtos_saidas = sorted(produtos_saidas_dict.values(), key=lambda x: (-x['valor_total'], x['codigo']))
-        
-        # ========================================
-        # BUSCAR PRODUTOS SALVOS VIA API (se não houver do SPED)
-        # ========================================
-        produtos_saidas_api = []
-        if not produtos_saidas:
-            # Buscar produtos salvos via API
-            produtos_api_db = ProdutoSaidaAPI.objects.filter(
-                empresa_id=empresa_id,
-                periodo_inicial=periodo_inicial,
-                periodo_final=periodo_final
-            )
-            
-            if produtos_api_db.exists():
-                # Agrupar produtos por código + NCM
-                produtos_api_dict = {}
-                for prod in produtos_api_db:
-                    # Filtrar apenas CFOPs de venda efetiva nos produtos da API
-                    cfop_api_s = (prod.cfop or '').replace('.', '').strip()
-                    sufixo_api_s = cfop_api_s[1:] if len(cfop_api_s) >= 4 else ''
-                    if sufixo_api_s not in SUFIXOS_VENDA_EFETIVA:
-                        continue
-                    chave = f"{prod.codigo}_{prod.ncm}"
-                    if chave not in produtos_api_dict:
-                        produtos_api_dict[chave] = {
-                            'chave_nfe': prod.chave_nfe,
-                            'codigo': prod.codigo,
-                            'descricao': prod.descricao,
-                            'ncm': prod.ncm,
-                            'cfop': prod.cfop,
-                            'quantidade': Decimal('0'),
-                            'valor_total': Decimal('0'),
-                            'icms': Decimal('0'),
-                            'icms_st': Decimal('0'),
-                            'ipi': Decimal('0'),
-                            'pis': Decimal('0'),
-                            'cofins': Decimal('0'),
-                        }
-                    produtos_api_dict[chave]['quantidade'] += prod.quantidade or Decimal('0')
-                    produtos_api_dict[chave]['valor_total'] += prod.valor_total or Decimal('0')
-                    produtos_api_dict[chave]['icms'] += prod.icms_valor or Decimal('0')
-                    produtos_api_dict[chave]['icms_st'] += prod.icms_st_valor or Decimal('0')
-                    produtos_api_dict[chave]['ipi'] += prod.ipi_valor or Decimal('0')
-                    produtos_api_dict[chave]['pis'] += prod.pis_valor or Decimal('0')
-                    produtos_api_dict[chave]['cofins'] += prod.cofins_valor or Decimal('0')
-                
-                # Calcular campos adicionais para produtos da API
-                for chave, prod in produtos_api_dict.items():
-                    total_tributos = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
-                    valor_liquido = prod['valor_total'] - total_tributos
-                    aliq_total = aliquota_ibs + aliquota_cbs + aliquota_is
-                    ibs_cbs = (valor_liquido * aliq_total / Decimal('100')).quantize(Decimal('0.01'))
-                    total_reforma = valor_liquido + ibs_cbs
-                    dif_total = ibs_cbs - total_tributos
-                    
-                    # Valores unitários
-                    qtd = prod['quantidade'] if prod['quantidade'] > 0 else Decimal('1')
-                    valor_bruto_unit = (prod['valor_total'] / qtd).quantize(Decimal('0.01'))
-                    valor_liq_unit = (valor_liquido / qtd).quantize(Decimal('0.01'))
-                    ibs_cbs_unit = (ibs_cbs / qtd).quantize(Decimal('0.01'))
-                    total_reforma_unit = (total_reforma / qtd).quantize(Decimal('0.01'))
-                    dif_unit = (dif_total / qtd).quantize(Decimal('0.01'))
-                    
-                    prod['ibs_cbs'] = ibs_cbs
-                    prod['valor_liquido'] = valor_liquido
-                    prod['total_tributos'] = total_tributos
-                    prod['total_reforma'] = total_reforma
-                    prod['dif_total'] = dif_total
-                    prod['valor_bruto_unit'] = valor_bruto_unit
-                    prod['valor_liq_unit'] = valor_liq_unit
-                    prod['ibs_cbs_unit'] = ibs_cbs_unit
-                    prod['total_reforma_unit'] = total_reforma_unit
-                    prod['dif_unit'] = dif_unit
-                    prod['aliq_ibs_cbs'] = aliq_total
-                    prod['perc_reducao'] = Decimal('0')
-                    
-                    # Formatar para exibição
-                    prod['quantidade_fmt'] = f"{prod['quantidade']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['perc_reducao_fmt'] = f"{prod['perc_reducao']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['aliq_ibs_cbs_fmt'] = f"{aliq_total:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['valor_bruto_unit_fmt'] = f"{valor_bruto_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['valor_bruto_fmt'] = f"{prod['valor_total']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['icms_fmt'] = f"{prod['icms']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['icms_st_fmt'] = f"{prod['icms_st']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['ipi_fmt'] = f"{prod['ipi']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['pis_fmt'] = f"{prod['pis']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['cofins_fmt'] = f"{prod['cofins']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['total_tributos_fmt'] = f"{total_tributos:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['valor_liq_unit_fmt'] = f"{valor_liq_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['valor_liq_fmt'] = f"{valor_liquido:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['ibs_cbs_unit_fmt'] = f"{ibs_cbs_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['ibs_cbs_fmt'] = f"{ibs_cbs:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['total_reforma_unit_fmt'] = f"{total_reforma_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['total_reforma_fmt'] = f"{total_reforma:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['dif_unit_fmt'] = f"{dif_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                    prod['dif_total_fmt'] = f"{dif_total:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                
-                produtos_saidas_api = sorted(produtos_api_dict.values(), key=lambda x: (-x['valor_total'], x['codigo']))
-                
-                # Usar produtos da API se não houver do SPED
-                produtos_saidas = produtos_saidas_api
-                
-                # Recalcular totais de saídas com dados da API
-                total_valor_saidas = sum(p['valor_total'] for p in produtos_saidas)
-                total_icms_saidas = sum(p['icms'] for p in produtos_saidas)
-                total_pis_saidas = sum(p['pis'] for p in produtos_saidas)
-                total_cofins_saidas = sum(p['cofins'] for p in produtos_saidas)
-                total_ibs_cbs_saidas = sum(p['ibs_cbs'] for p in produtos_saidas)
-                debitos_saidas = total_icms_saidas + total_pis_saidas + total_cofins_saidas
-                venda_liquida = total_valor_saidas - debitos_saidas
-                carga_saidas = (debitos_saidas / total_valor_saidas * 100) if total_valor_saidas else Decimal('0')
-                carga_saidas_reforma = (total_ibs_cbs_saidas / venda_liquida * 100) if venda_liquida else Decimal('0')
-        
-# ========================================
-        # BUSCAR PRODUTOS CONSUMO SALVOS VIA API (docs sem C170)
-        # ========================================
-        if produtos_entrada_api.exists():
-            for prod in produtos_entrada_api:
-                cfop_api = (prod.cfop or '').replace('.', '').strip()
-                if len(cfop_api) < 4 or cfop_api[0] not in ('1', '2'):
-                    continue
-                sufixo_api = cfop_api[1:]
-                if sufixo_api not in SUFIXOS_CONSUMO:
-                    continue
-                cod = prod.codigo
-                if cod not in produtos_consumo_dict:
-                    produtos_consumo_dict[cod] = {
-                        'codigo': cod,
-                        'descricao': prod.descricao,
-                        'ncm': prod.ncm,
-                        'cfops': set(),
-                        'quantidade': Decimal('0'),
-                        'valor_total': Decimal('0'),
-                        'icms': Decimal('0'),
-                        'icms_st': Decimal('0'),
-                        'ipi': Decimal('0'),
-                        'pis': Decimal('0'),
-                        'cofins': Decimal('0'),
-                        'vl_bc_icms': Decimal('0'),
-                        'vl_bc_pis': Decimal('0'),
-                        'vl_bc_cofins': Decimal('0'),
-                    }
-                produtos_consumo_dict[cod]['quantidade'] += prod.quantidade or Decimal('0')
-                produtos_consumo_dict[cod]['valor_total'] += prod.valor_total or Decimal('0')
-                produtos_consumo_dict[cod]['icms'] += prod.icms_valor or Decimal('0')
-                produtos_consumo_dict[cod]['icms_st'] += prod.icms_st_valor or Decimal('0')
-                produtos_consumo_dict[cod]['ipi'] += prod.ipi_valor or Decimal('0')
-                produtos_consumo_dict[cod]['pis'] += prod.pis_valor or Decimal('0')
-                produtos_consumo_dict[cod]['cofins'] += prod.cofins_valor or Decimal('0')
-                produtos_consumo_dict[cod]['cfops'].add(cfop_api)
-            
-            # Recalcular campos derivados para produtos de consumo da API
-            aliq_total_c = aliquota_ibs + aliquota_cbs + aliquota_is
-            for cod, prod in produtos_consumo_dict.items():
-                if 'ibs_cbs' in prod:
-                    continue
-                prod['cfop'] = ', '.join(sorted(prod.get('cfops', set())))
-                total_tributos = prod['icms'] + prod['icms_st'] + prod['ipi'] + prod['pis'] + prod['cofins']
-                valor_liquido = prod['valor_total'] - total_tributos
-                qtd = prod['quantidade'] if prod['quantidade'] else Decimal('1')
-                valor_bruto_unit = (prod['valor_total'] / qtd).quantize(Decimal('0.01')) if qtd else Decimal('0')
-                valor_liq_unit = (valor_liquido / qtd).quantize(Decimal('0.01')) if qtd else Decimal('0')
-                ibs_cbs = (valor_liquido * aliq_total_c / Decimal('100')).quantize(Decimal('0.01'))
-                ibs_cbs_unit = (ibs_cbs / qtd).quantize(Decimal('0.01')) if qtd else Decimal('0')
-                total_reforma = valor_liquido + ibs_cbs
-                total_reforma_unit = (total_reforma / qtd).quantize(Decimal('0.01')) if qtd else Decimal('0')
-                dif_unit = total_reforma_unit - valor_bruto_unit
-                dif_total = total_reforma - prod['valor_total']
-                prod['total_tributos'] = total_tributos
-                prod['valor_liquido'] = valor_liquido
-                prod['valor_bruto_unit'] = valor_bruto_unit
-                prod['valor_liq_unit'] = valor_liq_unit
-                prod['ibs_cbs'] = ibs_cbs
-                prod['ibs_cbs_unit'] = ibs_cbs_unit
-                prod['total_reforma'] = total_reforma
-                prod['total_reforma_unit'] = total_reforma_unit
-                prod['dif_unit'] = dif_unit
-                prod['dif_total'] = dif_total
-                prod['aliq_ibs_cbs'] = aliq_total_c
-                prod['perc_reducao'] = Decimal('0')
-                prod['quantidade_fmt'] = f"{prod['quantidade']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['perc_reducao_fmt'] = "0,00"
-                prod['aliq_ibs_cbs_fmt'] = f"{aliq_total_c:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['valor_bruto_unit_fmt'] = f"{valor_bruto_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['valor_bruto_fmt'] = f"{prod['valor_total']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['icms_fmt'] = f"{prod['icms']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['icms_st_fmt'] = f"{prod['icms_st']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['ipi_fmt'] = f"{prod['ipi']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['pis_fmt'] = f"{prod['pis']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['cofins_fmt'] = f"{prod['cofins']:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['total_tributos_fmt'] = f"{total_tributos:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['valor_liq_unit_fmt'] = f"{valor_liq_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['valor_liq_fmt'] = f"{valor_liquido:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['ibs_cbs_unit_fmt'] = f"{ibs_cbs_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['ibs_cbs_fmt'] = f"{ibs_cbs:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['total_reforma_unit_fmt'] = f"{total_reforma_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['total_reforma_fmt'] = f"{total_reforma:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['dif_unit_fmt'] = f"{dif_unit:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-                prod['dif_total_fmt'] = f"{dif_total:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-            
-            produtos_consumo = sorted(produtos_consumo_dict.values(), key=lambda x: (-x['valor_total'], x['codigo']))
-        
-        # Totais CONSUMO
-        total_valor_consumo = sum(p['valor_total'] for p in produtos_consumo)
-        total_icms_consumo = sum(p['icms'] for p in produtos_consumo)
-        total_icms_st_consumo = sum(p['icms_st'] for p in produtos_consumo)
-        total_ipi_consumo = sum(p.get('ipi', Decimal('0')) for p in produtos_consumo)
-        total_pis_consumo = sum(p['pis'] for p in produtos_consumo)
-        total_cofins_consumo = sum(p['cofins'] for p in produtos_consumo)
-        total_ibs_cbs_consumo = sum(p.get('ibs_cbs', Decimal('0')) for p in produtos_consumo)
-        total_tributos_consumo = sum(p.get('total_tributos', Decimal('0')) for p in produtos_consumo)
-        total_valor_liquido_consumo = sum(p.get('valor_liquido', Decimal('0')) for p in produtos_consumo)
-        total_valor_bruto_unit_consumo = sum(p.get('valor_bruto_unit', Decimal('0')) for p in produtos_consumo)
-        total_valor_liq_unit_consumo = sum(p.get('valor_liq_unit', Decimal('0')) for p in produtos_consumo)
-        total_ibs_cbs_unit_consumo = sum(p.get('ibs_cbs_unit', Decimal('0')) for p in produtos_consumo)
-        total_reforma_consumo = sum(p.get('total_reforma', Decimal('0')) for p in produtos_consumo)
-        total_reforma_unit_consumo = sum(p.get('total_reforma_unit', Decimal('0')) for p in produtos_consumo)
-        total_dif_total_consumo = sum(p.get('dif_total', Decimal('0')) for p in produtos_consumo)
-        total_dif_unit_consumo = sum(p.get('dif_unit', Decimal('0')) for p in produtos_consumo)
-        
-# Totais ENTRADAS
-        total_valor_entradas = sum(p['valor_total'] for p in produtos_entradas)
-        total_icms_entradas = sum(p['icms'] for p in produtos_entradas)
-        total_icms_st_entradas = sum(p['icms_st'] for p in produtos_entradas)
-        total_ipi_entradas = sum(p.get('ipi', Decimal('0')) for p in produtos_entradas)
-        total_pis_entradas = sum(p['pis'] for p in produtos_entradas)
-        total_cofins_entradas = sum(p['cofins'] for p in produtos_entradas)
-        total_ibs_cbs_entradas = sum(p['ibs_cbs'] for p in produtos_entradas)
-        creditos_entradas = total_icms_entradas + total_icms_st_entradas + total_ipi_entradas + total_pis_entradas + total_cofins_entradas
-        compra_liquida = total_valor_entradas - creditos_entradas
-        carga_entradas = (creditos_entradas / total_valor_entradas * 100) if total_valor_entradas else Decimal('0')
-        carga_entradas_reforma = (total_ibs_cbs_entradas / compra_liquida * 100) if compra_liquida else Decimal('0')
-        
-        # Totais detalhados para tfoot de Produtos Adquiridos
-        total_tributos_entradas = sum(p['total_tributos'] for p in produtos_entradas)
-        total_valor_liquido_entradas = sum(p['valor_liquido'] for p in produtos_entradas)
-        total_valor_bruto_unit_entradas = sum(p['valor_bruto_unit'] for p in produtos_entradas)
-        total_valor_liq_unit_entradas = sum(p['valor_liq_unit'] for p in produtos_entradas)
-        total_ibs_cbs_unit_entradas = sum(p['ibs_cbs_unit'] for p in produtos_entradas)
-        total_reforma_entradas = sum(p['total_reforma'] for p in produtos_entradas)
-        total_reforma_unit_entradas = sum(p['total_reforma_unit'] for p in produtos_entradas)
-        total_dif_total_entradas = sum(p['dif_total'] for p in produtos_entradas)
-        total_dif_unit_entradas = sum(p['dif_unit'] for p in produtos_entradas)
-        
-        # Totais SAÍDAS
-        total_valor_saidas = sum(p['valor_total'] for p in produtos_saidas)
-        total_icms_saidas = sum(p['icms'] for p in produtos_saidas)
-        total_pis_saidas = sum(p['pis'] for p in produtos_saidas)
-        total_cofins_saidas = sum(p['cofins'] for p in produtos_saidas)
-        total_ibs_cbs_saidas = sum(p['ibs_cbs'] for p in produtos_saidas)
-        debitos_saidas = total_icms_saidas + total_pis_saidas + total_cofins_saidas
-        venda_liquida = total_valor_saidas - debitos_saidas
-        carga_saidas = (debitos_saidas / total_valor_saidas * 100) if total_valor_saidas else Decimal('0')
-        carga_saidas_reforma = (total_ibs_cbs_saidas / venda_liquida * 100) if venda_liquida else Decimal('0')
-        
-        # Apuração geral
-        resultado_atual = debitos_saidas - creditos_entradas
-        resultado_reforma = total_ibs_cbs_saidas - total_ibs_cbs_entradas
-        carga_atual = (resultado_atual / total_valor_saidas * 100) if total_valor_saidas else Decimal('0')
-        carga_reforma = (resultado_reforma / venda_liquida * 100) if venda_liquida else Decimal('0')
-        
-# Função para formatar valores monetários no padrão brasileiro
-        def formatar_valor(valor):
-            return f"{valor:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
-        
-# ========================================
-        # COMPOSIÇÃO DETALHADA POR NF (ENTRADAS)
-        # ========================================
-        composicao_entradas_list = []
-        
-        # Somar VL_ITEM do C170 por (num_doc, cfop) para calcular diferença com C190
-        _soma_c170_por_nf_cfop = {}
-        
-        # Conjunto unificado de CFOPs válidos para composição (Revenda + Consumo)
-        SUFIXOS_COMPOSICAO = SUFIXOS_COMPRA_EFETIVA | SUFIXOS_CONSUMO
-        
-        for item in itens_entrada:
-            doc = item.registro_c100
-            info_item = itens_0200.get(item.cod_item, {})
-            num_doc = doc.num_doc or ''
-            cfop = item.cfop or ''
-            cfop_limpo = cfop.replace('.', '').strip()
-            
-            composicao_entradas_list.append({
-                'num_doc': num_doc,
-                'cfop': cfop_limpo,
-                'codigo': item.cod_item or '',
-                'descricao': info_item.get('descricao', item.descr_compl or item.cod_item or ''),
-                'valor': float(item.vl_item or 0),
-            })
-            
-            chave = (num_doc, cfop_limpo)
-            _soma_c170_por_nf_cfop[chave] = _soma_c170_por_nf_cfop.get(chave, Decimal('0')) + (item.vl_item or Decimal('0'))
-        
-# Adicionar linhas de "Outras Despesas" para diferença entre C190 VL_OPR e soma C170 VL_ITEM
-        for chave_nf_cfop, vl_opr_c190 in _c190_entrada_por_nf_cfop.items():
-            cfop_c190_limpo = chave_nf_cfop[1].replace('.', '').strip() if chave_nf_cfop[1] else ''
-            soma_c170 = _soma_c170_por_nf_cfop.get((chave_nf_cfop[0], cfop_c190_limpo), Decimal('0'))
-            if soma_c170 == Decimal('0'):
-                soma_c170 = _soma_c170_por_nf_cfop.get(chave_nf_cfop, Decimal('0'))
-            diferenca = vl_opr_c190 - soma_c170
-            if diferenca > Decimal('0.01'):
-                composicao_entradas_list.append({
-                    'num_doc': chave_nf_cfop[0],
-                    'cfop': cfop_c190_limpo,
-                    'codigo': '---',
-                    'descricao': 'Outras Despesas (Frete/Seguro/Outros)',
-                    'valor': float(diferenca),
-                })
-            elif diferenca < Decimal('-0.01') and soma_c170 == Decimal('0'):
-                # Documento sem C170 (ex: devolução) - usar valor integral do C190
-                composicao_entradas_list.append({
-                    'num_doc': chave_nf_cfop[0],
-                    'cfop': cfop_c190_limpo,
-                    'codigo': '---',
-                    'descricao': 'Valor da Operação (sem itens C170)',
-                    'valor': float(vl_opr_c190),
-                })
-        
-        composicao_entradas_list.sort(key=lambda x: (x['num_doc'], x['cfop'], x['codigo']))
-        
-# ========================================
-        # ADICIONAR PRODUTOS DA API NA COMPOSIÇÃO DE ENTRADAS
-        # ========================================
-        if produtos_entrada_api.exists():
-            for prod in produtos_entrada_api:
-                # Extrair número da NF a partir da chave (posições 25-33)
-                num_doc_api = ''
-                if prod.chave_nfe and len(prod.chave_nfe) >= 34:
-                    num_doc_api = prod.chave_nfe[25:34].lstrip('0') or '0'
-                cfop_api_limpo = (prod.cfop or '').replace('.', '').strip()
-                composicao_entradas_list.append({
-                    'num_doc': num_doc_api,
-                    'cfop': cfop_api_limpo,
-                    'codigo': prod.codigo or '',
-                    'descricao': prod.descricao or '',
-                    'valor': float(prod.valor_total or 0),
-                })
-            composicao_entradas_list.sort(key=lambda x: (x['num_doc'], x['cfop'], x['codigo']))
-        
-        # ========================================
-        # COMPOSIÇÃO DETALHADA POR NF (SAÍDAS)
-        # ========================================
-        composicao_saidas_list = []
-        for item in itens_saida:
-            doc = item.registro_c100
-            info_item = itens_0200.get(item.cod_item, {})
-            composicao_saidas_list.append({
-                'num_doc': doc.num_doc or '',
-                'cfop': item.cfop or '',
-                'codigo': item.cod_item or '',
-                'descricao': info_item.get('descricao', item.descr_compl or item.cod_item or ''),
-                'valor': float(item.vl_item or 0),
-            })
-        composicao_saidas_list.sort(key=lambda x: (x['num_doc'], x['cfop'], x['codigo']))
-        
-        # LOG TEMPORÁRIO - verificar discrepância Revenda vs Composição
-        _soma_revenda = sum(float(p['valor_total']) for p in produtos_entradas)
-        _soma_composicao_prod = sum(item['valor'] for item in composicao_entradas_list if item.get('codigo') != '---')
-        _soma_composicao_outras = sum(item['valor'] for item in composicao_entradas_list if item.get('codigo') == '---')
-        logger.warning(f"📊 REVENDA total={_soma_revenda:.2f} | COMPOSIÇÃO produtos={_soma_composicao_prod:.2f} outras={_soma_composicao_outras:.2f} total={_soma_composicao_prod + _soma_composicao_outras:.2f} | DIFERENÇA={_soma_revenda - _soma_composicao_prod:.2f}")
-        
-        # Atualizar contexto
-        context.update({
-# Produtos
-            'produtos_entradas': produtos_entradas,
-            'produtos_consumo': produtos_consumo,
-            'produtos_saidas': produtos_saidas,
-            
-            # Totais Entradas
-            'total_valor_entradas': total_valor_entradas,
-            'total_icms_entradas': total_icms_entradas,
-            'total_pis_entradas': total_pis_entradas,
-            'total_cofins_entradas': total_cofins_entradas,
-            'total_ibs_cbs_entradas': total_ibs_cbs_entradas,
-            'compra_bruta': total_valor_entradas,
-            'compra_bruta_fmt': formatar_valor(total_valor_entradas),
-            'creditos_entradas': creditos_entradas,
-            'creditos_entradas_fmt': formatar_valor(creditos_entradas),
-            'compra_liquida': compra_liquida,
-            'compra_liquida_fmt': formatar_valor(compra_liquida),
-            'carga_entradas': f"{carga_entradas:.2f}".replace('.', ','),
-            'compra_liquida_reforma': compra_liquida,
-            'compra_liquida_reforma_fmt': formatar_valor(compra_liquida),
-            'creditos_ibs_cbs': total_ibs_cbs_entradas,
-            'creditos_ibs_cbs_fmt': formatar_valor(total_ibs_cbs_entradas),
-            'compra_total_reforma': compra_liquida + total_ibs_cbs_entradas,
-            'compra_total_reforma_fmt': formatar_valor(compra_liquida + total_ibs_cbs_entradas),
-            'carga_entradas_reforma': f"{carga_entradas_reforma:.2f}".replace('.', ','),
-            
-# Totais tfoot Entradas
-            'total_icms_st_entradas': total_icms_st_entradas,
-            'total_ipi_entradas': total_ipi_entradas,
-            'total_tributos_entradas': total_tributos_entradas,
-            'total_valor_liquido_entradas': total_valor_liquido_entradas,
-            'total_valor_bruto_unit_entradas': total_valor_bruto_unit_entradas,
-            'total_valor_liq_unit_entradas': total_valor_liq_unit_entradas,
-            'total_ibs_cbs_unit_entradas': total_ibs_cbs_unit_entradas,
-            'total_reforma_entradas': total_reforma_entradas,
-            'total_reforma_unit_entradas': total_reforma_unit_entradas,
-            'total_dif_total_entradas': total_dif_total_entradas,
-            'total_dif_unit_entradas': total_dif_unit_entradas,
-            # Totais tfoot Entradas FORMATADOS
-            'total_valor_entradas_fmt': formatar_valor(total_valor_entradas),
-            'total_icms_entradas_fmt': formatar_valor(total_icms_entradas),
-            'total_icms_st_entradas_fmt': formatar_valor(total_icms_st_entradas),
-            'total_ipi_entradas_fmt': formatar_valor(total_ipi_entradas),
-            'total_pis_entradas_fmt': formatar_valor(total_pis_entradas),
-            'total_cofins_entradas_fmt': formatar_valor(total_cofins_entradas),
-            'total_tributos_entradas_fmt': formatar_valor(total_tributos_entradas),
-            'total_valor_liquido_entradas_fmt': formatar_valor(total_valor_liquido_entradas),
-            'total_valor_bruto_unit_entradas_fmt': formatar_valor(total_valor_bruto_unit_entradas),
-            'total_valor_liq_unit_entradas_fmt': formatar_valor(total_valor_liq_unit_entradas),
-            'total_ibs_cbs_entradas_fmt': formatar_valor(total_ibs_cbs_entradas),
-            'total_ibs_cbs_unit_entradas_fmt': formatar_valor(total_ibs_cbs_unit_entradas),
-            'total_reforma_entradas_fmt': formatar_valor(total_reforma_entradas),
-            'total_reforma_unit_entradas_fmt': formatar_valor(total_reforma_unit_entradas),
-            'total_dif_total_entradas_fmt': formatar_valor(total_dif_total_entradas),
-            'total_dif_unit_entradas_fmt': formatar_valor(total_dif_unit_entradas),
-            
-            # Totais Consumo
-            'total_valor_consumo': total_valor_consumo,
-            'total_icms_consumo': total_icms_consumo,
-            'total_icms_st_consumo': total_icms_st_consumo,
-            'total_ipi_consumo': total_ipi_consumo,
-            'total_pis_consumo': total_pis_consumo,
-            'total_cofins_consumo': total_cofins_consumo,
-            'total_ibs_cbs_consumo': total_ibs_cbs_consumo,
-            'total_tributos_consumo': total_tributos_consumo,
-            'total_valor_liquido_consumo': total_valor_liquido_consumo,
-            'total_valor_bruto_unit_consumo': total_valor_bruto_unit_consumo,
-            'total_valor_liq_unit_consumo': total_valor_liq_unit_consumo,
-            'total_ibs_cbs_unit_consumo': total_ibs_cbs_unit_consumo,
-            'total_reforma_consumo': total_reforma_consumo,
-            'total_reforma_unit_consumo': total_reforma_unit_consumo,
-            'total_dif_total_consumo': total_dif_total_consumo,
-            'total_dif_unit_consumo': total_dif_unit_consumo,
-            
-            # Totais Saídas
-            'total_valor_saidas': total_valor_saidas,
-            'total_icms_saidas': total_icms_saidas,
-            'total_pis_saidas': total_pis_saidas,
-            'total_cofins_saidas': total_cofins_saidas,
-            'total_ibs_cbs_saidas': total_ibs_cbs_saidas,
-            'venda_bruta': total_valor_saidas,
-            'debitos_saidas': debitos_saidas,
-            'venda_liquida': venda_liquida,
-            'carga_saidas': f"{carga_saidas:.2f}".replace('.', ','),
-            'venda_liquida_reforma': venda_liquida,
-            'debitos_ibs_cbs': total_ibs_cbs_saidas,
-            'venda_total_reforma': venda_liquida + total_ibs_cbs_saidas,
-            'carga_saidas_reforma': f"{carga_saidas_reforma:.2f}".replace('.', ','),
-            
-            # Apuração Resumo
-            'debitos_atual': debitos_saidas,
-            'creditos_atual': creditos_entradas,
-            'resultado_atual': resultado_atual,
-            'carga_atual': f"{carga_atual:.2f}".replace('.', ','),
-            'debitos_reforma': total_ibs_cbs_saidas,
-            'creditos_reforma': total_ibs_cbs_entradas,
-            'resultado_reforma': resultado_reforma,
-            'carga_reforma': f"{carga_reforma:.2f}".replace('.', ','),
-            
-            # Dados para gráficos
-            'icms_entradas': float(total_icms_entradas),
-            'pis_entradas': float(total_pis_entradas),
-            'cofins_entradas': float(total_cofins_entradas),
-            'ibs_cbs_entradas': float(total_ibs_cbs_entradas),
-            'icms_saidas': float(total_icms_saidas),
-            'pis_saidas': float(total_pis_saidas),
-            'cofins_saidas': float(total_cofins_saidas),
-            'ibs_cbs_saidas': float(total_ibs_cbs_saidas),
-            'carga_atual_compras': float(carga_entradas),
-            'carga_reforma_compras': float(carga_entradas_reforma),
-            'carga_atual_vendas': float(carga_saidas),
-            'carga_reforma_vendas': float(carga_saidas_reforma),
-            
-# Entradas sem itens (para botão busca API)
-            'total_docs_entrada_sem_itens': total_docs_entrada_sem_itens,
-            
-            # Fornecedores
-            'fornecedores_entradas': fornecedores_entradas,
-            'total_fornecedores_valor_bruto': total_fornecedores_valor_bruto,
-            'total_fornecedores_icms': total_fornecedores_icms,
-            'total_fornecedores_icms_st': total_fornecedores_icms_st,
-            'total_fornecedores_ipi': total_fornecedores_ipi,
-            'total_fornecedores_iss': total_fornecedores_iss,
-            'total_fornecedores_pis': total_fornecedores_pis,
-            'total_fornecedores_cofins': total_fornecedores_cofins,
-            'total_fornecedores_tributos': total_fornecedores_tributos,
-            'total_fornecedores_liquido': total_fornecedores_liquido,
-            'total_fornecedores_ibs_cbs': total_fornecedores_ibs_cbs,
-            'total_fornecedores_reforma': total_fornecedores_reforma,
-            
-            # CFOPs de Entrada
-            'cfops_entradas': cfops_entradas,
-            'total_cfops_valor_bruto': total_cfops_valor_bruto,
-            'total_cfops_icms': total_cfops_icms,
-            'total_cfops_icms_st': total_cfops_icms_st,
-            'total_cfops_ipi': total_cfops_ipi,
-            'total_cfops_pis': total_cfops_pis,
-            'total_cfops_cofins': total_cfops_cofins,
-            'total_cfops_tributos': total_cfops_tributos,
-            'total_cfops_liquido': total_cfops_liquido,
-            
-            # UFs de Entrada
-            'ufs_entradas': ufs_entradas,
-            'total_ufs_valor_bruto': total_ufs_valor_bruto,
-            'total_ufs_icms': total_ufs_icms,
-            'total_ufs_icms_st': total_ufs_icms_st,
-            'total_ufs_ipi': total_ufs_ipi,
-            'total_ufs_iss': total_ufs_iss,
-            'total_ufs_pis': total_ufs_pis,
-            'total_ufs_cofins': total_ufs_cofins,
-            'total_ufs_tributos': total_ufs_tributos,
-            'total_ufs_liquido': total_ufs_liquido,
-            
-# Ajustes Apuração ICMS
-            'ajustes_icms': ajustes_icms,
-            'total_ajustes_icms': total_ajustes_icms,
-            
-# Ajustes Manuais ICMS
-            'ajustes_manuais_icms': ajustes_manuais_icms,
-            'total_ajustes_manuais_icms': total_ajustes_manuais_icms,
-            
-            # Composição detalhada por NF
-            'composicao_entradas_json': json.dumps(composicao_entradas_list, ensure_ascii=False),
-            'composicao_saidas_json': json.dumps(composicao_saidas_list, ensure_ascii=False),
-        })
-    
     return render(request, 'dashboards/relatorio_fiscal.html', context)
+
+
+@login_required
+def api_secao_relatorio_fiscal(request, secao):
+    """Uma aba do relatório fiscal (HTML com as alíquotas aplicadas)"""
+    from django.template.loader import render_to_string
+    from apps.dashboards.secoes_relatorio import ABAS, GRAFICOS_RESUMO, dados_secoes
+    from apps.dashboards.simulacao import aplicar_aliquotas
+
+    if secao not in ABAS:
+        return JsonResponse({'success': False, 'message': 'Seção inválida'}, status=404)
+
+    empresa_id = request.GET.get('empresa')
+    periodo_inicial = request.GET.get('periodo_inicial')
+    periodo_final = request.GET.get('periodo_final')
+    agrupar_filiais = request.GET.get('filiais') == '1'
+
+    if not empresa_id or not periodo_inicial or not periodo_final:
+        return JsonResponse({'success': False, 'message': 'Informe a empresa e o período'}, status=400)
+
+    aliquotas = _aliquotas_da_requisicao(request)
+    if aliquotas is None:
+        return JsonResponse({'success': False, 'message': 'Alíquota inválida'}, status=400)
+
+    base = dados_secoes(ABAS[secao], empresa_id, periodo_inicial, periodo_final, agrupar_filiais)
+    dados = aplicar_aliquotas(base, *aliquotas)
+    resposta = {
+        'success': True,
+        'html': render_to_string(f'dashboards/relatorio_fiscal/{secao}.html', dados, request=request),
+    }
+    if secao == 'resumo':
+        resposta['graficos'] = {campo: dados[campo] for campo in GRAFICOS_RESUMO}
+    return JsonResponse(resposta)
+
+
+@login_required
+def api_composicao_relatorio_fiscal(request, tipo):
+    """
+    Página da composição por NF (entradas/saídas) com filtros, ordenação e cursor
+    (apos); sem cursor devolve também os totais das linhas filtradas
+    """
+    from apps.dashboards.composicao import TIPOS, FiltroComposicao, pagina_composicao, totais_composicao
+    from apps.dashboards.secoes_relatorio import ConsultaRelatorio
+
+    if tipo not in TIPOS:
+        return JsonResponse({'success': False, 'message': 'Composição inválida'}, status=404)
+
+    empresa_id = request.GET.get('empresa')
+    periodo_inicial = request.GET.get('periodo_inicial')
+    periodo_final = request.GET.get('periodo_final')
+    agrupar_filiais = request.GET.get('filiais') == '1'
+
+    if not empresa_id or not periodo_inicial or not periodo_final:
+        return JsonResponse({'success': False, 'message': 'Informe a empresa e o período'}, status=400)
+
+    try:
+        filtro = FiltroComposicao(tipo, request.GET)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    consulta = ConsultaRelatorio(empresa_id, periodo_inicial, periodo_final, agrupar_filiais)
+    resposta = {'success': True, **pagina_composicao(consulta, filtro)}
+    if filtro.apos is None:
+        resposta['totais'] = totais_composicao(consulta, filtro)
+    return JsonResponse(resposta)
+
+
+@login_required
+def api_valores_composicao(request, tipo, coluna):
+    """Valores distintos de uma coluna da composição (dropdown de filtro), com os demais filtros aplicados"""
+    from apps.dashboards.composicao import FILTROS_COLUNA, TIPOS, FiltroComposicao, valores_coluna
+    from apps.dashboards.secoes_relatorio import ConsultaRelatorio
+
+    if tipo not in TIPOS or coluna not in FILTROS_COLUNA:
+        return JsonResponse({'success': False, 'message': 'Composição ou coluna inválida'}, status=404)
+
+    empresa_id = request.GET.get('empresa')
+    periodo_inicial = request.GET.get('periodo_inicial')
+    periodo_final = request.GET.get('periodo_final')
+    agrupar_filiais = request.GET.get('filiais') == '1'
+
+    if not empresa_id or not periodo_inicial or not periodo_final:
+        return JsonResponse({'success': False, 'message': 'Informe a empresa e o período'}, status=400)
+
+    try:
+        filtro = FiltroComposicao(tipo, request.GET)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    consulta = ConsultaRelatorio(empresa_id, periodo_inicial, periodo_final, agrupar_filiais)
+    valores = valores_coluna(consulta, filtro, coluna, (request.GET.get('busca_valor') or '').strip())
+    return JsonResponse({'success': True, **valores})
+
+
+@login_required
+def api_exportar_relatorio_fiscal(request):
+    """Relatório fiscal completo em XLSX (todas as seções, alíquotas aplicadas), enviado em blocos"""
+    from apps.dashboards.exportacao import SECOES_EXPORTACAO, escrever_relatorio, resposta_xlsx
+    from apps.dashboards.secoes_relatorio import ConsultaRelatorio, dados_secoes
+    from apps.dashboards.simulacao import aplicar_aliquotas
+
+    empresa_id = request.GET.get('empresa')
+    periodo_inicial = request.GET.get('periodo_inicial')
+    periodo_final = request.GET.get('periodo_final')
+    agrupar_filiais = request.GET.get('filiais') == '1'
+
+    if not empresa_id or not periodo_inicial or not periodo_final:
+        return JsonResponse({'success': False, 'message': 'Informe a empresa e o período'}, status=400)
+
+    aliquotas = _aliquotas_da_requisicao(request)
+    if aliquotas is None:
+        return JsonResponse({'success': False, 'message': 'Alíquota inválida'}, status=400)
+
+    base = dados_secoes(SECOES_EXPORTACAO, empresa_id, periodo_inicial, periodo_final, agrupar_filiais)
+    dados = aplicar_aliquotas(base, *aliquotas)
+    consulta = ConsultaRelatorio(empresa_id, periodo_inicial, periodo_final, agrupar_filiais)
+    return resposta_xlsx(
+        f'relatorio_fiscal_{periodo_inicial}_{periodo_final}.xlsx',
+        lambda workbook: escrever_relatorio(workbook, dados, consulta),
+    )
+
+
+@login_required
+def api_exportar_composicao(request, tipo):
+    """Composição por NF com os filtros e a ordenação da página, em XLSX enviado em blocos"""
+    from apps.dashboards.composicao import TIPOS, FiltroComposicao
+    from apps.dashboards.exportacao import PlanilhaXlsx, escrever_composicao, resposta_xlsx
+    from apps.dashboards.secoes_relatorio import ConsultaRelatorio
+
+    if tipo not in TIPOS:
+        return JsonResponse({'success': False, 'message': 'Composição inválida'}, status=404)
+
+    empresa_id = request.GET.get('empresa')
+    periodo_inicial = request.GET.get('periodo_inicial')
+    periodo_final = request.GET.get('periodo_final')
+    agrupar_filiais = request.GET.get('filiais') == '1'
+
+    if not empresa_id or not periodo_inicial or not periodo_final:
+        return JsonResponse({'success': False, 'message': 'Informe a empresa e o período'}, status=400)
+
+    try:
+        filtro = FiltroComposicao(tipo, request.GET)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'message': str(e)}, status=400)
+
+    consulta = ConsultaRelatorio(empresa_id, periodo_inicial, periodo_final, agrupar_filiais)
+    nome_aba = 'Composição Entradas' if tipo == 'entradas' else 'Composição Saídas'
+    return resposta_xlsx(
+        f'composicao_{tipo}_{periodo_inicial}_{periodo_final}.xlsx',
+        lambda workbook: escrever_composicao(PlanilhaXlsx(workbook), consulta, filtro, nome_aba),
+    )
+
+
+@login_required
+def api_simular_aliquotas(request):
+    """Reaplica as alíquotas IBS/CBS/IS sobre as agregações em cache do relatório fiscal"""
+    from apps.dashboards.secoes_relatorio import SECOES_SIMULACAO, dados_secoes
+    from apps.dashboards.simulacao import aplicar_aliquotas, valores_simulacao
+
+    empresa_id = request.GET.get('empresa')
+    periodo_inicial = request.GET.get('periodo_inicial')
+    periodo_final = request.GET.get('periodo_final')
+    agrupar_filiais = request.GET.get('filiais') == '1'
+
+    if not empresa_id or not periodo_inicial or not periodo_final:
+        return JsonResponse({'success': False, 'message': 'Informe a empresa e o período'}, status=400)
+
+    aliquotas = _aliquotas_da_requisicao(request)
+    if aliquotas is None:
+        return JsonResponse({'success': False, 'message': 'Alíquota inválida'}, status=400)
+
+    base = dados_secoes(SECOES_SIMULACAO, empresa_id, periodo_inicial, periodo_final, agrupar_filiais)
+    dados = aplicar_aliquotas(base, *aliquotas)
+    return JsonResponse({'success': True, **valores_simulacao(dados)})
+
+
+@csrf_exempt
+@login_required
+def api_simular_cenarios(request):
+    """Compara vários cenários de alíquotas (com reduções por NCM) sobre as agregações em cache"""
+    from apps.dashboards.secoes_relatorio import SECOES_SIMULACAO, dados_secoes
+    from apps.dashboards.simulacao import MAXIMO_CENARIOS, matriz_cenarios, simular_cenarios
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método não permitido'}, status=405)
+
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({'success': False, 'message': 'JSON inválido'}, status=400)
+
+    empresa_id = data.get('empresa_id')
+    periodo_inicial = data.get('periodo_inicial')
+    periodo_final = data.get('periodo_final')
+    agrupar_filiais = bool(data.get('filiais'))
+    cenarios_json = data.get('cenarios') or []
+
+    if not empresa_id or not periodo_inicial or not periodo_final:
+        return JsonResponse({'success': False, 'message': 'Parâmetros obrigatórios não informados'}, status=400)
+    if not cenarios_json or len(cenarios_json) > MAXIMO_CENARIOS:
+        return JsonResponse(
+            {'success': False, 'message': f'Informe de 1 a {MAXIMO_CENARIOS} cenários'}, status=400,
+        )
+
+    try:
+        cenarios = [
+            {
+                'nome': cenario.get('nome') or f'Cenário {indice}',
+                'aliquota_ibs': _decimal_finito(cenario.get('aliquota_ibs'), '18.5'),
+                'aliquota_cbs': _decimal_finito(cenario.get('aliquota_cbs'), '8.5'),
+                'aliquota_is': _decimal_finito(cenario.get('aliquota_is'), '0'),
+                'reducoes_ncm': {
+                    str(ncm).strip(): _decimal_finito(perc, '0')
+                    for ncm, perc in (cenario.get('reducoes_ncm') or {}).items()
+                },
+            }
+            for indice, cenario in enumerate(cenarios_json, 1)
+        ]
+    except (InvalidOperation, AttributeError):
+        return JsonResponse({'success': False, 'message': 'Cenário inválido'}, status=400)
+
+    base = dados_secoes(SECOES_SIMULACAO, empresa_id, periodo_inicial, periodo_final, agrupar_filiais)
+    return JsonResponse({'success': True, **matriz_cenarios(cenarios, simular_cenarios(base, cenarios))})
+
+
 @login_required
 def api_periodos(request):
     empresa_id = request.GET.get('empresa')
@@ -1382,8 +329,8 @@ def api_chaves_processadas(request):
 @login_required
 def api_listar_chaves_saida(request):
     """Retorna lista de chaves de acesso das notas de saída do período selecionado"""
-    from apps.sped.models import Registro0000, RegistroC100
-    
+    from .busca_api import chaves_saida
+
     empresa_id = request.GET.get('empresa')
     periodo_inicial = request.GET.get('periodo_inicial')
     periodo_final = request.GET.get('periodo_final')
@@ -1391,38 +338,7 @@ def api_listar_chaves_saida(request):
     if not empresa_id or not periodo_inicial or not periodo_final:
         return JsonResponse({'success': False, 'message': 'Parâmetros incompletos', 'chaves': []})
     
-    registros_0000 = Registro0000.objects.filter(
-        empresa_id=empresa_id,
-        processado=True,
-        periodo__gte=periodo_inicial + '-01',
-        periodo__lte=periodo_final + '-28'
-    )
-    
-# Buscar TODOS os documentos C100 de saída (ind_oper='1') com chave válida
-    documentos_saida = RegistroC100.objects.filter(
-        registro_0000__in=registros_0000,
-        ind_oper='1'
-    ).exclude(chv_nfe__isnull=True).exclude(chv_nfe='')
-    
-    chaves_nfe = []  # NF-e para buscar
-    chaves_nfce = []  # NFC-e ignoradas
-    
-    for doc in documentos_saida:
-        if doc.chv_nfe and len(doc.chv_nfe) >= 44:
-            modelo = doc.cod_mod or '55'
-            dados_doc = {
-                'chave_nfe': doc.chv_nfe,
-                'numero': doc.num_doc,
-                'modelo': modelo,
-                'modelo_desc': 'NF-e' if modelo == '55' else 'NFC-e',
-                'valor': float(doc.vl_doc) if doc.vl_doc else 0,
-                'data': doc.dt_doc.strftime('%d/%m/%Y') if doc.dt_doc else '',
-            }
-            
-            if modelo == '55':
-                chaves_nfe.append(dados_doc)
-            else:
-                chaves_nfce.append(dados_doc)
+    chaves_nfe, chaves_nfce = chaves_saida(empresa_id, periodo_inicial, periodo_final)
     
     return JsonResponse({
         'success': True,
@@ -1434,86 +350,19 @@ def api_listar_chaves_saida(request):
     })
 
 
-from django.views.decorators.csrf import csrf_exempt
-
 import logging
 logger = logging.getLogger('dashboards.api')
 
 
-def _buscar_cache_xml(chave_acesso):
-    """Busca cache de produtos XML em qualquer pasta (entrada/saida/outros)"""
-    import re
-    from django.conf import settings
-
-    if len(chave_acesso) < 20:
-        return None
-
-    cnpj_chave = chave_acesso[6:20]
-    aamm = chave_acesso[2:6]
-    periodo = f"20{aamm[:2]}-{aamm[2:]}"
-
-    try:
-        empresa = Empresa.objects.filter(cnpj_cpf__startswith=cnpj_chave[:8]).first()
-        nome_pasta = re.sub(r'[<>:"/\\|?*\n\r]', '_', (empresa.razao_social[:80] if empresa else cnpj_chave)).strip('. ')
-    except Exception:
-        nome_pasta = cnpj_chave
-
-    base_dir = os.path.join(settings.MEDIA_ROOT, 'xml_cache', nome_pasta, periodo)
-
-    for tipo in ('entrada', 'saida', 'outros'):
-        path = os.path.join(base_dir, tipo, f"{chave_acesso}.json")
-        if os.path.exists(path):
-            return path
-    return None
-
-
-def _salvar_cache_xml(chave_acesso, ind_oper, produtos, num_nota=''):
-    """Salva produtos em cache: media/xml_cache/{empresa}/{YYYY-MM}/{entrada|saida}/"""
-    import re
-    from django.conf import settings
-
-    if len(chave_acesso) < 20:
-        return
-
-    cnpj_chave = chave_acesso[6:20]
-    aamm = chave_acesso[2:6]
-    periodo = f"20{aamm[:2]}-{aamm[2:]}"
-
-    try:
-        empresa = Empresa.objects.filter(cnpj_cpf__startswith=cnpj_chave[:8]).first()
-        nome_pasta = re.sub(r'[<>:"/\\|?*\n\r]', '_', (empresa.razao_social[:80] if empresa else cnpj_chave)).strip('. ')
-    except Exception:
-        nome_pasta = cnpj_chave
-
-    tipo = 'entrada' if ind_oper == '0' else 'saida' if ind_oper == '1' else 'outros'
-    cache_dir = os.path.join(settings.MEDIA_ROOT, 'xml_cache', nome_pasta, periodo, tipo)
-    os.makedirs(cache_dir, exist_ok=True)
-
-    cache_path = os.path.join(cache_dir, f"{chave_acesso}.json")
-    try:
-        with open(cache_path, 'w', encoding='utf-8') as f:
-            json.dump({
-                'chave': chave_acesso,
-                'num_nota': num_nota,
-                'produtos': produtos,
-            }, f, ensure_ascii=False, indent=2)
-        logger.info(f"[API-XML] NF {num_nota} - 💾 Cache salvo em {tipo}/")
-    except Exception as e:
-        logger.warning(f"[API-XML] NF {num_nota} - Erro ao salvar cache: {e}")
-
-
 @csrf_exempt
 @login_required
 def api_buscar_xml_produto(request):
     """Busca XML de uma NFe via API MeuDanfe e extrai dados dos produtos"""
-    import requests
-    import base64
-    import xml.etree.ElementTree as ET
+    from . import meudanfe
     
     if request.method != 'POST':
         return JsonResponse({'success': False, 'message': 'Método não permitido'}, status=405)
     
-    import json
     data = json.loads(request.body)
     chave_acesso = data.get('chave_acesso', '')
     
@@ -1531,192 +380,138 @@ def api_buscar_xml_produto(request):
 
     # Verificar cache local antes de chamar API
     ind_oper = data.get('ind_oper', '')
-    cache_local = _buscar_cache_xml(chave_acesso)
-    if cache_local:
-        try:
-            with open(cache_local, 'r', encoding='utf-8') as f:
-                cached = json.load(f)
-            qtd = len(cached.get('produtos', []))
-            logger.info(f"[API-XML] NF {num_nota} - 💾 CACHE LOCAL ({qtd} produtos)")
-            return JsonResponse({
-                'success': True,
-                'chave': chave_acesso,
-                'produtos': cached.get('produtos', []),
-                'qtd_produtos': qtd,
-                'from_cache': True
-            })
-        except Exception as e:
-            logger.warning(f"[API-XML] NF {num_nota} - Cache corrompido, rebuscando: {e}")
+    produtos = meudanfe.ler_cache_xml(chave_acesso)
+    if produtos is not None:
+        logger.info(f"[API-XML] NF {num_nota} - 💾 CACHE LOCAL ({len(produtos)} produtos)")
+        return JsonResponse({
+            'success': True,
+            'chave': chave_acesso,
+            'produtos': produtos,
+            'qtd_produtos': len(produtos),
+            'from_cache': True
+        })
 
     logger.info(f"[API-XML] Buscando NF {num_nota} - Chave: {chave_acesso[:20]}...")
-    
-    # API Key do MeuDanfe
-    api_key = '167af6d1-a260-4a6b-bc48-729064cc4efd'
-    
-    headers = {
-        'Api-Key': api_key,
-        'Content-Type': 'application/json'
-    }
-    
-    # Identificar modelo pela chave (posição 20-21 da chave = modelo)
-    modelo = chave_acesso[20:22] if len(chave_acesso) >= 22 else '55'
-    logger.info(f"[API-XML] NF {num_nota} - Modelo: {modelo} ({'NFC-e' if modelo == '65' else 'NF-e'})")
-    
+    resultado = meudanfe.consultar_chave_sincrona(chave_acesso)
+    if resultado['status'] != meudanfe.ENCONTRADA:
+        return JsonResponse({'success': False, 'message': resultado['mensagem']})
+
     try:
-        # Passo 1: Adicionar chave para busca
-        # NFC-e (65) usa endpoint diferente
-        if modelo == '65':
-            url_add = f'https://api.meudanfe.com.br/v2/nfce/add/{chave_acesso}'
-        else:
-            url_add = f'https://api.meudanfe.com.br/v2/fd/add/{chave_acesso}'
-        response = requests.put(url_add, headers=headers, timeout=30)
-        
-        if response.status_code == 200:
-            data_resp = response.json()
-            search_status = data_resp.get('SearchStatus') or data_resp.get('searchStatus') or data_resp.get('status')
-            logger.info(f"[API-XML] NF {num_nota} - Status: {search_status}")
-            
-            if search_status in ['FOUND', 'Found', 'found', 'OK', 'ok', 'SUCCESS', 'success']:
-# Passo 2: Buscar XML
-                if modelo == '65':
-                    url_xml = f'https://api.meudanfe.com.br/v2/nfce/get/xml/{chave_acesso}'
-                else:
-                    url_xml = f'https://api.meudanfe.com.br/v2/fd/get/xml/{chave_acesso}'
-                response_xml = requests.get(url_xml, headers=headers, timeout=30)
-                
-                if response_xml.status_code == 200:
-                    data_xml = response_xml.json()
-                    xml_content = None
-                    
-                    if data_xml.get('data') and data_xml.get('data').startswith('<?xml'):
-                        xml_content = data_xml.get('data')
-                    elif data_xml.get('Base64') or data_xml.get('base64'):
-                        xml_base64 = data_xml.get('Base64') or data_xml.get('base64')
-                        xml_content = base64.b64decode(xml_base64).decode('utf-8')
-                    
-                    if xml_content:
-                        # Extrair dados dos produtos
-                        produtos = extrair_produtos_xml(xml_content, chave_acesso)
-                        logger.info(f"[API-XML] NF {num_nota} - ✅ SUCESSO! {len(produtos)} produtos extraídos")
-
-                        # Salvar no cache local
-                        _salvar_cache_xml(chave_acesso, ind_oper, produtos, num_nota)
-
-                        return JsonResponse({
-                            'success': True,
-                            'chave': chave_acesso,
-                            'produtos': produtos,
-                            'qtd_produtos': len(produtos),
-                            'from_cache': False
-                        })
-
-                    else:
-                        return JsonResponse({'success': False, 'message': 'XML não retornado pela API'})
-                else:
-                    return JsonResponse({'success': False, 'message': f'Erro ao buscar XML: {response_xml.status_code}'})
-            else:
-                logger.warning(f"[API-XML] NF {num_nota} - Não encontrada: {search_status}")
-                return JsonResponse({'success': False, 'message': f'NFe não encontrada: {search_status}'})
-        elif response.status_code == 402:
-            logger.error(f"[API-XML] NF {num_nota} - Saldo insuficiente")
-            return JsonResponse({'success': False, 'message': 'Saldo insuficiente na API'})
-        elif response.status_code == 401:
-            logger.error(f"[API-XML] NF {num_nota} - API Key inválida")
-            return JsonResponse({'success': False, 'message': 'API Key inválida'})
-        else:
-            logger.error(f"[API-XML] NF {num_nota} - Erro HTTP: {response.status_code}")
-            return JsonResponse({'success': False, 'message': f'Erro na API: {response.status_code}'})
-    
+        produtos = meudanfe.registrar_xml(resultado, ind_oper, num_nota)
     except Exception as e:
-        logger.error(f"[API-XML] NF {num_nota} - Exceção: {str(e)}")
-        return JsonResponse({'success': False, 'message': f'Erro: {str(e)}'})
+        return JsonResponse({'success': False, 'message': f'Erro ao extrair produtos do XML: {e}'})
+    logger.info(f"[API-XML] NF {num_nota} - ✅ SUCESSO! {len(produtos)} produtos extraídos")
+
+    return JsonResponse({
+        'success': True,
+        'chave': chave_acesso,
+        'produtos': produtos,
+        'qtd_produtos': len(produtos),
+        'from_cache': False
+    })
+
+
+def _dados_busca(busca):
+    dados = {
+        'id': busca.id,
+        'tipo': busca.tipo,
+        'status': busca.status,
+        'status_display': busca.get_status_display(),
+        'ativa': busca.ativa,
+        'chaves_total': busca.chaves_total,
+        'chaves_ja_gravadas': busca.chaves_ja_gravadas,
+        'chaves_processadas': busca.chaves_processadas,
+        'sucesso': busca.sucesso,
+        'do_cache': busca.do_cache,
+        'erros': busca.erros,
+        'produtos': busca.produtos,
+        'cancelar': busca.cancelar,
+        'mensagem': busca.mensagem,
+    }
+    # Lista de pendências só no fim (pode ter milhares de notas)
+    if not busca.ativa:
+        dados['relatorio'] = busca.relatorio
+    return dados
+
+
+@csrf_exempt
+@login_required
+def api_iniciar_busca_api(request):
+    """Enfileira a busca dos produtos das notas do período via API (processada pelo worker_busca_api)"""
+    from .busca_api import enfileirar_busca, MODELOS
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método não permitido'}, status=405)
+
+    data = json.loads(request.body)
+    empresa_id = data.get('empresa_id')
+    periodo_inicial = data.get('periodo_inicial')
+    periodo_final = data.get('periodo_final')
+    tipo = data.get('tipo')
+
+    if not empresa_id or not periodo_inicial or not periodo_final:
+        return JsonResponse({'success': False, 'message': 'Parâmetros incompletos'})
+    if tipo not in MODELOS:
+        return JsonResponse({'success': False, 'message': f'Tipo de busca inválido: {tipo}'}, status=400)
+
+    busca = enfileirar_busca(request.user, empresa_id, periodo_inicial, periodo_final, tipo)
+    return JsonResponse({'success': True, 'busca': _dados_busca(busca)})
+
+
+@login_required
+def api_status_busca_api(request, busca_id):
+    """Progresso de uma busca via API"""
+    from .models import BuscaProdutosAPI
+
+    busca = BuscaProdutosAPI.objects.filter(id=busca_id).first()
+    if busca is None:
+        return JsonResponse({'success': False, 'message': 'Busca não encontrada'}, status=404)
+    return JsonResponse({'success': True, 'busca': _dados_busca(busca)})
+
+
+@login_required
+def api_ultima_busca_api(request):
+    """Busca via API mais recente da empresa/período (para retomar o acompanhamento ao reabrir a página)"""
+    from .models import BuscaProdutosAPI
+
+    empresa_id = request.GET.get('empresa')
+    periodo_inicial = request.GET.get('periodo_inicial')
+    periodo_final = request.GET.get('periodo_final')
+
+    if not empresa_id or not periodo_inicial or not periodo_final:
+        return JsonResponse({'success': False, 'message': 'Parâmetros incompletos'})
+
+    buscas = BuscaProdutosAPI.objects.filter(
+        empresa_id=empresa_id,
+        periodo_inicial=periodo_inicial,
+        periodo_final=periodo_final,
+    )
+    if request.GET.get('tipo'):
+        buscas = buscas.filter(tipo=request.GET['tipo'])
+    busca = buscas.first()
+    return JsonResponse({'success': True, 'busca': _dados_busca(busca) if busca else None})
+
+
+@csrf_exempt
+@login_required
+def api_cancelar_busca_api(request, busca_id):
+    """Cancela a busca: na fila, imediatamente; em processamento, ao fim do lote atual"""
+    from django.utils import timezone
+    from .models import BuscaProdutosAPI
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'message': 'Método não permitido'}, status=405)
+
+    agora = timezone.now()
+    cancelada = BuscaProdutosAPI.objects.filter(id=busca_id, status='pendente').update(
+        status='cancelado', cancelar=True, mensagem='Busca cancelada pelo usuário',
+        finalizado_em=agora, updated_at=agora,
+    )
+    if not cancelada:
+        BuscaProdutosAPI.objects.filter(id=busca_id, status='processando').update(cancelar=True)
+    return JsonResponse({'success': True})
 
 
-def extrair_produtos_xml(xml_content, chave_acesso):
-    """Extrai dados dos produtos de um XML de NFe"""
-    import xml.etree.ElementTree as ET
-    from decimal import Decimal
-    
-    produtos = []
-    
-    try:
-        root = ET.fromstring(xml_content)
-        ns = {'nfe': 'http://www.portalfiscal.inf.br/nfe'}
-        
-        # Buscar itens (det)
-        for det in root.findall('.//nfe:det', ns):
-            prod = det.find('nfe:prod', ns)
-            imposto = det.find('nfe:imposto', ns)
-            
-            if prod is None:
-                continue
-            
-            item = {
-                'chave_nfe': chave_acesso,
-                'num_item': det.get('nItem', ''),
-                'codigo': prod.findtext('nfe:cProd', '', ns),
-                'ean': prod.findtext('nfe:cEAN', '', ns),
-                'descricao': prod.findtext('nfe:xProd', '', ns),
-                'ncm': prod.findtext('nfe:NCM', '', ns),
-                'cest': prod.findtext('nfe:CEST', '', ns),
-                'cfop': prod.findtext('nfe:CFOP', '', ns),
-                'unidade': prod.findtext('nfe:uCom', '', ns),
-                'quantidade': float(prod.findtext('nfe:qCom', '0', ns) or 0),
-                'valor_unitario': float(prod.findtext('nfe:vUnCom', '0', ns) or 0),
-                'valor_total': float(prod.findtext('nfe:vProd', '0', ns) or 0),
-            }
-            
-# Impostos
-            if imposto:
-                # ICMS
-                icms = imposto.find('.//nfe:ICMS', ns)
-                if icms:
-                    for icms_tipo in icms:
-                        item['icms_cst'] = icms_tipo.findtext('nfe:CST', '', ns) or icms_tipo.findtext('nfe:CSOSN', '', ns)
-                        item['icms_aliq'] = float(icms_tipo.findtext('nfe:pICMS', '0', ns) or 0)
-                        item['icms_valor'] = float(icms_tipo.findtext('nfe:vICMS', '0', ns) or 0)
-                        # ICMS ST
-                        item['icms_st_valor'] = float(icms_tipo.findtext('nfe:vICMSST', '0', ns) or 0)
-                        item['icms_st_bc'] = float(icms_tipo.findtext('nfe:vBCST', '0', ns) or 0)
-                        break
-                
-                # IPI
-                ipi = imposto.find('.//nfe:IPI', ns)
-                if ipi:
-                    for ipi_tipo in ipi:
-                        item['ipi_cst'] = ipi_tipo.findtext('nfe:CST', '', ns)
-                        item['ipi_aliq'] = float(ipi_tipo.findtext('nfe:pIPI', '0', ns) or 0)
-                        item['ipi_valor'] = float(ipi_tipo.findtext('nfe:vIPI', '0', ns) or 0)
-                        break
-                else:
-                    item['ipi_cst'] = ''
-                    item['ipi_aliq'] = 0
-                    item['ipi_valor'] = 0
-                
-                # PIS
-                pis = imposto.find('.//nfe:PIS', ns)
-                if pis:
-                    for pis_tipo in pis:
-                        item['pis_cst'] = pis_tipo.findtext('nfe:CST', '', ns)
-                        item['pis_aliq'] = float(pis_tipo.findtext('nfe:pPIS', '0', ns) or 0)
-                        item['pis_valor'] = float(pis_tipo.findtext('nfe:vPIS', '0', ns) or 0)
-                        break
-                
-                # COFINS
-                cofins = imposto.find('.//nfe:COFINS', ns)
-                if cofins:
-                    for cofins_tipo in cofins:
-                        item['cofins_cst'] = cofins_tipo.findtext('nfe:CST', '', ns)
-                        item['cofins_aliq'] = float(cofins_tipo.findtext('nfe:pCOFINS', '0', ns) or 0)
-                        item['cofins_valor'] = float(cofins_tipo.findtext('nfe:vCOFINS', '0', ns) or 0)
-                        break
-            
-            produtos.append(item)
-    
-    except Exception as e:
-        print(f"Erro ao extrair produtos do XML: {e}")
-    
-    return produtos
 @login_required
 def debug_sped(request):
     from django.http import JsonResponse
@@ -1740,14 +535,7 @@ def debug_sped(request):
 def api_exportar_relatorio_erros(request):
     """Exporta relatório de NF-e com erro e NFC-e ignoradas para Excel"""
     import json
-    from io import BytesIO
-    from django.http import HttpResponse
-    
-    try:
-        import openpyxl
-        from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-    except ImportError:
-        return JsonResponse({'success': False, 'message': 'openpyxl não instalado'})
+    from apps.dashboards.exportacao import resposta_xlsx
     
     if request.method != 'POST':
         return JsonResponse({'success': False, 'message': 'Método não permitido'}, status=405)
@@ -1756,79 +544,28 @@ def api_exportar_relatorio_erros(request):
     nfe_erros = data.get('nfe_erros', [])
     nfce_ignoradas = data.get('nfce_ignoradas', [])
     
-    wb = openpyxl.Workbook()
-    
-    # Estilos
-    header_font = Font(bold=True, color='FFFFFF')
-    header_fill_erro = PatternFill(start_color='DC2626', end_color='DC2626', fill_type='solid')
-    header_fill_nfce = PatternFill(start_color='F59E0B', end_color='F59E0B', fill_type='solid')
-    border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
+    abas = [
+        ('NF-e com Erro', '#DC2626', 'Erro', 'erro', nfe_erros),
+        ('NFC-e Ignoradas', '#F59E0B', 'Motivo', 'motivo', nfce_ignoradas),
+    ]
     
-    # Aba NF-e com Erro
-    ws_erros = wb.active
-    ws_erros.title = 'NF-e com Erro'
-    headers_erro = ['Número', 'Chave de Acesso', 'Data', 'Valor', 'Erro']
-    for col, header in enumerate(headers_erro, 1):
-        cell = ws_erros.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill_erro
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    for row, nfe in enumerate(nfe_erros, 2):
-        ws_erros.cell(row=row, column=1, value=nfe.get('numero', '')).border = border
-        ws_erros.cell(row=row, column=2, value=nfe.get('chave_nfe', '')).border = border
-        ws_erros.cell(row=row, column=3, value=nfe.get('data', '')).border = border
-        ws_erros.cell(row=row, column=4, value=nfe.get('valor', 0)).border = border
-        ws_erros.cell(row=row, column=5, value=nfe.get('erro', '')).border = border
-    
-    # Ajustar largura das colunas
-    ws_erros.column_dimensions['A'].width = 12
-    ws_erros.column_dimensions['B'].width = 50
-    ws_erros.column_dimensions['C'].width = 12
-    ws_erros.column_dimensions['D'].width = 15
-    ws_erros.column_dimensions['E'].width = 40
-    
-    # Aba NFC-e Ignoradas
-    ws_nfce = wb.create_sheet('NFC-e Ignoradas')
-    headers_nfce = ['Número', 'Chave de Acesso', 'Data', 'Valor', 'Motivo']
-    for col, header in enumerate(headers_nfce, 1):
-        cell = ws_nfce.cell(row=1, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill_nfce
-        cell.border = border
-        cell.alignment = Alignment(horizontal='center')
-    
-    for row, nfce in enumerate(nfce_ignoradas, 2):
-        ws_nfce.cell(row=row, column=1, value=nfce.get('numero', '')).border = border
-        ws_nfce.cell(row=row, column=2, value=nfce.get('chave_nfe', '')).border = border
-        ws_nfce.cell(row=row, column=3, value=nfce.get('data', '')).border = border
-        ws_nfce.cell(row=row, column=4, value=nfce.get('valor', 0)).border = border
-        ws_nfce.cell(row=row, column=5, value=nfce.get('motivo', '')).border = border
-    
-    # Ajustar largura das colunas
-    ws_nfce.column_dimensions['A'].width = 12
-    ws_nfce.column_dimensions['B'].width = 50
-    ws_nfce.column_dimensions['C'].width = 12
-    ws_nfce.column_dimensions['D'].width = 15
-    ws_nfce.column_dimensions['E'].width = 40
-    
-    # Salvar em memória
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    response = HttpResponse(
-        output.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename=relatorio_erros_nfe.xlsx'
-    return response
+    def escrever(wb):
+        borda = wb.add_format({'border': 1})
+        for titulo, cor, coluna_motivo, campo_motivo, notas in abas:
+            cabecalho = wb.add_format({
+                'bold': True, 'font_color': '#FFFFFF', 'bg_color': cor, 'border': 1, 'align': 'center',
+            })
+            ws = wb.add_worksheet(titulo)
+            for col, largura in enumerate([12, 50, 12, 15, 40]):
+                ws.set_column(col, col, largura)
+            ws.write_row(0, 0, ['Número', 'Chave de Acesso', 'Data', 'Valor', coluna_motivo], cabecalho)
+            for row, nota in enumerate(notas, 1):
+                ws.write_row(row, 0, [
+                    nota.get('numero', ''), nota.get('chave_nfe', ''), nota.get('data', ''),
+                    nota.get('valor', 0), nota.get(campo_motivo, ''),
+                ], borda)
+    
+    return resposta_xlsx('relatorio_erros_nfe.xlsx', escrever)
 @csrf_exempt
 @login_required
 def api_salvar_produtos_api(request):
@@ -1904,7 +641,7 @@ def api_salvar_produtos_api(request):
 @login_required
 def api_listar_chaves_entrada_sem_itens(request):
     """Retorna chaves de NF-e de entrada que não possuem itens C170"""
-    from apps.sped.models import Registro0000, RegistroC100, RegistroC170
+    from .busca_api import chaves_entrada_sem_itens
 
     empresa_id = request.GET.get('empresa')
     periodo_inicial = request.GET.get('periodo_inicial')
@@ -1913,58 +650,7 @@ def api_listar_chaves_entrada_sem_itens(request):
     if not empresa_id or not periodo_inicial or not periodo_final:
         return JsonResponse({'success': False, 'message': 'Parâmetros incompletos', 'chaves': []})
 
-    registros_0000 = Registro0000.objects.filter(
-        empresa_id=empresa_id,
-        processado=True,
-        periodo__gte=periodo_inicial + '-01',
-        periodo__lte=periodo_final + '-28'
-    )
-
-    # Buscar documentos C100 de entrada (ind_oper='0') com chave válida
-    documentos_entrada = RegistroC100.objects.filter(
-        registro_0000__in=registros_0000,
-        ind_oper='0'
-    ).exclude(chv_nfe__isnull=True).exclude(chv_nfe='')
-
-    chaves_sem_itens = []
-    chaves_nfce = []
-
-    for doc in documentos_entrada:
-        if not doc.chv_nfe or len(doc.chv_nfe) < 44:
-            continue
-
-        modelo = doc.cod_mod or '55'
-
-        # Verificar se tem C170
-        tem_itens = RegistroC170.objects.filter(registro_c100=doc).exists()
-        if tem_itens:
-            continue
-
-        # Verificar se tem C113 (nota referenciada - devolução)
-        chave_referenciada = ''
-        try:
-            from apps.sped.models import RegistroC113
-            refs_c113 = RegistroC113.objects.filter(registro_c100=doc)
-            if refs_c113.exists():
-                ref = refs_c113.first()
-                if ref.chv_nfe and len(ref.chv_nfe) >= 44:
-                    chave_referenciada = ref.chv_nfe
-        except Exception:
-            pass
-
-        dados_doc = {
-            'chave_nfe': doc.chv_nfe,
-            'chave_referenciada': chave_referenciada,
-            'numero': doc.num_doc,
-            'modelo': modelo,
-            'modelo_desc': 'NF-e' if modelo == '55' else 'NFC-e',
-            'valor': float(doc.vl_doc) if doc.vl_doc else 0,
-            'data': doc.dt_doc.strftime('%d/%m/%Y') if doc.dt_doc else '',
-        }
-        if modelo == '55':
-            chaves_sem_itens.append(dados_doc)
-        else:
-            chaves_nfce.append(dados_doc)
+    chaves_sem_itens, chaves_nfce = chaves_entrada_sem_itens(empresa_id, periodo_inicial, periodo_final)
 
     return JsonResponse({
         'success': True,
@@ -0,0 +1,590 @@
+"""
+Carga em lote dos registros SPED no banco
+
+Substitui o update_or_create linha a linha por bulk_create com upsert
+(ON CONFLICT ... DO UPDATE) em lotes de SPED_BULK_BATCH_SIZE linhas.
+No PostgreSQL, C100/C170/C190 entram via COPY (ver CargaCopyPostgres).
+"""
+import logging
+import time
+from datetime import date
+from itertools import islice
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from apps.sped.models import (
+    Registro0150, Registro0200, RegistroC100, RegistroC110, RegistroC113, RegistroC170,
+    RegistroC190, RegistroE110, RegistroE111,
+)
+from apps.documentos_fiscais.models import NFe
+from apps.reforma_tributaria.models import ItemNCM
+
+logger = logging.getLogger('sped.processamento')
+
+
+CAMPOS_0150 = ['nome', 'cnpj', 'cpf', 'ie', 'cod_mun', 'endereco']
+CAMPOS_0200 = ['descr_item', 'cod_barra', 'unid_inv', 'tipo_item', 'cod_ncm', 'cest', 'aliq_icms']
+CAMPOS_C100 = [
+    'ind_emit', 'cod_part', 'cod_sit', 'chv_nfe', 'dt_doc', 'dt_e_s',
+    'vl_doc', 'vl_merc', 'vl_icms', 'vl_pis', 'vl_cofins',
+]
+# C170: (campo do modelo, chave no dicionário do parser); cod_ncm vem do 0200
+MAPA_C170 = (
+    ('cod_item', 'cod_item'), ('descr_compl', 'descr_compl'), ('qtd', 'qtd'), ('unid', 'unid'),
+    ('vl_item', 'vl_item'), ('vl_desc', 'vl_desc'), ('cst_icms', 'cst_icms'), ('cfop', 'cfop'),
+    ('cod_nat', 'cod_nat'), ('vl_bc_icms', 'vl_bc_icms'), ('aliq_icms', 'aliq_icms'), ('vl_icms', 'vl_icms'),
+    ('cst_pis', 'cst_pis'), ('vl_bc_pis', 'vl_bc_pis'), ('aliq_pis', 'aliq_pis_percent'), ('vl_pis', 'vl_pis'),
+    ('cst_cofins', 'cst_cofins'), ('vl_bc_cofins', 'vl_bc_cofins'), ('aliq_cofins', 'aliq_cofins_percent'),
+    ('vl_cofins', 'vl_cofins'),
+)
+CAMPOS_C170 = [campo for campo, _ in MAPA_C170] + ['cod_ncm']
+CAMPOS_C190 = [
+    'cst_icms', 'cfop', 'aliq_icms', 'vl_opr', 'vl_bc_icms', 'vl_icms',
+    'vl_bc_icms_st', 'vl_icms_st', 'vl_red_bc', 'vl_ipi', 'cod_obs',
+]
+# Valor usado quando o campo não veio do parser
+PADRAO_TEXTO = {'cod_item', 'descr_compl', 'unid', 'cst_icms', 'cfop', 'cod_nat', 'cst_pis', 'cst_cofins', 'cod_obs'}
+CAMPOS_C113 = ['ind_oper', 'ind_emit', 'cod_part', 'cod_mod', 'ser', 'sub', 'num_doc', 'dt_doc']
+CAMPOS_NFE = ['empresa', 'numero', 'serie', 'data_emissao', 'valor_total', 'modelo']
+CAMPOS_ITEM_NCM = [
+    'descricao', 'cod_ncm', 'cest', 'cod_barra', 'unidade', 'cst_icms', 'cst_pis', 'cst_cofins',
+    'cfop', 'aliq_icms', 'aliq_pis', 'aliq_cofins', 'origem', 'registro_0000', 'updated_at',
+]
+
+
+CHAVE_C100 = ['num_doc', 'ser', 'cod_mod', 'ind_oper']
+
+
+def chave_c100(doc):
+    """Chave natural do C100 (mesma usada no unique_together do modelo)"""
+    return (doc['num_doc'], doc.get('ser', ''), doc['cod_mod'], doc['ind_oper'])
+
+
+def agrupar_documentos(docs_data):
+    """Agrupa os C100 pela chave natural: campos do último documento, filhos de todos"""
+    documentos = {}
+    for doc in docs_data:
+        chave = chave_c100(doc)
+        if chave in documentos:
+            anterior = documentos[chave]
+            doc = dict(doc, **{
+                filho: anterior.get(filho, []) + doc.get(filho, [])
+                for filho in ('itens', 'complementares', 'referencias', 'analiticos')
+            })
+        documentos[chave] = doc
+    return documentos
+
+
+def gravar_em_lotes(model, objetos, batch_size, **opcoes):
+    """bulk_create em lotes consumindo um iterável, sem montar a lista inteira; retorna a quantidade gravada"""
+    objetos = iter(objetos)
+    total = 0
+    while True:
+        lote = list(islice(objetos, batch_size))
+        if not lote:
+            return total
+        model.objects.bulk_create(lote, **opcoes)
+        total += len(lote)
+
+
+class CargaEmLote:
+    """
+    Grava os registros de um Registro0000 em lotes, medindo linhas/segundo
+    por tipo de registro em self.estatisticas
+    """
+
+    def __init__(self, registro_0000, batch_size=None):
+        self.registro_0000 = registro_0000
+        self.batch_size = batch_size or settings.SPED_BULK_BATCH_SIZE
+        self.estatisticas = {}
+        self._ncm_por_item = None
+
+    # ------------------------------------------------------------------
+    # Infraestrutura
+    # ------------------------------------------------------------------
+
+    def _gravar(self, model, objetos, **opcoes):
+        return gravar_em_lotes(model, objetos, self.batch_size, **opcoes)
+
+    def _upsert(self, model, objetos, unique_fields, update_fields):
+        return self._gravar(
+            model, objetos,
+            update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields,
+        )
+
+    def _medir(self, registro, linhas, inicio):
+        segundos = time.perf_counter() - inicio
+        por_segundo = linhas / segundos if segundos > 0 else 0
+        self.estatisticas[registro] = {
+            'linhas': linhas,
+            'segundos': round(segundos, 3),
+            'linhas_por_segundo': round(por_segundo),
+        }
+        logger.info(f"  {registro}: {linhas} linhas em {segundos:.2f}s ({por_segundo:,.0f} linhas/s)")
+
+    @property
+    def ncm_por_item(self):
+        """Mapa cod_item → NCM do 0200; carregado do banco se os itens não passaram por aqui"""
+        if self._ncm_por_item is None:
+            self._ncm_por_item = dict(
+                Registro0200.objects.filter(registro_0000=self.registro_0000).values_list('cod_item', 'cod_ncm')
+            )
+        return self._ncm_por_item
+
+    # ------------------------------------------------------------------
+    # Registros do bloco 0
+    # ------------------------------------------------------------------
+
+    def participantes_0150(self, participantes_data):
+        inicio = time.perf_counter()
+        # Último registro vence, como no update_or_create (e o ON CONFLICT não aceita chave repetida no lote)
+        por_codigo = {}
+        for part in participantes_data:
+            por_codigo[part['cod_part']] = Registro0150(
+                registro_0000=self.registro_0000,
+                cod_part=part['cod_part'],
+                nome=part.get('nome', ''),
+                cnpj=part.get('cnpj', '').replace('.', '').replace('/', '').replace('-', ''),
+                cpf=part.get('cpf', '').replace('.', '').replace('-', ''),
+                ie=part.get('ie', ''),
+                cod_mun=part.get('cod_mun', ''),
+                endereco=part.get('end', ''),
+            )
+
+        total = self._upsert(Registro0150, por_codigo.values(), ['registro_0000', 'cod_part'], CAMPOS_0150)
+        self._medir('0150', total, inicio)
+        return total
+
+    def itens_0200(self, itens_data):
+        inicio = time.perf_counter()
+        por_codigo = {}
+        for item in itens_data:
+            por_codigo[item['cod_item']] = Registro0200(
+                registro_0000=self.registro_0000,
+                cod_item=item['cod_item'],
+                descr_item=item['descr_item'],
+                cod_barra=item.get('cod_barra', ''),
+                unid_inv=item.get('unid_inv', ''),
+                tipo_item=item.get('tipo_item', ''),
+                cod_ncm=item.get('cod_ncm', ''),
+                cest=item.get('cest', ''),
+                aliq_icms=item.get('aliq_icms', 0),
+            )
+
+        self._ncm_por_item = {cod: obj.cod_ncm for cod, obj in por_codigo.items()}
+        total = self._upsert(Registro0200, por_codigo.values(), ['registro_0000', 'cod_item'], CAMPOS_0200)
+        self._medir('0200', total, inicio)
+        return total
+
+    # ------------------------------------------------------------------
+    # Bloco C (C100 e filhos)
+    # ------------------------------------------------------------------
+
+    def documentos_c100(self, docs_data):
+        """Grava C100 e os filhos C170, C110, C113 e C190; retorna a quantidade de C100"""
+        inicio = time.perf_counter()
+        documentos = agrupar_documentos(docs_data)
+
+        total = self._upsert(
+            RegistroC100,
+            (self._novo_c100(doc) for doc in documentos.values()),
+            ['registro_0000', 'num_doc', 'ser', 'cod_mod', 'ind_oper'],
+            CAMPOS_C100,
+        )
+        self._medir('C100', total, inicio)
+
+        pares = self._pares_c100(documentos)
+        self._itens_c170(pares)
+        self._complementares_c110(pares)
+        self._referencias_c113(pares)
+        self._analiticos_c190(pares)
+        return total
+
+    def _pares_c100(self, documentos):
+        """(id do C100 gravado, documento) pela chave natural (nem todo banco devolve a PK num upsert)"""
+        ids_c100 = {
+            (num_doc, ser, cod_mod, ind_oper): pk
+            for pk, num_doc, ser, cod_mod, ind_oper in RegistroC100.objects.filter(
+                registro_0000=self.registro_0000
+            ).values_list('id', 'num_doc', 'ser', 'cod_mod', 'ind_oper')
+        }
+        return [(ids_c100[chave], doc) for chave, doc in documentos.items()]
+
+    def _novo_c100(self, doc):
+        return RegistroC100(
+            registro_0000=self.registro_0000,
+            num_doc=doc['num_doc'],
+            ser=doc.get('ser', ''),
+            cod_mod=doc['cod_mod'],
+            ind_oper=doc['ind_oper'],
+            ind_emit=doc['ind_emit'],
+            cod_part=doc.get('cod_part', ''),
+            cod_sit=doc.get('cod_sit', ''),
+            chv_nfe=doc.get('chv_nfe', ''),
+            dt_doc=doc.get('dt_doc'),
+            dt_e_s=doc.get('dt_e_s'),
+            vl_doc=doc.get('vl_doc', 0),
+            vl_merc=doc.get('vl_merc', 0),
+            vl_icms=doc.get('vl_icms', 0),
+            vl_pis=doc.get('vl_pis', 0),
+            vl_cofins=doc.get('vl_cofins', 0),
+        )
+
+    def _valores_c170(self, doc):
+        """Valores de num_item + CAMPOS_C170 para cada item do documento, um por num_item (o último vence)"""
+        ncm_por_item = self.ncm_por_item
+        por_num = {}
+        for item in doc.get('itens', []):
+            valores = [item['num_item']]
+            valores.extend(item.get(origem, '' if campo in PADRAO_TEXTO else 0) for campo, origem in MAPA_C170)
+            valores.append(ncm_por_item.get(item['cod_item'], ''))
+            por_num[item['num_item']] = valores
+        return por_num.values()
+
+    def _valores_c190(self, doc):
+        """Valores de CAMPOS_C190 para cada analítico do documento"""
+        return [
+            [analitico.get(campo, '' if campo in PADRAO_TEXTO else 0) for campo in CAMPOS_C190]
+            for analitico in doc.get('analiticos', [])
+        ]
+
+    def _c170_do_documento(self, c100_id, doc):
+        campos = ['num_item'] + CAMPOS_C170
+        return [
+            RegistroC170(registro_c100_id=c100_id, **dict(zip(campos, valores)))
+            for valores in self._valores_c170(doc)
+        ]
+
+    def _c190_do_documento(self, c100_id, doc):
+        return [
+            RegistroC190(registro_c100_id=c100_id, **dict(zip(CAMPOS_C190, valores)))
+            for valores in self._valores_c190(doc)
+        ]
+
+    def _itens_c170(self, pares):
+        inicio = time.perf_counter()
+        objetos = (obj for c100_id, doc in pares for obj in self._c170_do_documento(c100_id, doc))
+        total = self._upsert(RegistroC170, objetos, ['registro_c100', 'num_item'], CAMPOS_C170)
+        self._medir('C170', total, inicio)
+        return total
+
+    def _complementares_c110(self, pares):
+        inicio = time.perf_counter()
+
+        def objetos():
+            for c100_id, doc in pares:
+                por_codigo = {}
+                for compl in doc.get('complementares', []):
+                    por_codigo[compl.get('cod_inf', '')] = RegistroC110(
+                        registro_c100_id=c100_id,
+                        cod_inf=compl.get('cod_inf', ''),
+                        txt_compl=compl.get('txt_compl', ''),
+                    )
+                yield from por_codigo.values()
+
+        total = self._upsert(RegistroC110, objetos(), ['registro_c100', 'cod_inf'], ['txt_compl'])
+        self._medir('C110', total, inicio)
+        return total
+
+    def _referencias_c113(self, pares):
+        inicio = time.perf_counter()
+
+        def objetos():
+            for c100_id, doc in pares:
+                por_chave = {}
+                for ref in doc.get('referencias', []):
+                    chv_ref = ref.get('chv_nfe', '')
+                    if not chv_ref:
+                        continue
+                    por_chave[chv_ref] = RegistroC113(
+                        registro_c100_id=c100_id,
+                        chv_nfe=chv_ref,
+                        ind_oper=ref.get('ind_oper', ''),
+                        ind_emit=ref.get('ind_emit', ''),
+                        cod_part=ref.get('cod_part', ''),
+                        cod_mod=ref.get('cod_mod', ''),
+                        ser=ref.get('ser', ''),
+                        sub=ref.get('sub', ''),
+                        num_doc=ref.get('num_doc', ''),
+                        dt_doc=ref.get('dt_doc'),
+                    )
+                yield from por_chave.values()
+
+        total = self._upsert(RegistroC113, objetos(), ['registro_c100', 'chv_nfe'], CAMPOS_C113)
+        self._medir('C113', total, inicio)
+        return total
+
+    def _analiticos_c190(self, pares):
+        inicio = time.perf_counter()
+        # C190 não tem chave natural: é recriado a cada processamento
+        RegistroC190.objects.filter(registro_c100__registro_0000=self.registro_0000).delete()
+        objetos = (obj for c100_id, doc in pares for obj in self._c190_do_documento(c100_id, doc))
+        total = self._gravar(RegistroC190, objetos)
+        self._medir('C190', total, inicio)
+        return total
+
+    # ------------------------------------------------------------------
+    # Bloco E (apuração do ICMS)
+    # ------------------------------------------------------------------
+
+    def apuracao_e110(self, dados):
+        """Grava E110 e E111 (recriados a cada processamento); retorna a quantidade de E111"""
+        inicio = time.perf_counter()
+        RegistroE110.objects.filter(registro_0000=self.registro_0000).delete()
+        RegistroE111.objects.filter(registro_0000=self.registro_0000).delete()
+
+        self._gravar(RegistroE110, (
+            RegistroE110(registro_0000=self.registro_0000, **apuracao)
+            for apuracao in dados.get('E110', [])
+        ))
+        total = self._gravar(RegistroE111, (
+            RegistroE111(
+                registro_0000=self.registro_0000,
+                cod_aj_apur=ajuste.get('cod_aj_apur', ''),
+                descr_compl_aj=ajuste.get('descr_compl_aj', ''),
+                vl_aj_apur=ajuste.get('vl_aj_apur', 0),
+            )
+            for ajuste in dados.get('E111', [])
+            if ajuste.get('cod_aj_apur')
+        ))
+        self._medir('E111', total, inicio)
+        return total
+
+    # ------------------------------------------------------------------
+    # Módulos derivados (NF-e e NCM x cClassTrib)
+    # ------------------------------------------------------------------
+
+    def documentos_fiscais(self, docs_data):
+        """Popula NF-e a partir dos C100 modelo 55/65 não cancelados"""
+        inicio = time.perf_counter()
+        empresa = self.registro_0000.empresa
+        cnpj_limpo = empresa.cnpj_cpf[:14].replace('.', '').replace('/', '').replace('-', '')
+
+        por_chave = {}
+        for doc in docs_data:
+            # Apenas NF-e (modelo 55) e NFC-e (modelo 65), ignorando cancelados (cod_sit != 00)
+            if doc['cod_mod'] not in ['55', '65'] or doc.get('cod_sit', '00') != '00':
+                continue
+
+            chave = doc.get('chv_nfe', '')
+            if not chave or len(chave) != 44:
+                # Gera chave fictícia se não tiver
+                chave = f"{cnpj_limpo}{doc.get('ser','001').zfill(3)}{doc['num_doc'].zfill(9)}".ljust(44, '0')[:44]
+
+            por_chave[chave] = NFe(
+                chave_acesso=chave,
+                empresa=empresa,
+                numero=int(doc['num_doc']) if doc['num_doc'].isdigit() else 0,
+                serie=doc.get('ser', '1'),
+                data_emissao=doc.get('dt_doc') or self.registro_0000.periodo,
+                valor_total=doc.get('vl_doc', 0),
+                modelo=doc['cod_mod'],
+            )
+
+        total = self._upsert(NFe, por_chave.values(), ['chave_acesso'], CAMPOS_NFE)
+        self._medir('NF-e', total, inicio)
+        return total
+
+    def ncm_classtrib(self, dados):
+        """Popula ItemNCM com o NCM do 0200 e a primeira tributação vista no C170"""
+        inicio = time.perf_counter()
+        empresa = self.registro_0000.empresa
+
+        cst_por_item = {}
+        for doc in dados.get('C100', []):
+            for item in doc.get('itens', []):
+                cod_item = item.get('cod_item', '')
+                if cod_item and cod_item not in cst_por_item:
+                    cst_por_item[cod_item] = item
+
+        por_codigo = {}
+        itens_sem_ncm = 0
+        for item in dados.get('0200', []):
+            cod_item = item.get('cod_item', '')
+            cod_ncm = item.get('cod_ncm', '')
+            if not cod_ncm:
+                itens_sem_ncm += 1
+                continue
+
+            cst_info = cst_por_item.get(cod_item, {})
+            por_codigo[cod_item] = ItemNCM(
+                empresa=empresa,
+                cod_item=cod_item,
+                descricao=item.get('descr_item', ''),
+                cod_ncm=cod_ncm,
+                cest=item.get('cest', ''),
+                cod_barra=item.get('cod_barra', ''),
+                unidade=item.get('unid_inv', ''),
+                cst_icms=cst_info.get('cst_icms', ''),
+                cst_pis=cst_info.get('cst_pis', ''),
+                cst_cofins=cst_info.get('cst_cofins', ''),
+                cfop=cst_info.get('cfop', ''),
+                aliq_icms=cst_info.get('aliq_icms', 0),
+                aliq_pis=cst_info.get('aliq_pis_percent', 0),
+                aliq_cofins=cst_info.get('aliq_cofins_percent', 0),
+                origem='SPED',
+                registro_0000=self.registro_0000,
+            )
+
+        if itens_sem_ncm > 0:
+            logger.warning(f"  ⚠ {itens_sem_ncm} itens ignorados (sem NCM)")
+
+        total = self._upsert(ItemNCM, por_codigo.values(), ['empresa', 'cod_item'], CAMPOS_ITEM_NCM)
+        self._medir('NCM', total, inicio)
+        return total
+
+
+# ----------------------------------------------------------------------
+# PostgreSQL: COPY FROM STDIN em tabelas temporárias
+# ----------------------------------------------------------------------
+
+_ESCAPE_COPY = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _valor_copy(valor):
+    """Serializa um valor no formato texto do COPY"""
+    if isinstance(valor, str):
+        return valor.translate(_ESCAPE_COPY)
+    if valor is None:
+        return '\\N'
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _linha_copy(valores):
+    return '\t'.join(map(_valor_copy, valores)) + '\n'
+
+
+class _FluxoCopy:
+    """Arquivo somente leitura que gera as linhas do COPY sob demanda (psycopg2 copy_expert)"""
+
+    def __init__(self, linhas):
+        self._linhas = iter(linhas)
+        self._resto = ''
+
+    def read(self, size=-1):
+        partes, tamanho = [self._resto], len(self._resto)
+        for linha in self._linhas:
+            texto = _linha_copy(linha)
+            partes.append(texto)
+            tamanho += len(texto)
+            if 0 <= size <= tamanho:
+                break
+        dados = ''.join(partes)
+        if size < 0:
+            self._resto = ''
+            return dados
+        self._resto = dados[size:]
+        return dados[:size]
+
+
+class CargaCopyPostgres(CargaEmLote):
+    """
+    Carga para PostgreSQL: C100/C170/C190 vão por COPY FROM STDIN para
+    tabelas temporárias e chegam às tabelas reais num único INSERT ... SELECT
+    por registro, com a FK C170/C190 → C100 resolvida pela chave natural no
+    próprio banco. Os demais registros usam o upsert em lote da classe base.
+    """
+
+    def documentos_c100(self, docs_data):
+        documentos = agrupar_documentos(docs_data)
+        campos_chave = [RegistroC100._meta.get_field(nome) for nome in CHAVE_C100]
+        self.ncm_por_item  # carrega antes do COPY: não dá para consultar o banco no meio dele
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            inicio = time.perf_counter()
+            self._copiar(cursor, 'stg_sped_c100', campos_chave + self._campos(RegistroC100, CAMPOS_C100), (
+                [getattr(obj, nome) for nome in CHAVE_C100 + CAMPOS_C100]
+                for obj in map(self._novo_c100, documentos.values())
+            ))
+            total = self._inserir(
+                cursor, RegistroC100, 'stg_sped_c100', 'registro_0000', CHAVE_C100, CAMPOS_C100, juntar=False,
+            )
+            self._medir('C100', total, inicio)
+
+            inicio = time.perf_counter()
+            self._copiar(cursor, 'stg_sped_c170', campos_chave + self._campos(RegistroC170, ['num_item'] + CAMPOS_C170), (
+                chave + tuple(valores)
+                for chave, doc in documentos.items()
+                for valores in self._valores_c170(doc)
+            ))
+            total_c170 = self._inserir(cursor, RegistroC170, 'stg_sped_c170', 'registro_c100', ['num_item'], CAMPOS_C170)
+            self._medir('C170', total_c170, inicio)
+
+            inicio = time.perf_counter()
+            RegistroC190.objects.filter(registro_c100__registro_0000=self.registro_0000).delete()
+            self._copiar(cursor, 'stg_sped_c190', campos_chave + self._campos(RegistroC190, CAMPOS_C190), (
+                chave + tuple(valores)
+                for chave, doc in documentos.items()
+                for valores in self._valores_c190(doc)
+            ))
+            total_c190 = self._inserir(cursor, RegistroC190, 'stg_sped_c190', 'registro_c100', [], CAMPOS_C190)
+            self._medir('C190', total_c190, inicio)
+
+        pares = self._pares_c100(documentos)
+        self._complementares_c110(pares)
+        self._referencias_c113(pares)
+        return total
+
+    @staticmethod
+    def _campos(model, nomes):
+        return [model._meta.get_field(nome) for nome in nomes]
+
+    def _copiar(self, cursor, tabela, campos, linhas):
+        """Cria a tabela temporária com as colunas dos campos e a preenche via COPY"""
+        qn = connection.ops.quote_name
+        definicao = ', '.join(f'{qn(campo.column)} {campo.db_type(connection)}' for campo in campos)
+        cursor.execute(f'DROP TABLE IF EXISTS {tabela}')
+        cursor.execute(f'CREATE TEMP TABLE {tabela} ({definicao}) ON COMMIT DROP')
+
+        sql = f"COPY {tabela} ({', '.join(qn(campo.column) for campo in campos)}) FROM STDIN"
+        bruto = cursor.cursor
+        if hasattr(bruto, 'copy_expert'):
+            bruto.copy_expert(sql, _FluxoCopy(linhas))
+        else:
+            # psycopg 3
+            with bruto.copy(sql) as copia:
+                for linha in linhas:
+                    copia.write(_linha_copy(linha))
+
+    def _inserir(self, cursor, model, tabela, pai, chave, campos, juntar=True):
+        """
+        INSERT ... SELECT da tabela temporária para a tabela do modelo.
+        pai é o campo FK: registro_0000 (valor fixo) ou registro_c100 (JOIN
+        pela chave natural do C100). Com chave, faz upsert ON CONFLICT.
+        """
+        qn = connection.ops.quote_name
+        opts = model._meta
+        coluna_pai = qn(opts.get_field(pai).column)
+        colunas = [qn(opts.get_field(nome).column) for nome in chave + campos]
+
+        if juntar:
+            c100 = RegistroC100._meta
+            condicoes = ' AND '.join(
+                f'c.{qn(c100.get_field(nome).column)} = s.{qn(c100.get_field(nome).column)}' for nome in CHAVE_C100
+            )
+            origem = (
+                f"SELECT c.{qn(c100.pk.column)}, {', '.join(f's.{col}' for col in colunas)} "
+                f"FROM {tabela} s JOIN {qn(c100.db_table)} c "
+                f"ON c.{qn(c100.get_field('registro_0000').column)} = %s AND {condicoes}"
+            )
+        else:
+            origem = f"SELECT %s, {', '.join(colunas)} FROM {tabela}"
+
+        sql = f"INSERT INTO {qn(opts.db_table)} ({coluna_pai}, {', '.join(colunas)}) {origem}"
+        if chave:
+            conflito = ', '.join([coluna_pai] + colunas[:len(chave)])
+            atualizar = ', '.join(f'{col} = EXCLUDED.{col}' for col in colunas[len(chave):])
+            sql += f' ON CONFLICT ({conflito}) DO UPDATE SET {atualizar}'
+
+        cursor.execute(sql, [self.registro_0000.pk])
+        return cursor.rowcount
+
+
+def nova_carga(registro_0000, batch_size=None):
+    """CargaCopyPostgres no PostgreSQL (se SPED_COPY_POSTGRES), CargaEmLote nos demais bancos"""
+    if connection.vendor == 'postgresql' and settings.SPED_COPY_POSTGRES:
+        return CargaCopyPostgres(registro_0000, batch_size)
+    return CargaEmLote(registro_0000, batch_size)
@@ -0,0 +1,446 @@
+"""
+Importação de arquivos SPED (upload → Registro0000 → processamento)
+
+As importações são enfileiradas em ImportJob pela view e executadas pelo
+worker (python manage.py worker_importacao, fila em apps.utilitarios.fila),
+fora do request HTTP.
+"""
+import os
+import gzip
+import shutil
+import tempfile
+import zipfile
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from apps.sped.models import Registro0000, ImportJob
+from apps.sped.parser import parse_sped_caminho
+from apps.sped.services import processar_sped_completo
+from apps.empresa.models import Empresa
+
+# Logger para importação
+logger = logging.getLogger('sped.importacao')
+
+# Memória ocupada pelo resultado do parse em relação ao tamanho do arquivo (medido ~9x)
+FATOR_MEMORIA_PARSE = 10
+
+# Bloco de cópia dos streams do upload para o disco (1 MB)
+TAMANHO_BLOCO = 1024 * 1024
+
+# Membros de ZIP considerados na importação
+EXTENSOES_ZIP = ('.txt', '.gz', '.zip')
+
+
+def _copiar_para_disco(stream, pasta):
+    """Copia o stream em blocos para um arquivo em pasta; retorna (caminho, linhas)"""
+    fd, caminho = tempfile.mkstemp(dir=pasta, suffix='.txt')
+    linhas = 0
+    with os.fdopen(fd, 'wb') as destino:
+        while True:
+            bloco = stream.read(TAMANHO_BLOCO)
+            if not bloco:
+                break
+            linhas += bloco.count(b'\n')
+            destino.write(bloco)
+    return caminho, linhas
+
+
+def _extrair_zip(zf, pasta, arquivos):
+    """Extrai os membros .txt/.gz/.zip de um ZIP aberto, um stream por vez"""
+    for info in zf.infolist():
+        nome = info.filename
+        if info.is_dir() or nome.startswith('__MACOSX') or not nome.lower().endswith(EXTENSOES_ZIP):
+            continue
+        with zf.open(info) as stream:
+            _extrair_stream(stream, nome, pasta, arquivos)
+
+
+def _extrair_stream(stream, nome, pasta, arquivos):
+    """Grava o SPED do stream em pasta, descompactando .gz e ZIP aninhado"""
+    if nome.lower().endswith('.gz'):
+        with gzip.GzipFile(fileobj=stream) as descompactado:
+            _extrair_stream(descompactado, nome[:-3], pasta, arquivos)
+    elif nome.lower().endswith('.zip'):
+        # ZipFile precisa de seek: o ZIP interno vai para o disco antes de ser aberto
+        caminho, _ = _copiar_para_disco(stream, pasta)
+        try:
+            with zipfile.ZipFile(caminho) as zf:
+                _extrair_zip(zf, pasta, arquivos)
+        finally:
+            os.remove(caminho)
+    else:
+        caminho, linhas = _copiar_para_disco(stream, pasta)
+        arquivos.append((os.path.basename(nome), caminho, linhas))
+
+
+def extrair_arquivos_sped(arquivo, nome, pasta):
+    """
+    Extrai os SPEDs do upload (.txt, .gz, .zip, inclusive ZIP dentro de ZIP)
+    para arquivos em pasta, sem carregar o upload nem os membros na memória.
+    Retorna [(nome, caminho, linhas)] na ordem do upload.
+    """
+    arquivos = []
+    if nome.lower().endswith('.zip'):
+        with zipfile.ZipFile(arquivo) as zf:
+            _extrair_zip(zf, pasta, arquivos)
+    else:
+        _extrair_stream(arquivo, nome, pasta, arquivos)
+    return arquivos
+
+
+def _resultado_arquivo(nome_arquivo):
+    """Linha do relatorio['detalhes'] para um arquivo"""
+    return {
+        'arquivo': nome_arquivo,
+        'status': 'erro',
+        'cnpj': '',
+        'periodo': '',
+        'mensagem': '',
+        'registro_id': None,
+    }
+
+
+def processar_arquivo_sped(nome_arquivo, caminho, tipo, sobrescrever, dados=None):
+    """Processa um único arquivo SPED gravado em caminho (dados: parse já feito, ex. no pool)"""
+    resultado = _resultado_arquivo(nome_arquivo)
+    
+    try:
+        logger.debug(f"Iniciando parse do arquivo: {nome_arquivo}")
+        logger.debug(f"Tamanho do conteúdo: {os.path.getsize(caminho)} bytes")
+        
+        # Parse do arquivo
+        if dados is None:
+            dados = parse_sped_caminho(caminho)
+        
+        if not dados.get('0000'):
+            resultado['mensagem'] = 'Registro 0000 não encontrado'
+            logger.error(f"Registro 0000 não encontrado em {nome_arquivo}")
+            return resultado
+        
+        logger.debug("Parse concluído - Registros encontrados:")
+        logger.debug(f"  0150 (Participantes): {len(dados.get('0150', []))}")
+        logger.debug(f"  0200 (Itens): {len(dados.get('0200', []))}")
+        logger.debug(f"  C100 (Documentos): {len(dados.get('C100', []))}")
+        logger.debug(f"  C170 (Itens Doc): {len(dados.get('C170', []))}")
+        
+        reg_0000 = dados['0000']
+        cnpj = reg_0000.get('cnpj', '').strip()
+        dt_ini = reg_0000.get('dt_ini')
+        
+        resultado['cnpj'] = cnpj
+        resultado['periodo'] = dt_ini.strftime('%m/%Y') if dt_ini else ''
+        
+# Busca empresa pelo CNPJ completo
+        cnpj_limpo = ''.join(filter(str.isdigit, cnpj))
+        
+        # Primeiro tenta buscar pelo CNPJ exato
+        empresa = Empresa.objects.filter(
+            cnpj_cpf__contains=cnpj_limpo
+        ).first()
+        
+        # Se não encontrar, tenta pelo CNPJ formatado
+        if not empresa:
+            cnpj_formatado = formatar_cnpj(cnpj_limpo)
+            empresa = Empresa.objects.filter(cnpj_cpf=cnpj_formatado).first()
+        
+        if not empresa:
+            # Tenta criar empresa
+            from apps.empresa.models import UF
+            sigla_uf = reg_0000.get('uf', 'SP').upper().strip()
+            uf = UF.objects.filter(sigla=sigla_uf).first()
+            
+            if not uf:
+                # Cria a UF se não existir
+                codigos_uf = {
+                    'AC': 12, 'AL': 27, 'AP': 16, 'AM': 13, 'BA': 29, 'CE': 23,
+                    'DF': 53, 'ES': 32, 'GO': 52, 'MA': 21, 'MT': 51, 'MS': 50,
+                    'MG': 31, 'PA': 15, 'PB': 25, 'PR': 41, 'PE': 26, 'PI': 22,
+                    'RJ': 33, 'RN': 24, 'RS': 43, 'RO': 11, 'RR': 14, 'SC': 42,
+                    'SP': 35, 'SE': 28, 'TO': 17
+                }
+                nomes_uf = {
+                    'AC': 'Acre', 'AL': 'Alagoas', 'AP': 'Amapá', 'AM': 'Amazonas',
+                    'BA': 'Bahia', 'CE': 'Ceará', 'DF': 'Distrito Federal', 'ES': 'Espírito Santo',
+                    'GO': 'Goiás', 'MA': 'Maranhão', 'MT': 'Mato Grosso', 'MS': 'Mato Grosso do Sul',
+                    'MG': 'Minas Gerais', 'PA': 'Pará', 'PB': 'Paraíba', 'PR': 'Paraná',
+                    'PE': 'Pernambuco', 'PI': 'Piauí', 'RJ': 'Rio de Janeiro', 'RN': 'Rio Grande do Norte',
+                    'RS': 'Rio Grande do Sul', 'RO': 'Rondônia', 'RR': 'Roraima', 'SC': 'Santa Catarina',
+                    'SP': 'São Paulo', 'SE': 'Sergipe', 'TO': 'Tocantins'
+                }
+                codigo = codigos_uf.get(sigla_uf, 35)
+                nome = nomes_uf.get(sigla_uf, 'São Paulo')
+                if sigla_uf not in codigos_uf:
+                    sigla_uf = 'SP'
+                
+                uf, _ = UF.objects.get_or_create(
+                    codigo=codigo,
+                    defaults={'sigla': sigla_uf, 'nome': nome}
+                )
+            
+            empresa = Empresa.objects.create(
+                cnpj_cpf=formatar_cnpj(cnpj_limpo),
+                razao_social=reg_0000.get('nome', 'Empresa Importada'),
+                uf=uf,
+            )
+        
+        # Verifica se já existe
+        registro_existente = Registro0000.objects.filter(
+            empresa=empresa,
+            tipo=tipo,
+            periodo=dt_ini
+        ).first()
+        
+        # Registro não processado é de uma importação interrompida: reimporta
+        if registro_existente and registro_existente.processado and not sobrescrever:
+            resultado['status'] = 'pulado'
+            resultado['mensagem'] = 'Arquivo já importado anteriormente'
+            return resultado
+        
+        # Salva o arquivo (o storage copia do disco em blocos)
+        with open(caminho, 'rb') as f:
+            if registro_existente:
+                registro = registro_existente
+                registro.arquivo_original.save(nome_arquivo, File(f))
+                registro.processado = False
+                registro.save()
+            else:
+                registro = Registro0000.objects.create(
+                    empresa=empresa,
+                    tipo=tipo,
+                    periodo=dt_ini,
+                    arquivo_original=File(f, name=nome_arquivo),
+                    processado=False,
+                )
+        
+        resultado['status'] = 'sucesso'
+        resultado['mensagem'] = 'Importado com sucesso'
+        resultado['registro_id'] = registro.id
+        
+        # Popula módulos relacionados com o parse já feito (sem reler o arquivo salvo)
+        try:
+            logger.info(f"Processando registro {registro.id} (Documentos Fiscais e NCM)...")
+            resultado_proc = processar_sped_completo(registro.id, dados=dados)
+            logger.info(f"  → Itens 0200: {resultado_proc.get('itens', 0)}")
+            logger.info(f"  → Documentos C100: {resultado_proc.get('documentos', 0)}")
+            logger.info(f"  → Participantes 0150: {resultado_proc.get('participantes', 0)}")
+        except Exception as e:
+            logger.error(f"Erro ao processar SPED {registro.id}: {e}")
+        
+    except Exception as e:
+        resultado['mensagem'] = str(e)
+    
+    return resultado
+
+
+def _parse_local(caminho):
+    """Parse no próprio processo; devolve (dados, erro)"""
+    try:
+        return parse_sped_caminho(caminho), None
+    except Exception as e:
+        return None, e
+
+
+def parsear_arquivos(arquivos, processos=None):
+    """
+    Gera (nome, caminho, linhas, dados, erro) para cada arquivo, na ordem recebida.
+
+    Com mais de um processo o parse roda num pool (spawn: o parser não usa
+    Django nem o banco) enquanto o chamador grava os arquivos anteriores.
+    Os arquivos em parse ou aguardando gravação ficam limitados a
+    SPED_IMPORTACAO_MEMORIA_MB, estimado por FATOR_MEMORIA_PARSE.
+    """
+    if processos is None:
+        processos = settings.SPED_IMPORTACAO_PROCESSOS or os.cpu_count() or 1
+    processos = min(processos, len(arquivos))
+
+    if processos <= 1:
+        for nome, caminho, linhas in arquivos:
+            yield (nome, caminho, linhas, *_parse_local(caminho))
+        return
+
+    orcamento = settings.SPED_IMPORTACAO_MEMORIA_MB * 1024 * 1024
+    logger.info(f"Parse paralelo: {processos} processos, até {settings.SPED_IMPORTACAO_MEMORIA_MB} MB")
+
+    def proximo(fila):
+        nome, caminho, linhas, futuro, custo = fila.popleft()
+        if futuro is None:
+            return custo, (nome, caminho, linhas, *_parse_local(caminho))
+        try:
+            dados, erro = futuro.result(), None
+        except BrokenProcessPool:
+            # Processo do pool morto (ex.: falta de memória): refaz aqui mesmo
+            logger.warning(f"Pool de parse interrompido; parse local de {nome}")
+            dados, erro = _parse_local(caminho)
+        except Exception as e:
+            dados, erro = None, e
+        return custo, (nome, caminho, linhas, dados, erro)
+
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as pool:
+        fila = deque()
+        em_memoria = 0
+        for nome, caminho, linhas in arquivos:
+            custo = os.path.getsize(caminho) * FATOR_MEMORIA_PARSE
+            while fila and em_memoria + custo > orcamento:
+                liberado, item = proximo(fila)
+                em_memoria -= liberado
+                yield item
+            try:
+                futuro = pool.submit(parse_sped_caminho, caminho)
+            except BrokenProcessPool:
+                futuro = None
+            fila.append((nome, caminho, linhas, futuro, custo))
+            em_memoria += custo
+        while fila:
+            yield proximo(fila)[1]
+
+
+def formatar_cnpj(cnpj):
+    """Formata CNPJ para padrão XX.XXX.XXX/XXXX-XX"""
+    cnpj = ''.join(filter(str.isdigit, cnpj)).zfill(14)
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:14]}"
+
+
+# ========================================
+# FILA DE IMPORTAÇÃO (ImportJob)
+# ========================================
+
+def enfileirar_importacao(usuario, tipo, arquivo, sobrescrever=False, buscar_produtos_api=False,
+                          consultar_participantes=False):
+    """Grava o upload no storage e cria o ImportJob pendente"""
+    job = ImportJob.objects.create(
+        usuario=usuario,
+        tipo=tipo,
+        arquivo=arquivo,
+        nome_arquivo=arquivo.name,
+        sobrescrever=sobrescrever,
+        buscar_produtos_api=buscar_produtos_api,
+        consultar_participantes=consultar_participantes,
+    )
+    logger.info(f"Importação {job.id} enfileirada: {job.nome_arquivo}")
+    return job
+
+
+def _importar_arquivos(job, pasta):
+    """Extrai o upload para pasta e importa cada SPED, salvando o progresso no job"""
+    job.arquivo.open('rb')
+    try:
+        logger.info(f"Extraindo arquivos de {job.nome_arquivo}")
+        arquivos_processar = extrair_arquivos_sped(job.arquivo, job.nome_arquivo, pasta)
+        logger.info(f"Encontrados {len(arquivos_processar)} arquivos")
+    finally:
+        job.arquivo.close()
+
+    relatorio = {
+        'total_arquivos': len(arquivos_processar),
+        'sucesso': 0,
+        'pulados': 0,
+        'erros': 0,
+        'detalhes': []
+    }
+    registros_ids = []
+
+    job.fase = 'processando'
+    job.arquivos_total = len(arquivos_processar)
+    job.save(update_fields=['fase', 'arquivos_total', 'updated_at'])
+
+    for idx, (nome_arquivo, caminho, linhas, dados, erro) in enumerate(parsear_arquivos(arquivos_processar), 1):
+        logger.info("-" * 40)
+        logger.info(f"Processando arquivo {idx}/{len(arquivos_processar)}: {nome_arquivo}")
+        job.arquivo_atual = nome_arquivo
+        job.save(update_fields=['arquivo_atual', 'updated_at'])
+
+        if erro is not None:
+            resultado = _resultado_arquivo(nome_arquivo)
+            resultado['mensagem'] = str(erro)
+        else:
+            resultado = processar_arquivo_sped(nome_arquivo, caminho, job.tipo, job.sobrescrever, dados=dados)
+        relatorio['detalhes'].append(resultado)
+
+        if resultado['status'] == 'sucesso':
+            relatorio['sucesso'] += 1
+            logger.info(f"✓ SUCESSO - CNPJ: {resultado['cnpj']} | Período: {resultado['periodo']}")
+            if resultado.get('registro_id'):
+                registros_ids.append(resultado['registro_id'])
+        elif resultado['status'] == 'pulado':
+            relatorio['pulados'] += 1
+            logger.warning(f"⚠ PULADO - {resultado['mensagem']}")
+        else:
+            relatorio['erros'] += 1
+            logger.error(f"✗ ERRO - {resultado['mensagem']}")
+
+        job.arquivos_processados = idx
+        job.linhas_processadas += linhas
+        job.relatorio = relatorio
+        job.registros_ids = registros_ids
+        job.save(update_fields=[
+            'arquivos_processados', 'linhas_processadas', 'relatorio', 'registros_ids', 'updated_at',
+        ])
+        os.remove(caminho)
+
+    return relatorio, registros_ids
+
+
+def executar_importacao(job):
+    """Executa um ImportJob: extrai, importa e processa cada arquivo registrando o progresso"""
+    logger.info("=" * 60)
+    logger.info(f"INÍCIO DA IMPORTAÇÃO SPED - Job {job.id} (tentativa {job.tentativas})")
+    logger.info("=" * 60)
+    logger.info(f"Tipo SPED: {job.tipo}")
+    logger.info(f"Arquivo: {job.nome_arquivo}")
+    logger.info(f"Sobrescrever: {job.sobrescrever}")
+
+    job.fase = 'extraindo'
+    job.arquivos_processados = 0
+    job.linhas_processadas = 0
+    job.save(update_fields=['fase', 'arquivos_processados', 'linhas_processadas', 'updated_at'])
+
+    # Upload e membros extraídos ficam no disco; só o arquivo em processamento vai para a memória
+    pasta = tempfile.mkdtemp(prefix='sped_importacao_')
+    try:
+        relatorio, registros_ids = _importar_arquivos(job, pasta)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    # Consulta de regime tributário dos participantes (antes numa thread do request)
+    if job.consultar_participantes and registros_ids:
+        from apps.sped.consulta_participantes import consultar_participantes_lote
+
+        job.fase = 'consultando'
+        job.arquivo_atual = ''
+        job.save(update_fields=['fase', 'arquivo_atual', 'updated_at'])
+        for rid in registros_ids:
+            try:
+                stats = consultar_participantes_lote(rid)
+                logger.info(f"Consulta concluída para registro {rid}: {stats}")
+            except Exception as e:
+                logger.error(f"Erro consulta registro {rid}: {e}")
+
+    job.status = 'concluido'
+    job.fase = 'concluido'
+    job.arquivo_atual = ''
+    job.mensagem = f'Importação concluída! {relatorio["sucesso"]} arquivo(s) processado(s).'
+    job.finalizado_em = timezone.now()
+    job.save()
+
+    # O upload só serve para reexecutar o job; os arquivos ficam em Registro0000.arquivo_original
+    job.arquivo.delete(save=False)
+
+    logger.info("=" * 60)
+    logger.info("RESUMO DA IMPORTAÇÃO")
+    logger.info("=" * 60)
+    logger.info(f"Total de arquivos: {relatorio['total_arquivos']}")
+    logger.info(f"Sucesso: {relatorio['sucesso']}")
+    logger.info(f"Pulados: {relatorio['pulados']}")
+    logger.info(f"Erros: {relatorio['erros']}")
+    logger.info(f"Registros criados: {registros_ids}")
+    logger.info(f"Linhas/s: {job.linhas_por_segundo}")
+    logger.info("=" * 60)
+    return job
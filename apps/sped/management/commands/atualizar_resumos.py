@@ -0,0 +1,32 @@
+"""
+Gera os resumos por período (ResumoItem/ResumoDocumento/ComposicaoNF) dos SPEDs já
+processados que ainda não os têm
+
+Uso: python manage.py atualizar_resumos [--todos]
+"""
+from django.core.management.base import BaseCommand
+
+from apps.sped.models import Registro0000
+from apps.sped.resumos import atualizar_resumos
+
+
+class Command(BaseCommand):
+    help = 'Gera os resumos por período usados pelo relatório fiscal'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos', action='store_true',
+            help='Regera também os resumos já existentes',
+        )
+
+    def handle(self, *args, **options):
+        registros = Registro0000.objects.filter(processado=True).order_by('id')
+        if not options['todos']:
+            registros = registros.filter(resumos_em__isnull=True)
+        for reg in registros:
+            try:
+                qtd_itens, qtd_documentos = atualizar_resumos(reg)
+            except Exception as e:
+                self.stderr.write(f'Registro {reg.id} ({reg.periodo}): erro - {e}')
+                continue
+            self.stdout.write(f'Registro {reg.id} ({reg.periodo}): {qtd_itens} itens, {qtd_documentos} participantes')
@@ -0,0 +1,145 @@
+"""
+Benchmark do parser SPED sobre um arquivo sintético com N linhas C170
+
+Uso: python manage.py benchmark_parser --linhas 1000000 [--comparar]
+
+Com --comparar o mesmo arquivo também é lido pelo parse anterior aos layouts
+(checagem de tamanho e conversão campo a campo), para medir antes/depois.
+"""
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.sped.parser import (
+    DATA, DECIMAL, DECIMAL_ZERO, FILHOS_C100, LAYOUTS, _iter_linhas, iter_sped_records,
+    parse_date, parse_decimal, parse_sped_line,
+)
+
+
+LINHA_C100 = (
+    '|C100|0|1|F{doc}|55|00|1|{doc}|3525011234567800019955001{doc:09d}1000000000|05012025|05012025|'
+    '1500,00|0|0,00|0,00|1500,00|9|0,00|0,00|0,00|1500,00|270,00|0,00|0,00|0,00|24,75|114,00|0,00|0,00|\r\n'
+)
+LINHA_C170 = (
+    '|C170|{item}|ITEM{cod}|PRODUTO {cod}|{qtd},00000|UN|{valor},{cent:02d}|0,00|0|000|1102||'
+    '{valor},{cent:02d}|18,00|{icms},40|0,00|0,00|0,00|0|||0,00|0,00|0,00|50|{valor},{cent:02d}|1,6500|||1,65|'
+    '50|{valor},{cent:02d}|7,6000|||7,60||\r\n'
+)
+
+
+def _campo_legado(campos, posicao, tipo):
+    """Conversão de um campo como no parser original: checagem de tamanho por campo"""
+    if tipo == DECIMAL:
+        return parse_decimal(campos[posicao]) if len(campos) > posicao else DECIMAL_ZERO
+    if tipo == DATA:
+        return parse_date(campos[posicao]) if len(campos) > posicao else None
+    return campos[posicao] if len(campos) > posicao else ''
+
+
+def iter_sped_records_legado(fileobj, encoding='latin-1'):
+    """
+    Parse do arquivo como antes de LAYOUTS/compilar_layout (mesma saída de
+    iter_sped_records): cada campo é lido e convertido individualmente,
+    sem cache de decimais e com datas via strptime.
+    """
+    current_c100 = None
+    for line in _iter_linhas(fileobj, encoding):
+        campos = parse_sped_line(line)
+        if not campos:
+            continue
+
+        registro = campos[0]
+        if current_c100 is not None and (registro == 'C100' or not registro.startswith('C1')):
+            yield 'C100', current_c100
+            current_c100 = None
+
+        layout = LAYOUTS.get(registro)
+        if layout is None:
+            continue
+        dados = {nome: _campo_legado(campos, posicao, tipo) for nome, posicao, tipo in layout}
+
+        if registro == 'C100':
+            current_c100 = dados
+            current_c100['itens'] = []
+        elif registro in FILHOS_C100:
+            if current_c100 is not None:
+                current_c100.setdefault(FILHOS_C100[registro], []).append(dados)
+        else:
+            yield registro, dados
+
+    if current_c100 is not None:
+        yield 'C100', current_c100
+
+
+class Command(BaseCommand):
+    help = 'Mede linhas/segundo do parser SPED em um arquivo sintético de itens C170'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, default=1_000_000, help='Quantidade de linhas C170')
+        parser.add_argument('--itens-por-documento', type=int, default=10)
+        parser.add_argument(
+            '--comparar', action='store_true',
+            help='Mede também o parse anterior (campo a campo) no mesmo arquivo',
+        )
+
+    def handle(self, *args, **options):
+        total_c170 = options['linhas']
+        por_doc = max(1, options['itens_por_documento'])
+
+        fd, caminho = tempfile.mkstemp(suffix='.txt', prefix='bench_sped_')
+        try:
+            self.stdout.write(f'Gerando arquivo sintético com {total_c170} linhas C170...')
+            total_linhas = self._gerar_arquivo(fd, total_c170, por_doc)
+            tamanho_mb = os.path.getsize(caminho) / (1024 * 1024)
+
+            self.stdout.write(f'Arquivo: {tamanho_mb:.1f} MB | {total_linhas} linhas')
+
+            duracao = self._medir('Layouts', iter_sped_records, caminho, total_linhas)
+            if options['comparar']:
+                duracao_legado = self._medir('Campo a campo', iter_sped_records_legado, caminho, total_linhas)
+                self.stdout.write(self.style.SUCCESS(f'Ganho: {duracao_legado / duracao:.2f}x'))
+        finally:
+            os.remove(caminho)
+
+    def _medir(self, nome, parser, caminho, total_linhas):
+        inicio = time.perf_counter()
+        docs = itens = 0
+        with open(caminho, 'rb') as arquivo:
+            for registro, dados in parser(arquivo):
+                if registro == 'C100':
+                    docs += 1
+                    itens += len(dados['itens'])
+        duracao = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{nome}: {docs} C100 | {itens} C170 | {duracao:.2f}s | {total_linhas / duracao:,.0f} linhas/s'
+        ))
+        return duracao
+
+    def _gerar_arquivo(self, fd, total_c170, por_doc):
+        total_linhas = 0
+        with os.fdopen(fd, 'w', encoding='latin-1', newline='') as arquivo:
+            arquivo.write('|0000|017|0|01012025|31012025|EMPRESA BENCHMARK LTDA|12345678000199||SP|123456789|3550308|||A|1|\r\n')
+            total_linhas += 1
+            gerados = 0
+            doc = 0
+            while gerados < total_c170:
+                doc += 1
+                arquivo.write(LINHA_C100.format(doc=doc))
+                total_linhas += 1
+                for item in range(1, min(por_doc, total_c170 - gerados) + 1):
+                    cod = (doc * 7 + item) % 5000
+                    valor = 10 + (doc + item) % 990
+                    arquivo.write(LINHA_C170.format(
+                        item=item, cod=cod, qtd=1 + item % 20, valor=valor,
+                        cent=(doc * item) % 100, icms=valor * 18 // 100,
+                    ))
+                    gerados += 1
+                    total_linhas += 1
+                arquivo.write('|C190|000|1102|18,00|1500,00|1500,00|270,00|0,00|0,00|0,00|0,00||\r\n')
+                total_linhas += 1
+            arquivo.write('|9999|{}|\r\n'.format(total_linhas + 1))
+            total_linhas += 1
+        return total_linhas
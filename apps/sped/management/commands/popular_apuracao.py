@@ -0,0 +1,72 @@
+"""
+Popula C190/E110/E111 para arquivos SPED importados antes desses registros
+serem gravados no banco
+
+Uso: python manage.py popular_apuracao [--todos]
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from apps.sped.models import Registro0000, RegistroC100, RegistroC190
+from apps.sped.parser import iter_sped_records
+from apps.sped.services import processar_apuracao_e110
+
+
+class Command(BaseCommand):
+    help = 'Relê os arquivos SPED já importados e grava os registros C190, E110 e E111'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--todos', action='store_true',
+            help='Reprocessa também os registros que já possuem C190/E111 gravados',
+        )
+
+    def handle(self, *args, **options):
+        for reg in Registro0000.objects.filter(processado=True).order_by('id'):
+            if not options['todos'] and self._ja_populado(reg):
+                continue
+            try:
+                qtd_c190, qtd_e111 = self._popular(reg)
+            except Exception as e:
+                self.stderr.write(f'Registro {reg.id} ({reg.periodo}): erro - {e}')
+                continue
+            self.stdout.write(f'Registro {reg.id} ({reg.periodo}): {qtd_c190} C190, {qtd_e111} E111')
+
+    def _ja_populado(self, reg):
+        return (
+            reg.apuracoes_e110.exists()
+            or reg.ajustes_e111.exists()
+            or RegistroC190.objects.filter(registro_c100__registro_0000=reg).exists()
+        )
+
+    def _popular(self, reg):
+        c100_ids = {
+            (num_doc, ser, cod_mod, ind_oper): pk
+            for pk, num_doc, ser, cod_mod, ind_oper in RegistroC100.objects.filter(
+                registro_0000=reg
+            ).values_list('id', 'num_doc', 'ser', 'cod_mod', 'ind_oper')
+        }
+
+        analiticos = []
+        dados = {'E110': [], 'E111': []}
+        arquivo = reg.arquivo_original
+        arquivo.open('rb')
+        try:
+            for registro, linha in iter_sped_records(arquivo, only={'C100', 'C190', 'E110', 'E111'}):
+                if registro != 'C100':
+                    dados[registro].append(linha)
+                    continue
+                c100_id = c100_ids.get((linha['num_doc'], linha.get('ser', ''), linha['cod_mod'], linha['ind_oper']))
+                if c100_id is None:
+                    continue
+                for analitico in linha.get('analiticos', []):
+                    analiticos.append(RegistroC190(registro_c100_id=c100_id, **analitico))
+        finally:
+            arquivo.close()
+
+        with transaction.atomic():
+            RegistroC190.objects.filter(registro_c100__registro_0000=reg).delete()
+            RegistroC190.objects.bulk_create(analiticos, batch_size=1000)
+            qtd_e111 = processar_apuracao_e110(reg, dados)
+
+        return len(analiticos), qtd_e111
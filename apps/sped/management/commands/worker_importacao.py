@@ -0,0 +1,45 @@
+"""
+Worker das importações SPED enfileiradas (ImportJob)
+
+Uso: python manage.py worker_importacao [--uma-vez] [--intervalo 2]
+
+Reserva, batimento e recuperação dos jobs ficam em apps.utilitarios.fila;
+jobs sem sinal de vida por SPED_IMPORTACAO_TIMEOUT_MINUTOS voltam para a fila.
+Com a fila vazia, gera os resumos dos períodos importados antes deles (o
+relatório fiscal só lê os resumos).
+"""
+import logging
+
+from apps.sped.importacao import executar_importacao
+from apps.sped.models import ImportJob, Registro0000
+from apps.sped.resumos import garantir_resumos
+from apps.utilitarios.fila import WorkerFila
+
+
+class Command(WorkerFila):
+    help = 'Processa a fila de importações SPED (ImportJob)'
+    model = ImportJob
+    titulo = 'importação SPED'
+    rotulo = 'Importação'
+    timeout = 'SPED_IMPORTACAO_TIMEOUT_MINUTOS'
+    mensagem_interrompido = 'Importação interrompida repetidas vezes'
+    campos_fila = {'fase': 'na_fila'}
+    logger = logging.getLogger('sped.importacao')
+
+    def handle(self, *args, **options):
+        # Registros cujos resumos falharam: não são tentados de novo a cada consulta à fila
+        self.resumos_com_falha = set()
+        return super().handle(*args, **options)
+
+    def executar(self, job):
+        executar_importacao(job)
+
+    def ocioso(self):
+        pendentes = Registro0000.objects.exclude(id__in=self.resumos_com_falha)
+        self.resumos_com_falha |= garantir_resumos(pendentes)
+
+    def descrever(self, job):
+        return job.nome_arquivo
+
+    def resumir(self, job):
+        return f'concluída ({job.linhas_por_segundo} linhas/s)'
@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sped', '0004_registroc110_registroc113'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistroE110',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vl_tot_debitos', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Total Débitos')),
+                ('vl_aj_debitos', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Ajustes a Débito (Documento)')),
+                ('vl_tot_aj_debitos', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Total Ajustes a Débito')),
+                ('vl_estornos_cred', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Estornos de Créditos')),
+                ('vl_tot_creditos', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Total Créditos')),
+                ('vl_aj_creditos', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Ajustes a Crédito (Documento)')),
+                ('vl_tot_aj_creditos', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Total Ajustes a Crédito')),
+                ('vl_estornos_deb', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Estornos de Débitos')),
+                ('vl_sld_credor_ant', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Saldo Credor Anterior')),
+                ('vl_sld_apurado', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Saldo Devedor Apurado')),
+                ('vl_tot_ded', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Total Deduções')),
+                ('vl_icms_recolher', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='ICMS a Recolher')),
+                ('vl_sld_credor_transportar', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Saldo Credor a Transportar')),
+                ('deb_esp', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Débitos Especiais')),
+                ('registro_0000', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='apuracoes_e110', to='sped.registro0000')),
+            ],
+            options={
+                'verbose_name': 'Apuração ICMS E110',
+                'verbose_name_plural': 'Apurações ICMS E110',
+            },
+        ),
+        migrations.CreateModel(
+            name='RegistroC190',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cst_icms', models.CharField(blank=True, max_length=3, verbose_name='CST ICMS')),
+                ('cfop', models.CharField(blank=True, max_length=4, verbose_name='CFOP')),
+                ('aliq_icms', models.DecimalField(decimal_places=2, default=0, max_digits=6, verbose_name='Alíquota ICMS')),
+                ('vl_opr', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor da Operação')),
+                ('vl_bc_icms', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Base ICMS')),
+                ('vl_icms', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor ICMS')),
+                ('vl_bc_icms_st', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Base ICMS ST')),
+                ('vl_icms_st', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor ICMS ST')),
+                ('vl_red_bc', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor Redução BC')),
+                ('vl_ipi', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor IPI')),
+                ('cod_obs', models.CharField(blank=True, max_length=6, verbose_name='Código Observação')),
+                ('registro_c100', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='analiticos_c190', to='sped.registroc100')),
+            ],
+            options={
+                'verbose_name': 'Analítico C190',
+                'verbose_name_plural': 'Analíticos C190',
+                'indexes': [models.Index(fields=['registro_c100', 'cfop'], name='sped_regist_registr_f84d58_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='RegistroE111',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cod_aj_apur', models.CharField(max_length=8, verbose_name='Código do Ajuste')),
+                ('descr_compl_aj', models.TextField(blank=True, verbose_name='Descrição Complementar')),
+                ('vl_aj_apur', models.DecimalField(decimal_places=2, default=0, max_digits=15, verbose_name='Valor do Ajuste')),
+                ('registro_0000', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ajustes_e111', to='sped.registro0000')),
+            ],
+            options={
+                'verbose_name': 'Ajuste Apuração ICMS E111',
+                'verbose_name_plural': 'Ajustes Apuração ICMS E111',
+                'indexes': [models.Index(fields=['registro_0000', 'cod_aj_apur'], name='sped_regist_registr_04f271_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:43
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+# Chaves únicas criadas abaixo. C100 vem antes: excluir um C100 repetido leva
+# os filhos dele, e só depois se procuram repetições entre os filhos que ficaram
+CHAVES = [
+    ('RegistroC100', ['registro_0000', 'num_doc', 'ser', 'cod_mod', 'ind_oper']),
+    ('RegistroC110', ['registro_c100', 'cod_inf']),
+    ('RegistroC113', ['registro_c100', 'chv_nfe']),
+    ('RegistroC170', ['registro_c100', 'num_item']),
+]
+
+
+def remover_repetidos(apps, schema_editor):
+    """
+    Importações anteriores à carga em lote podiam gravar o mesmo documento
+    mais de uma vez; fica o de menor id de cada chave
+    """
+    for nome, campos in CHAVES:
+        model = apps.get_model('sped', nome)
+        repetidos = (
+            model.objects.values(*campos)
+            .annotate(menor_id=Min('id'), quantidade=Count('id'))
+            .filter(quantidade__gt=1)
+            .order_by()
+        )
+        for grupo in repetidos:
+            menor_id = grupo.pop('menor_id')
+            grupo.pop('quantidade')
+            if None in grupo.values():
+                # NULL não repete numa chave única
+                continue
+            model.objects.filter(**grupo).exclude(id=menor_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sped', '0005_registroc190_registroe110_registroe111'),
+    ]
+
+    operations = [
+        migrations.RunPython(remover_repetidos, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='registroc100',
+            unique_together={('registro_0000', 'num_doc', 'ser', 'cod_mod', 'ind_oper')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='registroc110',
+            unique_together={('registro_c100', 'cod_inf')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='registroc113',
+            unique_together={('registro_c100', 'chv_nfe')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='registroc170',
+            unique_together={('registro_c100', 'num_item')},
+        ),
+    ]
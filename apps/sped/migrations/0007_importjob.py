@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sped', '0006_chaves_unicas_documentos'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('fiscal', 'SPED Fiscal'), ('registro', 'SPED Contribuições')], max_length=20)),
+                ('arquivo', models.FileField(upload_to='importacoes/', verbose_name='Arquivo enviado')),
+                ('nome_arquivo', models.CharField(max_length=255, verbose_name='Nome do arquivo')),
+                ('sobrescrever', models.BooleanField(default=False)),
+                ('buscar_produtos_api', models.BooleanField(default=False)),
+                ('consultar_participantes', models.BooleanField(default=False, verbose_name='Consultar participantes no worker')),
+                ('status', models.CharField(choices=[('pendente', 'Na fila'), ('processando', 'Processando'), ('concluido', 'Concluído'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('fase', models.CharField(choices=[('na_fila', 'Na fila'), ('extraindo', 'Extraindo arquivos'), ('processando', 'Processando arquivos'), ('consultando', 'Consultando participantes'), ('concluido', 'Concluído')], default='na_fila', max_length=20)),
+                ('arquivo_atual', models.CharField(blank=True, max_length=255, verbose_name='Arquivo em processamento')),
+                ('arquivos_total', models.PositiveIntegerField(default=0)),
+                ('arquivos_processados', models.PositiveIntegerField(default=0)),
+                ('linhas_processadas', models.BigIntegerField(default=0)),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('relatorio', models.JSONField(blank=True, default=dict)),
+                ('registros_ids', models.JSONField(blank=True, default=list, verbose_name='IDs dos Registros 0000 importados')),
+                ('mensagem', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Importação SPED',
+                'verbose_name_plural': 'Importações SPED',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='sped_import_status_e1025b_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sped', '0007_importjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registro0000',
+            name='resumos_em',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Resumos gerados em'),
+        ),
+        migrations.CreateModel(
+            name='ResumoDocumento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ind_oper', models.CharField(max_length=1, verbose_name='Indicador de Operação')),
+                ('cod_part', models.CharField(blank=True, max_length=60, verbose_name='Código do Participante')),
+                ('primeiro_documento', models.BigIntegerField(verbose_name='Primeiro documento C100 (id)')),
+                ('qtd_documentos', models.IntegerField(default=0, verbose_name='Quantidade de documentos')),
+                ('vl_doc', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Valor dos Documentos')),
+                ('vl_icms', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Valor do ICMS')),
+                ('vl_pis', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Valor do PIS')),
+                ('vl_cofins', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Valor do COFINS')),
+                ('registro_0000', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumo_documentos', to='sped.registro0000')),
+            ],
+            options={
+                'verbose_name': 'Resumo de Documentos',
+                'verbose_name_plural': 'Resumos de Documentos',
+                'unique_together': {('registro_0000', 'ind_oper', 'cod_part')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumoItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ind_oper', models.CharField(max_length=1, verbose_name='Indicador de Operação')),
+                ('cod_part', models.CharField(blank=True, max_length=60, verbose_name='Código do Participante')),
+                ('cod_item', models.CharField(max_length=60, verbose_name='Código do Item')),
+                ('cfop', models.CharField(blank=True, max_length=4, verbose_name='CFOP')),
+                ('descr_compl', models.TextField(blank=True, verbose_name='Descrição Complementar')),
+                ('cod_ncm', models.CharField(blank=True, max_length=8, verbose_name='NCM')),
+                ('primeiro_item', models.BigIntegerField(verbose_name='Primeiro item C170 (id)')),
+                ('qtd_itens', models.IntegerField(default=0, verbose_name='Quantidade de itens C170')),
+                ('qtd', models.DecimalField(decimal_places=5, default=0, max_digits=20, verbose_name='Quantidade')),
+                ('vl_item', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Valor dos Itens')),
+                ('vl_bc_icms', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Base ICMS')),
+                ('vl_icms', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Valor ICMS')),
+                ('vl_bc_pis', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Base PIS')),
+                ('vl_pis', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Valor PIS')),
+                ('vl_bc_cofins', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Base COFINS')),
+                ('vl_cofins', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Valor COFINS')),
+                ('registro_0000', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumo_itens', to='sped.registro0000')),
+            ],
+            options={
+                'verbose_name': 'Resumo de Itens',
+                'verbose_name_plural': 'Resumos de Itens',
+                'indexes': [models.Index(fields=['registro_0000', 'ind_oper', 'cfop'], name='sped_resumo_registr_642b25_idx')],
+                'unique_together': {('registro_0000', 'ind_oper', 'cod_part', 'cod_item', 'cfop')},
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def regerar_resumos(apps, schema_editor):
+    # Períodos já resumidos ficam sem composição; o worker de importação os regera (garantir_resumos)
+    Registro0000 = apps.get_model('sped', 'Registro0000')
+    Registro0000.objects.filter(resumos_em__isnull=False).update(resumos_em=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sped', '0008_resumos_periodo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ComposicaoNF',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ind_oper', models.CharField(max_length=1, verbose_name='Indicador de Operação')),
+                ('num_doc', models.CharField(blank=True, max_length=9, verbose_name='Número do Documento')),
+                ('cfop', models.CharField(blank=True, max_length=4, verbose_name='CFOP')),
+                ('codigo', models.CharField(blank=True, max_length=60, verbose_name='Código do Item')),
+                ('descricao', models.TextField(blank=True, verbose_name='Descrição')),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=18, verbose_name='Valor')),
+                ('registro_0000', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='composicao_nf', to='sped.registro0000')),
+            ],
+            options={
+                'verbose_name': 'Composição por NF',
+                'verbose_name_plural': 'Composições por NF',
+                'indexes': [models.Index(fields=['registro_0000', 'ind_oper', 'num_doc', 'cfop', 'codigo'], name='sped_compos_registr_984374_idx')],
+            },
+        ),
+        migrations.RunPython(regerar_resumos, migrations.RunPython.noop),
+    ]
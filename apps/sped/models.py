@@ -1,4 +1,6 @@
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from apps.empresa.models import Empresa
 
 
@@ -13,6 +15,8 @@ class Registro0000(models.Model):
     periodo = models.DateField()
     arquivo_original = models.FileField(upload_to='sped/')
     processado = models.BooleanField(default=False)
+    # Quando os resumos (ResumoItem/ResumoDocumento/ComposicaoNF) foram gerados; vazio = ainda não gerados
+    resumos_em = models.DateTimeField('Resumos gerados em', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -67,6 +71,7 @@ class RegistroC100(models.Model):
     class Meta:
         verbose_name = 'Documento C100'
         verbose_name_plural = 'Documentos C100'
+        unique_together = ['registro_0000', 'num_doc', 'ser', 'cod_mod', 'ind_oper']
     
     def __str__(self):
         return f"{self.cod_mod} {self.ser}/{self.num_doc}"
@@ -81,6 +86,7 @@ class RegistroC110(models.Model):
     class Meta:
         verbose_name = 'Informação Complementar C110'
         verbose_name_plural = 'Informações Complementares C110'
+        unique_together = ['registro_c100', 'cod_inf']
 
     def __str__(self):
         return f"C110 - {self.cod_inf} - {self.txt_compl[:50]}"
@@ -102,6 +108,7 @@ class RegistroC113(models.Model):
     class Meta:
         verbose_name = 'Documento Referenciado C113'
         verbose_name_plural = 'Documentos Referenciados C113'
+        unique_together = ['registro_c100', 'chv_nfe']
 
     def __str__(self):
         return f"C113 - Doc {self.num_doc} - Chave: {self.chv_nfe[:20]}..."
@@ -196,6 +203,211 @@ class RegistroC170(models.Model):
     class Meta:
         verbose_name = 'Item C170'
         verbose_name_plural = 'Itens C170'
+        unique_together = ['registro_c100', 'num_item']
     
     def __str__(self):
         return f"Item {self.num_item} - {self.cod_item}"
+
+
+class RegistroC190(models.Model):
+    """Registro Analítico do Documento (Código 01, 1B, 04, 55 e 65)"""
+    registro_c100 = models.ForeignKey(RegistroC100, on_delete=models.CASCADE, related_name='analiticos_c190')
+    cst_icms = models.CharField('CST ICMS', max_length=3, blank=True)
+    cfop = models.CharField('CFOP', max_length=4, blank=True)
+    aliq_icms = models.DecimalField('Alíquota ICMS', max_digits=6, decimal_places=2, default=0)
+    vl_opr = models.DecimalField('Valor da Operação', max_digits=15, decimal_places=2, default=0)
+    vl_bc_icms = models.DecimalField('Base ICMS', max_digits=15, decimal_places=2, default=0)
+    vl_icms = models.DecimalField('Valor ICMS', max_digits=15, decimal_places=2, default=0)
+    vl_bc_icms_st = models.DecimalField('Base ICMS ST', max_digits=15, decimal_places=2, default=0)
+    vl_icms_st = models.DecimalField('Valor ICMS ST', max_digits=15, decimal_places=2, default=0)
+    vl_red_bc = models.DecimalField('Valor Redução BC', max_digits=15, decimal_places=2, default=0)
+    vl_ipi = models.DecimalField('Valor IPI', max_digits=15, decimal_places=2, default=0)
+    cod_obs = models.CharField('Código Observação', max_length=6, blank=True)
+
+    class Meta:
+        verbose_name = 'Analítico C190'
+        verbose_name_plural = 'Analíticos C190'
+        indexes = [
+            models.Index(fields=['registro_c100', 'cfop']),
+        ]
+
+    def __str__(self):
+        return f"C190 - CFOP {self.cfop} - CST {self.cst_icms} - R$ {self.vl_opr}"
+
+
+class RegistroE110(models.Model):
+    """Apuração do ICMS - Operações Próprias"""
+    registro_0000 = models.ForeignKey(Registro0000, on_delete=models.CASCADE, related_name='apuracoes_e110')
+    vl_tot_debitos = models.DecimalField('Total Débitos', max_digits=15, decimal_places=2, default=0)
+    vl_aj_debitos = models.DecimalField('Ajustes a Débito (Documento)', max_digits=15, decimal_places=2, default=0)
+    vl_tot_aj_debitos = models.DecimalField('Total Ajustes a Débito', max_digits=15, decimal_places=2, default=0)
+    vl_estornos_cred = models.DecimalField('Estornos de Créditos', max_digits=15, decimal_places=2, default=0)
+    vl_tot_creditos = models.DecimalField('Total Créditos', max_digits=15, decimal_places=2, default=0)
+    vl_aj_creditos = models.DecimalField('Ajustes a Crédito (Documento)', max_digits=15, decimal_places=2, default=0)
+    vl_tot_aj_creditos = models.DecimalField('Total Ajustes a Crédito', max_digits=15, decimal_places=2, default=0)
+    vl_estornos_deb = models.DecimalField('Estornos de Débitos', max_digits=15, decimal_places=2, default=0)
+    vl_sld_credor_ant = models.DecimalField('Saldo Credor Anterior', max_digits=15, decimal_places=2, default=0)
+    vl_sld_apurado = models.DecimalField('Saldo Devedor Apurado', max_digits=15, decimal_places=2, default=0)
+    vl_tot_ded = models.DecimalField('Total Deduções', max_digits=15, decimal_places=2, default=0)
+    vl_icms_recolher = models.DecimalField('ICMS a Recolher', max_digits=15, decimal_places=2, default=0)
+    vl_sld_credor_transportar = models.DecimalField('Saldo Credor a Transportar', max_digits=15, decimal_places=2, default=0)
+    deb_esp = models.DecimalField('Débitos Especiais', max_digits=15, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Apuração ICMS E110'
+        verbose_name_plural = 'Apurações ICMS E110'
+
+    def __str__(self):
+        return f"E110 - {self.registro_0000.periodo} - A recolher R$ {self.vl_icms_recolher}"
+
+
+class RegistroE111(models.Model):
+    """Ajuste/Benefício/Incentivo da Apuração do ICMS"""
+    registro_0000 = models.ForeignKey(Registro0000, on_delete=models.CASCADE, related_name='ajustes_e111')
+    cod_aj_apur = models.CharField('Código do Ajuste', max_length=8)
+    descr_compl_aj = models.TextField('Descrição Complementar', blank=True)
+    vl_aj_apur = models.DecimalField('Valor do Ajuste', max_digits=15, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Ajuste Apuração ICMS E111'
+        verbose_name_plural = 'Ajustes Apuração ICMS E111'
+        indexes = [
+            models.Index(fields=['registro_0000', 'cod_aj_apur']),
+        ]
+
+    def __str__(self):
+        return f"E111 - {self.cod_aj_apur} - R$ {self.vl_aj_apur}"
+
+
+class ResumoItem(models.Model):
+    """Itens C170 do período somados por operação, participante, item e CFOP"""
+    registro_0000 = models.ForeignKey(Registro0000, on_delete=models.CASCADE, related_name='resumo_itens')
+    ind_oper = models.CharField('Indicador de Operação', max_length=1)
+    cod_part = models.CharField('Código do Participante', max_length=60, blank=True)
+    cod_item = models.CharField('Código do Item', max_length=60)
+    cfop = models.CharField('CFOP', max_length=4, blank=True)
+    descr_compl = models.TextField('Descrição Complementar', blank=True)
+    cod_ncm = models.CharField('NCM', max_length=8, blank=True)
+    primeiro_item = models.BigIntegerField('Primeiro item C170 (id)')
+    qtd_itens = models.IntegerField('Quantidade de itens C170', default=0)
+    qtd = models.DecimalField('Quantidade', max_digits=20, decimal_places=5, default=0)
+    vl_item = models.DecimalField('Valor dos Itens', max_digits=18, decimal_places=2, default=0)
+    vl_bc_icms = models.DecimalField('Base ICMS', max_digits=18, decimal_places=2, default=0)
+    vl_icms = models.DecimalField('Valor ICMS', max_digits=18, decimal_places=2, default=0)
+    vl_bc_pis = models.DecimalField('Base PIS', max_digits=18, decimal_places=2, default=0)
+    vl_pis = models.DecimalField('Valor PIS', max_digits=18, decimal_places=2, default=0)
+    vl_bc_cofins = models.DecimalField('Base COFINS', max_digits=18, decimal_places=2, default=0)
+    vl_cofins = models.DecimalField('Valor COFINS', max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Resumo de Itens'
+        verbose_name_plural = 'Resumos de Itens'
+        unique_together = ['registro_0000', 'ind_oper', 'cod_part', 'cod_item', 'cfop']
+        indexes = [
+            models.Index(fields=['registro_0000', 'ind_oper', 'cfop']),
+        ]
+
+    def __str__(self):
+        return f"{self.cod_item} - CFOP {self.cfop} - R$ {self.vl_item}"
+
+
+class ResumoDocumento(models.Model):
+    """Documentos C100 do período somados por operação e participante"""
+    registro_0000 = models.ForeignKey(Registro0000, on_delete=models.CASCADE, related_name='resumo_documentos')
+    ind_oper = models.CharField('Indicador de Operação', max_length=1)
+    cod_part = models.CharField('Código do Participante', max_length=60, blank=True)
+    primeiro_documento = models.BigIntegerField('Primeiro documento C100 (id)')
+    qtd_documentos = models.IntegerField('Quantidade de documentos', default=0)
+    vl_doc = models.DecimalField('Valor dos Documentos', max_digits=18, decimal_places=2, default=0)
+    vl_icms = models.DecimalField('Valor do ICMS', max_digits=18, decimal_places=2, default=0)
+    vl_pis = models.DecimalField('Valor do PIS', max_digits=18, decimal_places=2, default=0)
+    vl_cofins = models.DecimalField('Valor do COFINS', max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Resumo de Documentos'
+        verbose_name_plural = 'Resumos de Documentos'
+        unique_together = ['registro_0000', 'ind_oper', 'cod_part']
+
+    def __str__(self):
+        return f"{self.cod_part or '-'} ({self.ind_oper}) - R$ {self.vl_doc}"
+
+
+class ComposicaoNF(models.Model):
+    """Linhas da composição por NF do período: itens C170 e diferenças do C190 (codigo '---')"""
+    registro_0000 = models.ForeignKey(Registro0000, on_delete=models.CASCADE, related_name='composicao_nf')
+    ind_oper = models.CharField('Indicador de Operação', max_length=1)
+    num_doc = models.CharField('Número do Documento', max_length=9, blank=True)
+    cfop = models.CharField('CFOP', max_length=4, blank=True)
+    codigo = models.CharField('Código do Item', max_length=60, blank=True)
+    descricao = models.TextField('Descrição', blank=True)
+    valor = models.DecimalField('Valor', max_digits=18, decimal_places=2, default=0)
+
+    class Meta:
+        verbose_name = 'Composição por NF'
+        verbose_name_plural = 'Composições por NF'
+        indexes = [
+            models.Index(fields=['registro_0000', 'ind_oper', 'num_doc', 'cfop', 'codigo']),
+        ]
+
+    def __str__(self):
+        return f"NF {self.num_doc} - CFOP {self.cfop} - {self.codigo}: R$ {self.valor}"
+
+
+class ImportJob(models.Model):
+    """Importação de SPED enfileirada, executada pelo worker (manage.py worker_importacao)"""
+    STATUS_CHOICES = [
+        ('pendente', 'Na fila'),
+        ('processando', 'Processando'),
+        ('concluido', 'Concluído'),
+        ('erro', 'Erro'),
+    ]
+    FASE_CHOICES = [
+        ('na_fila', 'Na fila'),
+        ('extraindo', 'Extraindo arquivos'),
+        ('processando', 'Processando arquivos'),
+        ('consultando', 'Consultando participantes'),
+        ('concluido', 'Concluído'),
+    ]
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    tipo = models.CharField(max_length=20, choices=Registro0000.TIPO_CHOICES)
+    arquivo = models.FileField('Arquivo enviado', upload_to='importacoes/')
+    nome_arquivo = models.CharField('Nome do arquivo', max_length=255)
+    sobrescrever = models.BooleanField(default=False)
+    buscar_produtos_api = models.BooleanField(default=False)
+    consultar_participantes = models.BooleanField('Consultar participantes no worker', default=False)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    fase = models.CharField(max_length=20, choices=FASE_CHOICES, default='na_fila')
+    arquivo_atual = models.CharField('Arquivo em processamento', max_length=255, blank=True)
+    arquivos_total = models.PositiveIntegerField(default=0)
+    arquivos_processados = models.PositiveIntegerField(default=0)
+    linhas_processadas = models.BigIntegerField(default=0)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    relatorio = models.JSONField(default=dict, blank=True)
+    registros_ids = models.JSONField('IDs dos Registros 0000 importados', default=list, blank=True)
+    mensagem = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    finalizado_em = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Importação SPED'
+        verbose_name_plural = 'Importações SPED'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Importação {self.id} - {self.nome_arquivo} - {self.get_status_display()}"
+
+    @property
+    def linhas_por_segundo(self):
+        if not self.iniciado_em or not self.linhas_processadas:
+            return 0
+        fim = self.finalizado_em or timezone.now()
+        segundos = (fim - self.iniciado_em).total_seconds()
+        return round(self.linhas_processadas / segundos) if segundos > 0 else 0
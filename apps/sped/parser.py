@@ -1,8 +1,21 @@
 """
 Parser para arquivos SPED Fiscal e Contribuições
 """
-from datetime import datetime
+from datetime import date, datetime
 from decimal import Decimal, InvalidOperation
+from io import BytesIO, StringIO
+from operator import itemgetter
+
+# Tamanho do bloco lido do arquivo a cada iteração (1 MB)
+CHUNK_SIZE = 1024 * 1024
+
+# Registros filhos do C100 anexados ao documento durante a leitura
+FILHOS_C100 = {
+    'C110': 'complementares',
+    'C113': 'referencias',
+    'C170': 'itens',
+    'C190': 'analiticos',
+}
 
 
 def parse_decimal(value, default=0):
@@ -27,6 +40,269 @@ def parse_date(value):
         return None
 
 
+# ============================================================
+# CONVERSORES USADOS PELOS LAYOUTS
+# ============================================================
+
+DECIMAL_ZERO = Decimal(0)
+
+# Valores decimais repetem muito no SPED ('0,00', '18,00', '1,6500'...);
+# como Decimal é imutável, o resultado da conversão pode ser reaproveitado
+_CACHE_DECIMAL_MAX = 65536
+
+
+class _CacheDecimal(dict):
+    """Cache valor SPED -> Decimal; a conversão só roda na primeira ocorrência"""
+
+    def __missing__(self, value):
+        resultado = parse_decimal(value)
+        if len(self) < _CACHE_DECIMAL_MAX:
+            self[value] = resultado
+        return resultado
+
+
+_cache_decimal = _CacheDecimal()
+_converter_decimal = _cache_decimal.__getitem__
+
+
+def _converter_data(value):
+    """Versão rápida de parse_date (DDMMAAAA) sem strptime"""
+    if len(value) != 8 or not value.isdigit():
+        return None
+    try:
+        return date(int(value[4:]), int(value[2:4]), int(value[:2]))
+    except ValueError:
+        return None
+
+
+TEXTO = 'str'
+DECIMAL = 'decimal'
+DATA = 'date'
+
+CONVERSORES = {
+    DECIMAL: _converter_decimal,
+    DATA: _converter_data,
+}
+
+
+# ============================================================
+# LAYOUTS DOS REGISTROS: (campo, posição, tipo)
+# Para suportar um novo registro basta incluir uma entrada aqui
+# ============================================================
+
+LAYOUTS = {
+    '0000': (
+        ('cod_ver', 1, TEXTO),
+        ('cod_fin', 2, TEXTO),
+        ('dt_ini', 3, DATA),
+        ('dt_fin', 4, DATA),
+        ('nome', 5, TEXTO),
+        ('cnpj', 6, TEXTO),
+        ('cpf', 7, TEXTO),
+        ('uf', 8, TEXTO),
+        ('ie', 9, TEXTO),
+        ('cod_mun', 10, TEXTO),
+        ('im', 11, TEXTO),
+        ('suframa', 12, TEXTO),
+        ('ind_perfil', 13, TEXTO),
+        ('ind_ativ', 14, TEXTO),
+    ),
+    '0150': (
+        ('cod_part', 1, TEXTO),
+        ('nome', 2, TEXTO),
+        ('cod_pais', 3, TEXTO),
+        ('cnpj', 4, TEXTO),
+        ('cpf', 5, TEXTO),
+        ('ie', 6, TEXTO),
+        ('cod_mun', 7, TEXTO),
+        ('suframa', 8, TEXTO),
+        ('end', 9, TEXTO),
+        ('num', 10, TEXTO),
+        ('compl', 11, TEXTO),
+        ('bairro', 12, TEXTO),
+    ),
+    '0200': (
+        ('cod_item', 1, TEXTO),
+        ('descr_item', 2, TEXTO),
+        ('cod_barra', 3, TEXTO),
+        ('cod_ant_item', 4, TEXTO),
+        ('unid_inv', 5, TEXTO),
+        ('tipo_item', 6, TEXTO),
+        ('cod_ncm', 7, TEXTO),
+        ('ex_ipi', 8, TEXTO),
+        ('cod_gen', 9, TEXTO),
+        ('cod_lst', 10, TEXTO),
+        ('aliq_icms', 11, DECIMAL),
+        ('cest', 12, TEXTO),
+    ),
+    'C100': (
+        ('ind_oper', 1, TEXTO),
+        ('ind_emit', 2, TEXTO),
+        ('cod_part', 3, TEXTO),
+        ('cod_mod', 4, TEXTO),
+        ('cod_sit', 5, TEXTO),
+        ('ser', 6, TEXTO),
+        ('num_doc', 7, TEXTO),
+        ('chv_nfe', 8, TEXTO),
+        ('dt_doc', 9, DATA),
+        ('dt_e_s', 10, DATA),
+        ('vl_doc', 11, DECIMAL),
+        ('ind_pgto', 12, TEXTO),
+        ('vl_desc', 13, DECIMAL),
+        ('vl_abat_nt', 14, DECIMAL),
+        ('vl_merc', 15, DECIMAL),
+        ('ind_frt', 16, TEXTO),
+        ('vl_frt', 17, DECIMAL),
+        ('vl_seg', 18, DECIMAL),
+        ('vl_out_da', 19, DECIMAL),
+        ('vl_bc_icms', 20, DECIMAL),
+        ('vl_icms', 21, DECIMAL),
+        ('vl_bc_icms_st', 22, DECIMAL),
+        ('vl_icms_st', 23, DECIMAL),
+        ('vl_ipi', 24, DECIMAL),
+        ('vl_pis', 25, DECIMAL),
+        ('vl_cofins', 26, DECIMAL),
+        ('vl_pis_st', 27, DECIMAL),
+        ('vl_cofins_st', 28, DECIMAL),
+    ),
+    'C110': (
+        ('cod_inf', 1, TEXTO),
+        ('txt_compl', 2, TEXTO),
+    ),
+    'C113': (
+        ('ind_oper', 1, TEXTO),
+        ('ind_emit', 2, TEXTO),
+        ('cod_part', 3, TEXTO),
+        ('cod_mod', 4, TEXTO),
+        ('ser', 5, TEXTO),
+        ('sub', 6, TEXTO),
+        ('num_doc', 7, TEXTO),
+        ('dt_doc', 8, DATA),
+        ('chv_nfe', 9, TEXTO),
+    ),
+    'C170': (
+        ('num_item', 1, TEXTO),
+        ('cod_item', 2, TEXTO),
+        ('descr_compl', 3, TEXTO),
+        ('qtd', 4, DECIMAL),
+        ('unid', 5, TEXTO),
+        ('vl_item', 6, DECIMAL),
+        ('vl_desc', 7, DECIMAL),
+        ('ind_mov', 8, TEXTO),
+        ('cst_icms', 9, TEXTO),
+        ('cfop', 10, TEXTO),
+        ('cod_nat', 11, TEXTO),
+        ('vl_bc_icms', 12, DECIMAL),
+        ('aliq_icms', 13, DECIMAL),
+        ('vl_icms', 14, DECIMAL),
+        ('vl_bc_icms_st', 15, DECIMAL),
+        ('aliq_st', 16, DECIMAL),
+        ('vl_icms_st', 17, DECIMAL),
+        ('ind_apur', 18, TEXTO),
+        ('cst_ipi', 19, TEXTO),
+        ('cod_enq', 20, TEXTO),
+        ('vl_bc_ipi', 21, DECIMAL),
+        ('aliq_ipi', 22, DECIMAL),
+        ('vl_ipi', 23, DECIMAL),
+        ('cst_pis', 24, TEXTO),
+        ('vl_bc_pis', 25, DECIMAL),
+        ('aliq_pis_percent', 26, DECIMAL),
+        ('quant_bc_pis', 27, DECIMAL),
+        ('aliq_pis_reais', 28, DECIMAL),
+        ('vl_pis', 29, DECIMAL),
+        ('cst_cofins', 30, TEXTO),
+        ('vl_bc_cofins', 31, DECIMAL),
+        ('aliq_cofins_percent', 32, DECIMAL),
+        ('quant_bc_cofins', 33, DECIMAL),
+        ('aliq_cofins_reais', 34, DECIMAL),
+        ('vl_cofins', 35, DECIMAL),
+        ('cod_cta', 36, TEXTO),
+    ),
+    'C190': (
+        ('cst_icms', 1, TEXTO),
+        ('cfop', 2, TEXTO),
+        ('aliq_icms', 3, DECIMAL),
+        ('vl_opr', 4, DECIMAL),
+        ('vl_bc_icms', 5, DECIMAL),
+        ('vl_icms', 6, DECIMAL),
+        ('vl_bc_icms_st', 7, DECIMAL),
+        ('vl_icms_st', 8, DECIMAL),
+        ('vl_red_bc', 9, DECIMAL),
+        ('vl_ipi', 10, DECIMAL),
+        ('cod_obs', 11, TEXTO),
+    ),
+    'E110': (
+        ('vl_tot_debitos', 1, DECIMAL),
+        ('vl_aj_debitos', 2, DECIMAL),
+        ('vl_tot_aj_debitos', 3, DECIMAL),
+        ('vl_estornos_cred', 4, DECIMAL),
+        ('vl_tot_creditos', 5, DECIMAL),
+        ('vl_aj_creditos', 6, DECIMAL),
+        ('vl_tot_aj_creditos', 7, DECIMAL),
+        ('vl_estornos_deb', 8, DECIMAL),
+        ('vl_sld_credor_ant', 9, DECIMAL),
+        ('vl_sld_apurado', 10, DECIMAL),
+        ('vl_tot_ded', 11, DECIMAL),
+        ('vl_icms_recolher', 12, DECIMAL),
+        ('vl_sld_credor_transportar', 13, DECIMAL),
+        ('deb_esp', 14, DECIMAL),
+    ),
+    'E111': (
+        ('cod_aj_apur', 1, TEXTO),
+        ('descr_compl_aj', 2, TEXTO),
+        ('vl_aj_apur', 3, DECIMAL),
+    ),
+}
+
+
+def _pegar_campos(posicoes):
+    """itemgetter que sempre devolve tupla, mesmo com uma única posição"""
+    if len(posicoes) == 1:
+        posicao = posicoes[0]
+        return lambda campos: (campos[posicao],)
+    return itemgetter(*posicoes)
+
+
+def compilar_layout(layout):
+    """
+    Compila um layout em uma função campos -> dict.
+    Os campos são agrupados por tipo: cada grupo é extraído em bloco via
+    itemgetter e convertido com map, sem checagem de tamanho por campo.
+    Campos ausentes no fim da linha viram '' antes da conversão.
+    """
+    tamanho = max(posicao for _, posicao, _ in layout) + 1
+    
+    grupos = {}
+    for nome, posicao, tipo in layout:
+        grupos.setdefault(tipo, []).append((nome, posicao))
+    
+    textos = grupos.pop(TEXTO, [])
+    nomes_texto = tuple(nome for nome, _ in textos)
+    pegar_textos = _pegar_campos([posicao for _, posicao in textos]) if textos else (lambda campos: ())
+    convertidos = [
+        (
+            tuple(nome for nome, _ in campos_tipo),
+            _pegar_campos([posicao for _, posicao in campos_tipo]),
+            CONVERSORES[tipo],
+        )
+        for tipo, campos_tipo in grupos.items()
+    ]
+
+    def converter(campos):
+        if len(campos) < tamanho:
+            campos = campos + [''] * (tamanho - len(campos))
+        dados = dict(zip(nomes_texto, pegar_textos(campos)))
+        for nomes, pegar, conversor in convertidos:
+            dados.update(zip(nomes, map(conversor, pegar(campos))))
+        return dados
+
+    return converter
+
+
+# Conversores compilados uma única vez, na importação do módulo
+CONVERSORES_REGISTRO = {registro: compilar_layout(layout) for registro, layout in LAYOUTS.items()}
+
+
 def parse_sped_line(line):
     """Parse de uma linha do SPED, retorna lista de campos"""
     line = line.strip()
@@ -40,10 +316,96 @@ def parse_sped_line(line):
     return line.split('|')
 
 
-def parse_sped_file(file_content, encoding='latin-1'):
+def _iter_linhas(fileobj, encoding='latin-1', chunk_size=CHUNK_SIZE, prefixos=None):
+    """
+    Lê o arquivo em blocos e devolve uma linha por vez, já decodificada.
+    Aceita arquivos binários ou de texto; apenas um bloco fica em memória.
+    Com prefixos (ex.: ('|C100|', '|C190|')), linhas que não começam por
+    um deles são descartadas ainda em bytes, sem decodificar nem separar campos.
+    """
+    prefixos_bytes = tuple(p.encode(encoding) for p in prefixos) if prefixos else None
+    resto = None
+    while True:
+        bloco = fileobj.read(chunk_size)
+        if not bloco:
+            break
+        binario = isinstance(bloco, bytes)
+        separador = b'\n' if binario else '\n'
+        if resto:
+            bloco = resto + bloco
+        linhas = bloco.split(separador)
+        resto = linhas.pop()
+        if prefixos:
+            filtro = prefixos_bytes if binario else prefixos
+            linhas = [linha for linha in linhas if linha.startswith(filtro)]
+        for linha in linhas:
+            yield linha.decode(encoding) if binario else linha
+    if resto:
+        if prefixos and not resto.startswith(prefixos_bytes if isinstance(resto, bytes) else prefixos):
+            return
+        yield resto.decode(encoding) if isinstance(resto, bytes) else resto
+
+
+def _prefixos_selecionados(only):
+    """
+    Converte o conjunto de registros pedidos em prefixos de linha.
+    Filhos do C100 dependem do documento pai, então o C100 entra junto.
+    """
+    registros = set(only)
+    if registros & set(FILHOS_C100):
+        registros.add('C100')
+    return tuple(f'|{registro}|' for registro in sorted(registros))
+
+
+def iter_sped_records(fileobj, encoding='latin-1', chunk_size=CHUNK_SIZE, only=None):
+    """
+    Parse em streaming de um arquivo SPED.
+    Gera tuplas (registro, dados) uma a uma, lendo o arquivo em blocos binários.
+    O C100 só é gerado quando completo, com os filhos C110/C113/C170/C190
+    anexados em 'complementares', 'referencias', 'itens' e 'analiticos'.
+    Registros sem layout em LAYOUTS são ignorados.
+    
+    only: conjunto de registros desejados (ex.: {'C100', 'C190'}). As demais
+    linhas são descartadas pelo prefixo, antes de qualquer split ou conversão.
+    """
+    conversores = CONVERSORES_REGISTRO
+    prefixos = _prefixos_selecionados(only) if only else None
+    current_c100 = None
+    
+    for line in _iter_linhas(fileobj, encoding, chunk_size, prefixos):
+        campos = parse_sped_line(line)
+        if not campos:
+            continue
+        
+        registro = campos[0]
+        
+        # Qualquer registro fora da hierarquia C1xx encerra o C100 corrente
+        if current_c100 is not None and (registro == 'C100' or not registro.startswith('C1')):
+            yield 'C100', current_c100
+            current_c100 = None
+        
+        converter = conversores.get(registro)
+        if converter is None:
+            continue
+        
+        if registro == 'C100':
+            current_c100 = converter(campos)
+            current_c100['itens'] = []
+        elif registro in FILHOS_C100:
+            if current_c100 is not None:
+                current_c100.setdefault(FILHOS_C100[registro], []).append(converter(campos))
+        else:
+            yield registro, converter(campos)
+    
+    if current_c100 is not None:
+        yield 'C100', current_c100
+
+
+def parse_sped_file(file_content, encoding='latin-1', only=None):
     """
     Parse completo de um arquivo SPED
     Retorna dicionário com registros organizados por tipo
+    Com only, apenas os registros informados são lidos (ver iter_sped_records)
     """
     registros = {
         '0000': None,
@@ -54,198 +416,31 @@ def parse_sped_file(file_content, encoding='latin-1'):
         'C113': [],  # Documento Fiscal Referenciado
         'C170': [],  # Itens dos documentos
         'C190': [],  # Analítico do documento
+        'E110': [],  # Apuração do ICMS
         'E111': [],  # Ajustes de Apuração ICMS
     }
     
     if isinstance(file_content, bytes):
-        file_content = file_content.decode(encoding)
+        fileobj = BytesIO(file_content)
+    elif hasattr(file_content, 'read'):
+        fileobj = file_content
+    else:
+        fileobj = StringIO(file_content)
     
-    lines = file_content.split('\n')
-    current_c100 = None
-    
-    for line in lines:
-        campos = parse_sped_line(line)
-        if not campos:
-            continue
-        
-        registro = campos[0]
-        
+    for registro, dados in iter_sped_records(fileobj, encoding, only=only):
         if registro == '0000':
-            registros['0000'] = {
-                'cod_ver': campos[1] if len(campos) > 1 else '',
-                'cod_fin': campos[2] if len(campos) > 2 else '',
-                'dt_ini': parse_date(campos[3]) if len(campos) > 3 else None,
-                'dt_fin': parse_date(campos[4]) if len(campos) > 4 else None,
-                'nome': campos[5] if len(campos) > 5 else '',
-                'cnpj': campos[6] if len(campos) > 6 else '',
-                'cpf': campos[7] if len(campos) > 7 else '',
-                'uf': campos[8] if len(campos) > 8 else '',
-                'ie': campos[9] if len(campos) > 9 else '',
-                'cod_mun': campos[10] if len(campos) > 10 else '',
-                'im': campos[11] if len(campos) > 11 else '',
-                'suframa': campos[12] if len(campos) > 12 else '',
-                'ind_perfil': campos[13] if len(campos) > 13 else '',
-                'ind_ativ': campos[14] if len(campos) > 14 else '',
-            }     
-        elif registro == '0150':
-            registros['0150'].append({
-                'cod_part': campos[1] if len(campos) > 1 else '',
-                'nome': campos[2] if len(campos) > 2 else '',
-                'cod_pais': campos[3] if len(campos) > 3 else '',
-                'cnpj': campos[4] if len(campos) > 4 else '',
-                'cpf': campos[5] if len(campos) > 5 else '',
-                'ie': campos[6] if len(campos) > 6 else '',
-                'cod_mun': campos[7] if len(campos) > 7 else '',
-                'suframa': campos[8] if len(campos) > 8 else '',
-                'end': campos[9] if len(campos) > 9 else '',
-                'num': campos[10] if len(campos) > 10 else '',
-                'compl': campos[11] if len(campos) > 11 else '',
-                'bairro': campos[12] if len(campos) > 12 else '',
-            })
-        
-        elif registro == '0200':
-            registros['0200'].append({
-                'cod_item': campos[1] if len(campos) > 1 else '',
-                'descr_item': campos[2] if len(campos) > 2 else '',
-                'cod_barra': campos[3] if len(campos) > 3 else '',
-                'cod_ant_item': campos[4] if len(campos) > 4 else '',
-                'unid_inv': campos[5] if len(campos) > 5 else '',
-                'tipo_item': campos[6] if len(campos) > 6 else '',
-                'cod_ncm': campos[7] if len(campos) > 7 else '',
-                'ex_ipi': campos[8] if len(campos) > 8 else '',
-                'cod_gen': campos[9] if len(campos) > 9 else '',
-                'cod_lst': campos[10] if len(campos) > 10 else '',
-                'aliq_icms': parse_decimal(campos[11]) if len(campos) > 11 else Decimal(0),
-                'cest': campos[12] if len(campos) > 12 else '',
-            })
-        
+            registros['0000'] = dados
         elif registro == 'C100':
-            current_c100 = {
-                'ind_oper': campos[1] if len(campos) > 1 else '',
-                'ind_emit': campos[2] if len(campos) > 2 else '',
-                'cod_part': campos[3] if len(campos) > 3 else '',
-                'cod_mod': campos[4] if len(campos) > 4 else '',
-                'cod_sit': campos[5] if len(campos) > 5 else '',
-                'ser': campos[6] if len(campos) > 6 else '',
-                'num_doc': campos[7] if len(campos) > 7 else '',
-                'chv_nfe': campos[8] if len(campos) > 8 else '',
-                'dt_doc': parse_date(campos[9]) if len(campos) > 9 else None,
-                'dt_e_s': parse_date(campos[10]) if len(campos) > 10 else None,
-                'vl_doc': parse_decimal(campos[11]) if len(campos) > 11 else Decimal(0),
-                'ind_pgto': campos[12] if len(campos) > 12 else '',
-                'vl_desc': parse_decimal(campos[13]) if len(campos) > 13 else Decimal(0),
-                'vl_abat_nt': parse_decimal(campos[14]) if len(campos) > 14 else Decimal(0),
-                'vl_merc': parse_decimal(campos[15]) if len(campos) > 15 else Decimal(0),
-                'ind_frt': campos[16] if len(campos) > 16 else '',
-                'vl_frt': parse_decimal(campos[17]) if len(campos) > 17 else Decimal(0),
-                'vl_seg': parse_decimal(campos[18]) if len(campos) > 18 else Decimal(0),
-                'vl_out_da': parse_decimal(campos[19]) if len(campos) > 19 else Decimal(0),
-                'vl_bc_icms': parse_decimal(campos[20]) if len(campos) > 20 else Decimal(0),
-                'vl_icms': parse_decimal(campos[21]) if len(campos) > 21 else Decimal(0),
-                'vl_bc_icms_st': parse_decimal(campos[22]) if len(campos) > 22 else Decimal(0),
-                'vl_icms_st': parse_decimal(campos[23]) if len(campos) > 23 else Decimal(0),
-                'vl_ipi': parse_decimal(campos[24]) if len(campos) > 24 else Decimal(0),
-                'vl_pis': parse_decimal(campos[25]) if len(campos) > 25 else Decimal(0),
-                'vl_cofins': parse_decimal(campos[26]) if len(campos) > 26 else Decimal(0),
-                'vl_pis_st': parse_decimal(campos[27]) if len(campos) > 27 else Decimal(0),
-                'vl_cofins_st': parse_decimal(campos[28]) if len(campos) > 28 else Decimal(0),
-                'itens': [],
-            }
-            registros['C100'].append(current_c100)
-        
-        elif registro == 'C170' and current_c100:
-            item = {
-                'num_item': campos[1] if len(campos) > 1 else '',
-                'cod_item': campos[2] if len(campos) > 2 else '',
-                'descr_compl': campos[3] if len(campos) > 3 else '',
-                'qtd': parse_decimal(campos[4]) if len(campos) > 4 else Decimal(0),
-                'unid': campos[5] if len(campos) > 5 else '',
-                'vl_item': parse_decimal(campos[6]) if len(campos) > 6 else Decimal(0),
-                'vl_desc': parse_decimal(campos[7]) if len(campos) > 7 else Decimal(0),
-                'ind_mov': campos[8] if len(campos) > 8 else '',
-                'cst_icms': campos[9] if len(campos) > 9 else '',
-                'cfop': campos[10] if len(campos) > 10 else '',
-                'cod_nat': campos[11] if len(campos) > 11 else '',
-                'vl_bc_icms': parse_decimal(campos[12]) if len(campos) > 12 else Decimal(0),
-                'aliq_icms': parse_decimal(campos[13]) if len(campos) > 13 else Decimal(0),
-                'vl_icms': parse_decimal(campos[14]) if len(campos) > 14 else Decimal(0),
-                'vl_bc_icms_st': parse_decimal(campos[15]) if len(campos) > 15 else Decimal(0),
-                'aliq_st': parse_decimal(campos[16]) if len(campos) > 16 else Decimal(0),
-                'vl_icms_st': parse_decimal(campos[17]) if len(campos) > 17 else Decimal(0),
-                'ind_apur': campos[18] if len(campos) > 18 else '',
-                'cst_ipi': campos[19] if len(campos) > 19 else '',
-                'cod_enq': campos[20] if len(campos) > 20 else '',
-                'vl_bc_ipi': parse_decimal(campos[21]) if len(campos) > 21 else Decimal(0),
-                'aliq_ipi': parse_decimal(campos[22]) if len(campos) > 22 else Decimal(0),
-                'vl_ipi': parse_decimal(campos[23]) if len(campos) > 23 else Decimal(0),
-                'cst_pis': campos[24] if len(campos) > 24 else '',
-                'vl_bc_pis': parse_decimal(campos[25]) if len(campos) > 25 else Decimal(0),
-                'aliq_pis_percent': parse_decimal(campos[26]) if len(campos) > 26 else Decimal(0),
-                'quant_bc_pis': parse_decimal(campos[27]) if len(campos) > 27 else Decimal(0),
-                'aliq_pis_reais': parse_decimal(campos[28]) if len(campos) > 28 else Decimal(0),
-                'vl_pis': parse_decimal(campos[29]) if len(campos) > 29 else Decimal(0),
-                'cst_cofins': campos[30] if len(campos) > 30 else '',
-                'vl_bc_cofins': parse_decimal(campos[31]) if len(campos) > 31 else Decimal(0),
-                'aliq_cofins_percent': parse_decimal(campos[32]) if len(campos) > 32 else Decimal(0),
-                'quant_bc_cofins': parse_decimal(campos[33]) if len(campos) > 33 else Decimal(0),
-                'aliq_cofins_reais': parse_decimal(campos[34]) if len(campos) > 34 else Decimal(0),
-                'vl_cofins': parse_decimal(campos[35]) if len(campos) > 35 else Decimal(0),
-                'cod_cta': campos[36] if len(campos) > 36 else '',
-            }
-            current_c100['itens'].append(item)
-            registros['C170'].append(item)
-        
-        elif registro == 'C110' and current_c100:
-            c110_data = {
-                'cod_inf': campos[1] if len(campos) > 1 else '',
-                'txt_compl': campos[2] if len(campos) > 2 else '',
-            }
-            if 'complementares' not in current_c100:
-                current_c100['complementares'] = []
-            current_c100['complementares'].append(c110_data)
-            registros['C110'].append(c110_data)
-
-        elif registro == 'C113' and current_c100:
-            c113_data = {
-                'ind_oper': campos[1] if len(campos) > 1 else '',
-                'ind_emit': campos[2] if len(campos) > 2 else '',
-                'cod_part': campos[3] if len(campos) > 3 else '',
-                'cod_mod': campos[4] if len(campos) > 4 else '',
-                'ser': campos[5] if len(campos) > 5 else '',
-                'sub': campos[6] if len(campos) > 6 else '',
-                'num_doc': campos[7] if len(campos) > 7 else '',
-                'dt_doc': parse_date(campos[8]) if len(campos) > 8 else None,
-                'chv_nfe': campos[9] if len(campos) > 9 else '',
-            }
-            if 'referencias' not in current_c100:
-                current_c100['referencias'] = []
-            current_c100['referencias'].append(c113_data)
-            registros['C113'].append(c113_data)
-
-        elif registro == 'C190' and current_c100:
-            c190_data = {
-                'cst_icms': campos[1] if len(campos) > 1 else '',
-                'cfop': campos[2] if len(campos) > 2 else '',
-                'aliq_icms': parse_decimal(campos[3]) if len(campos) > 3 else Decimal(0),
-                'vl_opr': parse_decimal(campos[4]) if len(campos) > 4 else Decimal(0),
-                'vl_bc_icms': parse_decimal(campos[5]) if len(campos) > 5 else Decimal(0),
-                'vl_icms': parse_decimal(campos[6]) if len(campos) > 6 else Decimal(0),
-                'vl_bc_icms_st': parse_decimal(campos[7]) if len(campos) > 7 else Decimal(0),
-                'vl_icms_st': parse_decimal(campos[8]) if len(campos) > 8 else Decimal(0),
-                'vl_red_bc': parse_decimal(campos[9]) if len(campos) > 9 else Decimal(0),
-                'vl_ipi': parse_decimal(campos[10]) if len(campos) > 10 else Decimal(0),
-                'cod_obs': campos[11] if len(campos) > 11 else '',
-            }
-            if 'analiticos' not in current_c100:
-                current_c100['analiticos'] = []
-            current_c100['analiticos'].append(c190_data)
-            registros['C190'].append(c190_data)
-
-        elif registro == 'E111':
-            registros['E111'].append({
-                'cod_aj_apur': campos[1] if len(campos) > 1 else '',
-                'descr_compl_aj': campos[2] if len(campos) > 2 else '',
-                'vl_aj_apur': parse_decimal(campos[3]) if len(campos) > 3 else Decimal(0),
-            })
+            registros['C100'].append(dados)
+            for filho, chave in FILHOS_C100.items():
+                registros[filho].extend(dados.get(chave, []))
+        else:
+            registros.setdefault(registro, []).append(dados)
     
-    return registros
\ No newline at end of file
+    return registros
+
+
+def parse_sped_caminho(caminho, encoding='latin-1', only=None):
+    """Parse de um arquivo SPED lido do disco em blocos (usado pelo pool da importação)"""
+    with open(caminho, 'rb') as f:
+        return parse_sped_file(f, encoding, only=only)
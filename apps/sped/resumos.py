@@ -0,0 +1,187 @@
+"""
+Resumos por período (ResumoItem / ResumoDocumento / ComposicaoNF)
+
+Gerados ao final de processar_sped_completo a partir dos C170/C100 gravados,
+para que os relatórios leiam algumas linhas agregadas por período em vez de
+todos os itens; os relatórios só leem. Períodos importados antes dos resumos
+são resumidos pelo worker de importação com a fila vazia (garantir_resumos)
+ou por manage.py atualizar_resumos. A ComposicaoNF guarda as linhas da composição por NF já
+prontas (descrição do 0200, CFOP limpo e as diferenças do C190), indexadas
+para a paginação por (num_doc, cfop, codigo). Reimportar o período regera os
+resumos; excluí-lo os remove junto (CASCADE).
+"""
+import logging
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.utils import timezone
+
+from apps.sped.carga import gravar_em_lotes
+from apps.sped.models import (
+    ComposicaoNF, Registro0200, RegistroC100, RegistroC170, RegistroC190, ResumoDocumento, ResumoItem,
+)
+
+logger = logging.getLogger('sped.processamento')
+
+# Somas gravadas nos resumos: campo -> casas decimais
+# (no SQLite o Sum de DecimalField volta com resíduo de float)
+SOMAS_ITEM = {
+    'qtd': Decimal('0.00001'),
+    'vl_item': Decimal('0.01'),
+    'vl_bc_icms': Decimal('0.01'),
+    'vl_icms': Decimal('0.01'),
+    'vl_bc_pis': Decimal('0.01'),
+    'vl_pis': Decimal('0.01'),
+    'vl_bc_cofins': Decimal('0.01'),
+    'vl_cofins': Decimal('0.01'),
+}
+SOMAS_DOCUMENTO = ['vl_doc', 'vl_icms', 'vl_pis', 'vl_cofins']
+CENTAVOS = Decimal('0.01')
+LOTE_PRIMEIROS_ITENS = 500
+
+
+def _somas(linha, campos):
+    return {campo: (linha[campo] or Decimal('0')).quantize(casas) for campo, casas in campos.items()}
+
+
+def _primeiros_itens(ids):
+    """{id do C170: (cod_ncm, descr_compl)} dos itens informados, em blocos (limite de parâmetros do SQLite)"""
+    ids = iter(ids)
+    dados = {}
+    while bloco := list(islice(ids, LOTE_PRIMEIROS_ITENS)):
+        for id_item, ncm, descr in RegistroC170.objects.filter(id__in=bloco).values_list('id', 'cod_ncm', 'descr_compl'):
+            dados[id_item] = (ncm, descr)
+    return dados
+
+
+def _resumo_itens(registro_0000):
+    linhas = list(RegistroC170.objects.filter(registro_c100__registro_0000=registro_0000).values(
+        'registro_c100__ind_oper', 'registro_c100__cod_part', 'cod_item', 'cfop',
+    ).annotate(
+        primeiro=Min('id'),
+        itens=Count('id'),
+        **{campo: Sum(campo) for campo in SOMAS_ITEM},
+    ).order_by())
+    # NCM e descrição do primeiro item do grupo (Max() pegaria o maior texto, não o primeiro)
+    primeiros = _primeiros_itens(linha['primeiro'] for linha in linhas)
+    for linha in linhas:
+        ncm, descr = primeiros.get(linha['primeiro'], ('', ''))
+        yield ResumoItem(
+            registro_0000=registro_0000,
+            ind_oper=linha['registro_c100__ind_oper'],
+            cod_part=linha['registro_c100__cod_part'],
+            cod_item=linha['cod_item'],
+            cfop=linha['cfop'],
+            descr_compl=descr or '',
+            cod_ncm=ncm or '',
+            primeiro_item=linha['primeiro'],
+            qtd_itens=linha['itens'],
+            **_somas(linha, SOMAS_ITEM),
+        )
+
+
+def _resumo_documentos(registro_0000):
+    linhas = RegistroC100.objects.filter(registro_0000=registro_0000).values('ind_oper', 'cod_part').annotate(
+        primeiro=Min('id'),
+        documentos=Count('id'),
+        **{campo: Sum(campo) for campo in SOMAS_DOCUMENTO},
+    ).order_by()
+    for linha in linhas:
+        yield ResumoDocumento(
+            registro_0000=registro_0000,
+            ind_oper=linha['ind_oper'],
+            cod_part=linha['cod_part'],
+            primeiro_documento=linha['primeiro'],
+            qtd_documentos=linha['documentos'],
+            **_somas(linha, dict.fromkeys(SOMAS_DOCUMENTO, Decimal('0.01'))),
+        )
+
+
+def _limpar_cfop(cfop):
+    return (cfop or '').replace('.', '').strip()
+
+
+def _composicao(registro_0000):
+    """Itens C170 (entradas e saídas) e, nas entradas, a diferença entre o VL_OPR do C190 e os itens por NF/CFOP"""
+    descricoes = dict(Registro0200.objects.filter(registro_0000=registro_0000).values_list('cod_item', 'descr_item'))
+    soma_c170_por_nf_cfop = {}
+    itens = RegistroC170.objects.filter(registro_c100__registro_0000=registro_0000).order_by('id').values_list(
+        'registro_c100__ind_oper', 'registro_c100__num_doc', 'cfop', 'cod_item', 'descr_compl', 'vl_item',
+    )
+    for ind_oper, num_doc, cfop, cod_item, descr_compl, vl_item in itens.iterator():
+        num_doc = num_doc or ''
+        cfop_limpo = _limpar_cfop(cfop)
+        yield ComposicaoNF(
+            registro_0000=registro_0000,
+            ind_oper=ind_oper,
+            num_doc=num_doc,
+            cfop=cfop_limpo,
+            codigo=cod_item or '',
+            descricao=descricoes.get(cod_item, descr_compl or cod_item or ''),
+            valor=vl_item or Decimal('0'),
+        )
+        if ind_oper == '0':
+            chave = (num_doc, cfop_limpo)
+            soma_c170_por_nf_cfop[chave] = soma_c170_por_nf_cfop.get(chave, Decimal('0')) + (vl_item or Decimal('0'))
+
+    # VL_OPR do C190 por NF/CFOP
+    c190_por_nf_cfop = {}
+    c190_entrada = RegistroC190.objects.filter(
+        registro_c100__registro_0000=registro_0000, registro_c100__ind_oper='0',
+    ).exclude(cfop='').values('registro_c100__num_doc', 'cfop').annotate(vl_opr=Sum('vl_opr')).order_by()
+    for c190 in c190_entrada:
+        chave = (c190['registro_c100__num_doc'], _limpar_cfop(c190['cfop']))
+        vl_opr = (c190['vl_opr'] or Decimal('0')).quantize(CENTAVOS)
+        c190_por_nf_cfop[chave] = c190_por_nf_cfop.get(chave, Decimal('0')) + vl_opr
+
+    # Linhas "---": diferença entre o C190 VL_OPR e a soma dos C170 VL_ITEM
+    for (num_doc, cfop), vl_opr_c190 in sorted(c190_por_nf_cfop.items()):
+        soma_c170 = soma_c170_por_nf_cfop.get((num_doc, cfop), Decimal('0'))
+        diferenca = vl_opr_c190 - soma_c170
+        if diferenca > CENTAVOS:
+            descricao, valor = 'Outras Despesas (Frete/Seguro/Outros)', diferenca
+        elif diferenca < -CENTAVOS and soma_c170 == Decimal('0'):
+            # Documento sem C170 (ex: devolução) - usar valor integral do C190
+            descricao, valor = 'Valor da Operação (sem itens C170)', vl_opr_c190
+        else:
+            continue
+        yield ComposicaoNF(
+            registro_0000=registro_0000, ind_oper='0', num_doc=num_doc, cfop=cfop,
+            codigo='---', descricao=descricao, valor=valor,
+        )
+
+
+def atualizar_resumos(registro_0000):
+    """Regera os resumos do período a partir dos C100/C170 gravados"""
+    batch_size = settings.SPED_BULK_BATCH_SIZE
+    with transaction.atomic():
+        ResumoItem.objects.filter(registro_0000=registro_0000).delete()
+        ResumoDocumento.objects.filter(registro_0000=registro_0000).delete()
+        ComposicaoNF.objects.filter(registro_0000=registro_0000).delete()
+        itens = gravar_em_lotes(ResumoItem, _resumo_itens(registro_0000), batch_size)
+        documentos = gravar_em_lotes(ResumoDocumento, _resumo_documentos(registro_0000), batch_size)
+        linhas = gravar_em_lotes(ComposicaoNF, _composicao(registro_0000), batch_size)
+        # save() para o post_save invalidar o relatório em cache da empresa
+        registro_0000.resumos_em = timezone.now()
+        registro_0000.save(update_fields=['resumos_em'])
+    logger.info(f"Resumos do registro {registro_0000.id}: {itens} itens, {documentos} participantes, "
+                f"{linhas} linhas de composição")
+    return itens, documentos
+
+
+def garantir_resumos(registros_0000):
+    """
+    Gera os resumos dos períodos processados que ainda não os têm (importados
+    antes dos resumos); retorna os ids dos registros em que a geração falhou
+    """
+    falhas = set()
+    for registro in registros_0000.filter(processado=True, resumos_em__isnull=True).order_by('id'):
+        try:
+            atualizar_resumos(registro)
+        except Exception as e:
+            logger.error(f"Resumos do registro {registro.id} falharam: {e}", exc_info=True)
+            falhas.add(registro.id)
+    return falhas
@@ -0,0 +1,438 @@
+import copy
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import date
+from decimal import Decimal
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
+from unittest import mock, skipUnless
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+
+from apps.empresa.models import UF, Empresa
+from apps.sped.carga import CargaCopyPostgres, CargaEmLote, chave_c100
+from apps.sped.importacao import enfileirar_importacao, extrair_arquivos_sped, parsear_arquivos
+from apps.sped.models import (
+    ImportJob, Registro0000, Registro0150, Registro0200, RegistroC100, RegistroC110, RegistroC113, RegistroC170, RegistroC190,
+    RegistroE110, RegistroE111, ResumoItem,
+)
+
+from apps.sped.parser import (
+    DATA, DECIMAL, FILHOS_C100, LAYOUTS, iter_sped_records, parse_date, parse_decimal, parse_sped_caminho,
+    parse_sped_file, parse_sped_line,
+)
+
+# EFD ICMS/IPI de janeiro/2025: uma entrada com C110/C113/dois C170 (o segundo
+# sem os campos finais) e C190, uma saída só com C190, E110 e E111
+ARQUIVO_SPED = Path(__file__).parent / 'testdata' / 'efd_icms_012025.txt'
+
+
+def _conteudo():
+    return ARQUIVO_SPED.read_bytes()
+
+
+def _campo_a_campo(campos, layout):
+    """Parse anterior aos layouts: cada campo com o próprio len() e parse_decimal/parse_date"""
+    dados = {}
+    for nome, posicao, tipo in layout:
+        if tipo == DECIMAL:
+            dados[nome] = parse_decimal(campos[posicao]) if len(campos) > posicao else Decimal(0)
+        elif tipo == DATA:
+            dados[nome] = parse_date(campos[posicao]) if len(campos) > posicao else None
+        else:
+            dados[nome] = campos[posicao] if len(campos) > posicao else ''
+    return dados
+
+
+class IterSpedRecordsTests(SimpleTestCase):
+    def test_registros_na_ordem_do_arquivo(self):
+        registros = [registro for registro, _ in iter_sped_records(io.BytesIO(_conteudo()))]
+        self.assertEqual(registros, ['0000', '0150', '0150', '0200', '0200', 'C100', 'C100', 'E110', 'E111'])
+
+    def test_filhos_anexados_ao_c100(self):
+        documentos = [dados for registro, dados in iter_sped_records(io.BytesIO(_conteudo())) if registro == 'C100']
+        entrada, saida = documentos
+        self.assertEqual([item['num_item'] for item in entrada['itens']], ['1', '2'])
+        self.assertEqual([compl['cod_inf'] for compl in entrada['complementares']], ['01'])
+        self.assertEqual([ref['num_doc'] for ref in entrada['referencias']], ['999'])
+        self.assertEqual([analitico['cfop'] for analitico in entrada['analiticos']], ['1102'])
+        self.assertEqual(saida['itens'], [])
+        self.assertEqual([analitico['cfop'] for analitico in saida['analiticos']], ['5102'])
+
+    def test_blocos_pequenos_e_texto_dao_o_mesmo_resultado(self):
+        esperado = list(iter_sped_records(io.BytesIO(_conteudo())))
+        # Bloco menor que uma linha: as linhas são remontadas entre os blocos
+        self.assertEqual(list(iter_sped_records(io.BytesIO(_conteudo()), chunk_size=7)), esperado)
+        self.assertEqual(list(iter_sped_records(io.StringIO(_conteudo().decode('latin-1')))), esperado)
+
+    def test_parse_sped_file_junta_os_filhos(self):
+        dados = parse_sped_file(_conteudo())
+        self.assertEqual(dados, parse_sped_caminho(ARQUIVO_SPED))
+        self.assertEqual(len(dados['C100']), 2)
+        self.assertEqual([item['cod_item'] for item in dados['C170']], ['P001', 'P002'])
+        self.assertEqual(len(dados['C190']), 2)
+        self.assertEqual(dados['0000']['dt_ini'], date(2025, 1, 1))
+
+
+class LayoutsTests(SimpleTestCase):
+    def _linhas(self):
+        for linha in _conteudo().decode('latin-1').splitlines():
+            campos = parse_sped_line(linha)
+            if campos and campos[0] in LAYOUTS:
+                yield campos
+
+    def _registros_parseados(self):
+        """(registro, dados) na ordem das linhas, com os filhos do C100 fora dele"""
+        for registro, dados in iter_sped_records(io.BytesIO(_conteudo())):
+            if registro != 'C100':
+                yield registro, dados
+                continue
+            yield registro, {campo: valor for campo, valor in dados.items() if campo not in FILHOS_C100.values()}
+            filhos = []
+            for filho, chave in FILHOS_C100.items():
+                filhos.extend((filho, item) for item in dados.get(chave, []))
+            # Na ordem do arquivo: C110, C113, C170, C190
+            yield from sorted(filhos, key=lambda par: par[0])
+
+    def test_mesmo_resultado_que_o_parse_campo_a_campo(self):
+        esperados = [(campos[0], _campo_a_campo(campos, LAYOUTS[campos[0]])) for campos in self._linhas()]
+        obtidos = list(self._registros_parseados())
+        self.assertEqual([registro for registro, _ in obtidos], [registro for registro, _ in esperados])
+        for (registro, dados), (_, esperado) in zip(obtidos, esperados):
+            with self.subTest(registro=registro):
+                self.assertEqual(dados, esperado)
+                self.assertEqual({campo: type(valor) for campo, valor in dados.items()},
+                                 {campo: type(valor) for campo, valor in esperado.items()})
+
+    def test_valores_convertidos(self):
+        dados = parse_sped_file(_conteudo())
+        self.assertEqual(dados['0000']['cnpj'], '12345678000199')
+        self.assertEqual(dados['0000']['dt_fin'], date(2025, 1, 31))
+        self.assertEqual(dados['0150'][0]['end'], 'RUA A')
+        self.assertEqual(dados['0200'][1]['aliq_icms'], Decimal('12.00'))
+        self.assertEqual(dados['0200'][1]['cest'], '0100100')
+
+        entrada = dados['C100'][0]
+        self.assertEqual(entrada['chv_nfe'], '35250111222333000144550010000012341000012345')
+        self.assertEqual(entrada['dt_e_s'], date(2025, 1, 6))
+        self.assertEqual(entrada['vl_doc'], Decimal('1000.00'))
+        self.assertEqual(entrada['vl_pis'], Decimal('16.50'))
+
+        item, curto = dados['C170']
+        self.assertEqual(item['qtd'], Decimal('10.00000'))
+        self.assertEqual(item['aliq_pis_percent'], Decimal('1.6500'))
+        self.assertEqual(item['vl_cofins'], Decimal('45.60'))
+        # Campos ausentes no fim da linha: '' e Decimal(0)
+        self.assertEqual(curto['vl_icms'], Decimal('63.00'))
+        self.assertEqual(curto['cst_pis'], '')
+        self.assertEqual(curto['vl_cofins'], Decimal(0))
+
+        self.assertEqual(dados['C113'][0]['dt_doc'], date(2024, 12, 1))
+        self.assertEqual(dados['C190'][1]['vl_opr'], Decimal('500.00'))
+        self.assertEqual(dados['E110'][0]['vl_sld_credor_transportar'], Decimal('80.00'))
+        self.assertEqual(dados['E111'][0]['vl_aj_apur'], Decimal('10.00'))
+
+
+class SelecaoRegistrosTests(SimpleTestCase):
+    def test_only_devolve_so_os_registros_pedidos(self):
+        dados = parse_sped_file(_conteudo(), only={'E111'})
+        self.assertIsNone(dados['0000'])
+        self.assertEqual(dados['0150'], [])
+        self.assertEqual(dados['C100'], [])
+        self.assertEqual(dados['E110'], [])
+        self.assertEqual(dados['E111'], parse_sped_file(_conteudo())['E111'])
+
+    def test_only_com_filho_do_c100_traz_o_documento(self):
+        completo = parse_sped_file(_conteudo())
+        dados = parse_sped_file(_conteudo(), only={'C190'})
+        self.assertEqual(dados['C190'], completo['C190'])
+        self.assertEqual([doc['num_doc'] for doc in dados['C100']], ['1234', '5678'])
+        # Os demais filhos não são lidos
+        self.assertEqual(dados['C170'], [])
+        self.assertEqual(dados['C100'][0]['itens'], [])
+        self.assertEqual(dados['0200'], [])
+
+    def test_only_em_blocos_pequenos(self):
+        registros = list(iter_sped_records(io.BytesIO(_conteudo()), chunk_size=5, only={'0200', 'E110'}))
+        self.assertEqual([registro for registro, _ in registros], ['0200', '0200', 'E110'])
+
+
+class CargaEmLoteTests(TestCase):
+    classe_carga = CargaEmLote
+    MODELOS = [
+        Registro0150, Registro0200, RegistroC100, RegistroC110, RegistroC113, RegistroC170, RegistroC190,
+        RegistroE110, RegistroE111,
+    ]
+
+    def setUp(self):
+        uf = UF.objects.create(codigo=35, sigla='SP', nome='São Paulo')
+        empresa = Empresa.objects.create(cnpj_cpf='12.345.678/0001-99', razao_social='Empresa', uf=uf)
+        self.registro = Registro0000.objects.create(empresa=empresa, tipo='fiscal', periodo=date(2025, 1, 1))
+        self.dados = parse_sped_file(_conteudo())
+
+    def _carregar(self, dados):
+        carga = self.classe_carga(self.registro, batch_size=2)
+        carga.participantes_0150(dados['0150'])
+        carga.itens_0200(dados['0200'])
+        carga.documentos_c100(dados['C100'])
+        carga.apuracao_e110(dados)
+        return carga
+
+    def _contagens(self):
+        return {model.__name__: model.objects.count() for model in self.MODELOS}
+
+    def test_recarga_nao_duplica_e_atualiza(self):
+        self._carregar(self.dados)
+        contagens = self._contagens()
+        self.assertEqual(contagens, {
+            'Registro0150': 2, 'Registro0200': 2, 'RegistroC100': 2, 'RegistroC110': 1, 'RegistroC113': 1,
+            'RegistroC170': 2, 'RegistroC190': 2, 'RegistroE110': 1, 'RegistroE111': 1,
+        })
+
+        alterados = copy.deepcopy(self.dados)
+        alterados['0150'][0]['nome'] = 'FORNECEDOR RENOMEADO'
+        alterados['0200'][0]['cod_ncm'] = '25222000'
+        entrada = alterados['C100'][0]
+        entrada['vl_doc'] = Decimal('1100.00')
+        entrada['itens'][0]['vl_item'] = Decimal('650.00')
+        entrada['complementares'][0]['txt_compl'] = 'OBS ALTERADA'
+        entrada['analiticos'][0]['vl_opr'] = Decimal('1100.00')
+        alterados['E111'][0]['vl_aj_apur'] = Decimal('12.00')
+        self._carregar(alterados)
+
+        self.assertEqual(self._contagens(), contagens)
+        self.assertEqual(Registro0150.objects.get(cod_part='F001').nome, 'FORNECEDOR RENOMEADO')
+        self.assertEqual(RegistroC100.objects.get(num_doc='1234').vl_doc, Decimal('1100.00'))
+        item = RegistroC170.objects.get(registro_c100__num_doc='1234', num_item='1')
+        self.assertEqual(item.vl_item, Decimal('650.00'))
+        # NCM do C170 vem do 0200 da mesma carga
+        self.assertEqual(item.cod_ncm, '25222000')
+        self.assertEqual(RegistroC110.objects.get().txt_compl, 'OBS ALTERADA')
+        self.assertEqual(RegistroC190.objects.get(cfop='1102').vl_opr, Decimal('1100.00'))
+        self.assertEqual(RegistroE111.objects.get().vl_aj_apur, Decimal('12.00'))
+
+    def test_filhos_ligados_ao_c100_pela_chave_natural(self):
+        self._carregar(self.dados)
+        for doc in self.dados['C100']:
+            c100 = RegistroC100.objects.get(
+                registro_0000=self.registro, **dict(zip(['num_doc', 'ser', 'cod_mod', 'ind_oper'], chave_c100(doc))),
+            )
+            with self.subTest(num_doc=doc['num_doc']):
+                self.assertEqual(
+                    list(c100.itens.order_by('num_item').values_list('num_item', 'cod_item')),
+                    [(item['num_item'], item['cod_item']) for item in doc['itens']],
+                )
+                self.assertEqual(
+                    list(c100.analiticos_c190.values_list('cfop', flat=True)),
+                    [analitico['cfop'] for analitico in doc['analiticos']],
+                )
+                self.assertEqual(
+                    list(c100.referencias_c113.values_list('chv_nfe', flat=True)),
+                    [ref['chv_nfe'] for ref in doc.get('referencias', [])],
+                )
+
+
+@skipUnless(connection.vendor == 'postgresql', 'COPY só no PostgreSQL')
+class CargaCopyPostgresTests(CargaEmLoteTests):
+    classe_carga = CargaCopyPostgres
+
+
+def _zip(membros):
+    """Conteúdo de um ZIP com os membros {nome: bytes}"""
+    conteudo = io.BytesIO()
+    with zipfile.ZipFile(conteudo, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for nome, dados in membros.items():
+            zip_file.writestr(nome, dados)
+    return conteudo.getvalue()
+
+
+class WorkerImportacaoTests(TransactionTestCase):
+    # O worker chama close_old_connections(), que não convive com a transação do TestCase
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        configuracao = override_settings(MEDIA_ROOT=self.media, SPED_IMPORTACAO_PROCESSOS=1)
+        configuracao.enable()
+        self.addCleanup(configuracao.disable)
+
+    def test_uma_vez_importa_o_upload_e_termina(self):
+        upload = _zip({'janeiro/efd.txt': _conteudo()})
+        job = enfileirar_importacao(None, 'fiscal', SimpleUploadedFile('efd.zip', upload))
+        caminho_upload = job.arquivo.path
+
+        call_command('worker_importacao', '--uma-vez', stdout=io.StringIO(), stderr=io.StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'concluido')
+        self.assertEqual(job.fase, 'concluido')
+        self.assertEqual(job.tentativas, 1)
+        self.assertEqual((job.arquivos_total, job.arquivos_processados), (1, 1))
+        self.assertEqual(job.linhas_processadas, _conteudo().count(b'\n'))
+        self.assertEqual(job.relatorio['sucesso'], 1)
+        self.assertEqual(job.relatorio['detalhes'][0]['arquivo'], 'efd.txt')
+        self.assertFalse(os.path.exists(caminho_upload))
+
+        registro = Registro0000.objects.get(id__in=job.registros_ids)
+        self.assertTrue(registro.processado)
+        self.assertEqual(registro.periodo, date(2025, 1, 1))
+        self.assertEqual(registro.empresa.cnpj_cpf, '12.345.678/0001-99')
+        self.assertEqual(RegistroC170.objects.filter(registro_c100__registro_0000=registro).count(), 2)
+        self.assertEqual(RegistroE111.objects.filter(registro_0000=registro).count(), 1)
+
+    def test_upload_gz(self):
+        enfileirar_importacao(None, 'fiscal', SimpleUploadedFile('efd.txt.gz', gzip.compress(_conteudo())))
+        call_command('worker_importacao', '--uma-vez', stdout=io.StringIO())
+
+        job = ImportJob.objects.get()
+        self.assertEqual(job.status, 'concluido')
+        self.assertEqual(job.relatorio['detalhes'][0]['arquivo'], 'efd.txt')
+        self.assertTrue(Registro0000.objects.get(id__in=job.registros_ids).processado)
+
+    def test_uma_vez_com_fila_vazia(self):
+        saida = io.StringIO()
+        call_command('worker_importacao', '--uma-vez', stdout=saida)
+        self.assertIn('iniciado', saida.getvalue())
+        self.assertFalse(ImportJob.objects.exists())
+
+    def test_arquivo_ja_importado_e_pulado(self):
+        for _ in range(2):
+            enfileirar_importacao(None, 'fiscal', SimpleUploadedFile('efd.txt', _conteudo()))
+        call_command('worker_importacao', '--uma-vez', stdout=io.StringIO())
+
+        primeiro, segundo = ImportJob.objects.order_by('id')
+        self.assertEqual(primeiro.relatorio['sucesso'], 1)
+        self.assertEqual(segundo.status, 'concluido')
+        self.assertEqual(segundo.relatorio['pulados'], 1)
+        self.assertEqual(Registro0000.objects.count(), 1)
+
+    def test_fila_vazia_gera_resumos_pendentes(self):
+        enfileirar_importacao(None, 'fiscal', SimpleUploadedFile('efd.txt', _conteudo()))
+        call_command('worker_importacao', '--uma-vez', stdout=io.StringIO())
+        registro = Registro0000.objects.get()
+        itens = list(ResumoItem.objects.values_list('cod_item', 'cfop', 'vl_item').order_by('cod_item'))
+        self.assertTrue(itens)
+
+        # Período importado antes dos resumos
+        ResumoItem.objects.all().delete()
+        Registro0000.objects.update(resumos_em=None)
+        call_command('worker_importacao', '--uma-vez', stdout=io.StringIO())
+
+        registro.refresh_from_db()
+        self.assertIsNotNone(registro.resumos_em)
+        self.assertEqual(list(ResumoItem.objects.values_list('cod_item', 'cfop', 'vl_item').order_by('cod_item')), itens)
+
+    def test_falha_nos_resumos_nao_derruba_o_worker(self):
+        enfileirar_importacao(None, 'fiscal', SimpleUploadedFile('efd.txt', _conteudo()))
+        call_command('worker_importacao', '--uma-vez', stdout=io.StringIO())
+        Registro0000.objects.update(resumos_em=None)
+
+        with mock.patch('apps.sped.resumos.atualizar_resumos', side_effect=ValueError('falhou')) as atualizar:
+            call_command('worker_importacao', '--uma-vez', stdout=io.StringIO())
+        self.assertEqual(atualizar.call_count, 1)
+        self.assertIsNone(Registro0000.objects.get().resumos_em)
+
+
+class _PoolQuebrado:
+    """ProcessPoolExecutor cujo processo morre: no submit (submit_quebra) ou no resultado"""
+
+    def __init__(self, *args, submit_quebra=False, **kwargs):
+        self.submit_quebra = submit_quebra
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def submit(self, funcao, *args):
+        if self.submit_quebra:
+            raise BrokenProcessPool('pool encerrado')
+        futuro = Future()
+        futuro.set_exception(BrokenProcessPool('processo morto'))
+        return futuro
+
+
+class ParsearArquivosTests(SimpleTestCase):
+    def setUp(self):
+        pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, pasta, ignore_errors=True)
+        self.arquivos = []
+        for indice in range(3):
+            caminho = os.path.join(pasta, f'efd_{indice}.txt')
+            shutil.copyfile(ARQUIVO_SPED, caminho)
+            self.arquivos.append((f'efd_{indice}.txt', caminho, indice))
+        self.esperado = parse_sped_caminho(ARQUIVO_SPED)
+
+    def _conferir(self, resultados):
+        self.assertEqual([resultado[:3] for resultado in resultados], self.arquivos)
+        for _, _, _, dados, erro in resultados:
+            self.assertIsNone(erro)
+            self.assertEqual(dados, self.esperado)
+
+    def test_sem_pool(self):
+        self._conferir(list(parsear_arquivos(self.arquivos, processos=1)))
+
+    def test_pool_mantem_a_ordem(self):
+        self._conferir(list(parsear_arquivos(self.arquivos, processos=2)))
+
+    @override_settings(SPED_IMPORTACAO_MEMORIA_MB=0)
+    def test_orcamento_de_memoria_esgotado(self):
+        # Sem orçamento cada arquivo espera o anterior sair da fila
+        self._conferir(list(parsear_arquivos(self.arquivos, processos=2)))
+
+    def test_processo_morto_refaz_o_parse_local(self):
+        with mock.patch('apps.sped.importacao.ProcessPoolExecutor', _PoolQuebrado):
+            self._conferir(list(parsear_arquivos(self.arquivos, processos=2)))
+
+    def test_pool_encerrado_no_envio(self):
+        with mock.patch('apps.sped.importacao.ProcessPoolExecutor', partial(_PoolQuebrado, submit_quebra=True)):
+            self._conferir(list(parsear_arquivos(self.arquivos, processos=2)))
+
+
+class ExtracaoUploadTests(SimpleTestCase):
+    def setUp(self):
+        self.pasta = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.pasta, ignore_errors=True)
+
+    def _extrair(self, conteudo, nome):
+        arquivos = extrair_arquivos_sped(io.BytesIO(conteudo), nome, self.pasta)
+        extraidos = []
+        for nome_arquivo, caminho, linhas in arquivos:
+            self.assertEqual(os.path.dirname(caminho), self.pasta)
+            with open(caminho, 'rb') as f:
+                extraidos.append((nome_arquivo, f.read(), linhas))
+        return extraidos
+
+    def test_txt(self):
+        self.assertEqual(self._extrair(_conteudo(), 'efd.txt'), [('efd.txt', _conteudo(), _conteudo().count(b'\n'))])
+
+    def test_gz(self):
+        extraidos = self._extrair(gzip.compress(_conteudo()), 'efd.TXT.gz')
+        self.assertEqual(extraidos, [('efd.TXT', _conteudo(), _conteudo().count(b'\n'))])
+
+    def test_zip_aninhado(self):
+        interno = _zip({'fev/efd_02.txt': b'|0000|\n', 'efd_03.txt.gz': gzip.compress(b'|0000|\n|9999|\n')})
+        upload = _zip({
+            'efd_01.txt': _conteudo(),
+            'outros.zip': interno,
+            'leia-me.pdf': b'%PDF',
+            '__MACOSX/efd_01.txt': b'lixo',
+        })
+        extraidos = self._extrair(upload, 'lote.zip')
+        self.assertEqual(extraidos, [
+            ('efd_01.txt', _conteudo(), _conteudo().count(b'\n')),
+            ('efd_02.txt', b'|0000|\n', 1),
+            ('efd_03.txt', b'|0000|\n|9999|\n', 2),
+        ])
+        # O ZIP interno vai para o disco só enquanto é lido
+        self.assertEqual(len(os.listdir(self.pasta)), 3)
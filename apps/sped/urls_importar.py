@@ -5,6 +5,7 @@ app_name = 'sped_importar'
 
 urlpatterns = [
     path('', views.importar_sped, name='importar'),
+    path('status/<int:job_id>/', views.status_importacao, name='status_importacao'),
     path('consultar-participantes/<int:registro_id>/', views.consultar_participantes, name='consultar_participantes'),
     path('status-participantes/<int:registro_id>/', views.status_participantes, name='status_participantes'),
     path('listar-participantes-pendentes/<int:registro_id>/', views.listar_participantes_pendentes, name='listar_participantes_pendentes'),
@@ -0,0 +1,160 @@
+"""
+Fila de jobs no banco, processada por workers (manage.py worker_*)
+
+Usada por ImportJob (worker_importacao), BuscaProdutosAPI (worker_busca_api)
+e ImportacaoXML (worker_importacao_xml). O model da fila tem status
+(pendente/processando/concluido/erro), tentativas, mensagem, iniciado_em,
+finalizado_em e updated_at; cada app só implementa a execução do job.
+
+Pode haver mais de um worker: a reserva é um UPDATE condicional. Enquanto o
+job roda, o worker atualiza updated_at a cada INTERVALO_BATIMENTO segundos;
+jobs sem esse sinal pelo timeout da fila (worker morto por deploy/reinício)
+voltam para ela, até MAX_TENTATIVAS vezes.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connection
+from django.db.models import F
+from django.utils import timezone
+
+# Após este número de tentativas um job interrompido vai para erro
+MAX_TENTATIVAS = 3
+
+# Segundos entre os sinais de vida do worker
+INTERVALO_BATIMENTO = 15
+
+
+def reservar_proximo(model):
+    """Marca o job pendente mais antigo como em processamento; None se a fila estiver vazia"""
+    pendentes = model.objects.filter(status='pendente').order_by('created_at').values_list('id', flat=True)
+    for job_id in pendentes[:10]:
+        agora = timezone.now()
+        # UPDATE condicional: só um worker consegue reservar o job
+        reservado = model.objects.filter(id=job_id, status='pendente').update(
+            status='processando',
+            iniciado_em=agora,
+            updated_at=agora,
+            tentativas=F('tentativas') + 1,
+        )
+        if reservado:
+            return model.objects.get(id=job_id)
+    return None
+
+
+def recuperar_interrompidos(model, timeout_minutos, mensagem, **campos_fila):
+    """
+    Devolve para a fila os jobs em processamento sem sinal de vida há mais de
+    timeout_minutos; os que já tiveram MAX_TENTATIVAS vão para erro com a
+    mensagem. campos_fila são gravados junto ao voltar (ex.: fase='na_fila').
+    Retorna quantos voltaram.
+    """
+    agora = timezone.now()
+    limite = agora - timedelta(minutes=timeout_minutos)
+    interrompidos = model.objects.filter(status='processando', updated_at__lt=limite)
+
+    interrompidos.filter(tentativas__gte=MAX_TENTATIVAS).update(
+        status='erro',
+        mensagem=mensagem,
+        finalizado_em=agora,
+        updated_at=agora,
+    )
+    return interrompidos.update(status='pendente', updated_at=agora, **campos_fila)
+
+
+class WorkerFila(BaseCommand):
+    """
+    Comando base dos workers. A subclasse define model, titulo (mensagens do
+    worker), rotulo (de cada job), timeout (nome do setting, em minutos),
+    mensagem_interrompido e executar(job); campos_fila, logger e ocioso() são
+    opcionais.
+    """
+    model = None
+    titulo = ''
+    rotulo = 'Job'
+    timeout = ''
+    mensagem_interrompido = 'Interrompido repetidas vezes'
+    campos_fila = {}
+    logger = logging.getLogger(__name__)
+
+    def add_arguments(self, parser):
+        parser.add_argument('--uma-vez', action='store_true', help='Esvazia a fila e termina')
+        parser.add_argument('--intervalo', type=float, default=2, help='Segundos entre consultas à fila vazia')
+
+    def executar(self, job):
+        raise NotImplementedError
+
+    def descrever(self, job):
+        """Linha exibida ao iniciar o job"""
+        return str(job)
+
+    def resumir(self, job):
+        """Linha exibida ao concluir o job"""
+        return job.mensagem
+
+    def ocioso(self):
+        """Trabalho de fundo feito com a fila vazia, antes de esperar pelo próximo job"""
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Worker de {self.titulo} iniciado')
+        while True:
+            close_old_connections()
+            try:
+                recuperados = recuperar_interrompidos(
+                    self.model, getattr(settings, self.timeout), self.mensagem_interrompido, **self.campos_fila,
+                )
+                job = reservar_proximo(self.model)
+            except DatabaseError as e:
+                # SQLite bloqueia o banco enquanto outro worker grava uma importação; tenta de novo
+                self.logger.warning(f"Fila de {self.titulo} indisponível: {e}")
+                time.sleep(options['intervalo'])
+                continue
+
+            if recuperados:
+                self.stdout.write(f'{recuperados} job(s) interrompido(s) devolvido(s) à fila')
+
+            if job is None:
+                try:
+                    self.ocioso()
+                except DatabaseError as e:
+                    self.logger.warning(f"Trabalho de fundo de {self.titulo} adiado: {e}")
+                if options['uma_vez']:
+                    return
+                time.sleep(options['intervalo'])
+                continue
+
+            self.stdout.write(f'{self.rotulo} {job.id}: {self.descrever(job)}')
+            self._executar(job)
+
+    def _executar(self, job):
+        parar = threading.Event()
+        batimento = threading.Thread(target=self._batimento, args=(job.id, parar), daemon=True)
+        batimento.start()
+        try:
+            self.executar(job)
+            self.stdout.write(f'{self.rotulo} {job.id}: {self.resumir(job)}')
+        except Exception as e:
+            self.logger.error(f"{self.rotulo} {job.id} falhou: {e}", exc_info=True)
+            self.model.objects.filter(id=job.id).update(
+                status='erro', mensagem=str(e), finalizado_em=timezone.now(), updated_at=timezone.now(),
+            )
+            self.stderr.write(f'{self.rotulo} {job.id} falhou: {e}')
+        finally:
+            parar.set()
+            batimento.join()
+
+    def _batimento(self, job_id, parar):
+        """Sinal de vida do worker enquanto o job roda (conexão própria da thread)"""
+        try:
+            while not parar.wait(INTERVALO_BATIMENTO):
+                try:
+                    self.model.objects.filter(id=job_id, status='processando').update(updated_at=timezone.now())
+                except Exception as e:
+                    # SQLite bloqueia escrita concorrente durante as gravações do job; tenta no próximo ciclo
+                    self.logger.debug(f"Batimento de {self.rotulo} {job_id} falhou: {e}")
+        finally:
+            connection.close()
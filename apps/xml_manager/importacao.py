@@ -0,0 +1,275 @@
+"""
+Importação de ZIP com XML de NF-e/NFC-e (ImportacaoXML)
+
+A view só grava o upload e enfileira; o worker (python manage.py
+worker_importacao_xml) lê os XML num pool de processos (apps.xml_manager.parser),
+XML_POR_TAREFA por tarefa. A cada lote devolvido pelo pool:
+- o XML fica no armazém (media/xml_nfe) e os produtos no cache (media/xml_cache),
+  então a busca via API não consulta mais essas chaves;
+- com período informado, os produtos das notas do SPED da empresa no período
+  são gravados de uma vez (bulk_create), como na busca via API.
+"""
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files import File
+from django.utils import timezone
+
+from apps.dashboards import armazem_xml, meudanfe
+from apps.dashboards.busca_api import IND_OPER, MODELOS, chaves_entrada_sem_itens, chaves_saida, gravar_produtos
+from apps.xml_manager.models import ImportacaoXML
+from apps.xml_manager.parser import fechar_zip, processar_xmls
+
+logger = logging.getLogger('xml_manager.importacao')
+
+# XML lidos por tarefa do pool (e gravados por lote)
+XML_POR_TAREFA = 200
+
+# Tarefas em andamento por processo do pool (limita os resultados na memória)
+TAREFAS_POR_PROCESSO = 2
+
+# XML com erro guardados no relatório
+MAX_ERROS_RELATORIO = 500
+
+# Bloco de cópia dos streams para o disco (1 MB)
+TAMANHO_BLOCO = 1024 * 1024
+
+
+# ========================================
+# ARQUIVOS
+# ========================================
+
+def compactar_xmls(arquivos):
+    """ZIP (arquivo temporário) com os XML enviados soltos, para virar uma única importação"""
+    destino = tempfile.TemporaryFile()
+    with zipfile.ZipFile(destino, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for arquivo in arquivos:
+            with zf.open(os.path.basename(arquivo.name), 'w') as membro:
+                for bloco in arquivo.chunks(TAMANHO_BLOCO):
+                    membro.write(bloco)
+    destino.seek(0)
+    return File(destino, name='xmls.zip')
+
+
+def _copiar_para_disco(stream, pasta, sufixo):
+    fd, caminho = tempfile.mkstemp(dir=pasta, suffix=sufixo)
+    with os.fdopen(fd, 'wb') as destino:
+        shutil.copyfileobj(stream, destino, TAMANHO_BLOCO)
+    return caminho
+
+
+def listar_xmls(caminho_zip, pasta):
+    """[(caminho do ZIP, [membros .xml])] do ZIP e dos ZIP dentro dele (extraídos para pasta)"""
+    membros = []
+    internos = []
+    with zipfile.ZipFile(caminho_zip) as zf:
+        for info in zf.infolist():
+            nome = info.filename
+            if info.is_dir() or nome.startswith('__MACOSX'):
+                continue
+            if nome.lower().endswith('.xml'):
+                membros.append(nome)
+            elif nome.lower().endswith('.zip'):
+                with zf.open(info) as stream:
+                    internos.append(_copiar_para_disco(stream, pasta, '.zip'))
+    zips = [(caminho_zip, membros)] if membros else []
+    for interno in internos:
+        zips.extend(listar_xmls(interno, pasta))
+    return zips
+
+
+def _tarefas(zips):
+    return [
+        (caminho, membros[inicio:inicio + XML_POR_TAREFA])
+        for caminho, membros in zips
+        for inicio in range(0, len(membros), XML_POR_TAREFA)
+    ]
+
+
+def ler_xmls(zips, processos=None):
+    """
+    Gera o resultado de processar_xmls de cada tarefa, na ordem. Com mais de um
+    processo as tarefas rodam num pool (spawn: o parser não usa Django nem o
+    banco) enquanto o chamador grava os lotes anteriores.
+    """
+    tarefas = _tarefas(zips)
+    raiz = armazem_xml.pasta_raiz()
+    if processos is None:
+        processos = settings.XML_IMPORTACAO_PROCESSOS or os.cpu_count() or 1
+    processos = min(processos, len(tarefas))
+
+    if processos <= 1:
+        try:
+            for caminho, membros in tarefas:
+                yield processar_xmls(caminho, membros, raiz)
+        finally:
+            # No Windows o ZIP aberto não pode ser apagado
+            fechar_zip()
+        return
+
+    logger.info(f"Leitura paralela: {processos} processos, {len(tarefas)} tarefas")
+    contexto = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=processos, mp_context=contexto) as pool:
+        fila = deque()
+
+        def proximo():
+            caminho, membros, futuro = fila.popleft()
+            if futuro is not None:
+                try:
+                    return futuro.result()
+                except BrokenProcessPool:
+                    # Processo do pool morto (ex.: falta de memória): refaz aqui mesmo
+                    logger.warning(f"Pool de leitura interrompido; lendo {len(membros)} XML localmente")
+            try:
+                return processar_xmls(caminho, membros, raiz)
+            finally:
+                fechar_zip()
+
+        for caminho, membros in tarefas:
+            while len(fila) >= processos * TAREFAS_POR_PROCESSO:
+                yield proximo()
+            try:
+                futuro = pool.submit(processar_xmls, caminho, membros, raiz)
+            except BrokenProcessPool:
+                futuro = None
+            fila.append((caminho, membros, futuro))
+        while fila:
+            yield proximo()
+
+
+# ========================================
+# FILA (ImportacaoXML)
+# ========================================
+
+def enfileirar_importacao_xml(usuario, empresa_id, arquivo, periodo_inicial='', periodo_final=''):
+    """Grava o upload (ZIP) no storage e cria a importação pendente"""
+    importacao = ImportacaoXML.objects.create(
+        usuario=usuario,
+        empresa_id=empresa_id,
+        periodo_inicial=periodo_inicial,
+        periodo_final=periodo_final,
+        arquivo=arquivo,
+        nome_arquivo=arquivo.name,
+    )
+    logger.info(f"Importação XML {importacao.id} enfileirada: {importacao.nome_arquivo}")
+    return importacao
+
+
+# ========================================
+# EXECUÇÃO
+# ========================================
+
+def _notas_periodo(importacao):
+    """
+    Notas do SPED da empresa no período: ({chave: [(tipo, chave da nota)]},
+    {chave referenciada: [chave da nota de entrada]}). Vazio sem período.
+    """
+    alvos = {}
+    referenciadas = {}
+    if not importacao.periodo_inicial or not importacao.periodo_final:
+        return alvos, referenciadas
+    periodo = (importacao.empresa_id, importacao.periodo_inicial, importacao.periodo_final)
+    for tipo, listar in (('saida', chaves_saida), ('entrada', chaves_entrada_sem_itens)):
+        nfe, nfce = listar(*periodo)
+        for nota in nfe + nfce:
+            alvos.setdefault(nota['chave_nfe'], []).append((tipo, nota['chave_nfe']))
+            if nota.get('chave_referenciada'):
+                referenciadas.setdefault(nota['chave_referenciada'], []).append(nota['chave_nfe'])
+    return alvos, referenciadas
+
+
+def _ind_oper(nota, alvos, raiz_cnpj):
+    """Entrada/saída do ponto de vista da empresa (para a pasta do cache)"""
+    for tipo, _ in alvos.get(nota['chave'], ()):
+        return IND_OPER[tipo]
+    if nota['chave'][6:14] == raiz_cnpj:
+        return nota['ind_oper']
+    return IND_OPER['entrada']
+
+
+def _salvar_progresso(importacao, *campos):
+    importacao.save(update_fields=list(campos) + ['updated_at'])
+
+
+def executar_importacao_xml(importacao):
+    """Lê os XML do ZIP e grava armazém, cache e produtos do período (chamado pelo worker)"""
+    alvos, referenciadas = _notas_periodo(importacao)
+    raiz_cnpj = ''.join(filter(str.isdigit, importacao.empresa.cnpj_cpf))[:8]
+    periodo = (importacao.empresa_id, importacao.periodo_inicial, importacao.periodo_final)
+
+    importacao.xml_processados = importacao.notas = importacao.ignorados = importacao.erros = 0
+    importacao.notas_periodo = importacao.produtos = 0
+    importacao.relatorio = {'erros': []}
+    pastas = {}
+    gravadas = set()
+    # Produtos da nota referenciada (devolução), usados se a nota de entrada não vier no ZIP
+    por_referencia = {}
+
+    pasta = tempfile.mkdtemp(prefix='xml_importacao_')
+    try:
+        importacao.arquivo.open('rb')
+        try:
+            caminho_zip = _copiar_para_disco(importacao.arquivo, pasta, '.zip')
+        finally:
+            importacao.arquivo.close()
+        zips = listar_xmls(caminho_zip, pasta)
+        importacao.xml_total = sum(len(membros) for _, membros in zips)
+        _salvar_progresso(importacao, 'xml_total', 'xml_processados', 'notas', 'ignorados', 'erros',
+                          'notas_periodo', 'produtos', 'relatorio')
+        logger.info(f"Importação XML {importacao.id}: {importacao.xml_total} XML, {len(alvos)} notas no período")
+
+        for resultados in ler_xmls(zips):
+            cache = []
+            produtos_periodo = {'saida': {}, 'entrada': {}}
+            for membro, nota, erro in resultados:
+                importacao.xml_processados += 1
+                if erro is not None:
+                    importacao.erros += 1
+                    if len(importacao.relatorio['erros']) < MAX_ERROS_RELATORIO:
+                        importacao.relatorio['erros'].append({'arquivo': membro, 'erro': erro})
+                    continue
+                if nota is None:
+                    importacao.ignorados += 1
+                    continue
+                importacao.notas += 1
+                cache.append((nota['chave'], _ind_oper(nota, alvos, raiz_cnpj), nota['produtos'], nota['numero']))
+                for tipo, chave_nota in alvos.get(nota['chave'], ()):
+                    produtos_periodo[tipo][chave_nota] = nota['produtos']
+                for chave_nota in referenciadas.get(nota['chave'], ()):
+                    por_referencia[chave_nota] = nota['produtos']
+
+            meudanfe.salvar_caches_xml(cache, pastas)
+            for tipo, produtos_por_chave in produtos_periodo.items():
+                importacao.produtos += gravar_produtos(MODELOS[tipo], *periodo, produtos_por_chave)
+                gravadas.update((tipo, chave) for chave in produtos_por_chave)
+            _salvar_progresso(importacao, 'xml_processados', 'notas', 'ignorados', 'erros', 'produtos', 'relatorio')
+
+        referencias = {chave: produtos for chave, produtos in por_referencia.items() if ('entrada', chave) not in gravadas}
+        importacao.produtos += gravar_produtos(MODELOS['entrada'], *periodo, referencias)
+        gravadas.update(('entrada', chave) for chave in referencias)
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+    importacao.notas_periodo = len(gravadas)
+    importacao.status = 'concluido'
+    importacao.mensagem = (
+        f"{importacao.notas} nota(s) importada(s), {importacao.ignorados} XML ignorado(s), "
+        f"{importacao.erros} com erro."
+    )
+    if alvos:
+        importacao.mensagem += f" {importacao.produtos} produto(s) gravado(s) em {importacao.notas_periodo} nota(s) do período."
+    importacao.finalizado_em = timezone.now()
+    # Os XML do upload já estão no armazém (media/xml_nfe); o ZIP só serviria para reexecutar.
+    # Removido antes do save para o campo arquivo também ficar vazio no banco
+    importacao.arquivo.delete(save=False)
+    importacao.save()
+    logger.info(f"Importação XML {importacao.id} concluída: {importacao.mensagem}")
+    return importacao
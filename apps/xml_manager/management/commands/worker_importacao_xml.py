@@ -0,0 +1,32 @@
+"""
+Worker das importações de ZIP com XML de NF-e (ImportacaoXML)
+
+Uso: python manage.py worker_importacao_xml [--uma-vez] [--intervalo 2]
+
+Reserva, batimento e recuperação das importações ficam em
+apps.utilitarios.fila. Cada worker lê os XML com XML_IMPORTACAO_PROCESSOS
+processos. Importações sem sinal de vida por XML_IMPORTACAO_TIMEOUT_MINUTOS
+voltam para a fila; refazer é seguro, pois XML já armazenados não são
+regravados e os produtos das chaves são substituídos.
+"""
+import logging
+
+from apps.utilitarios.fila import WorkerFila
+from apps.xml_manager.importacao import executar_importacao_xml
+from apps.xml_manager.models import ImportacaoXML
+
+
+class Command(WorkerFila):
+    help = 'Processa a fila de importações de ZIP com XML de NF-e (ImportacaoXML)'
+    model = ImportacaoXML
+    titulo = 'importação de XML'
+    rotulo = 'Importação XML'
+    timeout = 'XML_IMPORTACAO_TIMEOUT_MINUTOS'
+    mensagem_interrompido = 'Importação interrompida repetidas vezes'
+    logger = logging.getLogger('xml_manager.importacao')
+
+    def executar(self, importacao):
+        executar_importacao_xml(importacao)
+
+    def descrever(self, importacao):
+        return importacao.nome_arquivo
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('empresa', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportacaoXML',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo_inicial', models.CharField(blank=True, max_length=7, verbose_name='Período Inicial')),
+                ('periodo_final', models.CharField(blank=True, max_length=7, verbose_name='Período Final')),
+                ('arquivo', models.FileField(upload_to='importacoes_xml/', verbose_name='Arquivo enviado')),
+                ('nome_arquivo', models.CharField(max_length=255, verbose_name='Nome do arquivo')),
+                ('status', models.CharField(choices=[('pendente', 'Na fila'), ('processando', 'Processando'), ('concluido', 'Concluída'), ('erro', 'Erro')], default='pendente', max_length=20)),
+                ('xml_total', models.PositiveIntegerField(default=0, verbose_name='XML no arquivo')),
+                ('xml_processados', models.PositiveIntegerField(default=0)),
+                ('notas', models.PositiveIntegerField(default=0, verbose_name='NF-e/NFC-e lidas')),
+                ('ignorados', models.PositiveIntegerField(default=0, verbose_name='XML que não são de NF-e')),
+                ('erros', models.PositiveIntegerField(default=0)),
+                ('notas_periodo', models.PositiveIntegerField(default=0, verbose_name='Notas do período com produtos gravados')),
+                ('produtos', models.PositiveIntegerField(default=0, verbose_name='Produtos gravados')),
+                ('tentativas', models.PositiveSmallIntegerField(default=0)),
+                ('relatorio', models.JSONField(blank=True, default=dict, verbose_name='XML com erro')),
+                ('mensagem', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True)),
+                ('finalizado_em', models.DateTimeField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('empresa', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='importacoes_xml', to='empresa.empresa')),
+                ('usuario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Importação de XML',
+                'verbose_name_plural': 'Importações de XML',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='xml_manager_status_c949a9_idx')],
+            },
+        ),
+    ]
@@ -1 +1,60 @@
 # Models do XML Manager
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+from apps.empresa.models import Empresa
+
+
+class ImportacaoXML(models.Model):
+    """Importação de ZIP com XML de NF-e/NFC-e, executada pelo worker (manage.py worker_importacao_xml)"""
+    STATUS_CHOICES = [
+        ('pendente', 'Na fila'),
+        ('processando', 'Processando'),
+        ('concluido', 'Concluída'),
+        ('erro', 'Erro'),
+    ]
+
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    empresa = models.ForeignKey(Empresa, on_delete=models.CASCADE, related_name='importacoes_xml')
+    # Com o período, os produtos das notas do SPED da empresa no período são gravados (ProdutoSaidaAPI/ProdutoEntradaAPI)
+    periodo_inicial = models.CharField('Período Inicial', max_length=7, blank=True)
+    periodo_final = models.CharField('Período Final', max_length=7, blank=True)
+    arquivo = models.FileField('Arquivo enviado', upload_to='importacoes_xml/')
+    nome_arquivo = models.CharField('Nome do arquivo', max_length=255)
+
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pendente')
+    xml_total = models.PositiveIntegerField('XML no arquivo', default=0)
+    xml_processados = models.PositiveIntegerField(default=0)
+    notas = models.PositiveIntegerField('NF-e/NFC-e lidas', default=0)
+    ignorados = models.PositiveIntegerField('XML que não são de NF-e', default=0)
+    erros = models.PositiveIntegerField(default=0)
+    notas_periodo = models.PositiveIntegerField('Notas do período com produtos gravados', default=0)
+    produtos = models.PositiveIntegerField('Produtos gravados', default=0)
+    tentativas = models.PositiveSmallIntegerField(default=0)
+    relatorio = models.JSONField('XML com erro', default=dict, blank=True)
+    mensagem = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    iniciado_em = models.DateTimeField(null=True, blank=True)
+    finalizado_em = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Importação de XML'
+        verbose_name_plural = 'Importações de XML'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Importação XML {self.id} - {self.nome_arquivo} - {self.get_status_display()}"
+
+    @property
+    def xml_por_segundo(self):
+        if not self.iniciado_em or not self.xml_processados:
+            return 0
+        fim = self.finalizado_em or timezone.now()
+        segundos = (fim - self.iniciado_em).total_seconds()
+        return round(self.xml_processados / segundos) if segundos > 0 else 0
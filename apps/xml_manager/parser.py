@@ -0,0 +1,192 @@
+"""
+Parser dos XML de NF-e / NFC-e (itens da nota)
+
+Lê o XML com lxml.iterparse: cada <det> é convertido e descartado em seguida,
+então a memória não cresce com o número de itens. Não usa Django nem o banco,
+para rodar nos processos do pool da importação (spawn).
+"""
+import zipfile
+from decimal import Decimal, InvalidOperation
+from io import BytesIO
+
+from lxml import etree
+
+from apps.dashboards import armazem_xml
+
+NS = '{http://www.portalfiscal.inf.br/nfe}'
+
+TAG_INF_NFE = f'{NS}infNFe'
+TAG_IDE = f'{NS}ide'
+TAG_DET = f'{NS}det'
+TAG_CH_NFE = f'{NS}chNFe'
+
+ZERO = Decimal('0')
+
+
+def _decimal(texto):
+    if not texto:
+        return ZERO
+    try:
+        return Decimal(texto.strip())
+    except InvalidOperation:
+        return ZERO
+
+
+def _textos(elemento):
+    """{nome local: texto} dos filhos diretos (uma passada, em vez de um findtext por campo)"""
+    if elemento is None:
+        return {}
+    return {
+        filho.tag[len(NS):]: (filho.text or '').strip()
+        for filho in elemento
+        if isinstance(filho.tag, str) and filho.tag.startswith(NS)
+    }
+
+
+def _grupo(imposto, nome, subgrupos=None):
+    """Campos do grupo de tributação (ex.: ICMS/ICMS00); subgrupos limita os filhos aceitos"""
+    if imposto is None:
+        return {}
+    tributo = imposto.find(f'{NS}{nome}')
+    if tributo is None:
+        return {}
+    for filho in tributo:
+        if not isinstance(filho.tag, str) or len(filho) == 0:
+            continue
+        if subgrupos is None or filho.tag[len(NS):] in subgrupos:
+            return _textos(filho)
+    return {}
+
+
+def _item(det):
+    prod = _textos(det.find(f'{NS}prod'))
+    imposto = det.find(f'{NS}imposto')
+    icms = _grupo(imposto, 'ICMS')
+    # Em IPI os primeiros filhos são campos do enquadramento (cEnq, CNPJProd...)
+    ipi = _grupo(imposto, 'IPI', ('IPITrib', 'IPINT'))
+    pis = _grupo(imposto, 'PIS')
+    cofins = _grupo(imposto, 'COFINS')
+    return {
+        'num_item': det.get('nItem', ''),
+        'codigo': prod.get('cProd', ''),
+        'ean': prod.get('cEAN', ''),
+        'descricao': prod.get('xProd', ''),
+        'ncm': prod.get('NCM', ''),
+        'cest': prod.get('CEST', ''),
+        'cfop': prod.get('CFOP', ''),
+        'unidade': prod.get('uCom', ''),
+        'quantidade': _decimal(prod.get('qCom')),
+        'valor_unitario': _decimal(prod.get('vUnCom')),
+        'valor_total': _decimal(prod.get('vProd')),
+        'icms_cst': icms.get('CST') or icms.get('CSOSN', ''),
+        'icms_aliq': _decimal(icms.get('pICMS')),
+        'icms_valor': _decimal(icms.get('vICMS')),
+        'icms_st_valor': _decimal(icms.get('vICMSST')),
+        'icms_st_bc': _decimal(icms.get('vBCST')),
+        'ipi_cst': ipi.get('CST', ''),
+        'ipi_aliq': _decimal(ipi.get('pIPI')),
+        'ipi_valor': _decimal(ipi.get('vIPI')),
+        'pis_cst': pis.get('CST', ''),
+        'pis_aliq': _decimal(pis.get('pPIS')),
+        'pis_valor': _decimal(pis.get('vPIS')),
+        'cofins_cst': cofins.get('CST', ''),
+        'cofins_aliq': _decimal(cofins.get('pCOFINS')),
+        'cofins_valor': _decimal(cofins.get('vCOFINS')),
+    }
+
+
+def extrair_nfe(fonte):
+    """
+    Dados da NF-e/NFC-e do XML (bytes ou arquivo): {chave, modelo, ind_oper,
+    numero, produtos}, ou None se o XML não for de NF-e (CT-e, evento...).
+    Valores numéricos em Decimal.
+    """
+    if isinstance(fonte, bytes):
+        fonte = BytesIO(fonte)
+    nota = {'chave': '', 'modelo': '', 'ind_oper': '', 'numero': ''}
+    eh_nfe = False
+    chave_protocolo = ''
+    produtos = []
+    contexto = etree.iterparse(
+        fonte, events=('end',), tag=(TAG_INF_NFE, TAG_IDE, TAG_DET, TAG_CH_NFE),
+        resolve_entities=False, no_network=True,
+    )
+    for _, elemento in contexto:
+        if elemento.tag == TAG_DET:
+            produtos.append(_item(elemento))
+            # Libera o item lido e os anteriores
+            elemento.clear()
+            while elemento.getprevious() is not None:
+                del elemento.getparent()[0]
+        elif elemento.tag == TAG_IDE:
+            ide = _textos(elemento)
+            nota.update(modelo=ide.get('mod', ''), ind_oper=ide.get('tpNF', ''), numero=ide.get('nNF', ''))
+        elif elemento.tag == TAG_INF_NFE:
+            eh_nfe = True
+            identificador = elemento.get('Id', '')
+            if identificador.startswith('NFe'):
+                nota['chave'] = identificador[3:]
+        else:
+            chave_protocolo = (elemento.text or '').strip()
+
+    if not eh_nfe:
+        return None
+    if not nota['chave']:
+        nota['chave'] = chave_protocolo
+    for item in produtos:
+        item['chave_nfe'] = nota['chave']
+    nota['produtos'] = produtos
+    return nota
+
+
+def produtos_nfe(xml_content, chave_acesso):
+    """Itens do XML (texto ou bytes) de uma NF-e, com a chave informada; ValueError se o XML não for de NF-e"""
+    if isinstance(xml_content, str):
+        xml_content = xml_content.encode('utf-8')
+    nota = extrair_nfe(xml_content)
+    if nota is None:
+        raise ValueError('O XML não é de uma NF-e/NFC-e')
+    for item in nota['produtos']:
+        item['chave_nfe'] = chave_acesso
+    return nota['produtos']
+
+
+# ZIP aberto no processo: ler o diretório de um ZIP com dezenas de milhares de
+# membros custa mais que os XML de uma tarefa, então ele é reaproveitado
+_zip_aberto = {}
+
+
+def _abrir_zip(caminho_zip):
+    if caminho_zip not in _zip_aberto:
+        fechar_zip()
+        _zip_aberto[caminho_zip] = zipfile.ZipFile(caminho_zip)
+    return _zip_aberto[caminho_zip]
+
+
+def fechar_zip():
+    """Fecha o ZIP mantido aberto pelo processo (antes de apagar o arquivo)"""
+    for zf in _zip_aberto.values():
+        zf.close()
+    _zip_aberto.clear()
+
+
+def processar_xmls(caminho_zip, membros, raiz_armazem):
+    """
+    Extrai os XML membros do ZIP e guarda no armazém os que ainda não estão lá.
+    Roda nos processos do pool da importação. Devolve [(membro, nota ou None, erro)].
+    """
+    zf = _abrir_zip(caminho_zip)
+    resultados = []
+    for membro in membros:
+        try:
+            dados = zf.read(membro)
+            nota = extrair_nfe(dados)
+            if nota is not None:
+                if len(nota['chave']) != 44 or not nota['chave'].isdigit():
+                    raise ValueError('Chave de acesso não encontrada no XML')
+                if not armazem_xml.existe_xml(nota['chave'], raiz_armazem):
+                    armazem_xml.salvar_xml(nota['chave'], dados, raiz_armazem)
+            resultados.append((membro, nota, None))
+        except Exception as e:
+            resultados.append((membro, None, str(e)))
+    return resultados
@@ -0,0 +1,37 @@
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+
+from apps.empresa.models import UF, Empresa
+from apps.xml_manager.importacao import enfileirar_importacao_xml, executar_importacao_xml
+from apps.xml_manager.models import ImportacaoXML
+
+
+class ImportacaoXMLTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        uf = UF.objects.create(codigo=35, sigla='SP', nome='São Paulo')
+        self.empresa = Empresa.objects.create(cnpj_cpf='12345678000199', razao_social='Empresa', uf=uf)
+
+    def test_zip_removido_ao_concluir(self):
+        conteudo = io.BytesIO()
+        with zipfile.ZipFile(conteudo, 'w') as zip_file:
+            zip_file.writestr('outro.xml', '<outro/>')
+        with override_settings(MEDIA_ROOT=self.media):
+            importacao = enfileirar_importacao_xml(
+                None, self.empresa.id, SimpleUploadedFile('notas.zip', conteudo.getvalue()),
+            )
+            caminho = importacao.arquivo.path
+            executar_importacao_xml(importacao)
+
+        importacao = ImportacaoXML.objects.get(id=importacao.id)
+        self.assertEqual(importacao.status, 'concluido')
+        self.assertEqual(importacao.ignorados, 1)
+        self.assertFalse(importacao.arquivo)
+        self.assertFalse(os.path.exists(caminho))
@@ -5,4 +5,5 @@ app_name = 'xml_manager'
 
 urlpatterns = [
     path('lote/', views.lote, name='lote'),
+    path('lote/<int:importacao_id>/', views.status_lote, name='status_lote'),
 ]
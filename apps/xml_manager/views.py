@@ -1,13 +1,103 @@
+import logging
+import re
+
 from django.shortcuts import render
 from django.contrib.auth.decorators import login_required
 from django.http import JsonResponse
+from django.urls import reverse
+
+from apps.empresa.models import Empresa
+from apps.xml_manager.importacao import compactar_xmls, enfileirar_importacao_xml
+from apps.xml_manager.models import ImportacaoXML
+
+logger = logging.getLogger('xml_manager.importacao')
+
+PERIODO = re.compile(r'\d{4}-(0[1-9]|1[0-2])')
+
 
 @login_required
 def importar_xmls(request):
-    return render(request, 'xml_manager/importar.html')
+    return render(request, 'xml_manager/importar.html', {'empresas': Empresa.objects.filter(ativo=True)})
+
 
 @login_required
 def lote(request):
-    if request.method == 'POST':
-        return JsonResponse({'status': 'ok'})
-    return JsonResponse({'error': 'Method not allowed'}, status=405)
+    """Enfileira a importação de um ZIP (ou de XML soltos, reunidos num ZIP) para o worker"""
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    empresa_id = request.POST.get('empresa')
+    periodo_inicial = request.POST.get('periodo_inicial', '')
+    periodo_final = request.POST.get('periodo_final', '') or periodo_inicial
+    arquivos = request.FILES.getlist('arquivos')
+
+    if not empresa_id or not arquivos:
+        return JsonResponse({'success': False, 'message': 'Selecione a empresa e os arquivos.'}, status=400)
+    if periodo_final and not periodo_inicial:
+        return JsonResponse({'success': False, 'message': 'Informe o período inicial.'}, status=400)
+    if periodo_inicial and not (PERIODO.fullmatch(periodo_inicial) and PERIODO.fullmatch(periodo_final)):
+        return JsonResponse({'success': False, 'message': 'Período inválido: use o formato AAAA-MM.'}, status=400)
+    if periodo_inicial > periodo_final:
+        return JsonResponse({'success': False, 'message': 'O período inicial é posterior ao final.'}, status=400)
+    if not Empresa.objects.filter(id=empresa_id).exists():
+        return JsonResponse({'success': False, 'message': 'Empresa não encontrada.'}, status=404)
+
+    zips = [arquivo for arquivo in arquivos if arquivo.name.lower().endswith('.zip')]
+    xmls = [arquivo for arquivo in arquivos if arquivo.name.lower().endswith('.xml')]
+    if not zips and not xmls:
+        return JsonResponse({'success': False, 'message': 'Envie arquivos .zip ou .xml.'}, status=400)
+
+    try:
+        # A leitura roda no worker (manage.py worker_importacao_xml), fora do request
+        uploads = zips + ([compactar_xmls(xmls)] if xmls else [])
+        importacoes = [
+            enfileirar_importacao_xml(request.user, empresa_id, arquivo, periodo_inicial, periodo_final)
+            for arquivo in uploads
+        ]
+    except Exception as e:
+        logger.error(f"Erro ao enfileirar importação de XML: {e}", exc_info=True)
+        return JsonResponse({'success': False, 'message': f'Erro ao receber arquivos: {e}'}, status=500)
+
+    return JsonResponse({
+        'success': True,
+        'message': 'Importação enfileirada. Acompanhe o progresso.',
+        'importacoes': [
+            {
+                'id': importacao.id,
+                'arquivo': importacao.nome_arquivo,
+                'url_status': reverse('xml_manager:status_lote', args=[importacao.id]),
+            }
+            for importacao in importacoes
+        ],
+    })
+
+
+@login_required
+def status_lote(request, importacao_id):
+    """API de progresso de uma importação de XML enfileirada"""
+    try:
+        importacao = ImportacaoXML.objects.get(id=importacao_id)
+    except ImportacaoXML.DoesNotExist:
+        return JsonResponse({'success': False, 'message': 'Importação não encontrada.'}, status=404)
+
+    if importacao.usuario_id != request.user.id and not request.user.is_staff:
+        return JsonResponse({'success': False, 'message': 'Importação não encontrada.'}, status=404)
+
+    return JsonResponse({
+        'success': True,
+        'id': importacao.id,
+        'arquivo': importacao.nome_arquivo,
+        'status': importacao.status,
+        'status_descricao': importacao.get_status_display(),
+        'xml_total': importacao.xml_total,
+        'xml_processados': importacao.xml_processados,
+        'xml_por_segundo': importacao.xml_por_segundo,
+        'notas': importacao.notas,
+        'ignorados': importacao.ignorados,
+        'erros': importacao.erros,
+        'notas_periodo': importacao.notas_periodo,
+        'produtos': importacao.produtos,
+        'tentativas': importacao.tentativas,
+        'mensagem': importacao.mensagem,
+        'relatorio': importacao.relatorio,
+    })
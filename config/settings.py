@@ -196,6 +196,70 @@ CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
 
+# Importação SPED (tamanho dos lotes de gravação no banco)
+SPED_BULK_BATCH_SIZE = config('SPED_BULK_BATCH_SIZE', default=2000, cast=int)
+# No PostgreSQL, C100/C170/C190 são carregados via COPY em tabelas temporárias
+SPED_COPY_POSTGRES = config('SPED_COPY_POSTGRES', default=True, cast=bool)
+# Job em processamento sem sinal do worker há mais que isso volta para a fila
+SPED_IMPORTACAO_TIMEOUT_MINUTOS = config('SPED_IMPORTACAO_TIMEOUT_MINUTOS', default=5, cast=int)
+# Parse dos arquivos de um ZIP em paralelo (0 = um processo por CPU, 1 = sem pool)
+SPED_IMPORTACAO_PROCESSOS = config('SPED_IMPORTACAO_PROCESSOS', default=0, cast=int)
+# Memória máxima estimada para arquivos em parse/aguardando gravação
+SPED_IMPORTACAO_MEMORIA_MB = config('SPED_IMPORTACAO_MEMORIA_MB', default=1024, cast=int)
+
+# API MeuDanfe (XML das NF-e sem itens no SPED). A URL pode apontar para um servidor local (testes)
+MEUDANFE_URL = config('MEUDANFE_URL', default='https://api.meudanfe.com.br/v2')
+# Sem API Key só os XML já armazenados são usados (informe no .env)
+MEUDANFE_API_KEY = config('MEUDANFE_API_KEY', default='')
+MEUDANFE_TIMEOUT = config('MEUDANFE_TIMEOUT', default=30, cast=float)
+# Busca em lote (worker_busca_api): notas consultadas ao mesmo tempo e requisições por segundo ao provedor
+MEUDANFE_CONCORRENCIA = config('MEUDANFE_CONCORRENCIA', default=4, cast=int)
+MEUDANFE_REQUISICOES_POR_SEGUNDO = config('MEUDANFE_REQUISICOES_POR_SEGUNDO', default=4, cast=float)
+# Consultas à API por busca; a busca pausa ao atingir (0 = sem limite) e é retomada pela página
+MEUDANFE_CONSULTAS_POR_BUSCA = config('MEUDANFE_CONSULTAS_POR_BUSCA', default=165, cast=int)
+# Chave consultada sem XML só é consultada de novo depois do prazo do resultado (ConsultaChaveAPI)
+MEUDANFE_REPETIR_NAO_ENCONTRADA_HORAS = config('MEUDANFE_REPETIR_NAO_ENCONTRADA_HORAS', default=24, cast=float)
+MEUDANFE_REPETIR_ERRO_MINUTOS = config('MEUDANFE_REPETIR_ERRO_MINUTOS', default=10, cast=float)
+# Após saldo insuficiente / API Key inválida nenhuma consulta sai por esse tempo (EstadoCotaAPI)
+MEUDANFE_PAUSA_COTA_MINUTOS = config('MEUDANFE_PAUSA_COTA_MINUTOS', default=30, cast=float)
+# Busca em processamento sem sinal do worker há mais que isso volta para a fila
+BUSCA_API_TIMEOUT_MINUTOS = config('BUSCA_API_TIMEOUT_MINUTOS', default=5, cast=int)
+
+# Importação de ZIP com XML de NF-e (worker_importacao_xml): processos do pool (0 = um por CPU, 1 = sem pool)
+XML_IMPORTACAO_PROCESSOS = config('XML_IMPORTACAO_PROCESSOS', default=0, cast=int)
+# Importação em processamento sem sinal do worker há mais que isso volta para a fila
+XML_IMPORTACAO_TIMEOUT_MINUTOS = config('XML_IMPORTACAO_TIMEOUT_MINUTOS', default=5, cast=int)
+
+# Cache (resultados do relatório fiscal). redis://... usa Redis; caso contrário
+# arquivos em CACHE_DIR, compartilhados entre o servidor web e o worker de importação
+# (a memória local de cada processo não veria as invalidações feitas pelo worker).
+# Com vários processos web prefira Redis: nos arquivos a trava contra cálculos
+# repetidos do mesmo relatório não é atômica entre processos (ver cache_relatorio)
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL.startswith(('redis://', 'rediss://')):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+elif CACHE_URL == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': config('CACHE_DIR', default=str(BASE_DIR / 'cache')),
+        }
+    }
+# Segundos que um relatório calculado fica em cache (as importações/exclusões já o invalidam)
+RELATORIO_CACHE_SEGUNDOS = config('RELATORIO_CACHE_SEGUNDOS', default=3600, cast=int)
+
+
 # Cria diretório de logs se não existir
 LOGS_DIR = BASE_DIR / 'logs'
 LOGS_DIR.mkdir(exist_ok=True)